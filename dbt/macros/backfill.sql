@@ -0,0 +1,25 @@
+{#
+    Backfill por partição: com a var backfill_dates (lista de AAAA-MM-DD), os
+    modelos particionados por dia viram incrementais insert_overwrite e só
+    as partições informadas são lidas e substituídas. Sem a var, os modelos
+    gold continuam sendo reconstruídos como TABLE (a partir da silver, que é
+    sempre incremental e preserva as partições de backfill).
+#}
+
+{% macro backfill_materialization() -%}
+    {{ return('incremental' if var('backfill_dates', none) else 'table') }}
+{%- endmacro %}
+
+{% macro backfill_partitions() -%}
+    {%- set partitions = [] -%}
+    {%- for day in var('backfill_dates', []) -%}
+        {%- do partitions.append("DATE('" ~ day ~ "')") -%}
+    {%- endfor -%}
+    {{ return(partitions if partitions else none) }}
+{%- endmacro %}
+
+{% macro backfill_filter(column) -%}
+    {%- if var('backfill_dates', none) and is_incremental() -%}
+        WHERE {{ column }} IN ({{ backfill_partitions() | join(', ') }})
+    {%- endif -%}
+{%- endmacro %}
@@ -0,0 +1,46 @@
+{#
+    Dimensões incrementais (dim_brt_linhas, dim_brt_veiculos): cada linha da
+    dimensão guarda, além das métricas, o estado que permite somar um lote
+    novo (contagens, somas, somas de quadrados, mín/máx, sketches HLL e a
+    última captura incorporada). A marca d'água é a maior captura já
+    incorporada; só as linhas da silver capturadas depois dela (nas
+    partições a partir do dia da marca, menos dim_lookback_days) são lidas,
+    e só as chaves presentes nelas são reescritas pelo MERGE.
+
+    Reprocessamentos que reescrevem capturas antigas (backfill) ficam abaixo
+    da marca: o flow de backfill roda as dimensões com --full-refresh.
+
+    Tabelas criadas antes do estado incremental (sem ultima_captura_processada
+    e demais colunas de estado) não podem ser somadas: enquanto a coluna não
+    existe, o run recalcula a dimensão inteira a partir da silver e o MERGE
+    (on_schema_change='sync_all_columns') cria as colunas e reescreve todas
+    as chaves. A partir daí os runs voltam a ser incrementais.
+#}
+
+{% macro dim_has_state() -%}
+    {%- if not (is_incremental() and execute) -%}
+        {{ return(false) }}
+    {%- endif -%}
+    {%- set columns = adapter.get_columns_in_relation(this) | map(attribute='name') | map('lower') | list -%}
+    {{ return('ultima_captura_processada' in columns) }}
+{%- endmacro %}
+
+{% macro dim_watermark() -%}
+    {%- if dim_has_state() -%}
+        {%- set result = run_query("SELECT CAST(MAX(ultima_captura_processada) AS STRING) FROM " ~ this) -%}
+        {{ return(result.columns[0].values()[0]) }}
+    {%- endif -%}
+    {{ return(none) }}
+{%- endmacro %}
+
+{% macro dim_increment_filter(watermark) -%}
+    {%- if watermark -%}
+        AND data_gps >= DATE_SUB(DATE(TIMESTAMP('{{ watermark }}')), INTERVAL {{ var('dim_lookback_days', 1) }} DAY)
+        AND data_hora_captura > TIMESTAMP('{{ watermark }}')
+    {%- endif -%}
+{%- endmacro %}
+
+{# Desvio padrão amostral (STDDEV) a partir de n, soma e soma dos quadrados #}
+{% macro stddev_from_moments(n, total, sum_squares) -%}
+    SAFE.SQRT(GREATEST(SAFE_DIVIDE({{ sum_squares }} - SAFE_DIVIDE({{ total }} * {{ total }}, {{ n }}), {{ n }} - 1), 0))
+{%- endmacro %}
@@ -23,7 +23,19 @@ SELECT
     ignicao,
     CAST(capacidadePeVeiculo AS INT64) as capacidade_pe,
     CAST(capacidadeSentadoVeiculo AS INT64) as capacidade_sentado,
-    SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', timestamp_captura) as timestamp_captura
+    SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', timestamp_captura) as timestamp_captura,
+    -- Métricas de trajeto calculadas na ingestão
+    CAST(distancia_segmento_km AS FLOAT64) as distancia_segmento_km,
+    CAST(intervalo_segmento_s AS FLOAT64) as intervalo_segmento_s,
+    CAST(velocidade_calculada_kmh AS FLOAT64) as velocidade_calculada_kmh,
+    CAST(distancia_acumulada_km AS FLOAT64) as distancia_acumulada_km,
+    -- Estação BRT mais próxima (associada na ingestão)
+    estacao_id,
+    CAST(distancia_estacao_m AS FLOAT64) as distancia_estacao_m,
+    -- Células geohash (calculadas na ingestão)
+    geohash_5,
+    geohash_6,
+    geohash_7
 FROM {{ source('gcs_bronze', 'brt_gps_external') }}
 WHERE dataHora IS NOT NULL
   AND dataHora != ''
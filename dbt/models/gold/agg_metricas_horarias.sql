@@ -1,9 +1,12 @@
 -- Gold Layer: Aggregate Table - Métricas por Hora
 -- Análise de desempenho operacional por hora do dia
+-- Veículos e linhas distintos vêm de sketches HLL gravados por hora
 -- Materialização: TABLE (análises agregadas)
 
 {{ config(
-    materialized='table',
+    materialized=backfill_materialization(),
+    incremental_strategy='insert_overwrite',
+    partitions=backfill_partitions(),
     schema='brt_gold',
     partition_by={
         "field": "data_analise",
@@ -14,6 +17,7 @@
 
 WITH gps_data AS (
     SELECT * FROM {{ ref('stg_brt_gps') }}
+    {{ backfill_filter('data_gps') }}
 ),
 
 hourly_metrics AS (
@@ -38,8 +42,10 @@ hourly_metrics AS (
         
         -- Contagens
         COUNT(*) AS total_registros_gps,
-        COUNT(DISTINCT codigo_veiculo) AS total_veiculos_ativos,
-        COUNT(DISTINCT linha_brt) AS total_linhas_ativas,
+        
+        -- Sketches HLL (contagens distintas mescláveis em rollups de dia/semana)
+        HLL_COUNT.INIT(codigo_veiculo, {{ var('hll_precision', 14) }}) AS sketch_veiculos,
+        HLL_COUNT.INIT(linha_brt, {{ var('hll_precision', 14) }}) AS sketch_linhas,
         
         -- Métricas de velocidade
         AVG(velocidade_kmh) AS velocidade_media,
@@ -78,10 +84,10 @@ SELECT
     tipo_dia,
     periodo_dia,
     
-    -- Contagens
+    -- Contagens (distintas estimadas pelos sketches HLL)
     total_registros_gps,
-    total_veiculos_ativos,
-    total_linhas_ativas,
+    HLL_COUNT.EXTRACT(sketch_veiculos) AS total_veiculos_ativos,
+    HLL_COUNT.EXTRACT(sketch_linhas) AS total_linhas_ativas,
     
     -- Velocidade
     ROUND(velocidade_media, 2) AS velocidade_media_kmh,
@@ -96,19 +102,23 @@ SELECT
     veiculos_rapido,
     
     -- Percentuais de distribuição
-    ROUND(SAFE_DIVIDE(veiculos_parados, total_veiculos_ativos) * 100, 2) AS pct_parados,
-    ROUND(SAFE_DIVIDE(veiculos_lento, total_veiculos_ativos) * 100, 2) AS pct_lento,
-    ROUND(SAFE_DIVIDE(veiculos_moderado, total_veiculos_ativos) * 100, 2) AS pct_moderado,
-    ROUND(SAFE_DIVIDE(veiculos_rapido, total_veiculos_ativos) * 100, 2) AS pct_rapido,
+    ROUND(SAFE_DIVIDE(veiculos_parados, HLL_COUNT.EXTRACT(sketch_veiculos)) * 100, 2) AS pct_parados,
+    ROUND(SAFE_DIVIDE(veiculos_lento, HLL_COUNT.EXTRACT(sketch_veiculos)) * 100, 2) AS pct_lento,
+    ROUND(SAFE_DIVIDE(veiculos_moderado, HLL_COUNT.EXTRACT(sketch_veiculos)) * 100, 2) AS pct_moderado,
+    ROUND(SAFE_DIVIDE(veiculos_rapido, HLL_COUNT.EXTRACT(sketch_veiculos)) * 100, 2) AS pct_rapido,
     
     -- Status
     veiculos_ligados,
     veiculos_desligados,
-    ROUND(SAFE_DIVIDE(veiculos_ligados, total_veiculos_ativos) * 100, 2) AS pct_ligados,
+    ROUND(SAFE_DIVIDE(veiculos_ligados, HLL_COUNT.EXTRACT(sketch_veiculos)) * 100, 2) AS pct_ligados,
     
     -- Capacidade
     capacidade_total_frota,
     
+    -- Sketches para rollups (HLL_COUNT.MERGE por dia, semana, período)
+    sketch_veiculos,
+    sketch_linhas,
+    
     -- Metadados
     CURRENT_TIMESTAMP() AS dbt_updated_at
 
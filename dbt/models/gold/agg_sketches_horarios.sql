@@ -0,0 +1,29 @@
+-- Gold Layer: Sketches HLL por hora e linha
+-- Um sketch HLL_COUNT de veículos por (data, hora, linha): contagens distintas
+-- por dia, semana ou linha são obtidas com HLL_COUNT.MERGE sobre esta tabela,
+-- sem revarrer a silver
+-- Materialização: TABLE particionada por data (dataset brt_gold, como os
+-- demais modelos gold; civitas_gold é do caminho inline de create_gold_tables)
+
+{{ config(
+    materialized=backfill_materialization(),
+    incremental_strategy='insert_overwrite',
+    partitions=backfill_partitions(),
+    schema='brt_gold',
+    partition_by={
+        "field": "data_gps",
+        "data_type": "date",
+        "granularity": "day"
+    },
+    cluster_by=["linha_brt"]
+) }}
+
+SELECT
+    data_gps,
+    hora_gps,
+    linha_brt,
+    COUNT(*) AS total_registros_gps,
+    HLL_COUNT.INIT(codigo_veiculo, {{ var('hll_precision', 14) }}) AS sketch_veiculos
+FROM {{ ref('stg_brt_gps') }}
+{{ backfill_filter('data_gps') }}
+GROUP BY data_gps, hora_gps, linha_brt
@@ -1,91 +1,177 @@
 -- Gold Layer: Dimension Table - Linhas BRT
 -- Informações sobre as linhas de BRT
--- Materialização: TABLE (pequena, atualização rara)
+-- Materialização: INCREMENTAL (merge por linha): cada run lê só as capturas
+-- posteriores à marca d'água e soma o lote ao estado guardado na própria
+-- dimensão (contagens, somas, mín/máx, sketches HLL, ver macros/incremental_dims.sql)
 
 {{ config(
-    materialized='table',
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key='codigo_linha',
+    on_schema_change='sync_all_columns',
     schema='brt_gold'
 ) }}
 
+{# Sem as colunas de estado (tabela anterior ao incremental) o run recalcula tudo #}
+{% set has_state = dim_has_state() %}
+{% set watermark = dim_watermark() %}
+
 WITH gps_data AS (
     SELECT * FROM {{ ref('stg_brt_gps') }}
+    WHERE linha_brt IS NOT NULL
+    {{ dim_increment_filter(watermark) }}
 ),
 
+-- Estatísticas do lote novo, no mesmo formato do estado guardado
 linha_stats AS (
     SELECT
-        linha_brt,
-        
-        -- Contagens
-        COUNT(DISTINCT codigo_veiculo) AS total_veiculos,
-        COUNT(DISTINCT placa_veiculo) AS total_placas_unicas,
-        COUNT(DISTINCT descricao_trajeto) AS total_trajetos_distintos,
+        linha_brt AS codigo_linha,
+
+        -- Contagens (distintos via sketch HLL, somáveis entre lotes)
+        HLL_COUNT.INIT(codigo_veiculo, {{ var('hll_precision', 14) }}) AS sketch_veiculos,
+        HLL_COUNT.INIT(placa_veiculo, {{ var('hll_precision', 14) }}) AS sketch_placas,
+        HLL_COUNT.INIT(descricao_trajeto, {{ var('hll_precision', 14) }}) AS sketch_trajetos,
         COUNT(*) AS total_registros,
-        
+
         -- Métricas de velocidade
-        AVG(velocidade_kmh) AS velocidade_media_linha,
-        MAX(velocidade_kmh) AS velocidade_maxima_registrada,
-        
+        COUNT(velocidade_kmh) AS n_velocidade,
+        SUM(velocidade_kmh) AS soma_velocidade,
+        MAX(velocidade_kmh) AS velocidade_maxima_kmh,
+
         -- Capacidades
-        AVG(capacidade_total) AS capacidade_media_veiculos,
-        MIN(capacidade_total) AS capacidade_minima_veiculos,
-        MAX(capacidade_total) AS capacidade_maxima_veiculos,
-        
+        COUNT(capacidade_total) AS n_capacidade,
+        SUM(capacidade_total) AS soma_capacidade,
+        MIN(capacidade_total) AS capacidade_minima,
+        MAX(capacidade_total) AS capacidade_maxima,
+
         -- Cobertura temporal
         MIN(data_gps) AS primeira_data_registro,
         MAX(data_gps) AS ultima_data_registro,
-        DATE_DIFF(MAX(data_gps), MIN(data_gps), DAY) AS dias_operacao,
-        
-        -- Trajetos mais comuns
+
+        -- Trajetos mais comuns (os 10 primeiros em ordem; a união mantém o corte exato)
         ARRAY_AGG(
-            DISTINCT descricao_trajeto 
-            IGNORE NULLS 
-            ORDER BY descricao_trajeto 
+            DISTINCT descricao_trajeto
+            IGNORE NULLS
+            ORDER BY descricao_trajeto
             LIMIT 10
-        ) AS trajetos_operados
+        ) AS trajetos_operados,
+
+        MAX(data_hora_captura) AS ultima_captura_processada
 
     FROM gps_data
-    WHERE linha_brt IS NOT NULL
     GROUP BY linha_brt
+),
+
+estado AS (
+    SELECT * FROM linha_stats
+
+    {% if has_state %}
+    -- Estado atual só das linhas presentes no lote
+    UNION ALL
+
+    SELECT
+        codigo_linha,
+        sketch_veiculos,
+        sketch_placas,
+        sketch_trajetos,
+        total_registros,
+        n_velocidade,
+        soma_velocidade,
+        velocidade_maxima_kmh,
+        n_capacidade,
+        soma_capacidade,
+        capacidade_minima,
+        capacidade_maxima,
+        primeira_data_registro,
+        ultima_data_registro,
+        trajetos_operados,
+        ultima_captura_processada
+    FROM {{ this }}
+    WHERE codigo_linha IN (SELECT codigo_linha FROM linha_stats)
+    {% endif %}
+),
+
+combinado AS (
+    SELECT
+        codigo_linha,
+        HLL_COUNT.MERGE_PARTIAL(sketch_veiculos) AS sketch_veiculos,
+        HLL_COUNT.MERGE_PARTIAL(sketch_placas) AS sketch_placas,
+        HLL_COUNT.MERGE_PARTIAL(sketch_trajetos) AS sketch_trajetos,
+        SUM(total_registros) AS total_registros,
+        SUM(n_velocidade) AS n_velocidade,
+        SUM(soma_velocidade) AS soma_velocidade,
+        MAX(velocidade_maxima_kmh) AS velocidade_maxima_kmh,
+        SUM(n_capacidade) AS n_capacidade,
+        SUM(soma_capacidade) AS soma_capacidade,
+        MIN(capacidade_minima) AS capacidade_minima,
+        MAX(capacidade_maxima) AS capacidade_maxima,
+        MIN(primeira_data_registro) AS primeira_data_registro,
+        MAX(ultima_data_registro) AS ultima_data_registro,
+        ARRAY_CONCAT_AGG(trajetos_operados) AS trajetos_todos,
+        MAX(ultima_captura_processada) AS ultima_captura_processada
+    FROM estado
+    GROUP BY codigo_linha
+),
+
+linha_metricas AS (
+    SELECT
+        *,
+        HLL_COUNT.EXTRACT(sketch_veiculos) AS total_veiculos
+    FROM combinado
 )
 
-SELECT 
+SELECT
     -- Surrogate key
-    {{ dbt_utils.generate_surrogate_key(['linha_brt']) }} AS id_linha,
-    
-    linha_brt AS codigo_linha,
-    
+    {{ dbt_utils.generate_surrogate_key(['codigo_linha']) }} AS id_linha,
+
+    codigo_linha,
+
     -- Métricas operacionais
     total_veiculos,
-    total_placas_unicas,
-    total_trajetos_distintos,
+    HLL_COUNT.EXTRACT(sketch_placas) AS total_placas_unicas,
+    HLL_COUNT.EXTRACT(sketch_trajetos) AS total_trajetos_distintos,
     total_registros,
-    
+
     -- Métricas de velocidade
-    ROUND(velocidade_media_linha, 2) AS velocidade_media_kmh,
-    ROUND(velocidade_maxima_registrada, 2) AS velocidade_maxima_kmh,
-    
+    ROUND(SAFE_DIVIDE(soma_velocidade, n_velocidade), 2) AS velocidade_media_kmh,
+    ROUND(velocidade_maxima_kmh, 2) AS velocidade_maxima_kmh,
+
     -- Capacidades
-    ROUND(capacidade_media_veiculos, 0) AS capacidade_media,
-    capacidade_minima_veiculos AS capacidade_minima,
-    capacidade_maxima_veiculos AS capacidade_maxima,
-    
+    ROUND(SAFE_DIVIDE(soma_capacidade, n_capacidade), 0) AS capacidade_media,
+    capacidade_minima,
+    capacidade_maxima,
+
     -- Cobertura temporal
     primeira_data_registro,
     ultima_data_registro,
-    dias_operacao,
-    
+    DATE_DIFF(ultima_data_registro, primeira_data_registro, DAY) AS dias_operacao,
+
     -- Classificação da linha
-    CASE 
+    CASE
         WHEN total_veiculos >= 50 THEN 'ALTA_DEMANDA'
         WHEN total_veiculos BETWEEN 20 AND 49 THEN 'MEDIA_DEMANDA'
         ELSE 'BAIXA_DEMANDA'
     END AS classificacao_demanda,
-    
-    -- Trajetos
-    trajetos_operados,
-    
+
+    -- Trajetos (união dos conjuntos, mesmo corte de 10)
+    ARRAY(
+        SELECT DISTINCT trajeto
+        FROM UNNEST(trajetos_todos) AS trajeto
+        ORDER BY trajeto
+        LIMIT 10
+    ) AS trajetos_operados,
+
+    -- Estado incremental
+    sketch_veiculos,
+    sketch_placas,
+    sketch_trajetos,
+    n_velocidade,
+    soma_velocidade,
+    n_capacidade,
+    soma_capacidade,
+    ultima_captura_processada,
+
     -- Metadados
     CURRENT_TIMESTAMP() AS dbt_updated_at
 
-FROM linha_stats
-ORDER BY total_veiculos DESC
+FROM linha_metricas
@@ -1,118 +1,204 @@
 -- Gold Layer: Dimension Table - Veículos BRT
 -- Informações sobre os veículos da frota BRT
--- Materialização: TABLE (pequena, atualização periódica)
+-- Materialização: INCREMENTAL (merge por veículo): cada run lê só as capturas
+-- posteriores à marca d'água e soma o lote ao estado guardado na própria
+-- dimensão (contagens, momentos da velocidade, sketches HLL, ver macros/incremental_dims.sql)
 
 {{ config(
-    materialized='table',
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key='codigo_veiculo',
+    on_schema_change='sync_all_columns',
     schema='brt_gold'
 ) }}
 
+{# Sem as colunas de estado (tabela anterior ao incremental) o run recalcula tudo #}
+{% set has_state = dim_has_state() %}
+{% set watermark = dim_watermark() %}
+
 WITH gps_data AS (
     SELECT * FROM {{ ref('stg_brt_gps') }}
+    WHERE codigo_veiculo IS NOT NULL
+    {{ dim_increment_filter(watermark) }}
 ),
 
+-- Estatísticas do lote novo, no mesmo formato do estado guardado
 veiculo_stats AS (
     SELECT
         codigo_veiculo,
-        placa_veiculo,
-        
+        -- Placa mais recente do veículo
+        ARRAY_AGG(placa_veiculo IGNORE NULLS ORDER BY data_hora_gps DESC LIMIT 1)[SAFE_OFFSET(0)] AS placa_veiculo,
+
         -- Linhas operadas
-        COUNT(DISTINCT linha_brt) AS total_linhas_operadas,
         ARRAY_AGG(DISTINCT linha_brt IGNORE NULLS ORDER BY linha_brt) AS linhas_operadas,
-        
-        -- Contagens
+
+        -- Contagens (dias distintos via sketch HLL, somável entre lotes)
         COUNT(*) AS total_registros,
-        COUNT(DISTINCT data_gps) AS dias_ativos,
-        
-        -- Métricas de velocidade
-        AVG(velocidade_kmh) AS velocidade_media,
-        MIN(velocidade_kmh) AS velocidade_minima,
-        MAX(velocidade_kmh) AS velocidade_maxima,
-        STDDEV(velocidade_kmh) AS velocidade_desvio_padrao,
-        
-        -- Métricas de distância
-        MAX(hodometro_km) - MIN(hodometro_km) AS distancia_total_percorrida,
-        
+        HLL_COUNT.INIT(CAST(data_gps AS STRING), {{ var('hll_precision', 14) }}) AS sketch_dias,
+
+        -- Métricas de velocidade (momentos: média e desvio padrão saem da soma)
+        COUNT(velocidade_kmh) AS n_velocidade,
+        SUM(velocidade_kmh) AS soma_velocidade,
+        SUM(velocidade_kmh * velocidade_kmh) AS soma_quadrados_velocidade,
+        MIN(velocidade_kmh) AS velocidade_minima_kmh,
+        MAX(velocidade_kmh) AS velocidade_maxima_kmh,
+
+        -- Métricas de distância (soma dos segmentos GPS, imune a reset/ausência de hodômetro)
+        COALESCE(SUM(distancia_segmento_km), 0) AS distancia_total_km,
+
         -- Capacidades
         MAX(capacidade_total) AS capacidade_maxima,
-        AVG(capacidade_total) AS capacidade_media,
-        
+        COUNT(capacidade_total) AS n_capacidade,
+        SUM(capacidade_total) AS soma_capacidade,
+
         -- Cobertura temporal
         MIN(data_gps) AS primeira_data_registro,
         MAX(data_gps) AS ultima_data_registro,
-        DATE_DIFF(MAX(data_gps), MIN(data_gps), DAY) AS dias_operacao_span,
-        
+
         -- Status de ignição
         COUNTIF(status_ignicao = 'LIGADO') AS registros_ligado,
         COUNTIF(status_ignicao = 'DESLIGADO') AS registros_desligado,
-        SAFE_DIVIDE(
-            COUNTIF(status_ignicao = 'LIGADO'),
-            COUNT(*)
-        ) * 100 AS percentual_tempo_ligado
+
+        MAX(data_hora_captura) AS ultima_captura_processada
 
     FROM gps_data
-    WHERE codigo_veiculo IS NOT NULL
-    GROUP BY 
+    GROUP BY codigo_veiculo
+),
+
+estado AS (
+    SELECT * FROM veiculo_stats
+
+    {% if has_state %}
+    -- Estado atual só dos veículos presentes no lote
+    UNION ALL
+
+    SELECT
+        codigo_veiculo,
+        placa_veiculo,
+        linhas_operadas,
+        total_registros,
+        sketch_dias,
+        n_velocidade,
+        soma_velocidade,
+        soma_quadrados_velocidade,
+        velocidade_minima_kmh,
+        velocidade_maxima_kmh,
+        distancia_total_km,
+        capacidade_maxima,
+        n_capacidade,
+        soma_capacidade,
+        primeira_data_registro,
+        ultima_data_registro,
+        registros_ligado,
+        registros_desligado,
+        ultima_captura_processada
+    FROM {{ this }}
+    WHERE codigo_veiculo IN (SELECT codigo_veiculo FROM veiculo_stats)
+    {% endif %}
+),
+
+combinado AS (
+    SELECT
         codigo_veiculo,
-        placa_veiculo
+        ARRAY_AGG(placa_veiculo IGNORE NULLS ORDER BY ultima_captura_processada DESC LIMIT 1)[SAFE_OFFSET(0)] AS placa_veiculo,
+        ARRAY_CONCAT_AGG(linhas_operadas) AS linhas_todas,
+        SUM(total_registros) AS total_registros,
+        HLL_COUNT.MERGE_PARTIAL(sketch_dias) AS sketch_dias,
+        SUM(n_velocidade) AS n_velocidade,
+        SUM(soma_velocidade) AS soma_velocidade,
+        SUM(soma_quadrados_velocidade) AS soma_quadrados_velocidade,
+        MIN(velocidade_minima_kmh) AS velocidade_minima_kmh,
+        MAX(velocidade_maxima_kmh) AS velocidade_maxima_kmh,
+        SUM(distancia_total_km) AS distancia_total_km,
+        MAX(capacidade_maxima) AS capacidade_maxima,
+        SUM(n_capacidade) AS n_capacidade,
+        SUM(soma_capacidade) AS soma_capacidade,
+        MIN(primeira_data_registro) AS primeira_data_registro,
+        MAX(ultima_data_registro) AS ultima_data_registro,
+        SUM(registros_ligado) AS registros_ligado,
+        SUM(registros_desligado) AS registros_desligado,
+        MAX(ultima_captura_processada) AS ultima_captura_processada
+    FROM estado
+    GROUP BY codigo_veiculo
+),
+
+veiculo_metricas AS (
+    SELECT
+        * EXCEPT (linhas_todas),
+        -- União dos conjuntos de linhas
+        ARRAY(
+            SELECT DISTINCT linha
+            FROM UNNEST(linhas_todas) AS linha
+            ORDER BY linha
+        ) AS linhas_operadas,
+        HLL_COUNT.EXTRACT(sketch_dias) AS dias_ativos
+    FROM combinado
 )
 
-SELECT 
+SELECT
     -- Surrogate key
     {{ dbt_utils.generate_surrogate_key(['codigo_veiculo']) }} AS id_veiculo,
-    
+
     codigo_veiculo,
     placa_veiculo,
-    
+
     -- Operação
-    total_linhas_operadas,
+    ARRAY_LENGTH(linhas_operadas) AS total_linhas_operadas,
     linhas_operadas,
     total_registros,
     dias_ativos,
-    
+
     -- Velocidade
-    ROUND(velocidade_media, 2) AS velocidade_media_kmh,
-    ROUND(velocidade_minima, 2) AS velocidade_minima_kmh,
-    ROUND(velocidade_maxima, 2) AS velocidade_maxima_kmh,
-    ROUND(velocidade_desvio_padrao, 2) AS velocidade_desvio_padrao_kmh,
-    
-    -- Distância
-    ROUND(distancia_total_percorrida, 2) AS distancia_total_km,
-    CASE 
-        WHEN dias_ativos > 0 
-        THEN ROUND(distancia_total_percorrida / dias_ativos, 2)
+    ROUND(SAFE_DIVIDE(soma_velocidade, n_velocidade), 2) AS velocidade_media_kmh,
+    ROUND(velocidade_minima_kmh, 2) AS velocidade_minima_kmh,
+    ROUND(velocidade_maxima_kmh, 2) AS velocidade_maxima_kmh,
+    ROUND({{ stddev_from_moments('n_velocidade', 'soma_velocidade', 'soma_quadrados_velocidade') }}, 2) AS velocidade_desvio_padrao_kmh,
+
+    -- Distância (a soma guardada não é arredondada, para não acumular erro entre lotes)
+    distancia_total_km,
+    CASE
+        WHEN dias_ativos > 0
+        THEN ROUND(distancia_total_km / dias_ativos, 2)
         ELSE 0
     END AS distancia_media_diaria_km,
-    
+
     -- Capacidade
     capacidade_maxima,
-    ROUND(capacidade_media, 0) AS capacidade_media,
-    
+    ROUND(SAFE_DIVIDE(soma_capacidade, n_capacidade), 0) AS capacidade_media,
+
     -- Temporal
     primeira_data_registro,
     ultima_data_registro,
-    dias_operacao_span,
-    
+    DATE_DIFF(ultima_data_registro, primeira_data_registro, DAY) AS dias_operacao_span,
+
     -- Status
     registros_ligado,
     registros_desligado,
-    ROUND(percentual_tempo_ligado, 2) AS percentual_tempo_ligado,
-    
+    ROUND(SAFE_DIVIDE(registros_ligado, total_registros) * 100, 2) AS percentual_tempo_ligado,
+
     -- Classificações
-    CASE 
+    CASE
         WHEN dias_ativos >= 20 THEN 'ALTA_ATIVIDADE'
         WHEN dias_ativos BETWEEN 10 AND 19 THEN 'MEDIA_ATIVIDADE'
         ELSE 'BAIXA_ATIVIDADE'
     END AS classificacao_atividade,
-    
-    CASE 
-        WHEN distancia_total_percorrida >= 500 THEN 'ALTO_USO'
-        WHEN distancia_total_percorrida BETWEEN 100 AND 499 THEN 'MEDIO_USO'
+
+    CASE
+        WHEN distancia_total_km >= 500 THEN 'ALTO_USO'
+        WHEN distancia_total_km BETWEEN 100 AND 499 THEN 'MEDIO_USO'
         ELSE 'BAIXO_USO'
     END AS classificacao_uso,
-    
+
+    -- Estado incremental
+    sketch_dias,
+    n_velocidade,
+    soma_velocidade,
+    soma_quadrados_velocidade,
+    n_capacidade,
+    soma_capacidade,
+    ultima_captura_processada,
+
     -- Metadados
     CURRENT_TIMESTAMP() AS dbt_updated_at
 
-FROM veiculo_stats
-ORDER BY distancia_total_percorrida DESC
+FROM veiculo_metricas
@@ -3,18 +3,21 @@
 -- Materialização: TABLE (análises pesadas)
 
 {{ config(
-    materialized='table',
+    materialized=backfill_materialization(),
+    incremental_strategy='insert_overwrite',
+    partitions=backfill_partitions(),
     schema='brt_gold',
     partition_by={
         "field": "data_viagem",
         "data_type": "date",
         "granularity": "day"
     },
-    cluster_by=["linha_brt", "codigo_veiculo"]
+    cluster_by=["geohash_6", "linha_brt", "codigo_veiculo"]
 ) }}
 
 WITH gps_data AS (
     SELECT * FROM {{ ref('stg_brt_gps') }}
+    {{ backfill_filter('data_gps') }}
 ),
 
 -- Agregação por veículo, linha, data e hora
@@ -49,6 +52,7 @@ trips AS (
         MIN(longitude) AS longitude_min,
         MAX(longitude) AS longitude_max,
         AVG(longitude) AS longitude_media,
+        APPROX_TOP_COUNT(geohash_6, 1)[SAFE_OFFSET(0)].value AS geohash_6,
         
         -- Métricas de velocidade
         AVG(velocidade_kmh) AS velocidade_media,
@@ -59,7 +63,10 @@ trips AS (
         -- Métricas de hodômetro
         MIN(hodometro_km) AS hodometro_inicial,
         MAX(hodometro_km) AS hodometro_final,
-        (MAX(hodometro_km) - MIN(hodometro_km)) AS distancia_percorrida_km,
+        
+        -- Métricas de distância (soma dos segmentos GPS calculados na ingestão)
+        COALESCE(SUM(distancia_segmento_km), 0) AS distancia_percorrida_km,
+        SUM(intervalo_segmento_s) AS tempo_segmentos_s,
         
         -- Capacidade
         AVG(capacidade_total) AS capacidade_media,
@@ -103,11 +110,10 @@ SELECT
     *,
     
     -- Métricas derivadas
-    CASE 
-        WHEN duracao_minutos > 0 
-        THEN SAFE_DIVIDE(distancia_percorrida_km, duracao_minutos) * 60
-        ELSE 0
-    END AS velocidade_media_calculada,
+    COALESCE(
+        SAFE_DIVIDE(distancia_percorrida_km, tempo_segmentos_s) * 3600,
+        0
+    ) AS velocidade_media_calculada,
     
     -- Classificação de viagem
     CASE 
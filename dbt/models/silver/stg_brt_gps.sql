@@ -1,9 +1,27 @@
 -- Silver Layer: Staging BRT GPS
 -- Limpeza e padronização dos dados brutos
--- Materialização: VIEW (transformações leves)
+-- Regras de qualidade (nulos, coordenadas, velocidade, limites do Rio) já
+-- aplicadas na ingestão pelo quality gate (pipelines/utils/quality.py):
+-- registros inválidos ficam em quarentena e não chegam ao bronze
+-- Materialização: incremental insert_overwrite, particionada por data e
+-- clusterizada por célula geohash (filtros de área/corredor podam blocos em vez
+-- de varrer a tabela inteira). Só partições com dado novo são substituídas:
+-- - run regular: as datas presentes na bronze atual, reescritas com as linhas
+--   que a silver já tinha nelas mais as novas (dedup por id_registro), então
+--   partições de backfill e CSVs já arquivados não se perdem
+-- - backfill (var backfill_dates): exatamente as partições informadas,
+--   reconstruídas a partir da bronze do backfill (ver macros/backfill.sql)
 
 {{ config(
-    materialized='view'
+    materialized='incremental',
+    incremental_strategy='insert_overwrite',
+    partitions=backfill_partitions(),
+    partition_by={
+        "field": "data_gps",
+        "data_type": "date",
+        "granularity": "day"
+    },
+    cluster_by=["geohash_6", "linha_brt", "codigo_veiculo"]
 ) }}
 
 WITH source AS (
@@ -21,6 +39,11 @@ cleaned AS (
         ROUND(CAST(latitude AS FLOAT64), 6) AS latitude,
         ROUND(CAST(longitude AS FLOAT64), 6) AS longitude,
         
+        -- Células geohash (prefixos: geohash_5 ⊂ geohash_6 ⊂ geohash_7)
+        geohash_5,
+        geohash_6,
+        geohash_7,
+        
         -- Timestamps
         PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', dataHora) AS data_hora_gps,
         PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', timestamp_captura) AS data_hora_captura,
@@ -29,6 +52,16 @@ cleaned AS (
         ROUND(CAST(velocidade AS FLOAT64), 2) AS velocidade_kmh,
         CAST(hodometro AS FLOAT64) AS hodometro_km,
         
+        -- Métricas de trajeto (haversine entre fixes consecutivos, calculadas na ingestão)
+        CAST(distancia_segmento_km AS FLOAT64) AS distancia_segmento_km,
+        CAST(intervalo_segmento_s AS FLOAT64) AS intervalo_segmento_s,
+        CAST(velocidade_calculada_kmh AS FLOAT64) AS velocidade_calculada_kmh,
+        CAST(distancia_acumulada_km AS FLOAT64) AS distancia_acumulada_km,
+        
+        -- Estação BRT mais próxima dentro do raio (associada na ingestão)
+        NULLIF(TRIM(estacao_id), '') AS estacao_id,
+        CAST(distancia_estacao_m AS FLOAT64) AS distancia_estacao_m,
+        
         -- Categorias
         CASE 
             WHEN UPPER(TRIM(sentido)) = 'I' THEN 'IDA'
@@ -57,46 +90,43 @@ cleaned AS (
         -- Derived fields
         DATE(CAST(dataHora AS TIMESTAMP)) AS data_gps,
         EXTRACT(HOUR FROM CAST(dataHora AS TIMESTAMP)) AS hora_gps,
-        EXTRACT(DAYOFWEEK FROM CAST(dataHora AS TIMESTAMP)) AS dia_semana,
-        
-        -- Data quality flags
-        CASE 
-            WHEN CAST(latitude AS FLOAT64) BETWEEN -90 AND 90 
-             AND CAST(longitude AS FLOAT64) BETWEEN -180 AND 180
-            THEN TRUE
-            ELSE FALSE
-        END AS is_valid_coordinates,
-        
-        CASE 
-            WHEN CAST(velocidade AS FLOAT64) >= 0 
-             AND CAST(velocidade AS FLOAT64) <= 150
-            THEN TRUE
-            ELSE FALSE
-        END AS is_valid_velocity
+        EXTRACT(DAYOFWEEK FROM CAST(dataHora AS TIMESTAMP)) AS dia_semana
 
     FROM source
-    WHERE 
-        -- Filtros básicos de qualidade
-        codigo IS NOT NULL
-        AND placa IS NOT NULL
-        AND latitude IS NOT NULL
-        AND longitude IS NOT NULL
-        AND dataHora IS NOT NULL
+),
+
+new_rows AS (
+    SELECT 
+        *,
+        -- Hash ID para deduplicação (chave composta para garantir unicidade)
+        {{ dbt_utils.generate_surrogate_key([
+            'codigo_veiculo', 
+            'data_hora_gps', 
+            'latitude', 
+            'longitude', 
+            'velocidade_kmh',
+            'data_hora_captura'
+        ]) }} AS id_registro
+        
+    FROM cleaned
+    {{ backfill_filter('data_gps') }}
+)
+
+{% if is_incremental() and not var('backfill_dates', none) %}
+
+-- Run regular: a partição reescrita mantém o que a silver já tinha nela
+, merged AS (
+    SELECT * FROM new_rows
+    UNION ALL
+    SELECT * FROM {{ this }}
+    WHERE data_gps IN (SELECT DISTINCT data_gps FROM new_rows)
 )
 
-SELECT 
-    *,
-    -- Hash ID para deduplicação (chave composta para garantir unicidade)
-    {{ dbt_utils.generate_surrogate_key([
-        'codigo_veiculo', 
-        'data_hora_gps', 
-        'latitude', 
-        'longitude', 
-        'velocidade_kmh',
-        'data_hora_captura'
-    ]) }} AS id_registro
-    
-FROM cleaned
-WHERE 
-    is_valid_coordinates = TRUE
-    AND is_valid_velocity = TRUE
+SELECT * FROM merged
+QUALIFY ROW_NUMBER() OVER (PARTITION BY id_registro ORDER BY data_hora_captura) = 1
+
+{% else %}
+
+SELECT * FROM new_rows
+
+{% endif %}
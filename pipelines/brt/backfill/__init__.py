@@ -0,0 +1,3 @@
+"""
+Flow de backfill histórico dos dados do BRT
+"""
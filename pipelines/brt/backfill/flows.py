@@ -0,0 +1,166 @@
+"""
+Flow de backfill histórico dos dados do BRT
+"""
+import os
+
+from prefect import Flow, Parameter
+from prefect.storage import Local
+from prefect.run_configs import DockerRun
+from prefect.utilities.logging import get_logger
+
+from pipelines.brt.backfill.tasks import (
+    BACKFILL_FULL_REFRESH_MODELS,
+    backfill_days,
+    create_backfill_external_table,
+    list_backfill_files,
+    run_backfill_dbt
+)
+from pipelines.brt.extract_load.tasks import validate_layer
+from pipelines.constants import Constants
+from pipelines.utils.backfill import ARCHIVE_PREFIX
+from pipelines.utils.metrics import flush_metrics_on_finish
+
+
+logger = get_logger()
+
+
+# Configuração do Flow
+with Flow(
+    name="BRT: Historical Backfill",
+    state_handlers=[flush_metrics_on_finish]
+) as brt_backfill_flow:
+    
+    # =========================================================================
+    # PARÂMETROS DO FLOW
+    # =========================================================================
+    
+    # Intervalo fechado de dias (AAAA-MM-DD)
+    start_date = Parameter("start_date", required=True)
+    end_date = Parameter("end_date", required=True)
+    
+    bucket_name = Parameter(
+        "bucket_name",
+        default=os.getenv("GCS_BUCKET_NAME", Constants.GCS_BUCKET_NAME.value),
+        required=False
+    )
+    
+    archive_prefix = Parameter(
+        "archive_prefix",
+        default=ARCHIVE_PREFIX,
+        required=False
+    )
+    
+    # Processos simultâneos (um dia por processo)
+    max_workers = Parameter(
+        "max_workers",
+        default=int(os.getenv("BACKFILL_MAX_WORKERS", os.cpu_count() or 4)),
+        required=False
+    )
+    
+    output_dir = Parameter(
+        "output_dir",
+        default="./data",
+        required=False
+    )
+    
+    stations_path = Parameter(
+        "stations_path",
+        default=os.getenv("BRT_STATIONS_FILE"),
+        required=False
+    )
+    
+    dataset_id = Parameter(
+        "dataset_id",
+        default=Constants.BQ_DATASET_RAW.value,
+        required=False
+    )
+    
+    # =========================================================================
+    # FLOW LOGIC
+    # =========================================================================
+    
+    files_by_day = list_backfill_files(
+        bucket_name=bucket_name,
+        start_date=start_date,
+        end_date=end_date,
+        archive_prefix=archive_prefix
+    )
+    
+    backfill = backfill_days(
+        files_by_day=files_by_day,
+        bucket_name=bucket_name,
+        output_dir=output_dir,
+        max_workers=max_workers,
+        stations_path=stations_path
+    )
+    
+    # Bronze do backfill: external table sobre as partições dt=AAAA-MM-DD
+    bronze_backfill = create_backfill_external_table(
+        project_id="civitas-data-eng",
+        dataset_id="civitas_bronze",
+        table_id="brt_gps_backfill",
+        gcs_uri=backfill["gcs_uri"]
+    )
+    
+    # Silver e gold: só as partições dos dias reprocessados
+    dbt_result = run_backfill_dbt(
+        dataset_id=dataset_id,
+        materialize=True,
+        dbt_vars=backfill["dbt_vars"],
+        select="stg_brt_gps+",
+        exclude=BACKFILL_FULL_REFRESH_MODELS,
+        upstream_tasks=[bronze_backfill]
+    )
+    
+    # Dimensões incrementais: as capturas reprocessadas ficam abaixo da marca
+    # d'água, então são reconstruídas a partir da silver inteira
+    dims_result = run_backfill_dbt(
+        dataset_id=dataset_id,
+        materialize=True,
+        select=BACKFILL_FULL_REFRESH_MODELS,
+        full_refresh=True,
+        upstream_tasks=[dbt_result]
+    )
+    
+    validate_silver = validate_layer(
+        project_id="civitas-data-eng",
+        layer_name="Silver",
+        table_id="civitas_silver.stg_brt_gps",
+        min_records=1,
+        upstream_tasks=[dims_result]
+    )
+
+
+# =========================================================================
+# CONFIGURAÇÃO DE STORAGE E RUN
+# =========================================================================
+
+brt_backfill_flow.storage = Local(
+    path="./pipelines/",
+    stored_as_script=True
+)
+
+brt_backfill_flow.run_config = DockerRun(
+    image="civitas-brt-pipeline:latest",
+    labels=["civitas", "brt", "backfill"]
+)
+
+
+# =========================================================================
+# METADATA
+# =========================================================================
+
+brt_backfill_flow.metadata = {
+    "project": "CIVITAS",
+    "domain": "BRT",
+    "pipeline": "backfill",
+    "version": "1.0.0",
+    "description": "Reprocessamento histórico dos CSVs bronze arquivados, particionado por dia"
+}
+
+
+if __name__ == "__main__":
+    import sys
+    
+    state = brt_backfill_flow.run(parameters={"start_date": sys.argv[1], "end_date": sys.argv[-1]})
+    logger.info(f" Status final: {state}")
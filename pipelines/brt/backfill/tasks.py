@@ -0,0 +1,145 @@
+"""
+Tasks do backfill histórico: reprocessamento dos CSVs bronze arquivados por dia
+"""
+from datetime import timedelta
+from typing import Dict, List, Optional
+import os
+
+from prefect import task
+from prefect.utilities.logging import get_logger
+
+from pipelines.brt.extract_load.tasks import create_bronze_external_table, trigger_dbt_run
+from pipelines.utils.backfill import ARCHIVE_PREFIX, OUTPUT_PREFIX
+from pipelines.utils.checkpoint import without_checkpoint
+from pipelines.utils.metrics import instrumented
+from pipelines.utils.profiling import profiled
+
+
+logger = get_logger()
+
+# Tasks do extract/load sem checkpoint: o backfill não fecha lote de checkpoints
+# e as chamadas repetem os argumentos da captura com outro dado por trás
+create_backfill_external_table = without_checkpoint(create_bronze_external_table)
+run_backfill_dbt = without_checkpoint(trigger_dbt_run)
+
+# Dimensões com marca d'água (macros/incremental_dims.sql): o backfill as reconstrói
+# com --full-refresh em vez do insert_overwrite por partição
+BACKFILL_FULL_REFRESH_MODELS = "dim_brt_linhas dim_brt_veiculos"
+
+
+@task(
+    name="List Archived Files",
+    max_retries=2,
+    retry_delay=timedelta(seconds=15),
+    tags=["backfill", "storage"]
+)
+@instrumented
+@profiled
+def list_backfill_files(
+    bucket_name: str,
+    start_date: str,
+    end_date: str,
+    archive_prefix: str = ARCHIVE_PREFIX
+) -> Dict[str, List]:
+    """
+    Lista os CSVs bronze arquivados no intervalo, agrupados por dia.
+    
+    Args:
+        bucket_name: Nome do bucket GCS
+        start_date: Primeiro dia (AAAA-MM-DD)
+        end_date: Último dia (AAAA-MM-DD, inclusive)
+        archive_prefix: Prefixo do arquivo histórico
+        
+    Returns:
+        {dia: [(blob, md5)]}
+        
+    Raises:
+        ValueError: Intervalo inválido ou sem arquivos
+    """
+    from pipelines.utils.backfill import list_archived_files
+    
+    logger.info(f"🗂️  Listando arquivos de {start_date} a {end_date} em gs://{bucket_name}/{archive_prefix}")
+    
+    files_by_day = list_archived_files(bucket_name, start_date, end_date, archive_prefix)
+    if not files_by_day:
+        raise ValueError(f"Nenhum CSV arquivado entre {start_date} e {end_date}")
+    
+    total = sum(len(files) for files in files_by_day.values())
+    logger.info(f"   ✓ {total} arquivo(s) em {len(files_by_day)} dia(s)")
+    
+    return files_by_day
+
+
+@task(
+    name="Backfill Days",
+    tags=["backfill", "processing"]
+)
+@instrumented
+@profiled
+def backfill_days(
+    files_by_day: Dict[str, List],
+    bucket_name: str,
+    output_dir: str = "./data",
+    max_workers: int = 4,
+    stations_path: Optional[str] = None
+) -> Dict:
+    """
+    Reprocessa os dias em paralelo e grava a saída particionada no GCS.
+    
+    Cada dia roda em um processo: download dos CSVs, normalização,
+    deduplicação, quality gate e derivações (trajeto, estação, geohash),
+    gerando gs://<bucket>/backfill/brt_gps/dt=AAAA-MM-DD/. O manifesto de
+    cada dia concluído fica em <output_dir>/backfill/manifests; ao repetir
+    o backfill, só os dias pendentes (ou com entradas alteradas) rodam.
+    
+    Args:
+        files_by_day: Saída de list_backfill_files
+        bucket_name: Nome do bucket GCS
+        output_dir: Diretório local (trabalho e manifestos)
+        max_workers: Processos simultâneos
+        stations_path: CSV de estações BRT
+        
+    Returns:
+        Dict com dias reprocessados, uri da saída e vars do dbt
+        
+    Raises:
+        RuntimeError: Algum dia falhou (os concluídos já estão no manifesto)
+            ou nenhum dia gerou registros
+    """
+    from pipelines.utils.backfill import run_backfill
+    
+    work_dir = os.path.join(output_dir, "backfill")
+    logger.info(f"⏪ Backfill de {len(files_by_day)} dia(s) com {max_workers} processo(s)")
+    
+    manifests, failures = run_backfill(
+        files_by_day,
+        bucket_name=bucket_name,
+        work_dir=work_dir,
+        max_workers=int(max_workers),
+        stations_path=stations_path
+    )
+    
+    if failures:
+        raise RuntimeError(
+            f"Backfill falhou em {len(failures)} dia(s): {', '.join(sorted(failures))}. "
+            f"Reexecute o flow para retomar ({len(manifests)} dia(s) concluídos)."
+        )
+    
+    days = [m["day"] for m in manifests if m["output_uri"]]
+    if not days:
+        # Sem dias a substituir, o dbt reconstruiria a silver inteira a partir do backfill
+        raise RuntimeError("Backfill não gerou registros aprovados no intervalo")
+    
+    logger.info(
+        f"⏪ Backfill concluído: {len(days)} dia(s), "
+        f"{sum(m['records_out'] for m in manifests)} registros, "
+        f"{sum(m['skipped'] for m in manifests)} retomado(s) do manifesto"
+    )
+    
+    return {
+        "days": days,
+        "records_out": sum(m["records_out"] for m in manifests),
+        "gcs_uri": f"gs://{bucket_name}/{OUTPUT_PREFIX}/*",
+        # Silver lê a tabela do backfill e só as partições desses dias são reconstruídas
+        "dbt_vars": {"bronze_table": "brt_gps_backfill", "backfill_dates": days},
+    }
@@ -0,0 +1,3 @@
+"""
+Flow de compactação dos arquivos bronze arquivados
+"""
@@ -0,0 +1,111 @@
+"""
+Flow de compactação dos arquivos bronze arquivados
+"""
+import os
+
+from prefect import Flow, Parameter
+from prefect.storage import Local
+from prefect.run_configs import DockerRun
+from prefect.utilities.logging import get_logger
+
+from pipelines.brt.compaction.tasks import compact_archived_files
+from pipelines.constants import Constants
+from pipelines.utils.backfill import ARCHIVE_PREFIX
+from pipelines.utils.metrics import flush_metrics_on_finish
+
+
+logger = get_logger()
+
+
+# Configuração do Flow
+with Flow(
+    name="BRT: Compact Archived Files",
+    state_handlers=[flush_metrics_on_finish]
+) as brt_compaction_flow:
+    
+    # =========================================================================
+    # PARÂMETROS DO FLOW
+    # =========================================================================
+    
+    bucket_name = Parameter(
+        "bucket_name",
+        default=os.getenv("GCS_BUCKET_NAME", Constants.GCS_BUCKET_NAME.value),
+        required=False
+    )
+    
+    archive_prefix = Parameter(
+        "archive_prefix",
+        default=ARCHIVE_PREFIX,
+        required=False
+    )
+    
+    # Janela fechada compactada em um arquivo: "hour" ou "day"
+    granularity = Parameter(
+        "granularity",
+        default=os.getenv("COMPACTION_GRANULARITY", "hour"),
+        required=False
+    )
+    
+    lookback_days = Parameter(
+        "lookback_days",
+        default=int(os.getenv("COMPACTION_LOOKBACK_DAYS", "3")),
+        required=False
+    )
+    
+    output_format = Parameter(
+        "output_format",
+        default=os.getenv("COMPACTION_FORMAT", "parquet"),
+        required=False
+    )
+    
+    output_dir = Parameter(
+        "output_dir",
+        default="./data",
+        required=False
+    )
+    
+    # =========================================================================
+    # FLOW LOGIC
+    # =========================================================================
+    
+    compaction = compact_archived_files(
+        bucket_name=bucket_name,
+        archive_prefix=archive_prefix,
+        granularity=granularity,
+        lookback_days=lookback_days,
+        output_dir=output_dir,
+        output_format=output_format
+    )
+
+
+# =========================================================================
+# CONFIGURAÇÃO DE STORAGE E RUN
+# =========================================================================
+
+brt_compaction_flow.storage = Local(
+    path="./pipelines/",
+    stored_as_script=True
+)
+
+brt_compaction_flow.run_config = DockerRun(
+    image="civitas-brt-pipeline:latest",
+    labels=["civitas", "brt", "maintenance"]
+)
+
+
+# =========================================================================
+# METADATA
+# =========================================================================
+
+brt_compaction_flow.metadata = {
+    "project": "CIVITAS",
+    "domain": "BRT",
+    "pipeline": "compaction",
+    "version": "1.0.0",
+    "description": "Compactação de janelas fechadas do arquivo bronze em arquivos colunares"
+}
+
+
+if __name__ == "__main__":
+    state = brt_compaction_flow.run()
+    logger.info(f" Status final: {state}")
@@ -0,0 +1,117 @@
+"""
+Tasks de compactação dos CSVs bronze arquivados
+"""
+from datetime import date, timedelta
+from typing import Dict
+import os
+
+from prefect import task
+from prefect.utilities.logging import get_logger
+
+from pipelines.utils.backfill import ARCHIVE_PREFIX
+from pipelines.utils.metrics import get_registry, instrumented
+from pipelines.utils.profiling import profiled
+
+
+logger = get_logger()
+
+
+@task(
+    name="Compact Archived Files",
+    max_retries=1,
+    retry_delay=timedelta(seconds=30),
+    tags=["storage", "maintenance"]
+)
+@instrumented
+@profiled
+def compact_archived_files(
+    bucket_name: str,
+    archive_prefix: str = ARCHIVE_PREFIX,
+    granularity: str = "hour",
+    lookback_days: int = 3,
+    min_files: int = 2,
+    output_dir: str = "./data",
+    output_format: str = "parquet"
+) -> Dict:
+    """
+    Compacta as janelas fechadas das partições recentes do arquivo bronze.
+    
+    Cada janela (hora ou dia) com pelo menos `min_files` CSVs vira um único
+    arquivo Parquet (zstd) ou CSV gzip em
+    <archive_prefix>/dt=AAAA-MM-DD/compact_<janela>_<checksum>.<ext>. Os
+    originais só são removidos depois de o compactado ser relido do GCS e
+    conferido por linhas e checksum, e da gravação do manifesto da janela.
+    
+    Args:
+        bucket_name: Nome do bucket GCS
+        archive_prefix: Prefixo do arquivo histórico
+        granularity: Janela de compactação ("hour" ou "day")
+        lookback_days: Dias (a partir de hoje, para trás) verificados
+        min_files: Mínimo de arquivos para compactar uma janela
+        output_dir: Diretório local de trabalho
+        output_format: "parquet" (requer pyarrow) ou "csv.gz"
+        
+    Returns:
+        Dict com janelas compactadas, arquivos removidos e bytes antes/depois
+        
+    Raises:
+        ValueError: Granularidade ou formato inválidos
+    """
+    from pipelines.utils.compaction import WINDOW_FORMATS, compact_partition, parquet_available
+    from pipelines.utils.gcp import get_gcs_client
+    
+    if granularity not in WINDOW_FORMATS:
+        raise ValueError(f"Granularidade inválida: {granularity} (use {', '.join(WINDOW_FORMATS)})")
+    if output_format not in ("parquet", "csv.gz"):
+        raise ValueError(f"Formato inválido: {output_format}")
+    if output_format == "parquet" and not parquet_available():
+        logger.warning("⚠️  pyarrow não instalado, compactando em CSV gzip")
+        output_format = "csv.gz"
+    
+    bucket = get_gcs_client().bucket(bucket_name)
+    work_dir = os.path.join(output_dir, "compaction")
+    registry = get_registry()
+    
+    stats = {"windows": 0, "files_compacted": 0, "files_deleted": 0, "rows": 0, "failed": []}
+    
+    today = date.today()
+    for offset in range(int(lookback_days), -1, -1):
+        day = (today - timedelta(days=offset)).isoformat()
+        partition_prefix = f"{archive_prefix.rstrip('/')}/dt={day}/"
+        
+        try:
+            manifests, resumed = compact_partition(
+                bucket,
+                partition_prefix,
+                granularity=granularity,
+                min_files=int(min_files),
+                work_dir=work_dir,
+                output_format=output_format
+            )
+        except Exception as e:
+            # Uma janela que não confere não impede as demais partições
+            logger.error(f"   ❌ {day}: {str(e)}")
+            stats["failed"].append(day)
+            continue
+        
+        stats["files_deleted"] += resumed
+        for manifest in manifests:
+            stats["windows"] += 1
+            stats["files_compacted"] += len(manifest["originals"])
+            stats["files_deleted"] += manifest["deleted"]
+            stats["rows"] += manifest["rows"]
+            registry.inc("pipeline_compaction_files", len(manifest["originals"]))
+            logger.info(
+                f"   🗜️  {day} {manifest['window']}: {len(manifest['originals'])} arquivos → "
+                f"{os.path.basename(manifest['output'])} ({manifest['rows']} linhas)"
+            )
+    
+    logger.info(
+        f"🗜️  Compactação: {stats['windows']} janela(s), {stats['files_compacted']} arquivo(s) compactado(s), "
+        f"{stats['files_deleted']} removido(s)"
+    )
+    
+    if stats["failed"]:
+        raise RuntimeError(f"Compactação falhou em: {', '.join(stats['failed'])}")
+    
+    return stats
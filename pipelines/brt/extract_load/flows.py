@@ -5,7 +5,8 @@ from datetime import datetime, timedelta
 import os
 from typing import Optional
 
-from prefect import Flow, Parameter, task, unmapped
+from prefect import Flow, Parameter, case, task, unmapped
+from prefect.tasks.control_flow import merge
 from prefect.storage import Local
 from prefect.run_configs import DockerRun
 from prefect.utilities.logging import get_logger
@@ -13,6 +14,9 @@ from prefect.utilities.logging import get_logger
 from pipelines.brt.extract_load.tasks import (
     fetch_brt_gps_data,
     accumulate_data,
+    apply_quality_gate,
+    update_hourly_aggregates,
+    merge_hourly_aggregates,
     generate_csv,
     upload_csv_to_gcs,
     cleanup_local_file,
@@ -21,9 +25,15 @@ from pipelines.brt.extract_load.tasks import (
     validate_layer,
     clean_old_csvs,
     create_bronze_external_table,
-    create_gold_tables
+    load_csv_to_bronze_native,
+    create_gold_tables,
+    estimate_bigquery_cost,
+    summarize_bigquery_costs,
+    enqueue_for_transform,
+    complete_checkpoint_batch
 )
 from pipelines.constants import Constants
+from pipelines.utils.metrics import flush_metrics_on_finish
 
 
 logger = get_logger()
@@ -31,7 +41,8 @@ logger = get_logger()
 
 # Configurao do Flow
 with Flow(
-    name="BRT: Extract and Load GPS Data"
+    name="BRT: Extract and Load GPS Data",
+    state_handlers=[flush_metrics_on_finish]
 ) as brt_extract_load_flow:
     
     # =========================================================================
@@ -45,6 +56,39 @@ with Flow(
         required=False
     )
     
+    # Polling adaptativo: janela de captura (0 = uma requisição por run) e limites do intervalo
+    capture_window_seconds = Parameter(
+        "capture_window_seconds",
+        default=float(os.getenv("CAPTURE_WINDOW_SECONDS", "0")),
+        required=False
+    )
+    
+    poll_min_interval = Parameter(
+        "poll_min_interval",
+        default=float(os.getenv("POLL_MIN_INTERVAL_SECONDS", Constants.POLL_MIN_INTERVAL_SECONDS.value)),
+        required=False
+    )
+    
+    poll_max_interval = Parameter(
+        "poll_max_interval",
+        default=float(os.getenv("POLL_MAX_INTERVAL_SECONDS", Constants.POLL_MAX_INTERVAL_SECONDS.value)),
+        required=False
+    )
+    
+    # Endpoint local de última posição por veículo/linha (0 = desligado), como na
+    # captura multi-feed; serve enquanto o processo do agente viver
+    positions_port = Parameter(
+        "positions_port",
+        default=int(os.getenv("POSITIONS_PORT", "0")),
+        required=False
+    )
+    
+    positions_host = Parameter(
+        "positions_host",
+        default=os.getenv("POSITIONS_HOST", "127.0.0.1"),
+        required=False
+    )
+    
     # GCS Configuration
     bucket_name = Parameter(
         "bucket_name",
@@ -58,6 +102,27 @@ with Flow(
         required=False
     )
     
+    # Serializa o CSV direto em upload resumível para o GCS (arquivo local só em falha)
+    stream_upload = Parameter(
+        "stream_upload",
+        default=os.getenv("STREAM_UPLOAD", "false").lower() == "true",
+        required=False
+    )
+    
+    # Saltos de GPS por veículo: "drop" (quarentena), "flag" (só contados) ou "off"
+    teleport_action = Parameter(
+        "teleport_action",
+        default=os.getenv("GPS_TELEPORT_ACTION", "drop"),
+        required=False
+    )
+    
+    # Linhas por bloco na gravação do CSV local (0 = lote inteiro em memória)
+    csv_chunk_rows = Parameter(
+        "csv_chunk_rows",
+        default=int(os.getenv("CSV_CHUNK_ROWS", "0")),
+        required=False
+    )
+    
     # Local Storage
     output_dir = Parameter(
         "output_dir",
@@ -65,6 +130,13 @@ with Flow(
         required=False
     )
     
+    # Estações BRT (CSV local com estacao_id, latitude, longitude)
+    stations_path = Parameter(
+        "stations_path",
+        default=os.getenv("BRT_STATIONS_FILE"),
+        required=False
+    )
+    
     # GCP Credentials
     credentials_path = Parameter(
         "credentials_path",
@@ -85,6 +157,72 @@ with Flow(
         required=False
     )
     
+    # Profiling opcional: tasks separadas por vírgula (ex: "generate_csv,trigger_dbt_run") ou "all"
+    profile_tasks = Parameter(
+        "profile_tasks",
+        default=os.getenv("PIPELINE_PROFILE_TASKS", ""),
+        required=False
+    )
+    # Lido pelo decorator @profiled via contexto do flow run (não é input de task)
+    brt_extract_load_flow.add_task(profile_tasks)
+    
+    # Contabilidade BigQuery: dry-run do run inteiro e orçamento de bytes faturados
+    # (lidos por pipelines.utils.bq_accounting via contexto do flow run). Em
+    # dry-run nenhuma etapa altera dados: sem limpeza do GCS, upload, criação de
+    # tabela, load job ou enfileiramento; queries e dbt só estimam/compilam
+    bq_dry_run = Parameter(
+        "bq_dry_run",
+        default=os.getenv("BQ_DRY_RUN", "false"),
+        required=False
+    )
+    brt_extract_load_flow.add_task(bq_dry_run)
+    
+    bq_max_bytes = Parameter(
+        "bq_max_bytes",
+        default=os.getenv("BQ_MAX_BYTES_PER_RUN"),
+        required=False
+    )
+    brt_extract_load_flow.add_task(bq_max_bytes)
+    
+    bq_estimate_cost = Parameter(
+        "bq_estimate_cost",
+        default=os.getenv("BQ_ESTIMATE_COST", "false").lower() == "true",
+        required=False
+    )
+    
+    # Transform: "inline" (dbt + gold neste run) ou "triggered" (flow de
+    # transform, alimentado pela fila local; a captura não espera o dbt). Só use
+    # "triggered" com o flow "BRT: Transform on New Bronze Data" agendado
+    # (pipelines.brt.transform.schedules): sem ele a bronze nunca é transformada
+    transform_mode = Parameter(
+        "transform_mode",
+        default=os.getenv("TRANSFORM_MODE", "inline"),
+        required=False
+    )
+    
+    # Bronze sink: "external" (external table sobre o GCS) ou "native" (load jobs)
+    bronze_sink = Parameter(
+        "bronze_sink",
+        default=os.getenv("BRONZE_SINK", "external"),
+        required=False
+    )
+    
+    # Checkpoints de tasks: validade (horas, 0 desliga) e lote forçado
+    # (lidos por pipelines.utils.checkpoint via contexto do flow run)
+    checkpoint_ttl_hours = Parameter(
+        "checkpoint_ttl_hours",
+        default=os.getenv("PIPELINE_CHECKPOINT_TTL_HOURS", "6"),
+        required=False
+    )
+    brt_extract_load_flow.add_task(checkpoint_ttl_hours)
+    
+    checkpoint_batch = Parameter(
+        "checkpoint_batch",
+        default=os.getenv("PIPELINE_CHECKPOINT_BATCH"),
+        required=False
+    )
+    brt_extract_load_flow.add_task(checkpoint_batch)
+    
     # =========================================================================
     # FLOW LOGIC - PIPELINE AUTOMATIZADO COM LIMPEZA E VALIDAÇÕES
     # =========================================================================
@@ -92,12 +230,32 @@ with Flow(
     # Task 0: LIMPEZA COMPLETA - Remove todos CSVs locais e do GCS
     cleanup_all = cleanup_all_data(
         bucket_name=bucket_name,
-        local_data_dir=output_dir
+        local_data_dir=output_dir,
+        transform_mode=transform_mode
+    )
+    
+    # Estimativa de custo BigQuery (dry-run) antes de qualquer job real
+    cost_estimate = estimate_bigquery_cost(
+        project_id="civitas-data-eng",
+        validation_tables=[
+            "civitas_silver.stg_brt_gps",
+            "civitas_gold.dim_brt_linhas",
+            "civitas_gold.dim_brt_veiculos",
+            "civitas_gold.fct_brt_viagens",
+            "civitas_gold.agg_metricas_horarias"
+        ],
+        enabled=bq_estimate_cost
     )
     
     # Task 1: Capturar dados da API
     gps_data = fetch_brt_gps_data(
         api_url=api_url,
+        capture_window_seconds=capture_window_seconds,
+        min_interval_s=poll_min_interval,
+        max_interval_s=poll_max_interval,
+        output_dir=output_dir,
+        positions_port=positions_port,
+        positions_host=positions_host,
         upstream_tasks=[cleanup_all]
     )
     
@@ -107,14 +265,39 @@ with Flow(
         accumulated_data=None
     )
     
-    # Task 3: Gerar arquivo CSV
-    csv_path = generate_csv(
+    # Task 3: Quality gate (rejeitados vão para quarentena, não sobem ao GCS)
+    clean_data, quality_report = apply_quality_gate(
         data=accumulated,
         output_dir=output_dir,
-        filename_prefix="brt_gps"
+        filename_prefix="brt_gps",
+        teleport_action=teleport_action
+    )
+    
+    # Agregados horários incrementais: delta do lote mesclado direto no gold
+    aggregates_delta = update_hourly_aggregates(
+        data=clean_data,
+        output_dir=output_dir
     )
     
-    # Task 4: Upload para GCS
+    aggregates_merged = merge_hourly_aggregates(
+        project_id="civitas-data-eng",
+        delta_path=aggregates_delta
+    )
+    
+    # Task 4: Gerar arquivo CSV
+    csv_path = generate_csv(
+        data=clean_data,
+        output_dir=output_dir,
+        filename_prefix="brt_gps",
+        stations_path=stations_path,
+        stream_upload=stream_upload,
+        bucket_name=bucket_name,
+        destination_prefix=gcs_destination_prefix,
+        credentials_path=credentials_path,
+        chunk_rows=csv_chunk_rows
+    )
+    
+    # Task 5: Upload para GCS
     gcs_uri = upload_csv_to_gcs(
         csv_filepath=csv_path,
         bucket_name=bucket_name,
@@ -123,84 +306,122 @@ with Flow(
         upstream_tasks=[csv_path]
     )
     
-    # Task 5: Criar Bronze External Table
-    bronze_table = create_bronze_external_table(
-        project_id="civitas-data-eng",
-        dataset_id="civitas_bronze",
-        table_id="brt_gps_external",
-        gcs_uri="gs://civitas-brt-data/bronze/brt_gps/*.csv",
-        upstream_tasks=[gcs_uri]
-    )
+    # Task 6: Bronze - External Table (padrão) ou tabela nativa via load job
+    with case(bronze_sink, "external"):
+        bronze_external = create_bronze_external_table(
+            project_id="civitas-data-eng",
+            dataset_id="civitas_bronze",
+            table_id="brt_gps_external",
+            gcs_uri="gs://civitas-brt-data/bronze/brt_gps/*.csv",
+            upstream_tasks=[gcs_uri, cost_estimate]
+        )
     
-    # Task 6: VALIDAÇÃO Bronze
-    validate_bronze = validate_layer(
-        project_id="civitas-data-eng",
-        layer_name="Bronze",
-        table_id="civitas_bronze.brt_gps_external",
-        min_records=1,
-        upstream_tasks=[bronze_table]
-    )
+    with case(bronze_sink, "native"):
+        bronze_native = load_csv_to_bronze_native(
+            project_id="civitas-data-eng",
+            dataset_id="civitas_bronze",
+            table_id="brt_gps",
+            gcs_uri=gcs_uri,
+            upstream_tasks=[cost_estimate]
+        )
     
-    # Task 7: Trigger DBT para Silver
-    dbt_result = trigger_dbt_run(
-        dataset_id=dataset_id,
-        materialize=True,
-        upstream_tasks=[validate_bronze]
-    )
+    bronze_table = merge(bronze_external, bronze_native)
     
-    # Task 8: VALIDAÇÃO Silver
-    validate_silver = validate_layer(
+    # Task 7: VALIDAÇÃO Bronze
+    validate_bronze = validate_layer(
         project_id="civitas-data-eng",
-        layer_name="Silver",
-        table_id="civitas_silver.stg_brt_gps",
-        min_records=1,
-        upstream_tasks=[dbt_result]
+        layer_name="Bronze",
+        table_id=bronze_table["table_id"],
+        min_records=1
     )
     
-    # Task 9: Criar Gold Tables
-    gold_tables = create_gold_tables(
-        project_id="civitas-data-eng",
-        upstream_tasks=[validate_silver]
-    )
+    # Tasks 8-11: transform no próprio run (modo "inline")
+    with case(transform_mode, "inline"):
+        # Task 8: Trigger DBT para Silver (lendo a tabela bronze escolhida)
+        dbt_result = trigger_dbt_run(
+            dataset_id=dataset_id,
+            materialize=True,
+            dbt_vars={"bronze_table": bronze_table["name"]},
+            upstream_tasks=[validate_bronze]
+        )
+        
+        # Task 9: VALIDAÇÃO Silver
+        validate_silver = validate_layer(
+            project_id="civitas-data-eng",
+            layer_name="Silver",
+            table_id="civitas_silver.stg_brt_gps",
+            min_records=1,
+            upstream_tasks=[dbt_result]
+        )
+        
+        # Task 10: Criar Gold Tables
+        gold_tables = create_gold_tables(
+            project_id="civitas-data-eng",
+            upstream_tasks=[validate_silver]
+        )
+        
+        # Task 11: VALIDAÇÕES Gold (4 tabelas)
+        validate_gold_linhas = validate_layer(
+            project_id="civitas-data-eng",
+            layer_name="Gold - Linhas",
+            table_id="civitas_gold.dim_brt_linhas",
+            min_records=1,
+            upstream_tasks=[gold_tables]
+        )
+        
+        validate_gold_veiculos = validate_layer(
+            project_id="civitas-data-eng",
+            layer_name="Gold - Veículos",
+            table_id="civitas_gold.dim_brt_veiculos",
+            min_records=1,
+            upstream_tasks=[gold_tables]
+        )
+        
+        validate_gold_viagens = validate_layer(
+            project_id="civitas-data-eng",
+            layer_name="Gold - Viagens",
+            table_id="civitas_gold.fct_brt_viagens",
+            min_records=1,
+            upstream_tasks=[gold_tables]
+        )
+        
+        validate_gold_metricas = validate_layer(
+            project_id="civitas-data-eng",
+            layer_name="Gold - Métricas",
+            table_id="civitas_gold.agg_metricas_horarias",
+            min_records=1,
+            upstream_tasks=[gold_tables, validate_gold_linhas, validate_gold_veiculos, validate_gold_viagens]
+        )
     
-    # Task 10: VALIDAÇÕES Gold (4 tabelas)
-    validate_gold_linhas = validate_layer(
-        project_id="civitas-data-eng",
-        layer_name="Gold - Linhas",
-        table_id="civitas_gold.dim_brt_linhas",
-        min_records=1,
-        upstream_tasks=[gold_tables]
-    )
+    # Modo "triggered": o flow de transform coalesce as capturas pendentes
+    with case(transform_mode, "triggered"):
+        transform_deferred = enqueue_for_transform(
+            gcs_uri=gcs_uri,
+            output_dir=output_dir,
+            upstream_tasks=[validate_bronze]
+        )
     
-    validate_gold_veiculos = validate_layer(
-        project_id="civitas-data-eng",
-        layer_name="Gold - Veículos",
-        table_id="civitas_gold.dim_brt_veiculos",
-        min_records=1,
-        upstream_tasks=[gold_tables]
-    )
+    transform_done = merge(validate_gold_metricas, transform_deferred)
     
-    validate_gold_viagens = validate_layer(
-        project_id="civitas-data-eng",
-        layer_name="Gold - Viagens",
-        table_id="civitas_gold.fct_brt_viagens",
-        min_records=1,
-        upstream_tasks=[gold_tables]
+    # Task 12: Cleanup local (após validações)
+    cleanup = cleanup_local_file(
+        filepath=csv_path,
+        keep_file=keep_local_file,
+        upstream_tasks=[transform_done]
     )
     
-    validate_gold_metricas = validate_layer(
-        project_id="civitas-data-eng",
-        layer_name="Gold - Métricas",
-        table_id="civitas_gold.agg_metricas_horarias",
-        min_records=1,
-        upstream_tasks=[gold_tables]
+    # Fecha o lote de checkpoints (um run com falha deixa o lote aberto para o seu retry)
+    checkpoint_done = complete_checkpoint_batch(
+        upstream_tasks=[
+            cleanup,
+            aggregates_merged,
+            transform_done
+        ]
     )
     
-    # Task 11: Cleanup local (após validações)
-    cleanup = cleanup_local_file(
-        filepath=csv_path,
-        keep_file=keep_local_file,
-        upstream_tasks=[validate_gold_metricas]
+    # Consolidação do custo BigQuery do run
+    bq_costs = summarize_bigquery_costs(
+        upstream_tasks=[transform_done]
     )
 
 
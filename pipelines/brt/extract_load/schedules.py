@@ -57,6 +57,34 @@ brt_with_dbt_schedule = Schedule(
 )
 
 
+# =========================================================================
+# SCHEDULE: Captura Adaptativa (janela de 10 minutos com polling adaptativo)
+# =========================================================================
+
+# Um run a cada 10 minutos; dentro da janela o intervalo entre requisições
+# acompanha a cadência do feed (mais curto no pico, mais longo de madrugada)
+brt_adaptive_schedule = Schedule(
+    clocks=[
+        IntervalClock(
+            interval=timedelta(minutes=Constants.CSV_GENERATION_MINUTES.value),
+            parameter_defaults={
+                "api_url": Constants.BRT_API_URL.value,
+                "bucket_name": Constants.GCS_BUCKET_NAME.value,
+                "gcs_destination_prefix": "bronze/brt_gps",
+                "output_dir": "./data",
+                "keep_local_file": True,
+                "dataset_id": Constants.BQ_DATASET_RAW.value,
+                # Folga de 1 minuto para upload e carga antes do próximo run
+                "capture_window_seconds": (Constants.CSV_GENERATION_MINUTES.value - 1) * 60,
+                "poll_min_interval": Constants.POLL_MIN_INTERVAL_SECONDS.value,
+                "poll_max_interval": Constants.POLL_MAX_INTERVAL_SECONDS.value
+            },
+            labels=["civitas", "brt", "scheduled", "adaptive"]
+        )
+    ]
+)
+
+
 # =========================================================================
 # SCHEDULE: Desenvolvimento/Testes (a cada 5 minutos)
 # =========================================================================
@@ -88,5 +116,6 @@ brt_dev_schedule = Schedule(
 __all__ = [
     "brt_minute_schedule",
     "brt_with_dbt_schedule",
+    "brt_adaptive_schedule",
     "brt_dev_schedule"
 ]
@@ -2,77 +2,213 @@
 Tasks para extrao e carga de dados do BRT
 """
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 import os
 import json
+import time
 
-import requests
-import pandas as pd
 from prefect import task
+from prefect.triggers import all_finished
 from prefect.utilities.logging import get_logger
 
-from pipelines.utils.gcp import upload_to_gcs
+from pipelines.utils.gcp import load_gcs_csv_to_table, upload_if_changed
+from pipelines.utils.bq_accounting import (
+    compiled_dbt_models,
+    enforce_budget,
+    estimate_queries,
+    is_dry_run,
+    record_dbt_run_results,
+    run_query,
+    run_totals
+)
+from pipelines.utils.backfill import archive_blob_name
+from pipelines.utils.bronze import (
+    bronze_schema,
+    stream_bronze_csv,
+    write_bronze_csv,
+    write_bronze_csv_chunked,
+    write_quarantine
+)
+from pipelines.utils.checkpoint import checkpointed, complete_batch
+from pipelines.utils.feeds import get_feed, request_feed
+from pipelines.utils.handoff_queue import TransformQueue, report_queue, transform_queue_dir
+from pipelines.utils.metrics import get_registry, instrumented, record_bytes_uploaded, record_bytes_written
+from pipelines.utils.polling import (
+    DEFAULT_MAX_INTERVAL_S,
+    DEFAULT_MIN_INTERVAL_S,
+    load_poller,
+    parse_retry_after,
+    save_poller
+)
+from pipelines.utils.profiling import profiled
+from pipelines.utils.transform_trigger import read_transform_state, transform_state_path
+from pipelines.constants import Constants
+
+# pandas, requests e os utilitários numéricos (numpy) são importados dentro
+# das tasks que os usam: o import deste módulo (registro do flow, início do
+# agent) não paga esse custo
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 logger = get_logger()
 
 
+# Diretório do projeto DBT dentro do container
+DBT_DIR = "/app/dbt"
+
+# Buckets (segundos) do histograma de intervalo do polling adaptativo
+POLL_INTERVAL_BUCKETS = (5.0, 10.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _request_brt_gps(api_url: str) -> List[Dict]:
+    """
+    Faz uma requisição à API do BRT e retorna os registros com timestamp_captura.
+    
+    Raises:
+        requests.RequestException: Erro na requisição HTTP
+    """
+    return request_feed(get_feed("brt"), url=api_url)
+
+
 @task(
     name="Fetch BRT GPS Data",
     max_retries=3,
-    retry_delay=pd.Timedelta(seconds=10),
+    retry_delay=timedelta(seconds=10),
     tags=["extraction", "api"]
 )
-def fetch_brt_gps_data(api_url: str) -> List[Dict]:
+@checkpointed
+@instrumented
+@profiled
+def fetch_brt_gps_data(
+    api_url: str,
+    capture_window_seconds: float = 0,
+    min_interval_s: float = DEFAULT_MIN_INTERVAL_S,
+    max_interval_s: float = DEFAULT_MAX_INTERVAL_S,
+    output_dir: str = "./data",
+    state_dir: Optional[str] = None,
+    positions_port: int = 0,
+    positions_host: Optional[str] = None
+) -> List[Dict]:
     """
     Faz requisio  API do BRT e retorna os dados de GPS dos veculos.
     
+    Com `capture_window_seconds` > 0, faz polling adaptativo durante a janela:
+    o intervalo entre requisições acompanha a fração da frota cujo dataHora
+    avançou (entre os limites informados), respeita Retry-After em 429/503 e
+    só acumula registros com dataHora novo. Um poll que falha (erro HTTP,
+    conexão ou JSON inválido) alonga o intervalo e a janela segue com os
+    registros já acumulados; a task só falha se nenhum poll tiver sucesso.
+    O estado do poller é mantido em <state_dir>/polling_state.json entre runs.
+    
+    O snapshot fica no checkpoint do lote: um retry do mesmo flow run
+    reaproveita os registros já capturados em vez de consultar a API de
+    novo, então as entradas (e os checkpoints) das tasks seguintes não mudam.
+    
+    Cada resposta também atualiza a última posição por veículo do feed
+    "brt" em memória, servida com `positions_port` como na captura
+    multi-feed (pipelines.utils.positions).
+    
     Args:
         api_url: URL da API do BRT
+        capture_window_seconds: Duração da janela de captura (0 = uma requisição)
+        min_interval_s: Menor intervalo entre requisições
+        max_interval_s: Maior intervalo entre requisições
+        output_dir: Diretório local de saída
+        state_dir: Diretório do estado do poller (padrão: <output_dir>/state)
+        positions_port: Porta do endpoint de posições (0 = desligado)
+        positions_host: Interface do endpoint (padrão: POSITIONS_HOST ou 127.0.0.1)
         
     Returns:
         Lista de dicionrios com dados de GPS dos veculos
         
     Raises:
-        requests.RequestException: Erro na requisio HTTP
+        requests.RequestException: Erro na requisio HTTP (ou em todos os polls da janela)
+        ValueError: Resposta inválida (ou em todos os polls da janela)
     """
+    import requests
+    
+    from pipelines.utils.positions import start_position_server, update_positions
+    
     logger.info(f"Iniciando captura de dados da API: {api_url}")
     
-    try:
-        response = requests.get(api_url, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        timestamp_captura = datetime.now().isoformat()
-        
-        if isinstance(data, dict) and 'veiculos' in data:
-            veiculos = data['veiculos']
-            for record in veiculos:
-                record['timestamp_captura'] = timestamp_captura
+    if positions_port:
+        start_position_server(host=positions_host, port=int(positions_port))
+    
+    if not capture_window_seconds:
+        try:
+            veiculos = _request_brt_gps(api_url)
+            update_positions("brt", veiculos)
             logger.info(f"Capturados {len(veiculos)} registros de veculos")
             return veiculos
-        elif isinstance(data, list):
-            for record in data:
-                record['timestamp_captura'] = timestamp_captura
-            logger.info(f"Capturados {len(data)} registros de veculos")
-            return data
+        except requests.RequestException as e:
+            logger.error(f"Erro ao buscar dados da API: {str(e)}")
+            raise
+        except json.JSONDecodeError as e:
+            logger.error(f"Erro ao decodificar JSON: {str(e)}")
+            raise
+    
+    state_path = os.path.join(state_dir or os.path.join(output_dir, "state"), "polling_state.json")
+    poller = load_poller(state_path, min_interval=float(min_interval_s), max_interval=float(max_interval_s))
+    registry = get_registry()
+    
+    records: List[Dict] = []
+    polls = 0
+    last_error: Optional[Exception] = None
+    deadline = time.monotonic() + float(capture_window_seconds)
+    
+    while True:
+        try:
+            snapshot = _request_brt_gps(api_url)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status in (429, 503):
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                wait = poller.rate_limited(retry_after)
+                registry.inc("pipeline_capture_rate_limited", status=status)
+                logger.warning(f"   ⏳ API limitou requisições ({status}), aguardando {wait:.0f}s")
+            else:
+                last_error = e
+                wait = poller.rate_limited()
+                registry.inc("pipeline_capture_errors")
+                logger.error(f"   ❌ Erro ao buscar dados da API: {str(e)}, nova tentativa em {wait:.0f}s")
+        except (requests.RequestException, ValueError) as e:
+            last_error = e
+            wait = poller.rate_limited()
+            registry.inc("pipeline_capture_errors")
+            logger.error(f"   ❌ Erro ao buscar dados da API: {str(e)}, nova tentativa em {wait:.0f}s")
         else:
-            logger.warning(f"Formato inesperado da API. Tipo: {type(data)}")
-            return []
-            
-    except requests.RequestException as e:
-        logger.error(f"Erro ao buscar dados da API: {str(e)}")
-        raise
-    except json.JSONDecodeError as e:
-        logger.error(f"Erro ao decodificar JSON: {str(e)}")
-        raise
+            polls += 1
+            new_records = poller.observe(snapshot)
+            records.extend(new_records)
+            update_positions("brt", new_records)
+            wait = poller.interval
+            registry.inc("pipeline_capture_polls")
+            registry.observe("pipeline_capture_interval_seconds", wait, buckets=POLL_INTERVAL_BUCKETS)
+            logger.info(
+                f"   📡 Poll {polls}: {len(snapshot)} veículos, {len(new_records)} novos "
+                f"(avanço {poller.advance_fraction or 0:.0%}), próximo em {wait:.0f}s"
+            )
+        
+        if time.monotonic() + wait >= deadline:
+            break
+        time.sleep(wait)
+    
+    save_poller(poller, state_path)
+    if polls == 0 and last_error is not None:
+        raise last_error
+    logger.info(f"Capturados {len(records)} registros novos em {polls} polls")
+    
+    return records
 
 
 @task(
     name="Accumulate Data",
     tags=["processing"]
 )
+@checkpointed
+@instrumented
+@profiled
 def accumulate_data(
     current_data: List[Dict],
     accumulated_data: Optional[List[Dict]] = None
@@ -97,69 +233,265 @@ def accumulate_data(
     return accumulated_data
 
 
+@task(
+    name="Apply Quality Gate",
+    nout=2,
+    tags=["processing", "quality"]
+)
+@checkpointed
+@instrumented
+@profiled
+def apply_quality_gate(
+    data: List[Dict],
+    output_dir: str = "./data",
+    filename_prefix: str = "brt_gps",
+    track_state_dir: Optional[str] = None,
+    teleport_action: str = "drop"
+) -> Tuple["pd.DataFrame", Dict]:
+    """
+    Aplica as regras de qualidade ao lote acumulado antes de gerar o CSV.
+    
+    As mesmas regras da silver (campos obrigatórios, coordenadas e velocidade
+    válidas) e o bounding box do Rio são avaliados como máscaras sobre o lote
+    inteiro. Registros rejeitados vão para um CSV de quarentena com o motivo,
+    e as contagens por regra são gravadas em um relatório JSON.
+    
+    Saltos de GPS (fix a uma velocidade implícita impossível do último fix
+    aceito do veículo, lido do estado de trajeto) caem na regra gps_teleport.
+    
+    Args:
+        data: Lista de dicionários com dados acumulados
+        output_dir: Diretório de saída (quarentena em <output_dir>/quarantine)
+        filename_prefix: Prefixo dos arquivos de quarentena
+        track_state_dir: Diretório do estado de trajeto (padrão: <output_dir>/state)
+        teleport_action: Saltos de GPS: "drop" (quarentena), "flag" (só contados) ou "off"
+        
+    Returns:
+        Tupla (DataFrame com registros aprovados, relatório de qualidade)
+    """
+    import pandas as pd
+    
+    from pipelines.utils.quality import split_by_quality
+    
+    df = pd.DataFrame(data or [])
+    
+    if track_state_dir is None:
+        track_state_dir = os.path.join(output_dir, "state")
+    accepted, rejected, counts = split_by_quality(
+        df,
+        track_state_path=os.path.join(track_state_dir, "track_state.csv"),
+        teleport_action=teleport_action
+    )
+    
+    report = {
+        "records_in": len(df),
+        "records_accepted": len(accepted),
+        "records_rejected": len(rejected),
+        "rejections_by_rule": counts,
+        "quarantine_file": None
+    }
+    
+    logger.info(f"🔎 Qualidade: {len(accepted)} aprovados | {len(rejected)} rejeitados de {len(df)}")
+    for rule, count in counts.items():
+        if count:
+            logger.warning(f"   ⚠️  {rule}: {count} registro(s)")
+    
+    if len(rejected) > 0:
+        quarantine_path = write_quarantine(rejected, report, output_dir, filename_prefix)
+        logger.info(f"   🗃️  Quarentena: {quarantine_path}")
+    
+    return accepted, report
+
+
+@task(
+    name="Update Hourly Aggregates",
+    tags=["aggregation", "gold"]
+)
+@checkpointed
+@instrumented
+@profiled
+def update_hourly_aggregates(
+    data: Union[List[Dict], "pd.DataFrame"],
+    output_dir: str = "./data"
+) -> Optional[str]:
+    """
+    Atualiza os agregados horários incrementais com o lote aprovado.
+    
+    Contagens, faixas de velocidade e média/variância (Welford) por
+    (data, hora) são mescladas ao total acumulado em
+    <output_dir>/state/agregados_horarios.csv, e o delta do lote é gravado
+    em <output_dir>/aggregates para o gold mesclar.
+    
+    Args:
+        data: Lote aprovado pelo quality gate (dataHora em ms)
+        output_dir: Diretório base dos arquivos
+        
+    Returns:
+        Caminho do arquivo de delta (None se o lote estava vazio)
+    """
+    import pandas as pd
+    
+    from pipelines.utils.hourly_aggregates import HourlyAggregator
+    
+    aggregator = HourlyAggregator(state_path=os.path.join(output_dir, "state", "agregados_horarios.csv"))
+    batch = aggregator.update(pd.DataFrame(data) if isinstance(data, list) else data)
+    delta_path = aggregator.flush(os.path.join(output_dir, "aggregates"))
+    
+    if delta_path:
+        record_bytes_written(os.path.getsize(delta_path))
+        logger.info(f"📊 Delta de agregados horários: {len(batch)} hora(s) em {delta_path}")
+    else:
+        logger.info("   ℹ️  Nenhum registro para agregar")
+    
+    return delta_path
+
+
+@task(
+    name="Merge Hourly Aggregates",
+    max_retries=2,
+    retry_delay=timedelta(seconds=10),
+    tags=["bigquery", "gold"]
+)
+@checkpointed
+@instrumented
+@profiled
+def merge_hourly_aggregates(
+    project_id: str,
+    delta_path: Optional[str],
+    dataset_id: str = "civitas_gold",
+    table_id: str = "agg_metricas_horarias_incremental"
+) -> Dict:
+    """
+    Mescla um delta de agregados horários na tabela gold incremental.
+    
+    O MERGE toca apenas as horas presentes no delta (poucas linhas), então
+    as métricas horárias ficam disponíveis logo após a captura sem
+    reprocessar a silver. Deltas já aplicados são ignorados.
+    
+    Args:
+        project_id: ID do projeto GCP
+        delta_path: Arquivo de delta gerado por update_hourly_aggregates
+        dataset_id: Dataset da tabela incremental
+        table_id: Tabela incremental
+        
+    Returns:
+        Dict com tabela, delta_id e horas mescladas
+    """
+    from google.cloud import bigquery
+    
+    from pipelines.utils.hourly_aggregates import aggregates_merge_sql, load_aggregates
+    
+    table = f"{project_id}.{dataset_id}.{table_id}"
+    if not delta_path:
+        return {"table": table, "status": "skipped", "hours": 0}
+    
+    delta = load_aggregates(delta_path)
+    delta_id = os.path.splitext(os.path.basename(delta_path))[0]
+    
+    client = bigquery.Client(project=project_id)
+    sql = aggregates_merge_sql(table, delta, delta_id, f"{project_id}.{dataset_id}.{table_id}_deltas")
+    run_query(client, sql, label=f"gold:{table_id}")
+    
+    logger.info(f"✅ {len(delta)} hora(s) mescladas em {table} (delta {delta_id})")
+    
+    return {"table": table, "status": "merged", "delta_id": delta_id, "hours": len(delta)}
+
+
 @task(
     name="Generate CSV",
     tags=["processing", "storage"]
 )
+@checkpointed
+@instrumented
+@profiled
 def generate_csv(
-    data: List[Dict],
+    data: Union[List[Dict], "pd.DataFrame"],
     output_dir: str = "./data",
-    filename_prefix: str = "brt_gps"
+    filename_prefix: str = "brt_gps",
+    track_state_dir: Optional[str] = None,
+    stations_path: Optional[str] = None,
+    stream_upload: bool = False,
+    bucket_name: Optional[str] = None,
+    destination_prefix: str = "bronze/brt_gps",
+    credentials_path: Optional[str] = None,
+    chunk_rows: int = 0
 ) -> str:
     """
     Gera arquivo CSV a partir dos dados capturados.
     
+    Com `stream_upload`, o CSV é serializado direto em um upload resumível
+    para gs://<bucket_name>/<destination_prefix>/ e a URI é devolvida no
+    lugar do caminho local (upload_csv_to_gcs apenas a repassa). Se o
+    upload falhar (ou em dry-run), o CSV é gravado localmente e segue o
+    caminho normal.
+    
+    Com `chunk_rows`, o CSV local é enriquecido e gravado em blocos desse
+    tamanho (um cabeçalho só), sem montar o DataFrame do lote inteiro;
+    `data` pode então ser um iterável de lotes.
+    
     Args:
-        data: Lista de dicionrios com dados dos veculos
+        data: Lista de dicionrios (ou DataFrame aprovado pelo quality gate)
         output_dir: Diretrio de sada
         filename_prefix: Prefixo do nome do arquivo
+        track_state_dir: Diretório do estado de trajeto entre capturas
+            (padrão: <output_dir>/state)
+        stations_path: CSV de estações BRT para associar cada fix à estação
+            mais próxima (None = sem associação, estacao_id vazio)
+        stream_upload: Envia direto ao GCS, sem arquivo local
+        bucket_name: Bucket GCS (obrigatório com stream_upload)
+        destination_prefix: Prefixo do caminho no GCS
+        credentials_path: Caminho para credenciais GCP
+        chunk_rows: Linhas por bloco na gravação local (0 = lote inteiro)
         
     Returns:
-        Caminho completo do arquivo CSV gerado
+        Caminho completo do arquivo CSV gerado (ou URI gs:// no modo stream)
     """
-    if not data:
-        logger.warning(" Nenhum dado para gerar CSV")
-        return None
-    
-    # Criar diretrio se no existir
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Gerar nome do arquivo com timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{filename_prefix}_{timestamp}.csv"
-    filepath = os.path.join(output_dir, filename)
-    
-    # Converter para DataFrame
-    df = pd.DataFrame(data)
+    if track_state_dir is None:
+        track_state_dir = os.path.join(output_dir, "state")
+    track_state_path = os.path.join(track_state_dir, "track_state.csv")
     
-    # Converter campos de timestamp Unix (milissegundos) para ISO 8601
-    timestamp_columns = ['dataHora']
-    for col in timestamp_columns:
-        if col in df.columns:
-            # Converter de milissegundos Unix para datetime e depois para ISO 8601
-            df[col] = pd.to_datetime(df[col], unit='ms', errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S')
-    
-    # Garantir que timestamp_captura tambm est em formato ISO
-    if 'timestamp_captura' in df.columns:
-        # Se j  string ISO, manter; se no, converter
-        df['timestamp_captura'] = pd.to_datetime(df['timestamp_captura'], errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S')
-    
-    # Salvar CSV
-    df.to_csv(filepath, index=False, encoding='utf-8')
+    if stream_upload and bucket_name and is_dry_run():
+        logger.info("🧪 Dry-run: upload em stream desligado, CSV gravado localmente")
+    elif stream_upload and bucket_name:
+        return stream_bronze_csv(
+            data,
+            bucket_name=bucket_name,
+            destination_prefix=destination_prefix,
+            filename_prefix=filename_prefix,
+            output_dir=output_dir,
+            track_state_path=track_state_path,
+            stations_path=stations_path,
+            credentials_path=credentials_path
+        )
     
-    logger.info(f" CSV gerado: {filepath}")
-    logger.info(f" Linhas: {len(df)} | Colunas: {len(df.columns)}")
-    logger.info(f" Colunas: {', '.join(df.columns.tolist())}")
+    if chunk_rows:
+        return write_bronze_csv_chunked(
+            data,
+            output_dir=output_dir,
+            filename_prefix=filename_prefix,
+            track_state_path=track_state_path,
+            stations_path=stations_path,
+            chunk_rows=chunk_rows
+        )
     
-    return filepath
+    return write_bronze_csv(
+        data,
+        output_dir=output_dir,
+        filename_prefix=filename_prefix,
+        track_state_path=track_state_path,
+        stations_path=stations_path
+    )
 
 
 @task(
     name="Upload to GCS",
     max_retries=3,
-    retry_delay=pd.Timedelta(seconds=15),
+    retry_delay=timedelta(seconds=15),
     tags=["storage", "gcp"]
 )
+@checkpointed
+@instrumented
+@profiled
 def upload_csv_to_gcs(
     csv_filepath: str,
     bucket_name: str,
@@ -169,6 +501,10 @@ def upload_csv_to_gcs(
     """
     Faz upload do arquivo CSV para o Google Cloud Storage.
     
+    O upload é idempotente: conteúdo (MD5) já enviado ao mesmo prefixo não
+    é reenviado e a URI existente é devolvida; a escrita usa precondição
+    de geração para não sobrescrever outro escritor.
+    
     Args:
         csv_filepath: Caminho do arquivo CSV local
         bucket_name: Nome do bucket GCS
@@ -178,6 +514,11 @@ def upload_csv_to_gcs(
     Returns:
         URI do arquivo no GCS (gs://bucket/path/file.csv)
     """
+    if csv_filepath and csv_filepath.startswith("gs://"):
+        # generate_csv em modo stream já enviou o objeto
+        logger.info(f" CSV já enviado em stream: {csv_filepath}")
+        return csv_filepath
+    
     if not csv_filepath or not os.path.exists(csv_filepath):
         logger.error(f" Arquivo no encontrado: {csv_filepath}")
         raise FileNotFoundError(f"Arquivo no encontrado: {csv_filepath}")
@@ -186,16 +527,26 @@ def upload_csv_to_gcs(
     filename = os.path.basename(csv_filepath)
     destination_blob_name = f"{destination_prefix}/{filename}"
     
+    if is_dry_run():
+        logger.info(f"🧪 Dry-run: upload pulado (destino: gs://{bucket_name}/{destination_blob_name})")
+        return f"gs://{bucket_name}/{destination_blob_name}"
+    
     logger.info(f" Iniciando upload para GCS: gs://{bucket_name}/{destination_blob_name}")
     
     try:
-        gcs_uri = upload_to_gcs(
+        gcs_uri, uploaded = upload_if_changed(
             bucket_name=bucket_name,
             source_file_path=csv_filepath,
             destination_blob_name=destination_blob_name,
             credentials_path=credentials_path
         )
         
+        if not uploaded:
+            get_registry().inc("pipeline_upload_skipped")
+            logger.info(f" ♻️  Conteúdo já presente no GCS, upload pulado: {gcs_uri}")
+            return gcs_uri
+        
+        record_bytes_uploaded(os.path.getsize(csv_filepath))
         logger.info(f" Upload concludo: {gcs_uri}")
         return gcs_uri
         
@@ -208,6 +559,8 @@ def upload_csv_to_gcs(
     name="Cleanup Local Files",
     tags=["cleanup"]
 )
+@instrumented
+@profiled
 def cleanup_local_file(filepath: str, keep_file: bool = False) -> None:
     """
     Remove arquivo local aps upload bem-sucedido.
@@ -220,6 +573,10 @@ def cleanup_local_file(filepath: str, keep_file: bool = False) -> None:
         logger.info(f" Mantendo arquivo local: {filepath}")
         return
     
+    if filepath and filepath.startswith("gs://"):
+        # Modo stream: nenhum arquivo local foi gravado
+        return
+    
     try:
         if os.path.exists(filepath):
             os.remove(filepath)
@@ -236,9 +593,16 @@ def cleanup_local_file(filepath: str, keep_file: bool = False) -> None:
     max_retries=2,
     retry_delay=timedelta(seconds=30)
 )
+@checkpointed
+@instrumented
+@profiled
 def trigger_dbt_run(
     dataset_id: str,
-    materialize: bool = True
+    materialize: bool = True,
+    dbt_vars: Optional[Dict] = None,
+    select: Optional[str] = None,
+    exclude: Optional[str] = None,
+    full_refresh: bool = False
 ) -> Dict[str, str]:
     """
     Executa transformaes DBT aps upload de dados para GCS.
@@ -246,12 +610,15 @@ def trigger_dbt_run(
     Args:
         dataset_id: ID do dataset no BigQuery
         materialize: Se deve materializar os modelos (sempre True para produo)
+        dbt_vars: Variáveis repassadas via --vars (ex: {"bronze_table": "brt_gps"})
+        select: Seleção de modelos (--select, ex: "stg_brt_gps+"); padrão: todos
+        exclude: Modelos fora da seleção (--exclude)
+        full_refresh: Reconstrói os modelos incrementais selecionados (--full-refresh)
         
     Returns:
         Dicionrio com status da execuo DBT
     """
     import subprocess
-    import json
     
     if not materialize:
         logger.info(" DBT materializao desabilitada (materialize=False)")
@@ -265,7 +632,7 @@ def trigger_dbt_run(
     
     try:
         # Diretório DBT
-        dbt_dir = "/app/dbt"
+        dbt_dir = DBT_DIR
         
         # Primeiro: dbt deps (instalar dependências)
         logger.info(" Instalando dependências DBT...")
@@ -282,13 +649,32 @@ def trigger_dbt_run(
         else:
             logger.info(" Dependências DBT instaladas")
         
+        # run_results.json de um run anterior não pode ser contabilizado como deste
+        run_results_path = os.path.join(dbt_dir, "target", "run_results.json")
+        if os.path.exists(run_results_path):
+            os.remove(run_results_path)
+        dbt_started_at = time.time()
+        
         # Comando DBT run (todas as camadas: bronze  silver  gold)
+        # Em dry-run apenas compila (nenhuma query é executada no BigQuery)
         dbt_command = [
-            "dbt", "run",
+            "dbt", "compile" if is_dry_run() else "run",
             "--profiles-dir", dbt_dir,
             "--project-dir", dbt_dir
         ]
         
+        if dbt_vars:
+            dbt_command += ["--vars", json.dumps(dbt_vars)]
+        
+        if select:
+            dbt_command += ["--select", select]
+        
+        if exclude:
+            dbt_command += ["--exclude", exclude]
+        
+        if full_refresh:
+            dbt_command.append("--full-refresh")
+        
         logger.info(f" Executando: {' '.join(dbt_command)}")
         
         # Executar DBT run
@@ -307,6 +693,12 @@ def trigger_dbt_run(
         if result.stderr:
             logger.warning(f" DBT stderr:\n{result.stderr}")
         
+        # Custo por modelo (adapter_response do run_results.json)
+        dbt_costs = record_dbt_run_results(run_results_path, not_before=dbt_started_at)
+        if dbt_costs:
+            billed = sum(entry["bytes_billed"] for entry in dbt_costs)
+            logger.info(f" DBT BigQuery: {len(dbt_costs)} jobs, {billed / 1024**2:.1f} MB faturados")
+        
         # Verificar sucesso
         if result.returncode == 0:
             logger.info(" DBT transformations executadas com sucesso!")
@@ -343,16 +735,36 @@ def trigger_dbt_run(
 @task(
     name="Cleanup All Data",
     max_retries=1,
-    retry_delay=pd.Timedelta(seconds=5),
+    retry_delay=timedelta(seconds=5),
     tags=["cleanup", "maintenance"]
 )
-def cleanup_all_data(bucket_name: str, local_data_dir: str = "./data") -> Dict:
+@instrumented
+@profiled
+def cleanup_all_data(
+    bucket_name: str,
+    local_data_dir: str = "./data",
+    archive_prefix: Optional[str] = "archive/brt_gps",
+    transform_mode: str = "inline"
+) -> Dict:
     """
     Remove TODOS os CSVs locais e arquivos do GCS antes de executar o pipeline.
     
+    Antes de sair do prefixo bronze, cada CSV do GCS é copiado para
+    <archive_prefix>/dt=AAAA-MM-DD/ (dia da captura), de onde o flow de
+    backfill reprocessa o histórico.
+    
+    Com `transform_mode="triggered"` o transform roda em outro flow: só saem
+    do prefixo os CSVs que ele já processou (até a marca d'água em
+    <local_data_dir>/state/transform_state.json e fora da fila do
+    transform); os demais aguardam o próximo dbt + gold.
+    
+    Em dry-run nada é removido nem arquivado: a limpeza só lista o que faria.
+    
     Args:
         bucket_name: Nome do bucket GCS
         local_data_dir: Diretório local com CSVs
+        archive_prefix: Prefixo do arquivo histórico (None = não arquiva)
+        transform_mode: "inline" (transform neste run) ou "triggered"
         
     Returns:
         Dict com estatísticas da limpeza
@@ -362,9 +774,12 @@ def cleanup_all_data(bucket_name: str, local_data_dir: str = "./data") -> Dict:
     
     logger.info("🧹 LIMPEZA COMPLETA - Removendo todos os dados antigos...")
     
+    dry_run = is_dry_run()
     stats = {
         "local_files_deleted": 0,
         "gcs_files_deleted": 0,
+        "gcs_files_archived": 0,
+        "dry_run": dry_run,
         "errors": []
     }
     
@@ -372,6 +787,9 @@ def cleanup_all_data(bucket_name: str, local_data_dir: str = "./data") -> Dict:
     try:
         csv_files = glob.glob(os.path.join(local_data_dir, "brt_gps_*.csv"))
         for csv_file in csv_files:
+            if dry_run:
+                logger.info(f"   🧪 Dry-run: {os.path.basename(csv_file)} seria removido")
+                continue
             try:
                 os.remove(csv_file)
                 logger.info(f"   🗑️  Local: {os.path.basename(csv_file)}")
@@ -396,11 +814,36 @@ def cleanup_all_data(bucket_name: str, local_data_dir: str = "./data") -> Dict:
         # Listar TODOS os arquivos no bucket
         blobs = list(bucket.list_blobs(prefix='bronze/brt_gps/'))
         
+        if transform_mode == "triggered":
+            state = read_transform_state(transform_state_path(local_data_dir))
+            watermark = float(state.get("watermark") or 0.0)
+            queued = TransformQueue(transform_queue_dir(local_data_dir)).queued_uris()
+            
+            def transformed(blob) -> bool:
+                return (
+                    blob.updated is not None
+                    and blob.updated.timestamp() <= watermark
+                    and f"gs://{bucket_name}/{blob.name}" not in queued
+                )
+            
+            pending = [b for b in blobs if not transformed(b)]
+            blobs = [b for b in blobs if transformed(b)]
+            stats["gcs_files_pending_transform"] = len(pending)
+            if pending:
+                logger.info(f"   ⏳ {len(pending)} arquivo(s) GCS aguardando o transform (mantidos)")
+        
         if len(blobs) == 0:
             logger.info("   ℹ️  Nenhum arquivo GCS encontrado")
         else:
             for blob in blobs:
+                if dry_run:
+                    logger.info(f"   🧪 Dry-run: GCS {blob.name} seria arquivado e removido")
+                    continue
                 try:
+                    if archive_prefix and blob.name.endswith(".csv"):
+                        fallback_day = blob.time_created.date().isoformat() if blob.time_created else ""
+                        bucket.copy_blob(blob, bucket, archive_blob_name(blob.name, fallback_day, archive_prefix))
+                        stats["gcs_files_archived"] += 1
                     blob.delete()
                     logger.info(f"   🗑️  GCS: {blob.name}")
                     stats["gcs_files_deleted"] += 1
@@ -408,7 +851,7 @@ def cleanup_all_data(bucket_name: str, local_data_dir: str = "./data") -> Dict:
                     logger.warning(f"   ⚠️  Erro ao remover {blob.name}: {e}")
                     stats["errors"].append(str(e))
             
-            logger.info(f"   ✅ {stats['gcs_files_deleted']} arquivo(s) GCS removido(s)")
+            logger.info(f"   ✅ {stats['gcs_files_deleted']} arquivo(s) GCS removido(s), {stats['gcs_files_archived']} arquivado(s)")
     
     except Exception as e:
         logger.warning(f"   ⚠️  Erro na limpeza GCS: {e}")
@@ -422,9 +865,11 @@ def cleanup_all_data(bucket_name: str, local_data_dir: str = "./data") -> Dict:
 @task(
     name="Validate Pipeline Layer",
     max_retries=1,
-    retry_delay=pd.Timedelta(seconds=5),
+    retry_delay=timedelta(seconds=5),
     tags=["validation", "testing"]
 )
+@instrumented
+@profiled
 def validate_layer(
     project_id: str,
     layer_name: str,
@@ -452,9 +897,17 @@ def validate_layer(
         
         # Query simples de contagem
         query = f"SELECT COUNT(*) as total FROM `{project_id}.{table_id}`"
-        result = list(client.query(query).result())[0]
+        rows = run_query(client, query, label=f"validate:{table_id}")
+        
+        if rows is None:
+            logger.info(f"   ℹ️  {layer_name}: dry-run, contagem não executada")
+            return {
+                "layer": layer_name,
+                "table": table_id,
+                "status": "DRY_RUN"
+            }
         
-        total_records = result.total
+        total_records = list(rows)[0].total
         
         if total_records >= min_records:
             logger.info(f"   ✅ {layer_name}: {total_records} registros (mínimo: {min_records})")
@@ -488,9 +941,11 @@ def validate_layer(
 @task(
     name="Clean Old CSVs from GCS",
     max_retries=2,
-    retry_delay=pd.Timedelta(seconds=5),
+    retry_delay=timedelta(seconds=5),
     tags=["maintenance", "gcs"]
 )
+@instrumented
+@profiled
 def clean_old_csvs(bucket_name: str, prefix: str = 'bronze/brt_gps/') -> Dict:
     """
     Remove CSVs antigos do GCS, mantendo apenas o mais recente.
@@ -525,6 +980,9 @@ def clean_old_csvs(bucket_name: str, prefix: str = 'bronze/brt_gps/') -> Dict:
         # Deletar todos exceto o mais recente
         deleted_count = 0
         for blob in blobs_sorted[1:]:
+            if is_dry_run():
+                logger.info(f"   🧪 Dry-run: {blob.name} seria deletado")
+                continue
             logger.info(f"   Deletando: {blob.name}")
             blob.delete()
             deleted_count += 1
@@ -545,9 +1003,12 @@ def clean_old_csvs(bucket_name: str, prefix: str = 'bronze/brt_gps/') -> Dict:
 @task(
     name="Create Bronze External Table",
     max_retries=2,
-    retry_delay=pd.Timedelta(seconds=5),
+    retry_delay=timedelta(seconds=5),
     tags=["bigquery", "bronze"]
 )
+@checkpointed
+@instrumented
+@profiled
 def create_bronze_external_table(
     project_id: str,
     dataset_id: str,
@@ -570,6 +1031,17 @@ def create_bronze_external_table(
     
     logger.info(f"📊 Criando External Table: {project_id}.{dataset_id}.{table_id}")
     
+    if is_dry_run():
+        logger.info(f"   🧪 Dry-run: dataset e tabela externa não criados (URI: {gcs_uri})")
+        return {
+            "table": f"{project_id}.{dataset_id}.{table_id}",
+            "table_id": f"{dataset_id}.{table_id}",
+            "name": table_id,
+            "type": "EXTERNAL",
+            "uri": gcs_uri,
+            "records": None
+        }
+    
     try:
         client = bigquery.Client(project=project_id)
         
@@ -593,24 +1065,7 @@ def create_bronze_external_table(
         external_config.options.allow_quoted_newlines = True
         
         # Schema
-        external_config.schema = [
-            bigquery.SchemaField("codigo", "STRING"),
-            bigquery.SchemaField("placa", "STRING"),
-            bigquery.SchemaField("linha", "STRING"),
-            bigquery.SchemaField("latitude", "FLOAT"),
-            bigquery.SchemaField("longitude", "FLOAT"),
-            bigquery.SchemaField("dataHora", "STRING"),
-            bigquery.SchemaField("velocidade", "FLOAT"),
-            bigquery.SchemaField("id_migracao_trajeto", "STRING"),
-            bigquery.SchemaField("sentido", "STRING"),
-            bigquery.SchemaField("trajeto", "STRING"),
-            bigquery.SchemaField("hodometro", "FLOAT"),
-            bigquery.SchemaField("direcao", "STRING"),
-            bigquery.SchemaField("ignicao", "STRING"),
-            bigquery.SchemaField("capacidadePeVeiculo", "INTEGER"),
-            bigquery.SchemaField("capacidadeSentadoVeiculo", "INTEGER"),
-            bigquery.SchemaField("timestamp_captura", "STRING"),
-        ]
+        external_config.schema = bronze_schema()
         
         # Criar tabela
         table = bigquery.Table(table_ref)
@@ -622,14 +1077,17 @@ def create_bronze_external_table(
         
         # Testar query
         query = f"SELECT COUNT(*) as n FROM `{table_ref}`"
-        result = list(client.query(query).result())[0]
-        logger.info(f"   ✓ Teste OK: {result.n} registros")
+        rows = run_query(client, query, label=f"bronze_count:{table_id}")
+        records = list(rows)[0].n if rows is not None else None
+        logger.info(f"   ✓ Teste OK: {records} registros")
         
         return {
             "table": table_ref,
+            "table_id": f"{dataset_id}.{table_id}",
+            "name": table_id,
             "type": "EXTERNAL",
             "uri": gcs_uri,
-            "records": result.n
+            "records": records
         }
     
     except Exception as e:
@@ -637,15 +1095,498 @@ def create_bronze_external_table(
         raise
 
 
+@task(
+    name="Load Bronze Native Table",
+    max_retries=2,
+    retry_delay=timedelta(seconds=10),
+    tags=["bigquery", "bronze"]
+)
+@checkpointed
+@instrumented
+@profiled
+def load_csv_to_bronze_native(
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    gcs_uri: str,
+    partition_field: Optional[str] = None,
+    client=None
+) -> Dict:
+    """
+    Carrega o CSV recém-enviado em uma tabela bronze nativa particionada.
+    
+    Alternativa à external table: cada flush vira um load job (sem custo de
+    scan) em uma tabela particionada por dia de ingestão. A carga é
+    idempotente pelo nome do arquivo, então retries não duplicam linhas.
+    
+    Args:
+        project_id: ID do projeto GCP
+        dataset_id: Nome do dataset (ex: civitas_bronze)
+        table_id: Nome da tabela nativa (ex: brt_gps)
+        gcs_uri: URI do arquivo no GCS (gs://bucket/path/file.csv)
+        partition_field: Coluna de particionamento (None = tempo de ingestão)
+        client: Cliente BigQuery (opcional, para substituir por um local)
+        
+    Returns:
+        Dict com informações da carga
+    """
+    from google.cloud import bigquery
+    
+    table_ref = f"{project_id}.{dataset_id}.{table_id}"
+    logger.info(f"📥 Carregando {gcs_uri} em {table_ref}")
+    
+    if is_dry_run():
+        logger.info("   🧪 Dry-run: dataset e load job não criados")
+        return {
+            "table": table_ref,
+            "table_id": f"{dataset_id}.{table_id}",
+            "name": table_id,
+            "type": "NATIVE",
+            "uri": gcs_uri,
+            "job_id": None,
+            "status": "dry_run",
+            "records": None
+        }
+    
+    try:
+        if client is None:
+            client = bigquery.Client(project=project_id)
+        
+        # Criar dataset se não existir
+        dataset = bigquery.Dataset(f"{project_id}.{dataset_id}")
+        dataset.location = "us-east1"
+        client.create_dataset(dataset, exists_ok=True)
+        
+        result = load_gcs_csv_to_table(
+            source_uri=gcs_uri,
+            table_ref=table_ref,
+            schema=bronze_schema(),
+            client=client,
+            partition_field=partition_field
+        )
+        
+        if result["status"] == "already_loaded":
+            logger.info(f"   ✓ Arquivo já carregado anteriormente (job {result['job_id']}), nada a fazer")
+        else:
+            logger.info(f"   ✓ {result['output_rows']} registros carregados (job {result['job_id']})")
+        
+        return {
+            "table": table_ref,
+            "table_id": f"{dataset_id}.{table_id}",
+            "name": table_id,
+            "type": "NATIVE",
+            "uri": gcs_uri,
+            "job_id": result["job_id"],
+            "status": result["status"],
+            "records": result["output_rows"]
+        }
+    
+    except Exception as e:
+        logger.error(f"   ❌ Erro ao carregar bronze nativa: {str(e)}")
+        raise
+
+
+# Dias antes da marca d'água relidos pelas dimensões incrementais (fixes atrasados)
+DIM_LOOKBACK_DAYS = 1
+
+
+def incremental_dimension_script(
+    table_ref: str,
+    key: str,
+    columns_ddl: str,
+    source_sql: str
+) -> str:
+    """
+    Monta o script (multi-statement) de atualização incremental de uma dimensão.
+    
+    A dimensão guarda o próprio estado (contagens, somas, sketches e a
+    captura mais recente incorporada, `ultima_captura_processada`). O script
+    lê essa marca d'água em `marca`, e `source_sql` deve usar
+    `{filtro_incremental}` para ler só as capturas posteriores a ela (com
+    poda das partições anteriores) e devolver as linhas já combinadas com o
+    estado atual das chaves tocadas. Tabelas do formato antigo (CTAS, sem
+    estado) são recriadas a partir da silver inteira.
+    
+    Args:
+        table_ref: Tabela da dimensão (projeto.dataset.tabela)
+        key: Coluna chave do MERGE
+        columns_ddl: Colunas da tabela, na ordem do SELECT de `source_sql`
+        source_sql: SELECT com as linhas novas/atualizadas
+        
+    Returns:
+        Script SQL
+    """
+    project_id, dataset, table = table_ref.split(".")
+    columns = [line.strip().split()[0] for line in columns_ddl.strip().rstrip(",").split(",\n")]
+    updates = ",\n                ".join(f"{c} = n.{c}" for c in columns if c != key)
+    incremental_filter = f"""
+                    AND data_gps >= COALESCE(DATE_SUB(DATE(marca), INTERVAL {DIM_LOOKBACK_DAYS} DAY), DATE '1970-01-01')
+                    AND data_hora_captura > COALESCE(marca, TIMESTAMP '1970-01-01')"""
+    
+    return f"""
+            DECLARE marca TIMESTAMP;
+            
+            IF EXISTS (
+                SELECT 1 FROM `{project_id}.{dataset}.INFORMATION_SCHEMA.TABLES`
+                WHERE table_name = '{table}'
+            ) AND NOT EXISTS (
+                SELECT 1 FROM `{project_id}.{dataset}.INFORMATION_SCHEMA.COLUMNS`
+                WHERE table_name = '{table}' AND column_name = 'ultima_captura_processada'
+            ) THEN
+                DROP TABLE `{table_ref}`;
+            END IF;
+            
+            CREATE TABLE IF NOT EXISTS `{table_ref}` (
+                {columns_ddl.strip()}
+            );
+            
+            SET marca = (SELECT MAX(ultima_captura_processada) FROM `{table_ref}`);
+            
+            MERGE `{table_ref}` AS d
+            USING ({source_sql.format(filtro_incremental=incremental_filter)}) AS n
+            ON d.{key} = n.{key}
+            WHEN MATCHED THEN UPDATE SET
+                {updates}
+            WHEN NOT MATCHED THEN INSERT ROW;
+        """
+
+
+def partitioned_table_script(table_ref: str, partition_column: str, create_sql: str) -> str:
+    """
+    Envolve o CTAS de uma tabela particionada com a migração do formato antigo.
+    
+    O BigQuery rejeita `CREATE OR REPLACE` que muda o particionamento, então
+    uma tabela existente que não é particionada por `partition_column`
+    (CTAS anterior ao particionamento) é removida antes, como as dimensões
+    sem estado em `incremental_dimension_script`.
+    
+    Args:
+        table_ref: Tabela (projeto.dataset.tabela)
+        partition_column: Coluna de particionamento esperada
+        create_sql: CREATE OR REPLACE TABLE ... PARTITION BY ... AS SELECT ...
+        
+    Returns:
+        Script SQL
+    """
+    project_id, dataset, table = table_ref.split(".")
+    
+    return f"""
+            IF EXISTS (
+                SELECT 1 FROM `{project_id}.{dataset}.INFORMATION_SCHEMA.TABLES`
+                WHERE table_name = '{table}'
+            ) AND NOT EXISTS (
+                SELECT 1 FROM `{project_id}.{dataset}.INFORMATION_SCHEMA.COLUMNS`
+                WHERE table_name = '{table}' AND column_name = '{partition_column}'
+                    AND is_partitioning_column = 'YES'
+            ) THEN
+                DROP TABLE `{table_ref}`;
+            END IF;
+            
+            {create_sql.strip()};
+        """
+
+
+def gold_table_statements(project_id: str) -> Dict[str, str]:
+    """
+    Retorna o SQL de cada tabela Gold, na ordem de criação.
+    
+    Fato e agregações são CTAS (os particionados migram o formato antigo,
+    ver `partitioned_table_script`); as dimensões são scripts de MERGE
+    incremental (`incremental_dimension_script`), que só leem as capturas
+    novas da silver e só reescrevem as linhas/veículos presentes nelas.
+    
+    Args:
+        project_id: ID do projeto GCP
+        
+    Returns:
+        Dicionário {nome_tabela: sql}
+    """
+    from pipelines.utils.hll import DEFAULT_PRECISION as HLL_PRECISION
+    
+    silver = f"`{project_id}.civitas_silver.stg_brt_gps`"
+    dim_linhas = f"{project_id}.civitas_gold.dim_brt_linhas"
+    dim_veiculos = f"{project_id}.civitas_gold.dim_brt_veiculos"
+    
+    return {
+        "dim_brt_linhas": incremental_dimension_script(
+            dim_linhas,
+            key="codigo_linha",
+            columns_ddl="""
+                id_linha STRING,
+                codigo_linha STRING,
+                total_veiculos INT64,
+                total_viagens INT64,
+                velocidade_media FLOAT64,
+                primeira_viagem TIMESTAMP,
+                ultima_viagem TIMESTAMP,
+                trajetos_operados ARRAY<STRING>,
+                sketch_veiculos BYTES,
+                n_velocidade INT64,
+                soma_velocidade FLOAT64,
+                ultima_captura_processada TIMESTAMP
+            """,
+            source_sql=f"""
+                WITH lote AS (
+                    SELECT
+                        linha_brt as codigo_linha,
+                        COUNT(*) as total_viagens,
+                        MIN(data_hora_gps) as primeira_viagem,
+                        MAX(data_hora_gps) as ultima_viagem,
+                        ARRAY_AGG(DISTINCT descricao_trajeto IGNORE NULLS ORDER BY descricao_trajeto LIMIT 10) as trajetos_operados,
+                        HLL_COUNT.INIT(codigo_veiculo, {HLL_PRECISION}) as sketch_veiculos,
+                        COUNT(velocidade_kmh) as n_velocidade,
+                        SUM(velocidade_kmh) as soma_velocidade,
+                        MAX(data_hora_captura) as ultima_captura_processada
+                    FROM {silver}
+                    WHERE linha_brt IS NOT NULL AND linha_brt != ''{{filtro_incremental}}
+                    GROUP BY linha_brt
+                ),
+                estado AS (
+                    SELECT * FROM lote
+                    UNION ALL
+                    SELECT
+                        codigo_linha, total_viagens, primeira_viagem, ultima_viagem, trajetos_operados,
+                        sketch_veiculos, n_velocidade, soma_velocidade, ultima_captura_processada
+                    FROM `{dim_linhas}`
+                    WHERE codigo_linha IN (SELECT codigo_linha FROM lote)
+                ),
+                combinado AS (
+                    SELECT
+                        codigo_linha,
+                        SUM(total_viagens) as total_viagens,
+                        MIN(primeira_viagem) as primeira_viagem,
+                        MAX(ultima_viagem) as ultima_viagem,
+                        ARRAY_CONCAT_AGG(trajetos_operados) as trajetos_todos,
+                        HLL_COUNT.MERGE_PARTIAL(sketch_veiculos) as sketch_veiculos,
+                        SUM(n_velocidade) as n_velocidade,
+                        SUM(soma_velocidade) as soma_velocidade,
+                        MAX(ultima_captura_processada) as ultima_captura_processada
+                    FROM estado
+                    GROUP BY codigo_linha
+                )
+                SELECT
+                    TO_HEX(MD5(codigo_linha)) as id_linha,
+                    codigo_linha,
+                    HLL_COUNT.EXTRACT(sketch_veiculos) as total_veiculos,
+                    total_viagens,
+                    SAFE_DIVIDE(soma_velocidade, n_velocidade) as velocidade_media,
+                    primeira_viagem,
+                    ultima_viagem,
+                    ARRAY(SELECT DISTINCT t FROM UNNEST(trajetos_todos) t ORDER BY t LIMIT 10) as trajetos_operados,
+                    sketch_veiculos,
+                    n_velocidade,
+                    soma_velocidade,
+                    ultima_captura_processada
+                FROM combinado
+            """
+        ),
+        "dim_brt_veiculos": incremental_dimension_script(
+            dim_veiculos,
+            key="codigo_veiculo",
+            columns_ddl="""
+                id_veiculo STRING,
+                codigo_veiculo STRING,
+                placa_veiculo STRING,
+                dias_ativos INT64,
+                total_registros INT64,
+                velocidade_media FLOAT64,
+                classificacao_atividade STRING,
+                linhas_operadas ARRAY<STRING>,
+                sketch_dias BYTES,
+                n_velocidade INT64,
+                soma_velocidade FLOAT64,
+                ultima_captura_processada TIMESTAMP
+            """,
+            source_sql=f"""
+                WITH lote AS (
+                    SELECT
+                        codigo_veiculo,
+                        MAX(placa_veiculo) as placa_veiculo,
+                        COUNT(*) as total_registros,
+                        ARRAY_AGG(DISTINCT linha_brt IGNORE NULLS ORDER BY linha_brt) as linhas_operadas,
+                        HLL_COUNT.INIT(CAST(data_gps AS STRING), {HLL_PRECISION}) as sketch_dias,
+                        COUNT(velocidade_kmh) as n_velocidade,
+                        SUM(velocidade_kmh) as soma_velocidade,
+                        MAX(data_hora_captura) as ultima_captura_processada
+                    FROM {silver}
+                    WHERE codigo_veiculo IS NOT NULL{{filtro_incremental}}
+                    GROUP BY codigo_veiculo
+                ),
+                estado AS (
+                    SELECT * FROM lote
+                    UNION ALL
+                    SELECT
+                        codigo_veiculo, placa_veiculo, total_registros, linhas_operadas,
+                        sketch_dias, n_velocidade, soma_velocidade, ultima_captura_processada
+                    FROM `{dim_veiculos}`
+                    WHERE codigo_veiculo IN (SELECT codigo_veiculo FROM lote)
+                ),
+                combinado AS (
+                    SELECT
+                        codigo_veiculo,
+                        MAX(placa_veiculo) as placa_veiculo,
+                        SUM(total_registros) as total_registros,
+                        ARRAY_CONCAT_AGG(linhas_operadas) as linhas_todas,
+                        HLL_COUNT.MERGE_PARTIAL(sketch_dias) as sketch_dias,
+                        SUM(n_velocidade) as n_velocidade,
+                        SUM(soma_velocidade) as soma_velocidade,
+                        MAX(ultima_captura_processada) as ultima_captura_processada
+                    FROM estado
+                    GROUP BY codigo_veiculo
+                )
+                SELECT
+                    TO_HEX(MD5(codigo_veiculo)) as id_veiculo,
+                    codigo_veiculo,
+                    placa_veiculo,
+                    HLL_COUNT.EXTRACT(sketch_dias) as dias_ativos,
+                    total_registros,
+                    SAFE_DIVIDE(soma_velocidade, n_velocidade) as velocidade_media,
+                    CASE 
+                        WHEN HLL_COUNT.EXTRACT(sketch_dias) >= 5 THEN 'ALTA_ATIVIDADE'
+                        WHEN HLL_COUNT.EXTRACT(sketch_dias) >= 2 THEN 'MEDIA_ATIVIDADE'
+                        ELSE 'BAIXA_ATIVIDADE'
+                    END as classificacao_atividade,
+                    ARRAY(SELECT DISTINCT l FROM UNNEST(linhas_todas) l ORDER BY l) as linhas_operadas,
+                    sketch_dias,
+                    n_velocidade,
+                    soma_velocidade,
+                    ultima_captura_processada
+                FROM combinado
+            """
+        ),
+        "fct_brt_viagens": partitioned_table_script(
+            f"{project_id}.civitas_gold.fct_brt_viagens",
+            "data_viagem",
+            f"""
+            CREATE OR REPLACE TABLE `{project_id}.civitas_gold.fct_brt_viagens`
+            PARTITION BY data_viagem
+            CLUSTER BY geohash_6, linha_brt, codigo_veiculo
+            AS
+            WITH viagens AS (
+                SELECT
+                    codigo_veiculo,
+                    linha_brt,
+                    data_gps,
+                    EXTRACT(HOUR FROM data_hora_gps) as hora,
+                    COUNT(*) as total_registros,
+                    AVG(velocidade_kmh) as velocidade_media,
+                    MIN(data_hora_gps) as inicio_viagem,
+                    MAX(data_hora_gps) as fim_viagem,
+                    APPROX_TOP_COUNT(geohash_6, 1)[SAFE_OFFSET(0)].value as geohash_6
+                FROM `{project_id}.civitas_silver.stg_brt_gps`
+                GROUP BY codigo_veiculo, linha_brt, data_gps, EXTRACT(HOUR FROM data_hora_gps)
+            )
+            SELECT
+                TO_HEX(MD5(CONCAT(codigo_veiculo, linha_brt, CAST(data_gps AS STRING), CAST(hora AS STRING)))) as id_viagem,
+                codigo_veiculo,
+                linha_brt,
+                data_gps as data_viagem,
+                hora as hora_viagem,
+                total_registros,
+                velocidade_media,
+                inicio_viagem,
+                fim_viagem,
+                geohash_6,
+                TIMESTAMP_DIFF(fim_viagem, inicio_viagem, MINUTE) as duracao_minutos
+            FROM viagens
+            """
+        ),
+        "agg_sketches_horarios": partitioned_table_script(
+            f"{project_id}.civitas_gold.agg_sketches_horarios",
+            "data_gps",
+            f"""
+            CREATE OR REPLACE TABLE `{project_id}.civitas_gold.agg_sketches_horarios`
+            PARTITION BY data_gps
+            CLUSTER BY linha_brt
+            AS
+            SELECT
+                data_gps,
+                hora_gps,
+                linha_brt,
+                COUNT(*) as total_registros_gps,
+                HLL_COUNT.INIT(codigo_veiculo, {HLL_PRECISION}) as sketch_veiculos
+            FROM `{project_id}.civitas_silver.stg_brt_gps`
+            GROUP BY data_gps, hora_gps, linha_brt
+            """
+        ),
+        "agg_metricas_horarias": f"""
+            CREATE OR REPLACE TABLE `{project_id}.civitas_gold.agg_metricas_horarias` AS
+            WITH metricas AS (
+                SELECT
+                    data_gps,
+                    hora_gps,
+                    HLL_COUNT.INIT(codigo_veiculo, {HLL_PRECISION}) as sketch_veiculos,
+                    HLL_COUNT.INIT(linha_brt, {HLL_PRECISION}) as sketch_linhas,
+                    COUNT(*) as total_registros,
+                    AVG(velocidade_kmh) as velocidade_media,
+                    MIN(velocidade_kmh) as velocidade_minima,
+                    MAX(velocidade_kmh) as velocidade_maxima,
+                    STDDEV(velocidade_kmh) as velocidade_desvio_padrao,
+                    COUNTIF(velocidade_kmh = 0) as veiculos_parados
+                FROM `{project_id}.civitas_silver.stg_brt_gps`
+                GROUP BY data_gps, hora_gps
+            )
+            SELECT
+                data_gps,
+                hora_gps,
+                HLL_COUNT.EXTRACT(sketch_veiculos) as veiculos_ativos,
+                HLL_COUNT.EXTRACT(sketch_linhas) as linhas_ativas,
+                total_registros,
+                velocidade_media,
+                velocidade_minima,
+                velocidade_maxima,
+                velocidade_desvio_padrao,
+                veiculos_parados,
+                sketch_veiculos,
+                sketch_linhas
+            FROM metricas
+        """,
+        "vw_distintos_diarios": f"""
+            CREATE OR REPLACE VIEW `{project_id}.civitas_gold.vw_distintos_diarios` AS
+            SELECT
+                data_gps,
+                HLL_COUNT.MERGE(sketch_veiculos) as veiculos_ativos,
+                HLL_COUNT.MERGE(sketch_linhas) as linhas_ativas
+            FROM `{project_id}.civitas_gold.agg_metricas_horarias`
+            GROUP BY data_gps
+        """,
+        "vw_distintos_semanais": f"""
+            CREATE OR REPLACE VIEW `{project_id}.civitas_gold.vw_distintos_semanais` AS
+            SELECT
+                DATE_TRUNC(data_gps, WEEK(MONDAY)) as semana,
+                HLL_COUNT.MERGE(sketch_veiculos) as veiculos_ativos,
+                HLL_COUNT.MERGE(sketch_linhas) as linhas_ativas
+            FROM `{project_id}.civitas_gold.agg_metricas_horarias`
+            GROUP BY semana
+        """,
+        "vw_veiculos_por_linha_diario": f"""
+            CREATE OR REPLACE VIEW `{project_id}.civitas_gold.vw_veiculos_por_linha_diario` AS
+            SELECT
+                data_gps,
+                linha_brt,
+                HLL_COUNT.MERGE(sketch_veiculos) as veiculos_ativos
+            FROM `{project_id}.civitas_gold.agg_sketches_horarios`
+            GROUP BY data_gps, linha_brt
+        """,
+    }
+
+
 @task(
     name="Create Gold Tables",
     max_retries=2,
-    retry_delay=pd.Timedelta(seconds=10),
+    retry_delay=timedelta(seconds=10),
     tags=["bigquery", "gold"]
 )
+@checkpointed
+@instrumented
+@profiled
 def create_gold_tables(project_id: str) -> Dict:
     """
-    Cria 4 tabelas Gold (2 dimensões + 1 fato + 1 agregação).
+    Cria as tabelas Gold (2 dimensões + 1 fato + agregações com sketches HLL)
+    e as views de rollup de contagens distintas.
+    
+    As dimensões são atualizadas por MERGE incremental: só as capturas
+    posteriores à marca d'água de cada dimensão são lidas.
     
     Args:
         project_id: ID do projeto GCP
@@ -672,113 +1613,28 @@ def create_gold_tables(project_id: str) -> Dict:
         
         results = {}
         
-        # 1. dim_brt_linhas
-        logger.info("   📊 Criando dim_brt_linhas...")
-        sql1 = f"""
-        CREATE OR REPLACE TABLE `{project_id}.civitas_gold.dim_brt_linhas` AS
-        SELECT
-            TO_HEX(MD5(linha_brt)) as id_linha,
-            linha_brt as codigo_linha,
-            COUNT(DISTINCT codigo_veiculo) as total_veiculos,
-            COUNT(*) as total_viagens,
-            AVG(velocidade_kmh) as velocidade_media,
-            MIN(data_hora_gps) as primeira_viagem,
-            MAX(data_hora_gps) as ultima_viagem
-        FROM `{project_id}.civitas_silver.stg_brt_gps`
-        WHERE linha_brt IS NOT NULL AND linha_brt != '' AND is_valid_coordinates = TRUE
-        GROUP BY linha_brt
-        """
-        client.query(sql1).result()
-        count = list(client.query(f"SELECT COUNT(*) as n FROM `{project_id}.civitas_gold.dim_brt_linhas`").result())[0].n
-        logger.info(f"      ✓ dim_brt_linhas: {count} registros")
-        results['dim_brt_linhas'] = count
-        
-        # 2. dim_brt_veiculos
-        logger.info("   📊 Criando dim_brt_veiculos...")
-        sql2 = f"""
-        CREATE OR REPLACE TABLE `{project_id}.civitas_gold.dim_brt_veiculos` AS
-        SELECT
-            TO_HEX(MD5(codigo_veiculo)) as id_veiculo,
-            codigo_veiculo,
-            MAX(placa_veiculo) as placa_veiculo,
-            COUNT(DISTINCT data_gps) as dias_ativos,
-            COUNT(*) as total_registros,
-            AVG(velocidade_kmh) as velocidade_media,
-            CASE 
-                WHEN COUNT(DISTINCT data_gps) >= 5 THEN 'ALTA_ATIVIDADE'
-                WHEN COUNT(DISTINCT data_gps) >= 2 THEN 'MEDIA_ATIVIDADE'
-                ELSE 'BAIXA_ATIVIDADE'
-            END as classificacao_atividade
-        FROM `{project_id}.civitas_silver.stg_brt_gps`
-        WHERE codigo_veiculo IS NOT NULL AND is_valid_coordinates = TRUE
-        GROUP BY codigo_veiculo
-        """
-        client.query(sql2).result()
-        count = list(client.query(f"SELECT COUNT(*) as n FROM `{project_id}.civitas_gold.dim_brt_veiculos`").result())[0].n
-        logger.info(f"      ✓ dim_brt_veiculos: {count} registros")
-        results['dim_brt_veiculos'] = count
-        
-        # 3. fct_brt_viagens
-        logger.info("   📊 Criando fct_brt_viagens...")
-        sql3 = f"""
-        CREATE OR REPLACE TABLE `{project_id}.civitas_gold.fct_brt_viagens` AS
-        WITH viagens AS (
-            SELECT
-                codigo_veiculo,
-                linha_brt,
-                data_gps,
-                EXTRACT(HOUR FROM data_hora_gps) as hora,
-                COUNT(*) as total_registros,
-                AVG(velocidade_kmh) as velocidade_media,
-                MIN(data_hora_gps) as inicio_viagem,
-                MAX(data_hora_gps) as fim_viagem
-            FROM `{project_id}.civitas_silver.stg_brt_gps`
-            WHERE is_valid_coordinates = TRUE AND is_valid_velocity = TRUE
-            GROUP BY codigo_veiculo, linha_brt, data_gps, EXTRACT(HOUR FROM data_hora_gps)
-        )
-        SELECT
-            TO_HEX(MD5(CONCAT(codigo_veiculo, linha_brt, CAST(data_gps AS STRING), CAST(hora AS STRING)))) as id_viagem,
-            codigo_veiculo,
-            linha_brt,
-            data_gps as data_viagem,
-            hora as hora_viagem,
-            total_registros,
-            velocidade_media,
-            inicio_viagem,
-            fim_viagem,
-            TIMESTAMP_DIFF(fim_viagem, inicio_viagem, MINUTE) as duracao_minutos
-        FROM viagens
-        """
-        client.query(sql3).result()
-        count = list(client.query(f"SELECT COUNT(*) as n FROM `{project_id}.civitas_gold.fct_brt_viagens`").result())[0].n
-        logger.info(f"      ✓ fct_brt_viagens: {count} registros")
-        results['fct_brt_viagens'] = count
-        
-        # 4. agg_metricas_horarias
-        logger.info("   📊 Criando agg_metricas_horarias...")
-        sql4 = f"""
-        CREATE OR REPLACE TABLE `{project_id}.civitas_gold.agg_metricas_horarias` AS
-        SELECT
-            data_gps,
-            hora_gps,
-            COUNT(DISTINCT codigo_veiculo) as veiculos_ativos,
-            COUNT(DISTINCT linha_brt) as linhas_ativas,
-            COUNT(*) as total_registros,
-            AVG(velocidade_kmh) as velocidade_media,
-            MIN(velocidade_kmh) as velocidade_minima,
-            MAX(velocidade_kmh) as velocidade_maxima,
-            STDDEV(velocidade_kmh) as velocidade_desvio_padrao,
-            COUNTIF(velocidade_kmh = 0) as veiculos_parados
-        FROM `{project_id}.civitas_silver.stg_brt_gps`
-        WHERE is_valid_coordinates = TRUE
-        GROUP BY data_gps, hora_gps
-        """
-        client.query(sql4).result()
-        count = list(client.query(f"SELECT COUNT(*) as n FROM `{project_id}.civitas_gold.agg_metricas_horarias`").result())[0].n
-        logger.info(f"      ✓ agg_metricas_horarias: {count} registros")
-        results['agg_metricas_horarias'] = count
+        for table_name, sql in gold_table_statements(project_id).items():
+            logger.info(f"   📊 Criando {table_name}...")
+            if run_query(client, sql, label=f"gold:{table_name}") is None:
+                # Dry-run: apenas estimativa, tabela não foi (re)criada
+                results[table_name] = None
+                continue
+            
+            if table_name.startswith("vw_"):
+                # Views de rollup por sketch: contar linhas as executaria
+                results[table_name] = "view"
+                continue
+            
+            count_rows = run_query(
+                client,
+                f"SELECT COUNT(*) as n FROM `{project_id}.civitas_gold.{table_name}`",
+                label=f"gold_count:{table_name}"
+            )
+            count = list(count_rows)[0].n
+            logger.info(f"      ✓ {table_name}: {count} registros")
+            results[table_name] = count
         
-        logger.info("   ✅ Todas as 4 tabelas Gold criadas!")
+        logger.info(f"   ✅ {len(results)} objetos Gold criados!")
         
         return {
             "status": "success",
@@ -789,3 +1645,169 @@ def create_gold_tables(project_id: str) -> Dict:
     except Exception as e:
         logger.error(f"   ❌ Erro ao criar tabelas Gold: {str(e)}")
         raise
+
+
+@task(
+    name="Estimate BigQuery Run Cost",
+    tags=["bigquery", "cost"]
+)
+@instrumented
+@profiled
+def estimate_bigquery_cost(
+    project_id: str,
+    validation_tables: Optional[List[str]] = None,
+    include_dbt: bool = True,
+    enabled: bool = True
+) -> Dict:
+    """
+    Estima via dry-run o volume escaneado pelo run inteiro antes de executá-lo.
+    
+    Compila os modelos DBT (`dbt compile`) e faz dry-run do SQL compilado de
+    silver e gold, das tabelas Gold nativas e das contagens de validação.
+    O total é comparado com o orçamento (bq_max_bytes / BQ_MAX_BYTES_PER_RUN):
+    acima dele o run é apenas avisado ou abortado (BQ_BUDGET_ACTION=abort).
+    
+    Args:
+        project_id: ID do projeto GCP
+        validation_tables: Tabelas (dataset.table) contadas nas validações
+        include_dbt: Se deve compilar e estimar os modelos DBT
+        enabled: Se False, a estimativa é pulada
+        
+    Returns:
+        Dict com total estimado e bytes por query
+    """
+    import subprocess
+    from google.cloud import bigquery
+    
+    if not enabled:
+        logger.info("💰 Estimativa de custo BigQuery desabilitada")
+        return {"status": "skipped", "total_bytes": None, "queries": {}}
+    
+    logger.info("💰 Estimando custo BigQuery do run (dry-run)...")
+    
+    client = bigquery.Client(project=project_id)
+    statements: Dict[str, str] = {}
+    
+    if include_dbt:
+        compile_result = subprocess.run(
+            ["dbt", "compile", "--profiles-dir", DBT_DIR, "--project-dir", DBT_DIR],
+            cwd=DBT_DIR,
+            capture_output=True,
+            text=True,
+            timeout=300
+        )
+        if compile_result.returncode == 0:
+            statements.update(compiled_dbt_models(
+                os.path.join(DBT_DIR, "target", "compiled", "civitas_brt", "models")
+            ))
+        else:
+            logger.warning(f"   ⚠️  dbt compile falhou, modelos DBT fora da estimativa: {compile_result.stderr}")
+    
+    for table_name, sql in gold_table_statements(project_id).items():
+        statements[f"gold:{table_name}"] = sql
+    
+    for table_id in validation_tables or []:
+        statements[f"validate:{table_id}"] = f"SELECT COUNT(*) as total FROM `{project_id}.{table_id}`"
+    
+    estimate = estimate_queries(client, statements)
+    
+    for label, num_bytes in estimate["queries"].items():
+        if num_bytes is not None:
+            logger.info(f"   {label}: {num_bytes / 1024**2:.1f} MB")
+    logger.info(f"   💰 Total estimado: {estimate['total_bytes'] / 1024**3:.3f} GB")
+    
+    enforce_budget(estimate["total_bytes"], context="estimativa do run")
+    
+    return estimate
+
+
+@task(
+    name="Summarize BigQuery Costs",
+    trigger=all_finished,
+    tags=["bigquery", "cost"]
+)
+@instrumented
+@profiled
+def summarize_bigquery_costs() -> Dict:
+    """
+    Consolida o custo BigQuery de todos os jobs do flow run atual.
+    
+    Returns:
+        Dict com jobs, bytes processados/faturados, slot-ms e cache hits
+    """
+    totals = run_totals()
+    
+    logger.info(
+        f"💰 BigQuery no run: {totals['jobs']} jobs | "
+        f"{totals['bytes_processed'] / 1024**3:.3f} GB processados | "
+        f"{totals['bytes_billed'] / 1024**3:.3f} GB faturados | "
+        f"{totals['slot_ms'] / 1000:.1f} slot-s | "
+        f"{totals['cache_hits']} cache hits"
+    )
+    
+    return totals
+
+
+@task(
+    name="Enqueue for Transform",
+    tags=["transformation", "queue"]
+)
+@instrumented
+@profiled
+def enqueue_for_transform(
+    gcs_uri: Optional[str],
+    output_dir: str = "./data",
+    feed: str = "brt"
+) -> Dict:
+    """
+    Entrega o CSV do run ao flow de transform (modo "triggered") e segue.
+    
+    Grava o manifesto do arquivo na fila local <output_dir>/queue/transform;
+    o flow "BRT: Transform on New Bronze Data" consome os pendentes em lote,
+    sem que a captura espere pelo dbt.
+    
+    Args:
+        gcs_uri: CSV enviado neste run (None = nada a enfileirar)
+        output_dir: Diretório local (fila do transform)
+        feed: Feed de origem do arquivo
+        
+    Returns:
+        Dict com o manifesto enfileirado e a profundidade e o atraso da fila
+    """
+    queue = TransformQueue(transform_queue_dir(output_dir))
+    manifest_path = None
+    if gcs_uri and is_dry_run():
+        logger.info(f"🧪 Dry-run: {gcs_uri} não enfileirado (o arquivo não foi enviado)")
+    elif gcs_uri:
+        manifest_path = queue.enqueue({"uri": gcs_uri, "feed": feed})
+        get_registry().inc("pipeline_transform_queue_enqueued", feed=feed)
+    
+    stats = report_queue(queue)
+    logger.info(
+        f"📬 Fila do transform: {stats['depth']} pendente(s), {stats['inflight']} em transform, "
+        f"atraso {stats['lag_seconds']:.0f}s"
+    )
+    return {"manifest": manifest_path, **stats}
+
+
+@task(
+    name="Complete Checkpoint Batch",
+    tags=["checkpoint"]
+)
+@instrumented
+@profiled
+def complete_checkpoint_batch() -> Optional[str]:
+    """
+    Fecha o lote de checkpoints após o run concluir com sucesso.
+    
+    Enquanto o lote está aberto, um retry do mesmo flow run reaproveita os
+    resultados já gravados (snapshot, CSV, upload, bronze...) das tasks que
+    concluíram. Limpeza e validações não têm checkpoint e sempre rodam.
+    
+    Returns:
+        Id do lote concluído
+    """
+    batch_id = complete_batch()
+    if batch_id:
+        logger.info(f"✅ Lote de checkpoints {batch_id} concluído")
+    return batch_id
@@ -0,0 +1,3 @@
+"""
+Flow de transformação (dbt + gold) disparado pela chegada de dados na bronze
+"""
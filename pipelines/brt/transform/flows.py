@@ -0,0 +1,200 @@
+"""
+Flow de transformação (dbt + gold) disparado pela chegada de dados na bronze
+
+Roda separado da captura: a captura enfileira um manifesto por arquivo
+gravado em <output_dir>/queue/transform e segue; este flow consome a fila
+em lotes, um transform por vez.
+"""
+import os
+
+from prefect import Flow, Parameter, case
+from prefect.storage import Local
+from prefect.run_configs import DockerRun
+from prefect.utilities.logging import get_logger
+
+from pipelines.brt.extract_load.tasks import validate_layer
+from pipelines.brt.transform.tasks import (
+    build_gold_tables,
+    check_transform_trigger,
+    record_transform,
+    run_dbt,
+    unlock_transform
+)
+from pipelines.constants import Constants
+from pipelines.utils.metrics import flush_metrics_on_finish
+from pipelines.utils.transform_trigger import DEFAULT_MAX_STALENESS_SECONDS, DEFAULT_MIN_INTERVAL_SECONDS
+
+
+logger = get_logger()
+
+
+# Configuração do Flow
+with Flow(
+    name="BRT: Transform on New Bronze Data",
+    state_handlers=[flush_metrics_on_finish]
+) as brt_transform_flow:
+
+    # =========================================================================
+    # PARÂMETROS DO FLOW
+    # =========================================================================
+
+    bucket_name = Parameter(
+        "bucket_name",
+        default=os.getenv("GCS_BUCKET_NAME", Constants.GCS_BUCKET_NAME.value),
+        required=False
+    )
+
+    # Origem dos dados novos: "queue" (manifestos da captura) ou "bronze" (marca d'água no GCS)
+    trigger_source = Parameter(
+        "trigger_source",
+        default=os.getenv("TRANSFORM_TRIGGER_SOURCE", "queue"),
+        required=False
+    )
+
+    # Prefixos bronze cuja marca d'água dispara o transform, separados por vírgula
+    bronze_prefixes = Parameter(
+        "bronze_prefixes",
+        default=os.getenv("TRANSFORM_BRONZE_PREFIXES", "bronze/brt_gps"),
+        required=False
+    )
+
+    # Tabela bronze lida pela silver: brt_gps_external ou brt_gps (nativa)
+    bronze_table = Parameter(
+        "bronze_table",
+        default=os.getenv("BRONZE_TABLE", "brt_gps_external"),
+        required=False
+    )
+
+    # Intervalo mínimo entre transforms e idade máxima do gold (segundos)
+    min_interval_seconds = Parameter(
+        "min_interval_seconds",
+        default=float(os.getenv("TRANSFORM_MIN_INTERVAL_SECONDS", DEFAULT_MIN_INTERVAL_SECONDS)),
+        required=False
+    )
+
+    max_staleness_seconds = Parameter(
+        "max_staleness_seconds",
+        default=float(os.getenv("TRANSFORM_MAX_STALENESS_SECONDS", DEFAULT_MAX_STALENESS_SECONDS)),
+        required=False
+    )
+
+    output_dir = Parameter(
+        "output_dir",
+        default="./data",
+        required=False
+    )
+
+    dataset_id = Parameter(
+        "dataset_id",
+        default=Constants.BQ_DATASET_RAW.value,
+        required=False
+    )
+
+    # Dry-run do BigQuery (dbt só compila, gold só estima), lido via contexto do
+    # flow run como no flow de extract/load. Este flow não usa checkpoints: cada
+    # transform roda o dbt de fato
+    bq_dry_run = Parameter(
+        "bq_dry_run",
+        default=os.getenv("BQ_DRY_RUN", "false"),
+        required=False
+    )
+    brt_transform_flow.add_task(bq_dry_run)
+
+    # =========================================================================
+    # FLOW LOGIC
+    # =========================================================================
+
+    decision = check_transform_trigger(
+        bucket_name=bucket_name,
+        bronze_prefixes=bronze_prefixes,
+        output_dir=output_dir,
+        min_interval_seconds=min_interval_seconds,
+        max_staleness_seconds=max_staleness_seconds,
+        trigger_source=trigger_source
+    )
+
+    # Todas as capturas desde o último transform entram em um único dbt + gold
+    with case(decision["run"], True):
+        dbt_result = run_dbt(
+            dataset_id=dataset_id,
+            materialize=True,
+            dbt_vars={"bronze_table": bronze_table}
+        )
+
+        validate_silver = validate_layer(
+            project_id="civitas-data-eng",
+            layer_name="Silver",
+            table_id="civitas_silver.stg_brt_gps",
+            min_records=1,
+            upstream_tasks=[dbt_result]
+        )
+
+        gold_tables = build_gold_tables(
+            project_id="civitas-data-eng",
+            upstream_tasks=[validate_silver]
+        )
+
+        validate_gold = [
+            validate_layer(
+                project_id="civitas-data-eng",
+                layer_name=layer_name,
+                table_id=table_id,
+                min_records=1,
+                upstream_tasks=[gold_tables]
+            )
+            for layer_name, table_id in [
+                ("Gold - Linhas", "civitas_gold.dim_brt_linhas"),
+                ("Gold - Veículos", "civitas_gold.dim_brt_veiculos"),
+                ("Gold - Viagens", "civitas_gold.fct_brt_viagens"),
+                ("Gold - Métricas", "civitas_gold.agg_metricas_horarias"),
+            ]
+        ]
+
+        # A marca d'água só avança com o gold validado
+        transform_state = record_transform(
+            decision=decision,
+            output_dir=output_dir,
+            upstream_tasks=validate_gold
+        )
+
+    # Libera o lock mesmo com falha no dbt/gold (o lote volta para a fila no próximo run)
+    queue_report = unlock_transform(
+        output_dir=output_dir,
+        upstream_tasks=[transform_state]
+    )
+
+# O run falha com o transform, não com a liberação do lock
+brt_transform_flow.set_reference_tasks([decision, transform_state])
+
+
+# =========================================================================
+# CONFIGURAÇÃO DE STORAGE E RUN
+# =========================================================================
+
+brt_transform_flow.storage = Local(
+    path="./pipelines/",
+    stored_as_script=True
+)
+
+brt_transform_flow.run_config = DockerRun(
+    image="civitas-brt-pipeline:latest",
+    labels=["civitas", "brt", "transform"]
+)
+
+
+# =========================================================================
+# METADATA
+# =========================================================================
+
+brt_transform_flow.metadata = {
+    "project": "CIVITAS",
+    "domain": "BRT",
+    "pipeline": "transform",
+    "version": "1.0.0",
+    "description": "dbt + gold desacoplados da captura, coalescendo os arquivos pendentes na fila local"
+}
+
+
+if __name__ == "__main__":
+    state = brt_transform_flow.run()
+    logger.info(f" Status final: {state}")
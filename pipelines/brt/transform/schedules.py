@@ -0,0 +1,43 @@
+"""
+Schedules para o transform disparado pela bronze
+"""
+from datetime import timedelta
+
+from prefect.schedules import Schedule
+from prefect.schedules.clocks import IntervalClock
+
+from pipelines.constants import Constants
+
+
+# =========================================================================
+# SCHEDULE: Verificação da marca d'água (a cada minuto)
+# =========================================================================
+
+# O schedule só verifica a fila (ou a bronze); o dbt + gold roda quando há
+# dados novos e o intervalo mínimo passou (ou quando o gold passa da idade
+# máxima), e runs sobrepostos saem sem transform pelo lock. Registre este
+# schedule junto com TRANSFORM_MODE=triggered na captura: sem ele, a captura
+# desacoplada só enfileira e a bronze nunca chega ao gold
+brt_transform_trigger_schedule = Schedule(
+    clocks=[
+        IntervalClock(
+            interval=timedelta(minutes=Constants.CAPTURE_INTERVAL_MINUTES.value),
+            parameter_defaults={
+                "bucket_name": Constants.GCS_BUCKET_NAME.value,
+                "bronze_prefixes": "bronze/brt_gps",
+                "output_dir": "./data",
+                "dataset_id": Constants.BQ_DATASET_RAW.value
+            },
+            labels=["civitas", "brt", "scheduled", "transform"]
+        )
+    ]
+)
+
+
+# =========================================================================
+# EXPORTAR SCHEDULES
+# =========================================================================
+
+__all__ = [
+    "brt_transform_trigger_schedule"
+]
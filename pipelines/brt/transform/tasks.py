@@ -0,0 +1,239 @@
+"""
+Tasks do transform disparado pela fila de manifestos ou pela marca d'água da bronze
+"""
+from datetime import timedelta
+from typing import Dict
+import time
+
+import prefect
+from prefect import task
+from prefect.triggers import all_finished
+from prefect.utilities.logging import get_logger
+
+from pipelines.brt.extract_load.tasks import create_gold_tables, trigger_dbt_run
+from pipelines.utils.bq_accounting import is_dry_run
+from pipelines.utils.checkpoint import without_checkpoint
+from pipelines.utils.handoff_queue import TransformQueue, report_queue, transform_queue_dir
+from pipelines.utils.metrics import get_registry, instrumented
+from pipelines.utils.profiling import profiled
+from pipelines.utils.transform_trigger import (
+    DEFAULT_MAX_STALENESS_SECONDS,
+    DEFAULT_MIN_INTERVAL_SECONDS,
+    acquire_transform_lock,
+    decide_transform,
+    read_transform_state,
+    release_transform_lock,
+    scan_bronze_watermark,
+    transform_state_path,
+    write_transform_state
+)
+
+
+logger = get_logger()
+
+# Buckets (segundos) do atraso entre o enfileiramento de um arquivo e o fim do transform
+TRANSFORM_LAG_BUCKETS = (60.0, 120.0, 300.0, 600.0, 900.0, 1800.0, 3600.0, 7200.0)
+
+# dbt e gold do extract/load sem checkpoint: o dado novo não aparece nos
+# argumentos, então um resultado reaproveitado liberaria a fila (e a limpeza da
+# bronze) sem o dbt ter lido os arquivos do lote
+run_dbt = without_checkpoint(trigger_dbt_run)
+build_gold_tables = without_checkpoint(create_gold_tables)
+
+
+@task(
+    name="Check Transform Trigger",
+    max_retries=1,
+    retry_delay=timedelta(seconds=10),
+    tags=["transformation", "trigger"]
+)
+@instrumented
+@profiled
+def check_transform_trigger(
+    bucket_name: str,
+    bronze_prefixes: str = "bronze/brt_gps",
+    output_dir: str = "./data",
+    min_interval_seconds: float = DEFAULT_MIN_INTERVAL_SECONDS,
+    max_staleness_seconds: float = DEFAULT_MAX_STALENESS_SECONDS,
+    trigger_source: str = "queue"
+) -> Dict:
+    """
+    Decide se este run faz o transform e, se sim, reivindica o lote.
+
+    Só um transform roda por vez: sem o lock de <output_dir>/state/transform.lock
+    o run termina sem transform (o que está rodando consome a fila). Com o
+    lock, lotes de transforms interrompidos voltam para a fila e os
+    pendentes são comparados com o estado do último transform concluído.
+
+    Com `trigger_source="queue"` os dados novos são os manifestos que a
+    captura enfileirou; todos os pendentes entram em um único lote. Com
+    "bronze", são os CSVs do bucket posteriores à marca d'água. Sem
+    checkpoint: a decisão é refeita a cada run.
+
+    Args:
+        bucket_name: Bucket GCS
+        bronze_prefixes: Prefixos bronze observados, separados por vírgula ("bronze")
+        output_dir: Diretório local (fila e estado do transform)
+        min_interval_seconds: Intervalo mínimo entre transforms
+        max_staleness_seconds: Idade máxima do gold (0 = desligado)
+        trigger_source: "queue" ou "bronze"
+
+    Returns:
+        Dict com run (bool), reason, watermark, pending_files, batch_id,
+        queue (profundidade e atraso) e started_at
+
+    Raises:
+        ValueError: trigger_source desconhecida
+    """
+    if trigger_source not in ("queue", "bronze"):
+        raise ValueError(f"trigger_source inválida: {trigger_source} (use queue ou bronze)")
+
+    started_at = time.time()
+    queue_dir = transform_queue_dir(output_dir)
+    queue = TransformQueue(queue_dir)
+
+    if not acquire_transform_lock(output_dir):
+        stats = report_queue(queue, started_at)
+        logger.info(
+            f"⏸️  Transform já em andamento; fila: {stats['depth']} pendente(s), "
+            f"{stats['inflight']} em transform, atraso {stats['lag_seconds']:.0f}s"
+        )
+        return {"run": False, "reason": "transform em andamento", "queue": stats, "started_at": started_at}
+
+    requeued = queue.requeue_inflight()
+    if requeued:
+        logger.warning(f"♻️  {requeued} manifesto(s) de um transform interrompido voltaram para a fila")
+
+    state = read_transform_state(transform_state_path(output_dir))
+    since = float(state.get("watermark") or 0.0)
+    stats = report_queue(queue, started_at)
+
+    if trigger_source == "queue":
+        scan = {
+            "watermark": started_at,
+            "files": stats["depth"],
+            "pending_files": stats["depth"],
+            "oldest_pending": stats["oldest_enqueued_at"],
+        }
+    else:
+        prefixes = [p.strip() for p in str(bronze_prefixes).split(",") if p.strip()]
+        try:
+            scan = scan_bronze_watermark(bucket_name, prefixes, since=since)
+        except Exception as e:
+            # Sem marca d'água o transform ainda roda pela idade máxima do gold
+            logger.warning(f"⚠️  Marca d'água da bronze indisponível: {e}")
+            scan = None
+
+    run, reason = decide_transform(
+        state,
+        scan,
+        now=started_at,
+        min_interval_seconds=float(min_interval_seconds),
+        max_staleness_seconds=float(max_staleness_seconds)
+    )
+
+    lag = f"{started_at - scan['oldest_pending']:.0f}s" if scan and scan["oldest_pending"] else "-"
+    logger.info(
+        f"{'▶️ ' if run else '⏸️ '} Transform {'disparado' if run else 'adiado'}: {reason} "
+        f"(fila: {stats['depth']} pendente(s), atraso: {lag})"
+    )
+
+    batch_id = None
+    if run:
+        # O lote fecha aqui: o que a captura enfileirar durante o dbt fica para o próximo
+        batch_id, manifests = queue.claim()
+        if batch_id:
+            logger.info(f"📦 Lote {batch_id}: {len(manifests)} arquivo(s) coalescido(s)")
+    else:
+        release_transform_lock(output_dir)
+
+    return {
+        "run": run,
+        "reason": reason,
+        "watermark": scan["watermark"] if scan else since,
+        "pending_files": scan["pending_files"] if scan else None,
+        "batch_id": batch_id,
+        "queue": stats,
+        "started_at": started_at
+    }
+
+
+@task(
+    name="Record Transform Watermark",
+    tags=["transformation", "trigger"]
+)
+@instrumented
+@profiled
+def record_transform(decision: Dict, output_dir: str = "./data") -> Dict:
+    """
+    Registra o transform concluído e remove o lote consumido da fila.
+
+    A marca d'água é a lida no início do run: CSVs e manifestos que
+    chegaram durante o dbt entram no próximo transform. Em dry-run nem o
+    estado nem a fila avançam (o lote volta para a fila no próximo run).
+
+    Args:
+        decision: Saída de check_transform_trigger
+        output_dir: Diretório local (fila e estado do transform)
+
+    Returns:
+        Estado gravado
+    """
+    finished_at = time.time()
+    state = {
+        "watermark": decision["watermark"],
+        "transformed_at": decision["started_at"],
+        "pending_files": decision["pending_files"],
+        "batch_id": decision.get("batch_id"),
+        "duration_seconds": round(finished_at - decision["started_at"], 1),
+        "flow_run_id": prefect.context.get("flow_run_id")
+    }
+
+    if is_dry_run():
+        logger.info("🧪 Dry-run: marca d'água do transform não avançada")
+        return state
+
+    write_transform_state(transform_state_path(output_dir), state)
+
+    max_lag = None
+    if decision.get("batch_id"):
+        consumed = TransformQueue(transform_queue_dir(output_dir)).ack(decision["batch_id"])
+        registry = get_registry()
+        registry.inc("pipeline_transform_queue_consumed", len(consumed))
+        lags = [finished_at - float(m.get("enqueued_at", finished_at)) for m in consumed]
+        for lag in lags:
+            registry.observe("pipeline_transform_lag_seconds", lag, buckets=TRANSFORM_LAG_BUCKETS)
+        max_lag = max(lags, default=None)
+
+    files = state["pending_files"] if state["pending_files"] is not None else "?"
+    lag_info = f", atraso máximo {max_lag:.0f}s" if max_lag is not None else ""
+    logger.info(f"✅ Transform concluído em {state['duration_seconds']:.0f}s ({files} arquivo(s) coalescido(s){lag_info})")
+    return state
+
+
+@task(
+    name="Release Transform Lock",
+    trigger=all_finished,
+    skip_on_upstream_skip=False,
+    tags=["transformation", "trigger"]
+)
+@instrumented
+@profiled
+def unlock_transform(output_dir: str = "./data") -> Dict:
+    """
+    Libera o lock do transform (também quando o dbt ou o gold falham) e reporta a fila.
+
+    Args:
+        output_dir: Diretório local (fila do transform)
+
+    Returns:
+        Profundidade e atraso da fila ao fim do run
+    """
+    released = release_transform_lock(output_dir)
+    stats = report_queue(TransformQueue(transform_queue_dir(output_dir)))
+    if released:
+        logger.info(
+            f"🔓 Lock do transform liberado; fila: {stats['depth']} pendente(s), "
+            f"atraso {stats['lag_seconds']:.0f}s"
+        )
+    return stats
@@ -17,10 +17,21 @@ class Constants(Enum):
     # API BRT
     BRT_API_URL = "https://dados.mobilidade.rio/gps/brt"
     
+    # API ônibus convencionais (SPPO) e cadência de polling do feed
+    SPPO_API_URL = "https://dados.mobilidade.rio/gps/sppo"
+    SPPO_POLL_INTERVAL_SECONDS = 30
+    
     # Configuraes de execuo
     CAPTURE_INTERVAL_MINUTES = 1
     CSV_GENERATION_MINUTES = 10
     
+    # Polling adaptativo (limites do intervalo entre requisições, em segundos)
+    POLL_MIN_INTERVAL_SECONDS = 15
+    POLL_MAX_INTERVAL_SECONDS = 300
+    
+    # Raio de associação fix → estação BRT (opt-in via parâmetro stations_path)
+    STATION_MATCH_RADIUS_M = 150
+    
     # Prefect
     PREFECT_BACKEND = "server"
     PREFECT_PROJECT_NAME = "desafio-civitas"
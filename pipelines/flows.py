@@ -4,11 +4,19 @@ Importar este arquivo registra todos os flows automaticamente
 """
 
 # Importar flows
+from pipelines.brt.backfill.flows import brt_backfill_flow
+from pipelines.brt.compaction.flows import brt_compaction_flow
 from pipelines.brt.extract_load.flows import brt_extract_load_flow
+from pipelines.brt.transform.flows import brt_transform_flow
+from pipelines.gps_feeds.capture.flows import gps_feeds_capture_flow
 
 # Lista de todos os flows disponveis
 ALL_FLOWS = [
     brt_extract_load_flow,
+    brt_backfill_flow,
+    brt_compaction_flow,
+    brt_transform_flow,
+    gps_feeds_capture_flow,
 ]
 
-__all__ = ["ALL_FLOWS", "brt_extract_load_flow"]
+__all__ = ["ALL_FLOWS", "brt_extract_load_flow", "brt_backfill_flow", "brt_compaction_flow", "brt_transform_flow", "gps_feeds_capture_flow"]
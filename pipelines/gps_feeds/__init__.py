@@ -0,0 +1,3 @@
+"""
+Pipeline GPS multi-feed - Captura concorrente dos feeds da Data.Rio
+"""
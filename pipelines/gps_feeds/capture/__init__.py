@@ -0,0 +1,3 @@
+"""
+Flow de captura concorrente dos feeds de GPS
+"""
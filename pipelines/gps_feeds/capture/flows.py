@@ -0,0 +1,145 @@
+"""
+Flow de captura concorrente dos feeds de GPS da Data.Rio
+"""
+import os
+
+from prefect import Flow, Parameter
+from prefect.storage import Local
+from prefect.run_configs import DockerRun
+from prefect.utilities.logging import get_logger
+
+from pipelines.gps_feeds.capture.tasks import capture_gps_feeds
+from pipelines.constants import Constants
+from pipelines.utils.metrics import flush_metrics_on_finish
+
+
+logger = get_logger()
+
+
+# Configuração do Flow
+with Flow(
+    name="GPS: Multi-feed Capture",
+    state_handlers=[flush_metrics_on_finish]
+) as gps_feeds_capture_flow:
+    
+    # =========================================================================
+    # PARÂMETROS DO FLOW
+    # =========================================================================
+    
+    # Feeds do registro (pipelines.utils.feeds.FEED_REGISTRY), separados por vírgula.
+    # O BRT já é capturado em bronze/brt_gps pelo flow "BRT: Extract and Load":
+    # incluir "brt" aqui só sem aquele flow agendado, ou os CSVs se duplicam
+    feeds = Parameter(
+        "feeds",
+        default=os.getenv("CAPTURE_FEEDS", "sppo"),
+        required=False
+    )
+    
+    # Janela de captura: cada feed faz polling na própria cadência até o fim da janela
+    capture_window_seconds = Parameter(
+        "capture_window_seconds",
+        default=float(os.getenv("CAPTURE_WINDOW_SECONDS", (Constants.CSV_GENERATION_MINUTES.value - 1) * 60)),
+        required=False
+    )
+    
+    bucket_name = Parameter(
+        "bucket_name",
+        default=os.getenv("GCS_BUCKET_NAME", Constants.GCS_BUCKET_NAME.value),
+        required=False
+    )
+    
+    output_dir = Parameter(
+        "output_dir",
+        default="./data",
+        required=False
+    )
+    
+    stations_path = Parameter(
+        "stations_path",
+        default=os.getenv("BRT_STATIONS_FILE"),
+        required=False
+    )
+    
+    credentials_path = Parameter(
+        "credentials_path",
+        default=os.getenv("GOOGLE_APPLICATION_CREDENTIALS"),
+        required=False
+    )
+    
+    keep_local_files = Parameter(
+        "keep_local_files",
+        default=False,
+        required=False
+    )
+    
+    # Endpoint local de última posição por veículo/linha (0 = desligado)
+    positions_port = Parameter(
+        "positions_port",
+        default=int(os.getenv("POSITIONS_PORT", "0")),
+        required=False
+    )
+    
+    # Interface do endpoint (127.0.0.1 = só local; 0.0.0.0 para expor fora do container)
+    positions_host = Parameter(
+        "positions_host",
+        default=os.getenv("POSITIONS_HOST", "127.0.0.1"),
+        required=False
+    )
+    
+    # Enfileira os arquivos enviados para o flow de transform (TRANSFORM_MODE=triggered,
+    # que exige o flow "BRT: Transform on New Bronze Data" agendado)
+    transform_queue = Parameter(
+        "transform_queue",
+        default=os.getenv("TRANSFORM_MODE", "inline") == "triggered",
+        required=False
+    )
+    
+    # =========================================================================
+    # FLOW LOGIC
+    # =========================================================================
+    
+    capture_summary = capture_gps_feeds(
+        feeds=feeds,
+        capture_window_seconds=capture_window_seconds,
+        output_dir=output_dir,
+        bucket_name=bucket_name,
+        credentials_path=credentials_path,
+        stations_path=stations_path,
+        keep_local_files=keep_local_files,
+        positions_port=positions_port,
+        transform_queue=transform_queue,
+        positions_host=positions_host
+    )
+
+
+# =========================================================================
+# CONFIGURAÇÃO DE STORAGE E RUN
+# =========================================================================
+
+gps_feeds_capture_flow.storage = Local(
+    path="./pipelines/",
+    stored_as_script=True
+)
+
+gps_feeds_capture_flow.run_config = DockerRun(
+    image="civitas-brt-pipeline:latest",
+    labels=["civitas", "gps", "capture"]
+)
+
+
+# =========================================================================
+# METADATA
+# =========================================================================
+
+gps_feeds_capture_flow.metadata = {
+    "project": "CIVITAS",
+    "domain": "GPS",
+    "pipeline": "capture",
+    "version": "1.0.0",
+    "description": "Captura concorrente dos feeds de GPS (BRT, ônibus) da API Data.Rio"
+}
+
+
+if __name__ == "__main__":
+    state = gps_feeds_capture_flow.run(parameters={"capture_window_seconds": 0})
+    logger.info(f" Status final: {state}")
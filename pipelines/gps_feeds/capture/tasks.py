@@ -0,0 +1,196 @@
+"""
+Tasks de captura concorrente dos feeds de GPS
+"""
+from datetime import timedelta
+from typing import Dict, List, Optional
+import os
+
+from prefect import task
+from prefect.utilities.logging import get_logger
+
+from pipelines.utils.bq_accounting import is_dry_run
+from pipelines.utils.feeds import FeedConfig, parse_feed_names
+from pipelines.utils.metrics import get_registry, instrumented, record_bytes_uploaded
+from pipelines.utils.profiling import profiled
+
+
+logger = get_logger()
+
+
+@task(
+    name="Capture GPS Feeds",
+    max_retries=1,
+    retry_delay=timedelta(seconds=30),
+    tags=["extraction", "api"]
+)
+@instrumented
+@profiled
+def capture_gps_feeds(
+    feeds: str,
+    capture_window_seconds: float = 0,
+    output_dir: str = "./data",
+    bucket_name: Optional[str] = None,
+    credentials_path: Optional[str] = None,
+    stations_path: Optional[str] = None,
+    keep_local_files: bool = False,
+    positions_port: int = 0,
+    transform_queue: bool = False,
+    positions_host: Optional[str] = None
+) -> Dict[str, Dict]:
+    """
+    Captura os feeds do registro concorrentemente e grava cada um no seu prefixo.
+    
+    Cada feed faz polling na própria cadência com fila limitada; a cada
+    `flush_records` registros novos (e no fim da janela) o lote passa pelo
+    quality gate, vira um CSV bronze (estado de trajeto por feed em
+    <output_dir>/state/track_state_<feed>.csv) e sobe para
+    gs://<bucket>/<prefixo do feed>/ em stream, sem arquivo local (exceto
+    com keep_local_files ou se o stream falhar).
+    
+    Cada snapshot também atualiza a última posição por veículo em memória;
+    com `positions_port`, ela é servida em http://<positions_host>:<porta>/
+    (<feed>/veiculos/<codigo>, <feed>/linhas/<linha>) enquanto o processo viver.
+    
+    Com `transform_queue`, cada arquivo enviado ao GCS de um feed que o
+    transform consome (handoff_queue.TRANSFORM_FEEDS) ganha um manifesto na
+    fila local do flow de transform (<output_dir>/queue/transform); a
+    captura não espera pelo dbt.
+    
+    Args:
+        feeds: Feeds separados por vírgula (ex: "brt,sppo")
+        capture_window_seconds: Duração da janela de captura (0 = um poll por feed)
+        output_dir: Diretório local de saída
+        bucket_name: Bucket GCS (None = só grava localmente; ignorado em dry-run)
+        credentials_path: Caminho para credenciais GCP
+        stations_path: CSV de estações BRT
+        keep_local_files: Mantém os CSVs locais após o upload
+        positions_port: Porta do endpoint de posições (0 = desligado)
+        transform_queue: Enfileira os arquivos enviados para o flow de transform
+        positions_host: Interface do endpoint de posições (padrão: POSITIONS_HOST ou 127.0.0.1)
+        
+    Returns:
+        Estatísticas por feed (polls, erros, descartes, registros, arquivos)
+        
+    Raises:
+        ValueError: Nenhum feed informado ou feed desconhecido
+    """
+    from pipelines.utils.bronze import iter_record_chunks, stream_bronze_csv, write_bronze_csv_chunked, write_quarantine
+    from pipelines.utils.feed_capture import capture_feeds
+    from pipelines.utils.gcp import upload_if_changed
+    from pipelines.utils.handoff_queue import TRANSFORM_FEEDS, TransformQueue, report_queue, transform_queue_dir
+    from pipelines.utils.positions import start_position_server
+    from pipelines.utils.quality import split_by_quality
+    
+    import pandas as pd
+    
+    selected = parse_feed_names(feeds)
+    if not selected:
+        raise ValueError("Nenhum feed informado")
+    
+    if positions_port:
+        start_position_server(host=positions_host, port=int(positions_port))
+    
+    if bucket_name and is_dry_run():
+        logger.info("🧪 Dry-run (BQ_DRY_RUN): CSVs só gravados localmente, sem upload nem fila do transform")
+        bucket_name = None
+    
+    state_dir = os.path.join(output_dir, "state")
+    queue = TransformQueue(transform_queue_dir(output_dir)) if transform_queue else None
+    
+    def handoff(feed: FeedConfig, uri: str, records: int) -> None:
+        if queue is not None and feed.name in TRANSFORM_FEEDS:
+            queue.enqueue({"uri": uri, "feed": feed.name, "records": records})
+            get_registry().inc("pipeline_transform_queue_enqueued", feed=feed.name)
+    
+    def flush(feed: FeedConfig, records: List[Dict]) -> Optional[str]:
+        track_state_path = os.path.join(state_dir, f"track_state_{feed.name}.csv")
+        gate = {"accepted": 0, "rejected": [], "counts": {}}
+        
+        def gated(batch: List[Dict]) -> "pd.DataFrame":
+            accepted, rejected, counts = split_by_quality(pd.DataFrame(batch), track_state_path=track_state_path)
+            gate["accepted"] += len(accepted)
+            if len(rejected) > 0:
+                gate["rejected"].append(rejected)
+            for rule, count in counts.items():
+                gate["counts"][rule] = gate["counts"].get(rule, 0) + count
+            return accepted
+        
+        if bucket_name and not keep_local_files:
+            # Direto para o GCS; o arquivo local só aparece se o stream falhar
+            # (o fallback precisa do lote aprovado inteiro)
+            csv_path = stream_bronze_csv(
+                gated(records),
+                bucket_name=bucket_name,
+                destination_prefix=feed.gcs_prefix,
+                filename_prefix=feed.file_prefix,
+                output_dir=output_dir,
+                track_state_path=track_state_path,
+                stations_path=stations_path,
+                credentials_path=credentials_path
+            )
+        else:
+            # Quality gate e gravação bloco a bloco: só um bloco vira DataFrame por vez
+            csv_path = write_bronze_csv_chunked(
+                (gated(chunk) for chunk in iter_record_chunks(records)),
+                output_dir=output_dir,
+                filename_prefix=feed.file_prefix,
+                track_state_path=track_state_path,
+                stations_path=stations_path
+            )
+        
+        if gate["rejected"]:
+            rejected = pd.concat(gate["rejected"], ignore_index=True)
+            report = {
+                "feed": feed.name,
+                "records_in": len(records),
+                "records_accepted": gate["accepted"],
+                "records_rejected": len(rejected),
+                "rejections_by_rule": gate["counts"],
+                "quarantine_file": None
+            }
+            write_quarantine(rejected, report, output_dir, feed.file_prefix)
+        
+        accepted_count = gate["accepted"]
+        if csv_path is None or not bucket_name:
+            return csv_path
+        if csv_path.startswith("gs://"):
+            handoff(feed, csv_path, accepted_count)
+            return csv_path
+        
+        gcs_uri, uploaded = upload_if_changed(
+            bucket_name=bucket_name,
+            source_file_path=csv_path,
+            destination_blob_name=f"{feed.gcs_prefix}/{os.path.basename(csv_path)}",
+            credentials_path=credentials_path
+        )
+        if uploaded:
+            record_bytes_uploaded(os.path.getsize(csv_path))
+        if not keep_local_files:
+            os.remove(csv_path)
+        handoff(feed, gcs_uri, accepted_count)
+        logger.info(f"   ☁️  [{feed.name}] {accepted_count} registros -> {gcs_uri}")
+        return gcs_uri
+    
+    logger.info(f"🚀 Capturando {len(selected)} feed(s) por {float(capture_window_seconds):.0f}s: "
+                f"{', '.join(feed.name for feed in selected)}")
+    
+    summary = capture_feeds(selected, float(capture_window_seconds), flush, state_dir=state_dir)
+    
+    for name, stats in summary.items():
+        logger.info(
+            f"📊 [{name}] polls: {stats['polls']} | registros: {stats['records']} | "
+            f"arquivos: {len(stats['files'])} | erros: {stats['errors']} | "
+            f"descartados: {stats['dropped_snapshots']}"
+        )
+    
+    if queue is not None:
+        queue_stats = report_queue(queue)
+        logger.info(
+            f"📬 Fila do transform: {queue_stats['depth']} pendente(s), "
+            f"{queue_stats['inflight']} em transform, atraso {queue_stats['lag_seconds']:.0f}s"
+        )
+    
+    if not any(stats["records"] for stats in summary.values()):
+        logger.warning("⚠️  Nenhum feed capturou registros novos na janela")
+    
+    return summary
@@ -0,0 +1,303 @@
+"""
+Backfill histórico: reprocessa os CSVs bronze arquivados, um processo por dia
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+from prefect.utilities.logging import get_logger
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+logger = get_logger()
+
+# Prefixo onde cleanup_all_data arquiva os CSVs bronze (<prefixo>/dt=AAAA-MM-DD/)
+ARCHIVE_PREFIX = "archive/brt_gps"
+
+# Saída do backfill, particionada por dia (<prefixo>/dt=AAAA-MM-DD/brt_gps_AAAAMMDD.csv)
+OUTPUT_PREFIX = "backfill/brt_gps"
+
+# Data de captura no nome dos CSVs gerados pela ingestão (brt_gps_AAAAMMDD_HHMMSS.csv)
+FILENAME_DATE_PATTERN = re.compile(r"_(\d{8})_\d{6}\.csv$")
+
+# Arquivo de um dia: (nome do blob, md5 do conteúdo)
+ArchivedFile = Tuple[str, str]
+
+
+def date_range(start_date: str, end_date: str) -> List[str]:
+    """
+    Dias do intervalo fechado [start_date, end_date] em AAAA-MM-DD.
+
+    Raises:
+        ValueError: Datas inválidas ou fim anterior ao início
+    """
+    start = date.fromisoformat(str(start_date))
+    end = date.fromisoformat(str(end_date))
+    if end < start:
+        raise ValueError(f"Intervalo de backfill inválido: {start_date} > {end_date}")
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+def day_from_blob_name(name: str) -> Optional[str]:
+    """Dia (AAAA-MM-DD) da partição dt= ou do timestamp no nome do arquivo."""
+    partition = re.search(r"/dt=(\d{4}-\d{2}-\d{2})/", name)
+    if partition:
+        return partition.group(1)
+    match = FILENAME_DATE_PATTERN.search(name)
+    if match:
+        return datetime.strptime(match.group(1), "%Y%m%d").date().isoformat()
+    return None
+
+
+def archive_blob_name(name: str, fallback_day: str, archive_prefix: str = ARCHIVE_PREFIX) -> str:
+    """Destino de um CSV bronze no arquivo histórico, particionado pelo dia de captura."""
+    day = day_from_blob_name(name) or fallback_day
+    return f"{archive_prefix.rstrip('/')}/dt={day}/{os.path.basename(name)}"
+
+
+def list_archived_files(
+    bucket_name: str,
+    start_date: str,
+    end_date: str,
+    archive_prefix: str = ARCHIVE_PREFIX,
+    bronze_prefix: Optional[str] = "bronze/brt_gps"
+) -> Dict[str, List[ArchivedFile]]:
+    """
+    Lista os CSVs bronze do intervalo, agrupados por dia.
+
+    O arquivo histórico é listado por partição (um prefixo por dia, sem
+    varrer o bucket inteiro), já considerando as janelas compactadas; o
+    prefixo bronze corrente, que ainda não foi arquivado, é incluído
+    filtrando pela data no nome do arquivo.
+
+    Returns:
+        {dia: [(blob, md5)]} apenas com os dias que têm arquivos
+    """
+    from pipelines.utils.compaction import live_files
+    from pipelines.utils.gcp import get_gcs_client
+
+    days = date_range(start_date, end_date)
+    bucket = get_gcs_client().bucket(bucket_name)
+    files: Dict[str, Dict[str, ArchivedFile]] = {day: {} for day in days}
+
+    for day in days:
+        partition = list(bucket.list_blobs(prefix=f"{archive_prefix.rstrip('/')}/dt={day}/"))
+        for blob in live_files(partition):
+            files[day][os.path.basename(blob.name)] = (blob.name, blob.md5_hash)
+
+    if bronze_prefix:
+        for blob in bucket.list_blobs(prefix=f"{bronze_prefix.rstrip('/')}/"):
+            day = day_from_blob_name(blob.name)
+            # O mesmo CSV pode estar arquivado e ainda no prefixo corrente
+            if day in files and os.path.basename(blob.name) not in files[day]:
+                files[day][os.path.basename(blob.name)] = (blob.name, blob.md5_hash)
+
+    return {day: sorted(entries.values()) for day, entries in files.items() if entries}
+
+
+def input_hash(files: List[ArchivedFile]) -> str:
+    """Hash do conjunto de entradas de um dia (muda se um arquivo for adicionado ou regravado)."""
+    digest = hashlib.sha256()
+    for name, md5 in sorted(files):
+        digest.update(f"{name}:{md5}|".encode())
+    return digest.hexdigest()
+
+
+def _manifest_path(work_dir: str, day: str) -> str:
+    return os.path.join(work_dir, "manifests", f"dt={day}.json")
+
+
+def load_manifest(work_dir: str, day: str) -> Optional[Dict]:
+    """Manifesto de um dia já processado (None se ausente ou ilegível)."""
+    try:
+        with open(_manifest_path(work_dir, day)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_manifest(work_dir: str, manifest: Dict) -> None:
+    path = _manifest_path(work_dir, manifest["day"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def normalize_bronze_frame(df: "pd.DataFrame") -> "pd.DataFrame":
+    """
+    Volta um lote bronze ao formato de entrada da ingestão.
+
+    Mantém só as colunas da API (as derivadas são recalculadas), converte
+    dataHora de texto para milissegundos e deduplica por (codigo, dataHora),
+    ficando com a captura mais recente: arquivos de minutos vizinhos repetem
+    o mesmo fix enquanto o veículo não reporta de novo.
+
+    Returns:
+        DataFrame ordenado por veículo e dataHora
+    """
+    import pandas as pd
+
+    from pipelines.utils.bronze import RAW_COLUMNS
+    from pipelines.utils.datetime_utils import parse_timestamps
+
+    df = df.reindex(columns=RAW_COLUMNS)
+    data_hora, invalid = parse_timestamps(df["dataHora"], source="bronze.dataHora")
+    if len(invalid) > 0:
+        logger.warning(f"   ⚠️  {len(invalid)} valores de dataHora não convertidos descartados")
+    df["dataHora"] = ((data_hora - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)).to_numpy()
+    df = df[data_hora.notna().to_numpy()]
+
+    df = df.sort_values(["codigo", "dataHora", "timestamp_captura"], kind="mergesort")
+    df = df.drop_duplicates(subset=["codigo", "dataHora"], keep="last")
+    return df.reset_index(drop=True)
+
+
+def process_day(
+    day: str,
+    files: List[ArchivedFile],
+    bucket_name: str,
+    work_dir: str,
+    output_prefix: str = OUTPUT_PREFIX,
+    stations_path: Optional[str] = None
+) -> Dict:
+    """
+    Reprocessa um dia: baixa os CSVs, normaliza, deduplica, recalcula as
+    derivações (trajeto, estação, geohash) e grava um CSV particionado.
+
+    Roda em processo separado (um por dia). O trajeto começa sem estado no
+    início do dia, então o resultado não depende da ordem dos processos.
+    Dias cujo manifesto tem o mesmo hash de entrada são pulados.
+
+    Returns:
+        Manifesto do dia (arquivos, contagens, URI de saída)
+    """
+    import pandas as pd
+
+    from pipelines.utils.bronze import write_bronze_csv_chunked, write_quarantine
+    from pipelines.utils.compaction import read_bronze_blob
+    from pipelines.utils.gcp import get_gcs_client, upload_if_changed
+    from pipelines.utils.quality import split_by_quality
+
+    files_hash = input_hash(files)
+    manifest = load_manifest(work_dir, day)
+    if manifest and manifest.get("input_hash") == files_hash and manifest.get("status") == "done":
+        return {**manifest, "skipped": True}
+
+    started = time.monotonic()
+    bucket = get_gcs_client().bucket(bucket_name)
+    frames = [read_bronze_blob(bucket.blob(name)) for name, _ in files]
+    raw = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    del frames
+    records_in = len(raw)
+
+    # Dedup e trajeto precisam do dia inteiro ordenado por veículo; o resto
+    # (enriquecimento e gravação) segue bloco a bloco sobre os aprovados
+    df = normalize_bronze_frame(raw)
+    del raw
+    records_deduplicated = records_in - len(df)
+    accepted, rejected, counts = split_by_quality(df)
+    del df
+
+    day_dir = os.path.join(work_dir, f"dt={day}")
+    shutil.rmtree(day_dir, ignore_errors=True)
+    os.makedirs(day_dir)
+
+    if len(rejected) > 0:
+        write_quarantine(rejected, {"day": day, "rejections_by_rule": counts}, day_dir, f"brt_gps_{day}")
+
+    filename = f"brt_gps_{day.replace('-', '')}.csv"
+    csv_path = write_bronze_csv_chunked(
+        accepted,
+        output_dir=day_dir,
+        track_state_path=os.path.join(day_dir, "track_state.csv"),
+        stations_path=stations_path,
+        filename=filename
+    )
+
+    output_uri = None
+    if csv_path:
+        # Nome fixo por dia: reprocessar o dia substitui o objeto em vez de duplicá-lo
+        blob_name = f"{output_prefix.rstrip('/')}/dt={day}/{filename}"
+        output_uri, _ = upload_if_changed(bucket_name, csv_path, blob_name)
+        os.remove(csv_path)
+
+    manifest = {
+        "day": day,
+        "status": "done",
+        "input_hash": files_hash,
+        "input_files": len(files),
+        "records_in": records_in,
+        "records_deduplicated": records_deduplicated,
+        "records_rejected": len(rejected),
+        "records_out": len(accepted),
+        "output_uri": output_uri,
+        "duration_s": round(time.monotonic() - started, 1),
+        "completed_at": datetime.now().isoformat(),
+    }
+    _save_manifest(work_dir, manifest)
+    return {**manifest, "skipped": False}
+
+
+def run_backfill(
+    files_by_day: Dict[str, List[ArchivedFile]],
+    bucket_name: str,
+    work_dir: str,
+    max_workers: int = 4,
+    output_prefix: str = OUTPUT_PREFIX,
+    stations_path: Optional[str] = None
+) -> Tuple[List[Dict], Dict[str, str]]:
+    """
+    Processa os dias em paralelo (ProcessPoolExecutor, um dia por tarefa).
+
+    Um dia que falha não interrompe os demais; os concluídos ficam no
+    manifesto, então um novo run com o mesmo intervalo só refaz os que
+    faltaram ou cujas entradas mudaram.
+
+    Args:
+        files_by_day: Saída de `list_archived_files`
+        bucket_name: Bucket GCS
+        work_dir: Diretório local de trabalho e manifestos
+        max_workers: Processos simultâneos
+        output_prefix: Prefixo de saída no bucket
+        stations_path: CSV de estações BRT
+
+    Returns:
+        Tupla (manifestos dos dias concluídos, {dia: erro} dos que falharam)
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    manifests: List[Dict] = []
+    failures: Dict[str, str] = {}
+
+    with ProcessPoolExecutor(max_workers=max(int(max_workers), 1)) as pool:
+        futures = {
+            pool.submit(process_day, day, files, bucket_name, work_dir, output_prefix, stations_path): day
+            for day, files in sorted(files_by_day.items())
+        }
+        for future in as_completed(futures):
+            day = futures[future]
+            try:
+                manifest = future.result()
+            except Exception as e:
+                failures[day] = repr(e)
+                logger.error(f"   ❌ {day}: {e!r}")
+                continue
+            manifests.append(manifest)
+            if manifest["skipped"]:
+                logger.info(f"   ♻️  {day}: já processado ({manifest['records_out']} registros)")
+            else:
+                logger.info(
+                    f"   ✅ {day}: {manifest['input_files']} arquivos, {manifest['records_in']} → "
+                    f"{manifest['records_out']} registros em {manifest['duration_s']}s"
+                )
+
+    return sorted(manifests, key=lambda m: m["day"]), failures
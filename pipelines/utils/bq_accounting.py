@@ -0,0 +1,371 @@
+"""
+Contabilidade de custo dos jobs BigQuery (bytes processados/faturados, slots, cache)
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import json
+import os
+import re
+import uuid
+
+import prefect
+from prefect.utilities.logging import get_logger
+
+from pipelines.utils.metrics import current_task_name, get_registry
+
+
+logger = get_logger()
+
+# Variáveis de ambiente (o parâmetro homônimo do flow tem precedência)
+DRY_RUN_ENV_VAR = "BQ_DRY_RUN"
+BUDGET_ENV_VAR = "BQ_MAX_BYTES_PER_RUN"
+BUDGET_ACTION_ENV_VAR = "BQ_BUDGET_ACTION"
+
+# Ledger de jobs (JSON lines), ao lado das métricas OpenMetrics
+LEDGER_FILENAME = "bq_jobs.jsonl"
+
+# Id de execução quando não há flow run (execução avulsa)
+_PROCESS_RUN_ID = str(uuid.uuid4())
+
+# Totais dos runs vistos neste processo (evita reler o ledger a cada query)
+_RUN_TOTALS: Dict[str, Dict] = {}
+
+
+class BudgetExceededError(Exception):
+    """Volume de bytes do run ultrapassou o orçamento configurado."""
+
+
+def _parameter(name: str) -> Optional[str]:
+    """Valor de um parâmetro do flow run (apenas os informados explicitamente)."""
+    return (prefect.context.get("parameters") or {}).get(name)
+
+
+def _truthy(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "sim")
+
+
+def is_dry_run() -> bool:
+    """Modo dry-run ativo (parâmetro bq_dry_run ou BQ_DRY_RUN)."""
+    value = _parameter("bq_dry_run")
+    if value is None:
+        value = os.getenv(DRY_RUN_ENV_VAR, "")
+    return _truthy(value)
+
+
+def get_budget() -> Optional[int]:
+    """Orçamento de bytes faturados por run (parâmetro bq_max_bytes ou BQ_MAX_BYTES_PER_RUN)."""
+    value = _parameter("bq_max_bytes")
+    if value is None:
+        value = os.getenv(BUDGET_ENV_VAR)
+    return int(value) if value not in (None, "", 0, "0") else None
+
+
+def get_budget_action() -> str:
+    """Ação ao exceder o orçamento: 'warn' (padrão) ou 'abort'."""
+    return str(os.getenv(BUDGET_ACTION_ENV_VAR, "warn")).lower()
+
+
+def get_run_id() -> str:
+    """Id do flow run atual (ou do processo, fora do Prefect)."""
+    return prefect.context.get("flow_run_id") or _PROCESS_RUN_ID
+
+
+def _ledger_path() -> str:
+    return os.path.join(get_registry().metrics_dir, LEDGER_FILENAME)
+
+
+def _empty_totals(run_id: str) -> Dict:
+    return {"run_id": run_id, "jobs": 0, "bytes_processed": 0, "bytes_billed": 0, "slot_ms": 0, "cache_hits": 0}
+
+
+def _add_to_totals(totals: Dict, entry: Dict) -> None:
+    totals["jobs"] += 1
+    totals["bytes_processed"] += entry.get("bytes_processed", 0)
+    totals["bytes_billed"] += entry.get("bytes_billed", 0)
+    totals["slot_ms"] += entry.get("slot_ms", 0)
+    totals["cache_hits"] += int(bool(entry.get("cache_hit")))
+
+
+def _sanitize_label(value: str) -> str:
+    """Rótulo BigQuery: minúsculas, [a-z0-9_-], até 63 caracteres."""
+    return re.sub(r"[^a-z0-9_-]", "_", str(value).lower())[:63]
+
+
+def record_job(
+    label: str,
+    bytes_processed: Optional[int],
+    bytes_billed: Optional[int] = None,
+    slot_ms: Optional[int] = None,
+    cache_hit: Optional[bool] = None,
+    job_id: Optional[str] = None,
+    dry_run: bool = False
+) -> Dict:
+    """
+    Registra o custo de um job no ledger e nas métricas do processo.
+
+    Args:
+        label: Identificação do job (ex: 'gold:dim_brt_linhas', 'dbt:model.x')
+        bytes_processed: total_bytes_processed (estimado, em dry-run)
+        bytes_billed: total_bytes_billed
+        slot_ms: Slot-milissegundos consumidos
+        cache_hit: Se o resultado veio do cache
+        job_id: Id do job BigQuery
+        dry_run: Se é apenas uma estimativa
+
+    Returns:
+        Registro gravado no ledger
+    """
+    task_name = current_task_name() or "untracked"
+    entry = {
+        "timestamp": datetime.now().isoformat(),
+        "run_id": get_run_id(),
+        "task": task_name,
+        "label": label,
+        "job_id": job_id,
+        "dry_run": dry_run,
+        "bytes_processed": int(bytes_processed or 0),
+        "bytes_billed": int(bytes_billed or 0),
+        "slot_ms": int(slot_ms or 0),
+        "cache_hit": bool(cache_hit),
+    }
+
+    if not dry_run:
+        registry = get_registry()
+        registry.inc("pipeline_bq_jobs", task=task_name)
+        registry.inc("pipeline_bq_bytes_processed", entry["bytes_processed"], task=task_name)
+        registry.inc("pipeline_bq_bytes_billed", entry["bytes_billed"], task=task_name)
+        registry.inc("pipeline_bq_slot_ms", entry["slot_ms"], task=task_name)
+        if entry["cache_hit"]:
+            registry.inc("pipeline_bq_cache_hits", task=task_name)
+        _add_to_totals(_RUN_TOTALS.setdefault(entry["run_id"], _empty_totals(entry["run_id"])), entry)
+
+    try:
+        os.makedirs(os.path.dirname(_ledger_path()), exist_ok=True)
+        with open(_ledger_path(), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        logger.warning(f"⚠️  Não foi possível gravar ledger BigQuery: {e}")
+
+    return entry
+
+
+def run_totals(run_id: Optional[str] = None, include_dry_run: bool = False) -> Dict:
+    """
+    Soma o custo dos jobs de um run.
+
+    Usa os totais mantidos em memória quando o run executou neste processo;
+    caso contrário (ou incluindo estimativas de dry-run), relê o ledger.
+
+    Args:
+        run_id: Id do run (padrão: run atual)
+        include_dry_run: Incluir estimativas de dry-run
+
+    Returns:
+        Dict com jobs, bytes_processed, bytes_billed, slot_ms e cache_hits
+    """
+    run_id = run_id or get_run_id()
+
+    if run_id in _RUN_TOTALS and not include_dry_run:
+        return dict(_RUN_TOTALS[run_id])
+
+    totals = _empty_totals(run_id)
+    if not os.path.exists(_ledger_path()):
+        return totals
+
+    with open(_ledger_path()) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("run_id") != run_id or (entry.get("dry_run") and not include_dry_run):
+                continue
+            _add_to_totals(totals, entry)
+
+    return totals
+
+
+def enforce_budget(total_bytes: int, context: str = "run") -> None:
+    """
+    Compara um volume de bytes com o orçamento e avisa ou aborta.
+
+    Args:
+        total_bytes: Volume (real ou estimado) a comparar
+        context: Descrição usada na mensagem
+
+    Raises:
+        BudgetExceededError: Se o orçamento foi excedido e a ação é 'abort'
+    """
+    budget = get_budget()
+    if budget is None or total_bytes <= budget:
+        return
+
+    message = (
+        f"Orçamento BigQuery excedido ({context}): "
+        f"{total_bytes / 1024**2:.1f} MB > {budget / 1024**2:.1f} MB"
+    )
+    if get_budget_action() == "abort":
+        logger.error(f"❌ {message}")
+        raise BudgetExceededError(message)
+    logger.warning(f"⚠️  {message}")
+
+
+def run_query(
+    client,
+    sql: str,
+    label: str,
+    dry_run: Optional[bool] = None
+):
+    """
+    Executa uma query passando pela contabilidade de custo.
+
+    Em dry-run, a query é apenas validada e o volume estimado é registrado;
+    nenhum dado é lido e o retorno é None. Com orçamento e ação 'abort', o
+    job recebe `maximum_bytes_billed` igual ao saldo do run, de modo que o
+    próprio BigQuery recusa uma query que o estouraria.
+
+    Args:
+        client: bigquery.Client
+        sql: Query SQL (SELECT, DDL ou DML)
+        label: Identificação do job no ledger
+        dry_run: Força (ou desliga) dry-run; None = configuração do run
+
+    Returns:
+        RowIterator com o resultado, ou None em dry-run
+    """
+    from google.cloud import bigquery
+
+    dry_run = is_dry_run() if dry_run is None else dry_run
+
+    job_config = bigquery.QueryJobConfig(
+        dry_run=dry_run,
+        use_query_cache=not dry_run,
+        labels={
+            "pipeline": "civitas-brt",
+            "task": _sanitize_label(current_task_name() or "untracked"),
+            "run_id": _sanitize_label(get_run_id()),
+        }
+    )
+
+    budget = get_budget()
+    if budget is not None and not dry_run and get_budget_action() == "abort":
+        remaining = budget - run_totals()["bytes_billed"]
+        if remaining <= 0:
+            enforce_budget(budget + 1, context=label)
+        job_config.maximum_bytes_billed = remaining
+
+    job = client.query(sql, job_config=job_config)
+
+    if dry_run:
+        record_job(label, job.total_bytes_processed, job_id=job.job_id, dry_run=True)
+        return None
+
+    rows = job.result()
+    record_job(
+        label,
+        bytes_processed=job.total_bytes_processed,
+        bytes_billed=job.total_bytes_billed,
+        slot_ms=job.slot_millis,
+        cache_hit=job.cache_hit,
+        job_id=job.job_id
+    )
+    enforce_budget(run_totals()["bytes_billed"], context=label)
+
+    return rows
+
+
+def estimate_queries(client, statements: Dict[str, str]) -> Dict:
+    """
+    Estima via dry-run o volume de um conjunto de queries.
+
+    Args:
+        client: bigquery.Client
+        statements: {label: sql}
+
+    Returns:
+        Dict com total_bytes e bytes por label (None se o dry-run falhou)
+    """
+    per_query: Dict[str, Optional[int]] = {}
+    for label, sql in statements.items():
+        try:
+            job = client.query(sql, job_config=_dry_run_config())
+            per_query[label] = int(job.total_bytes_processed or 0)
+            record_job(label, per_query[label], job_id=job.job_id, dry_run=True)
+        except Exception as e:
+            logger.warning(f"   ⚠️  Dry-run falhou para {label}: {e}")
+            per_query[label] = None
+
+    return {
+        "total_bytes": sum(v for v in per_query.values() if v),
+        "queries": per_query,
+    }
+
+
+def _dry_run_config():
+    from google.cloud import bigquery
+
+    return bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+
+
+def record_dbt_run_results(run_results_path: str, not_before: Optional[float] = None) -> List[Dict]:
+    """
+    Registra o custo dos modelos de um `dbt run` a partir do run_results.json.
+
+    O adapter BigQuery grava bytes_processed, bytes_billed e slot_ms em
+    `adapter_response` de cada nó. Um arquivo anterior a `not_before` é de
+    outro run (o dbt falhou antes de gravar o seu) e é ignorado.
+
+    Args:
+        run_results_path: Caminho de target/run_results.json
+        not_before: Início do `dbt run` (epoch); None = aceita qualquer arquivo
+
+    Returns:
+        Lista de registros gravados no ledger
+    """
+    if not os.path.exists(run_results_path):
+        return []
+
+    if not_before is not None and os.path.getmtime(run_results_path) < not_before:
+        logger.warning(f"⚠️  {run_results_path} é de um run anterior, custo do dbt não registrado")
+        return []
+
+    with open(run_results_path) as f:
+        run_results = json.load(f)
+
+    entries = []
+    for result in run_results.get("results", []):
+        response = result.get("adapter_response") or {}
+        if "bytes_processed" not in response and "bytes_billed" not in response:
+            continue
+        entries.append(record_job(
+            label=f"dbt:{result.get('unique_id')}",
+            bytes_processed=response.get("bytes_processed"),
+            bytes_billed=response.get("bytes_billed"),
+            slot_ms=response.get("slot_ms"),
+            job_id=response.get("job_id")
+        ))
+
+    return entries
+
+
+def compiled_dbt_models(compiled_dir: str, layers: Iterable[str] = ("silver", "gold")) -> Dict[str, str]:
+    """
+    Lê o SQL compilado (`dbt compile`) dos modelos para estimativa por dry-run.
+
+    Args:
+        compiled_dir: Diretório target/compiled/<projeto>/models
+        layers: Subpastas de modelos a incluir
+
+    Returns:
+        {'dbt:<camada>/<modelo>': sql}
+    """
+    statements = {}
+    for layer in layers:
+        layer_dir = os.path.join(compiled_dir, layer)
+        if not os.path.isdir(layer_dir):
+            continue
+        for filename in sorted(os.listdir(layer_dir)):
+            if filename.endswith(".sql"):
+                with open(os.path.join(layer_dir, filename)) as f:
+                    statements[f"dbt:{layer}/{filename[:-4]}"] = f.read()
+    return statements
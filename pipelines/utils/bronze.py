@@ -0,0 +1,436 @@
+"""
+Layout bronze dos CSVs de GPS e gravação dos arquivos (bronze e quarentena)
+"""
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Union
+import json
+import os
+import zlib
+
+from prefect.utilities.logging import get_logger
+
+from pipelines.constants import Constants
+from pipelines.utils.metrics import record_bytes_uploaded, record_bytes_written
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+logger = get_logger()
+
+# Linhas serializadas por bloco no upload em stream
+DEFAULT_STREAM_CHUNK_ROWS = 20000
+
+# Linhas enriquecidas e gravadas por bloco na gravação em blocos
+DEFAULT_WRITE_CHUNK_ROWS = 50000
+
+
+# Layout do CSV bronze (posicional: a ordem deve coincidir com as colunas geradas)
+BRONZE_COLUMNS = [
+    ("codigo", "STRING"),
+    ("placa", "STRING"),
+    ("linha", "STRING"),
+    ("latitude", "FLOAT"),
+    ("longitude", "FLOAT"),
+    ("dataHora", "STRING"),
+    ("velocidade", "FLOAT"),
+    ("id_migracao_trajeto", "STRING"),
+    ("sentido", "STRING"),
+    ("trajeto", "STRING"),
+    ("hodometro", "FLOAT"),
+    ("direcao", "STRING"),
+    ("ignicao", "STRING"),
+    ("capacidadePeVeiculo", "INTEGER"),
+    ("capacidadeSentadoVeiculo", "INTEGER"),
+    ("timestamp_captura", "STRING"),
+    # Métricas de trajeto calculadas na ingestão
+    ("distancia_segmento_km", "FLOAT"),
+    ("intervalo_segmento_s", "FLOAT"),
+    ("velocidade_calculada_kmh", "FLOAT"),
+    ("distancia_acumulada_km", "FLOAT"),
+    # Estação BRT mais próxima (dentro do raio)
+    ("estacao_id", "STRING"),
+    ("distancia_estacao_m", "FLOAT"),
+    # Células geohash (~4,9 km, ~1,2 km, ~150 m)
+    ("geohash_5", "STRING"),
+    ("geohash_6", "STRING"),
+    ("geohash_7", "STRING"),
+]
+
+
+# Colunas vindas da API (as seguintes são derivadas na ingestão e podem ser recalculadas)
+_COLUMN_NAMES = [name for name, _ in BRONZE_COLUMNS]
+RAW_COLUMNS = _COLUMN_NAMES[:_COLUMN_NAMES.index("timestamp_captura") + 1]
+
+
+# Marca de índice de estações ainda não carregado (None já significa "sem arquivo de estações")
+_STATIONS_NOT_LOADED = object()
+
+
+def _load_stations(stations_path: Optional[str]):
+    """Índice de estações (None sem stations_path; aviso se o arquivo informado não existir)."""
+    from pipelines.utils.stations import load_station_index
+
+    if not stations_path:
+        return None
+
+    station_index = load_station_index(stations_path, radius_m=Constants.STATION_MATCH_RADIUS_M.value)
+    if station_index is None:
+        logger.warning(f" Arquivo de estações {stations_path} não encontrado, estacao_id ficará vazio")
+    return station_index
+
+
+def bronze_schema() -> List:
+    """
+    Retorna o schema bronze como lista de bigquery.SchemaField.
+    """
+    from google.cloud import bigquery
+
+    return [bigquery.SchemaField(name, field_type) for name, field_type in BRONZE_COLUMNS]
+
+
+def prepare_bronze_frame(
+    data: Union[List[Dict], "pd.DataFrame"],
+    output_dir: str = "./data",
+    track_state_path: Optional[str] = None,
+    stations_path: Optional[str] = None,
+    station_index=_STATIONS_NOT_LOADED
+) -> Optional["pd.DataFrame"]:
+    """
+    Enriquece um lote de fixes e o coloca no layout bronze.
+
+    Adiciona métricas de trajeto (estado entre capturas em `track_state_path`),
+    estação mais próxima e células geohash, converte dataHora (ms) para texto
+    e reordena as colunas conforme BRONZE_COLUMNS.
+
+    Args:
+        data: Lista de dicionários ou DataFrame (campos já no layout bronze)
+        output_dir: Diretório base do estado de trajeto padrão
+        track_state_path: Estado de trajeto (padrão: <output_dir>/state/track_state.csv)
+        stations_path: CSV de estações (None = sem associação à estação)
+        station_index: Índice de estações já carregado (padrão: carrega de stations_path)
+
+    Returns:
+        DataFrame no layout bronze (None se o lote estava vazio)
+    """
+    import pandas as pd
+
+    from pipelines.utils.datetime_utils import parse_timestamps
+    from pipelines.utils.geocell import add_geohash_columns
+    from pipelines.utils.stations import add_station_columns
+    from pipelines.utils.track_metrics import add_track_metrics
+
+    if data is None or len(data) == 0:
+        logger.warning(" Nenhum dado para gerar CSV")
+        return None
+    
+    # Converter para DataFrame
+    df = pd.DataFrame(data)
+    
+    # Métricas de trajeto (distância/velocidade entre fixes consecutivos por veículo)
+    # Calculadas antes da conversão de dataHora, enquanto ainda está em milissegundos
+    if track_state_path is None:
+        track_state_path = os.path.join(output_dir, "state", "track_state.csv")
+    df = add_track_metrics(df, state_path=track_state_path)
+    
+    # Estação mais próxima dentro do raio (índice em grade, consulta vetorizada)
+    if station_index is _STATIONS_NOT_LOADED:
+        station_index = _load_stations(stations_path)
+    df = add_station_columns(df, station_index)
+    
+    # Células geohash em várias resoluções (colunas de clusterização em silver/gold)
+    df = add_geohash_columns(df)
+    
+    # Converter dataHora (epoch ms) e timestamp_captura (ISO) para texto; o
+    # formato de cada coluna é detectado uma vez e reaproveitado nos lotes seguintes
+    for col in ('dataHora', 'timestamp_captura'):
+        if col in df.columns:
+            parsed, invalid = parse_timestamps(df[col], source=col)
+            if len(invalid) > 0:
+                logger.warning(f" {len(invalid)} valores de {col} não convertidos (ex: {invalid.iloc[0]!r})")
+            df[col] = parsed.dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy()
+    
+    # Layout posicional do bronze (external table e load jobs mapeiam por posição)
+    bronze_columns = [name for name, _ in BRONZE_COLUMNS]
+    extra_columns = [c for c in df.columns if c not in bronze_columns]
+    if extra_columns:
+        logger.warning(f" Colunas fora do layout bronze descartadas: {', '.join(extra_columns)}")
+    return df.reindex(columns=bronze_columns)
+
+
+def bronze_filename(filename_prefix: str = "brt_gps") -> str:
+    """Nome de um CSV bronze: <prefixo>_<AAAAMMDD_HHMMSS>.csv."""
+    return f"{filename_prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+
+
+def write_bronze_csv(
+    data: Union[List[Dict], "pd.DataFrame"],
+    output_dir: str = "./data",
+    filename_prefix: str = "brt_gps",
+    track_state_path: Optional[str] = None,
+    stations_path: Optional[str] = None,
+    filename: Optional[str] = None
+) -> Optional[str]:
+    """
+    Enriquece um lote de fixes e grava o CSV no layout bronze.
+
+    Args:
+        data: Lista de dicionários ou DataFrame (campos já no layout bronze)
+        output_dir: Diretório de saída
+        filename_prefix: Prefixo do nome do arquivo
+        track_state_path: Estado de trajeto (padrão: <output_dir>/state/track_state.csv)
+        stations_path: CSV de estações (None = sem associação à estação)
+        filename: Nome fixo do arquivo (padrão: <prefixo>_<timestamp>.csv)
+
+    Returns:
+        Caminho do CSV gerado (None se o lote estava vazio)
+    """
+    df = prepare_bronze_frame(data, output_dir, track_state_path, stations_path)
+    if df is None:
+        return None
+    
+    return _save_local_csv(df, os.path.join(output_dir, filename or bronze_filename(filename_prefix)))
+
+
+def _save_local_csv(df: "pd.DataFrame", filepath: str) -> str:
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    
+    df.to_csv(filepath, index=False, encoding='utf-8')
+    record_bytes_written(os.path.getsize(filepath))
+    
+    logger.info(f" CSV gerado: {filepath}")
+    logger.info(f" Linhas: {len(df)} | Colunas: {len(df.columns)}")
+    logger.info(f" Colunas: {', '.join(df.columns.tolist())}")
+    
+    return filepath
+
+
+def iter_record_chunks(
+    batches: Union[List[Dict], "pd.DataFrame", Iterable[Union[List[Dict], "pd.DataFrame"]]],
+    chunk_rows: int = DEFAULT_WRITE_CHUNK_ROWS
+) -> Iterator[Union[List[Dict], "pd.DataFrame"]]:
+    """
+    Reparte lotes de registros em blocos de até `chunk_rows` linhas.
+
+    Aceita um lote (lista de dicionários ou DataFrame) ou um iterável de
+    lotes, consumido sob demanda. Lotes pequenos de dicionários são
+    agrupados até completar um bloco; DataFrames são fatiados.
+
+    Yields:
+        Lista de dicionários ou fatia de DataFrame com no máximo `chunk_rows` linhas
+    """
+    import pandas as pd
+
+    chunk_rows = max(int(chunk_rows), 1)
+    if isinstance(batches, pd.DataFrame) or (
+        isinstance(batches, list) and (not batches or isinstance(batches[0], dict))
+    ):
+        batches = [batches]
+
+    pending: List[Dict] = []
+    for batch in batches:
+        if batch is None:
+            continue
+        if isinstance(batch, pd.DataFrame):
+            # Registros pendentes saem antes, preservando a ordem de chegada
+            if pending:
+                yield pending
+                pending = []
+            for start in range(0, len(batch), chunk_rows):
+                yield batch.iloc[start:start + chunk_rows]
+            continue
+        for record in batch:
+            pending.append(record)
+            if len(pending) >= chunk_rows:
+                yield pending
+                pending = []
+
+    if pending:
+        yield pending
+
+
+def write_bronze_csv_chunked(
+    batches: Union[List[Dict], "pd.DataFrame", Iterable[Union[List[Dict], "pd.DataFrame"]]],
+    output_dir: str = "./data",
+    filename_prefix: str = "brt_gps",
+    track_state_path: Optional[str] = None,
+    stations_path: Optional[str] = None,
+    filename: Optional[str] = None,
+    chunk_rows: int = DEFAULT_WRITE_CHUNK_ROWS
+) -> Optional[str]:
+    """
+    Grava o CSV bronze bloco a bloco, com memória limitada pelo tamanho do bloco.
+
+    Cada bloco é enriquecido e acrescentado ao mesmo arquivo (cabeçalho só
+    no primeiro); o estado de trajeto passa de um bloco ao seguinte pelo
+    arquivo de estado, como entre capturas, e o índice de estações é
+    carregado uma vez. Com um iterável (ex: gerador que aplica o quality
+    gate bloco a bloco), o lote nunca fica inteiro em memória. O CSV é escrito em
+    <arquivo>.part e renomeado ao final, então um arquivo com o nome
+    definitivo está sempre completo.
+
+    Args:
+        batches: Lote ou iterável de lotes (listas de dicionários ou DataFrames)
+        output_dir: Diretório de saída
+        filename_prefix: Prefixo do nome do arquivo
+        track_state_path: Estado de trajeto (padrão: <output_dir>/state/track_state.csv)
+        stations_path: CSV de estações (None = sem associação à estação)
+        filename: Nome fixo do arquivo (padrão: <prefixo>_<timestamp>.csv)
+        chunk_rows: Linhas enriquecidas e gravadas por vez
+
+    Returns:
+        Caminho do CSV gerado (None se não havia registros)
+    """
+    filepath = os.path.join(output_dir, filename or bronze_filename(filename_prefix))
+    tmp_path = f"{filepath}.part"
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+
+    station_index = _load_stations(stations_path)
+    rows, chunks, columns = 0, 0, []
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            for chunk in iter_record_chunks(batches, chunk_rows):
+                df = prepare_bronze_frame(chunk, output_dir, track_state_path, stations_path, station_index)
+                if df is None:
+                    continue
+                df.to_csv(f, index=False, header=rows == 0)
+                rows += len(df)
+                chunks += 1
+                columns = df.columns.tolist()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if rows == 0:
+        os.remove(tmp_path)
+        logger.warning(" Nenhum dado para gerar CSV")
+        return None
+
+    os.replace(tmp_path, filepath)
+    record_bytes_written(os.path.getsize(filepath))
+
+    logger.info(f" CSV gerado em {chunks} blocos: {filepath}")
+    logger.info(f" Linhas: {rows} | Colunas: {len(columns)}")
+    return filepath
+
+
+def iter_csv_chunks(
+    df: "pd.DataFrame",
+    chunk_rows: int = DEFAULT_STREAM_CHUNK_ROWS,
+    compress: bool = False
+) -> Iterator[bytes]:
+    """
+    Serializa o DataFrame em CSV por blocos de linhas (cabeçalho só no primeiro).
+
+    Com `compress`, os blocos saem como um único stream gzip. A memória
+    usada é a de um bloco serializado, não a do arquivo inteiro.
+
+    Yields:
+        Bytes prontos para envio
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    
+    for start in range(0, max(len(df), 1), chunk_rows):
+        text = df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0)
+        data = text.encode("utf-8")
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def stream_bronze_csv(
+    data: Union[List[Dict], "pd.DataFrame"],
+    bucket_name: str,
+    destination_prefix: str = "bronze/brt_gps",
+    filename_prefix: str = "brt_gps",
+    output_dir: str = "./data",
+    track_state_path: Optional[str] = None,
+    stations_path: Optional[str] = None,
+    credentials_path: Optional[str] = None,
+    compress: bool = False,
+    chunk_rows: int = DEFAULT_STREAM_CHUNK_ROWS
+) -> Optional[str]:
+    """
+    Enriquece um lote e envia o CSV bronze direto para o GCS, sem arquivo local.
+
+    A serialização alimenta um upload resumível em blocos (memória limitada
+    a um bloco de linhas e ao buffer do upload). Se o upload falhar, o CSV
+    é gravado em `output_dir` e o caminho local é devolvido, para que o
+    upload normal tente de novo.
+
+    Args:
+        data: Lista de dicionários ou DataFrame (campos já no layout bronze)
+        bucket_name: Bucket GCS
+        destination_prefix: Prefixo do objeto no bucket
+        filename_prefix: Prefixo do nome do arquivo
+        output_dir: Diretório do fallback local e do estado de trajeto padrão
+        track_state_path: Estado de trajeto
+        stations_path: CSV de estações
+        credentials_path: Credenciais GCP
+        compress: Envia como CSV gzip (<nome>.csv.gz)
+        chunk_rows: Linhas serializadas por bloco
+
+    Returns:
+        URI gs:// do objeto, caminho local do fallback ou None se o lote estava vazio
+    """
+    from pipelines.utils.gcp import stream_to_gcs
+
+    df = prepare_bronze_frame(data, output_dir, track_state_path, stations_path)
+    if df is None:
+        return None
+    
+    filename = bronze_filename(filename_prefix) + (".gz" if compress else "")
+    try:
+        gcs_uri, size = stream_to_gcs(
+            bucket_name,
+            f"{destination_prefix}/{filename}",
+            iter_csv_chunks(df, chunk_rows, compress),
+            content_type="application/gzip" if compress else "text/csv",
+            credentials_path=credentials_path
+        )
+    except Exception as e:
+        logger.warning(f" Upload em stream falhou ({str(e)}), gravando CSV local")
+        local_name = filename[:-3] if compress else filename
+        return _save_local_csv(df, os.path.join(output_dir, local_name))
+    
+    record_bytes_uploaded(size)
+    logger.info(f" CSV enviado em stream: {gcs_uri} ({len(df)} linhas, {size / 1024**2:.1f} MB)")
+    return gcs_uri
+
+
+def write_quarantine(
+    rejected: "pd.DataFrame",
+    report: Dict,
+    output_dir: str = "./data",
+    filename_prefix: str = "brt_gps"
+) -> str:
+    """
+    Grava os registros rejeitados e o relatório de qualidade em <output_dir>/quarantine.
+
+    Args:
+        rejected: Registros rejeitados (com motivo_rejeicao)
+        report: Relatório de qualidade do lote (recebe o caminho da quarentena)
+        output_dir: Diretório base
+        filename_prefix: Prefixo dos arquivos
+
+    Returns:
+        Caminho do CSV de quarentena
+    """
+    quarantine_dir = os.path.join(output_dir, "quarantine")
+    os.makedirs(quarantine_dir, exist_ok=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    quarantine_path = os.path.join(quarantine_dir, f"quarentena_{filename_prefix}_{timestamp}.csv")
+    rejected.to_csv(quarantine_path, index=False, encoding='utf-8')
+    record_bytes_written(os.path.getsize(quarantine_path))
+    report["quarantine_file"] = quarantine_path
+
+    with open(os.path.join(quarantine_dir, f"qualidade_{filename_prefix}_{timestamp}.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    return quarantine_path
@@ -0,0 +1,287 @@
+"""
+Checkpoint de resultados de tasks endereçado por conteúdo (hash das entradas)
+"""
+from datetime import datetime
+from functools import wraps
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import re
+import time
+import uuid
+
+import prefect
+from prefect.utilities.logging import get_logger
+
+from pipelines.utils.metrics import get_registry
+
+if TYPE_CHECKING:
+    from prefect import Task
+
+
+logger = get_logger()
+
+# Variáveis de ambiente (o parâmetro homônimo do flow tem precedência)
+TTL_ENV_VAR = "PIPELINE_CHECKPOINT_TTL_HOURS"
+BATCH_ENV_VAR = "PIPELINE_CHECKPOINT_BATCH"
+
+# Validade padrão de um checkpoint (horas); 0 desliga o cache
+DEFAULT_TTL_HOURS = 6.0
+
+# Diretório (dentro do de checkpoints) com um registro de lote por flow run,
+# agrupados pelo nome do flow: batches/<flow>/<flow_run_id>.json
+JOURNAL_DIRNAME = "batches"
+
+
+def _parameter(name: str) -> Optional[Any]:
+    """Valor de um parâmetro do flow run (apenas os informados explicitamente)."""
+    return (prefect.context.get("parameters") or {}).get(name)
+
+
+def checkpoint_dir() -> str:
+    """Diretório dos checkpoints: <output_dir>/checkpoints do flow run (ou ./data/checkpoints)."""
+    output_dir = _parameter("output_dir") or "./data"
+    return os.getenv("PIPELINE_CHECKPOINT_DIR", os.path.join(output_dir, "checkpoints"))
+
+
+def get_ttl_seconds() -> float:
+    """Validade dos checkpoints em segundos (parâmetro checkpoint_ttl_hours ou env)."""
+    value = _parameter("checkpoint_ttl_hours")
+    if value is None:
+        value = os.getenv(TTL_ENV_VAR, DEFAULT_TTL_HOURS)
+    return float(value) * 3600
+
+
+def _journal_path(flow_run_id: str) -> str:
+    """Registro do lote de um flow run: <checkpoints>/batches/<flow>/<flow_run_id>.json."""
+    flow_name = prefect.context.get("flow_name") or "flow"
+    flow_slug = re.sub(r"[^a-z0-9]+", "_", flow_name.lower()).strip("_") or "flow"
+    return os.path.join(checkpoint_dir(), JOURNAL_DIRNAME, flow_slug, f"{flow_run_id}.json")
+
+
+def _read_journal(flow_run_id: str) -> Optional[Dict]:
+    try:
+        with open(_journal_path(flow_run_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_journal(journal: Dict) -> None:
+    path = _journal_path(journal["flow_run_id"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(journal, f)
+    os.replace(tmp_path, path)
+
+
+def current_batch() -> Optional[str]:
+    """
+    Resolve o lote (batch) de checkpoints do flow run atual.
+
+    Cada flow run tem o seu lote, registrado por nome do flow e id do run,
+    e o fecha com `complete_batch`. Só um retry do mesmo flow run (mesmo
+    flow_run_id, ex: restart pela UI) retoma o lote: as tasks que já tinham
+    concluído devolvem o resultado gravado e a execução recomeça, na
+    prática, pela primeira task que falhou. Um run novo, do mesmo flow ou de
+    outro, nunca adota o lote de outro run, então runs concorrentes não
+    compartilham resultados. O parâmetro `checkpoint_batch` (ou
+    PIPELINE_CHECKPOINT_BATCH) força um lote específico.
+
+    Returns:
+        Id do lote, ou None fora de um flow run
+    """
+    flow_run_id = prefect.context.get("flow_run_id")
+    if not flow_run_id:
+        return None
+
+    forced = _parameter("checkpoint_batch") or os.getenv(BATCH_ENV_VAR)
+    if forced:
+        return str(forced)
+
+    journal = _read_journal(flow_run_id)
+    if journal:
+        return journal["batch_id"]
+
+    journal = {
+        "batch_id": f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}",
+        "flow_run_id": flow_run_id,
+        "flow_name": prefect.context.get("flow_name"),
+        "started_at": time.time(),
+        "status": "running",
+    }
+    _write_journal(journal)
+    return journal["batch_id"]
+
+
+def complete_batch() -> Optional[str]:
+    """
+    Marca o lote do run atual como concluído e remove checkpoints expirados.
+
+    Returns:
+        Id do lote concluído (None se não havia lote aberto por este run)
+    """
+    flow_run_id = prefect.context.get("flow_run_id")
+    journal = _read_journal(flow_run_id) if flow_run_id else None
+    if not journal:
+        return None
+
+    journal["status"] = "complete"
+    journal["completed_at"] = time.time()
+    _write_journal(journal)
+    prune_expired()
+    return journal["batch_id"]
+
+
+def prune_expired() -> int:
+    """
+    Remove checkpoints e registros de lote mais antigos que a validade configurada.
+
+    Returns:
+        Quantidade de arquivos removidos
+    """
+    directory = checkpoint_dir()
+    if not os.path.isdir(directory):
+        return 0
+
+    cutoff = time.time() - get_ttl_seconds()
+    removed = 0
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            if not filename.endswith((".pkl", ".json")):
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def _is_dataframe(value: Any) -> bool:
+    """Testa se é um DataFrame sem importar pandas."""
+    return type(value).__name__ == "DataFrame" and type(value).__module__.startswith("pandas")
+
+
+def _update_digest(digest, value: Any) -> None:
+    """Alimenta o hash com uma representação estável do valor."""
+    if _is_dataframe(value):
+        import pandas as pd
+        
+        digest.update(b"df:" + json.dumps([str(c) for c in value.columns]).encode())
+        try:
+            digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+        except TypeError:
+            digest.update(value.to_csv(index=False).encode())
+    elif isinstance(value, (list, tuple)) and value and _is_dataframe(value[0]):
+        for item in value:
+            _update_digest(digest, item)
+    else:
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+
+
+def checkpoint_key(task_name: str, batch_id: str, arguments: Dict[str, Any]) -> str:
+    """
+    Chave do checkpoint: sha256 de (lote, task, entradas).
+
+    Args:
+        task_name: Nome da função da task
+        batch_id: Lote de checkpoints
+        arguments: Argumentos da chamada (já com os defaults aplicados)
+
+    Returns:
+        Hash hexadecimal
+    """
+    digest = hashlib.sha256(f"{batch_id}:{task_name}".encode())
+    for name in sorted(arguments):
+        digest.update(f"|{name}=".encode())
+        _update_digest(digest, arguments[name])
+    return digest.hexdigest()
+
+
+def _file_artifacts(result: Any) -> List[str]:
+    """Arquivos locais referenciados pelo resultado (caminho retornado pela task)."""
+    if isinstance(result, str) and os.path.isfile(result):
+        return [result]
+    return []
+
+
+def checkpointed(fn: Callable) -> Callable:
+    """
+    Decorator que grava o resultado da task e o reutiliza na mesma entrada.
+
+    A chave combina o lote do flow run (ver `current_batch`), o nome da task
+    e o hash das entradas. Um resultado gravado é reutilizado enquanto não
+    expira e enquanto os arquivos locais a que ele se refere (ex: o CSV de
+    `generate_csv`) ainda existem. Fora de um flow run, ou com validade 0,
+    a task roda normalmente. Deve ficar logo abaixo de `@task`.
+    """
+    task_name = fn.__name__
+    signature = inspect.signature(fn)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        ttl = get_ttl_seconds()
+        batch_id = current_batch() if ttl > 0 else None
+        if batch_id is None:
+            return fn(*args, **kwargs)
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = checkpoint_key(task_name, batch_id, bound.arguments)
+        path = os.path.join(checkpoint_dir(), f"{task_name}_{key[:32]}.pkl")
+
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < ttl:
+            try:
+                with open(path, "rb") as f:
+                    entry = pickle.load(f)
+                if all(os.path.isfile(p) for p in entry["artifacts"]):
+                    logger.info(f"♻️  {task_name}: resultado reutilizado do checkpoint ({entry['created_at']})")
+                    get_registry().inc("pipeline_task_checkpoint_hits", task=task_name)
+                    return entry["result"]
+                logger.info(f"   ⚠️  {task_name}: artefato do checkpoint ausente, reexecutando")
+            except (OSError, pickle.UnpicklingError, EOFError, KeyError) as e:
+                logger.warning(f"   ⚠️  {task_name}: checkpoint ilegível ({e}), reexecutando")
+
+        result = fn(*args, **kwargs)
+
+        entry = {
+            "task": task_name,
+            "batch_id": batch_id,
+            "created_at": datetime.now().isoformat(),
+            "artifacts": _file_artifacts(result),
+            "result": result,
+        }
+        try:
+            os.makedirs(checkpoint_dir(), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError, TypeError) as e:
+            logger.warning(f"   ⚠️  {task_name}: não foi possível gravar checkpoint: {e}")
+
+        return result
+
+    wrapper.__checkpointed__ = True
+    return wrapper
+
+
+def without_checkpoint(checkpointed_task: "Task") -> "Task":
+    """
+    Cópia de uma task `@checkpointed` que sempre executa (sem ler nem gravar checkpoint).
+
+    Para flows em que reutilizar um resultado é incorreto mesmo com as
+    mesmas entradas (ex: o dbt do transform, cujo dado novo não aparece
+    nos argumentos).
+    """
+    task_copy = checkpointed_task.copy()
+    if getattr(checkpointed_task.run, "__checkpointed__", False):
+        task_copy.run = checkpointed_task.run.__wrapped__
+    return task_copy
@@ -0,0 +1,259 @@
+"""
+Compactação dos CSVs bronze arquivados: janelas fechadas viram poucos arquivos grandes
+"""
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import hashlib
+import io
+import json
+import os
+import re
+
+from prefect.utilities.logging import get_logger
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from google.cloud import storage
+
+
+logger = get_logger()
+
+# Granularidades de janela aceitas (formato da chave no nome do arquivo)
+WINDOW_FORMATS = {"hour": "%Y%m%d_%H", "day": "%Y%m%d"}
+
+# Espera após o fim da janela antes de considerá-la fechada (capturas atrasadas)
+DEFAULT_GRACE_MINUTES = 15
+
+# Manifesto de uma janela compactada: a gravação dele é o ponto de troca
+MANIFEST_PATTERN = re.compile(r"_compaction_(\d{8}(?:_\d{2})?)\.json$")
+
+# Timestamp de captura no nome dos CSVs (brt_gps_AAAAMMDD_HHMMSS.csv)
+CAPTURE_PATTERN = re.compile(r"_(\d{8}_\d{6})\.csv$")
+
+
+def parquet_available() -> bool:
+    """pyarrow é opcional: sem ele a compactação grava CSV gzip."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def window_key(blob_name: str, granularity: str = "hour") -> Optional[str]:
+    """Janela (AAAAMMDD_HH ou AAAAMMDD) de um CSV de captura; None se não for um."""
+    match = CAPTURE_PATTERN.search(blob_name)
+    if not match:
+        return None
+    captured = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+    return captured.strftime(WINDOW_FORMATS[granularity])
+
+
+def window_end(key: str) -> datetime:
+    """Instante em que a janela termina."""
+    if "_" in key:
+        return datetime.strptime(key, WINDOW_FORMATS["hour"]) + timedelta(hours=1)
+    return datetime.strptime(key, WINDOW_FORMATS["day"]) + timedelta(days=1)
+
+
+def frame_checksum(df: "pd.DataFrame") -> str:
+    """
+    Checksum do conteúdo de um lote, independente da ordem das linhas e do formato.
+
+    Os valores são comparados como texto (nulos como vazio), então o mesmo
+    lote lido de CSV ou de Parquet produz o mesmo checksum.
+    """
+    import numpy as np
+    import pandas as pd
+
+    canonical = df.astype(object).where(df.notna(), "").astype(str)
+    row_hashes = pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+    digest = hashlib.sha256(json.dumps([str(c) for c in df.columns]).encode())
+    digest.update(np.sort(row_hashes).tobytes())
+    return digest.hexdigest()
+
+
+def read_bronze_blob(blob: "storage.Blob") -> "pd.DataFrame":
+    """Lê um arquivo bronze (CSV, CSV gzip ou Parquet) com todas as colunas como texto."""
+    import pandas as pd
+
+    data = io.BytesIO(blob.download_as_bytes())
+    if blob.name.endswith(".parquet"):
+        return pd.read_parquet(data).astype(object).where(lambda df: df.notna(), None)
+    return pd.read_csv(data, dtype=str, compression="gzip" if blob.name.endswith(".gz") else None)
+
+
+def load_manifests(blobs: List["storage.Blob"]) -> Dict[str, Dict]:
+    """Manifestos de compactação entre os blobs listados, por janela."""
+    manifests = {}
+    for blob in blobs:
+        match = MANIFEST_PATTERN.search(blob.name)
+        if match:
+            manifests[match.group(1)] = json.loads(blob.download_as_bytes())
+    return manifests
+
+
+def live_files(blobs: List["storage.Blob"]) -> List["storage.Blob"]:
+    """
+    Arquivos de dados visíveis de uma partição após as compactações concluídas.
+
+    Originais listados em um manifesto são ignorados (mesmo que a remoção
+    ainda não tenha acontecido) e arquivos compactados só contam se o
+    manifesto deles existir (uma compactação interrompida antes da troca
+    deixa um arquivo órfão, que é descartado).
+    """
+    manifests = load_manifests(blobs)
+    replaced = {name for m in manifests.values() for name in m["originals"]}
+    committed = {m["output"] for m in manifests.values()}
+
+    visible = []
+    for blob in blobs:
+        name = os.path.basename(blob.name)
+        if MANIFEST_PATTERN.search(name) or blob.name in replaced:
+            continue
+        if name.startswith("compact_") and blob.name not in committed:
+            continue
+        if name.endswith((".csv", ".csv.gz", ".parquet")):
+            visible.append(blob)
+    return visible
+
+
+def compact_window(
+    bucket: "storage.Bucket",
+    partition_prefix: str,
+    key: str,
+    originals: List["storage.Blob"],
+    work_dir: str,
+    output_format: str = "parquet"
+) -> Dict:
+    """
+    Compacta uma janela fechada em um único arquivo e troca os originais por ele.
+
+    1. Lê os originais e grava o compactado (Parquet zstd ou CSV gzip) com
+       precondição de geração 0 (nunca sobrescreve um objeto existente).
+    2. Relê o compactado do GCS e confere linhas e checksum com os originais.
+    3. Grava o manifesto da janela (ponto de troca: a partir daqui os
+       leitores veem o compactado no lugar dos originais).
+    4. Remove os originais, cada um condicionado à geração lida no passo 1.
+
+    Raises:
+        ValueError: Verificação do compactado falhou (o compactado é removido)
+    """
+    import pandas as pd
+
+    frames = [read_bronze_blob(blob) for blob in originals]
+    df = pd.concat(frames, ignore_index=True)
+    rows = len(df)
+    checksum = frame_checksum(df)
+
+    extension = "parquet" if output_format == "parquet" else "csv.gz"
+    output_name = f"{partition_prefix}compact_{key}_{checksum[:8]}.{extension}"
+    local_path = os.path.join(work_dir, os.path.basename(output_name))
+    os.makedirs(work_dir, exist_ok=True)
+
+    if output_format == "parquet":
+        df.to_parquet(local_path, index=False, compression="zstd")
+    else:
+        df.to_csv(local_path, index=False, encoding="utf-8", compression="gzip")
+
+    output = bucket.blob(output_name)
+    if output.exists():
+        # Órfão de uma compactação interrompida com o mesmo conteúdo: refaz a partir do zero
+        output.reload()
+        output.delete(if_generation_match=output.generation)
+    output.upload_from_filename(local_path, if_generation_match=0, checksum="crc32c")
+    os.remove(local_path)
+
+    output.reload()
+    compacted = read_bronze_blob(output)
+    if len(compacted) != rows or frame_checksum(compacted[df.columns]) != checksum:
+        output.delete(if_generation_match=output.generation)
+        raise ValueError(
+            f"Compactação de {key} não confere: {len(compacted)} linhas vs {rows} nos originais"
+        )
+
+    manifest = {
+        "window": key,
+        "output": output_name,
+        "output_generation": output.generation,
+        "rows": rows,
+        "checksum": checksum,
+        "originals": [blob.name for blob in originals],
+        "generations": {blob.name: blob.generation for blob in originals},
+        "created_at": datetime.now().isoformat(),
+    }
+    bucket.blob(f"{partition_prefix}_compaction_{key}.json").upload_from_string(
+        json.dumps(manifest, indent=2),
+        content_type="application/json",
+        if_generation_match=0
+    )
+
+    manifest["deleted"] = delete_originals(bucket, manifest)
+    return manifest
+
+
+def delete_originals(bucket: "storage.Bucket", manifest: Dict) -> int:
+    """
+    Remove os originais de uma janela já trocada.
+
+    A remoção é condicionada à geração registrada no manifesto: um original
+    regravado depois da compactação não é apagado.
+
+    Returns:
+        Quantidade de originais removidos
+    """
+    from google.api_core.exceptions import NotFound, PreconditionFailed
+
+    deleted = 0
+    for name in manifest["originals"]:
+        try:
+            bucket.blob(name).delete(if_generation_match=manifest["generations"][name])
+            deleted += 1
+        except NotFound:
+            pass
+        except PreconditionFailed:
+            logger.warning(f"   ⚠️  {name} mudou após a compactação, mantido")
+    return deleted
+
+
+def compact_partition(
+    bucket: "storage.Bucket",
+    partition_prefix: str,
+    granularity: str = "hour",
+    min_files: int = 2,
+    grace_minutes: float = DEFAULT_GRACE_MINUTES,
+    work_dir: str = "./data/compaction",
+    output_format: str = "parquet",
+    now: Optional[datetime] = None
+) -> Tuple[List[Dict], int]:
+    """
+    Compacta as janelas fechadas de uma partição (<prefixo>/dt=AAAA-MM-DD/).
+
+    Janelas com manifesto e originais remanescentes (remoção interrompida)
+    só têm os originais removidos.
+
+    Returns:
+        Tupla (manifestos das janelas compactadas agora, originais removidos de janelas antigas)
+    """
+    now = now or datetime.now()
+    blobs = list(bucket.list_blobs(prefix=partition_prefix))
+    manifests = load_manifests(blobs)
+
+    resumed = 0
+    names = {blob.name for blob in blobs}
+    for manifest in manifests.values():
+        if names.intersection(manifest["originals"]):
+            resumed += delete_originals(bucket, manifest)
+
+    windows: Dict[str, List] = {}
+    for blob in live_files(blobs):
+        key = window_key(blob.name, granularity)
+        if key and window_end(key) + timedelta(minutes=grace_minutes) <= now:
+            windows.setdefault(key, []).append(blob)
+
+    compacted = []
+    for key, originals in sorted(windows.items()):
+        if key in manifests or len(originals) < min_files:
+            continue
+        compacted.append(compact_window(bucket, partition_prefix, key, originals, work_dir, output_format))
+    return compacted, resumed
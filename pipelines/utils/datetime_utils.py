@@ -2,9 +2,32 @@
 Utilitrios para manipulao de datas e timestamps
 """
 from datetime import datetime, timezone
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
 import pytz
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Formatos tentados por parse_timestamp e pela detecção em lote
+COMMON_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y%m%d_%H%M%S",
+    "%d/%m/%Y %H:%M:%S"
+]
+
+# Formatos especiais da detecção em lote (além de COMMON_FORMATS)
+EPOCH_MS = "epoch_ms"
+EPOCH_S = "epoch_s"
+ISO8601 = "ISO8601"
+
+# Formato detectado por coluna de origem (ex: "dataHora", "timestamp_captura")
+_FORMAT_CACHE: Dict[str, str] = {}
+
+# Sufixo de fuso em textos ISO 8601 (Z, +00:00, -0300)
+_OFFSET_SUFFIX = r"(?:Z|[+-]\d{2}:?\d{2})$"
+
 
 def get_current_timestamp(
     tz_name: str = "America/Sao_Paulo",
@@ -51,14 +74,7 @@ def parse_timestamp(
         return datetime.fromisoformat(timestamp_str)
     except ValueError:
         # Tentar outros formatos comuns
-        common_formats = [
-            "%Y-%m-%d %H:%M:%S",
-            "%Y-%m-%dT%H:%M:%S",
-            "%Y%m%d_%H%M%S",
-            "%d/%m/%Y %H:%M:%S"
-        ]
-        
-        for fmt in common_formats:
+        for fmt in COMMON_FORMATS:
             try:
                 return datetime.strptime(timestamp_str, fmt)
             except ValueError:
@@ -67,6 +83,141 @@ def parse_timestamp(
         raise ValueError(f"No foi possvel parsear timestamp: {timestamp_str}")
 
 
+def _to_datetime(values: "pd.Series", fmt: str) -> "pd.Series":
+    """
+    Converte uma série inteira em um formato conhecido (inválidos viram NaT).
+
+    Valores com fuso (ISO 8601 ou %z) são levados para UTC e perdem o fuso,
+    como os epochs; assim offsets diferentes no mesmo lote não derrubam a
+    conversão. Valores sem fuso ficam como vieram.
+    """
+    import pandas as pd
+
+    if fmt in (EPOCH_MS, EPOCH_S):
+        unit = "ms" if fmt == EPOCH_MS else "s"
+        return pd.to_datetime(pd.to_numeric(values, errors="coerce"), unit=unit, errors="coerce")
+
+    text = values.astype(object).where(values.notna(), None)
+    if fmt != ISO8601 and "%z" not in fmt:
+        return pd.to_datetime(text, format=fmt, errors="coerce")
+
+    has_offset = text.astype(str).str.contains(_OFFSET_SUFFIX, regex=True) & values.notna()
+    parsed = pd.to_datetime(text.where(~has_offset, None), format=fmt, errors="coerce")
+    if has_offset.any():
+        aware = pd.to_datetime(text.where(has_offset, None), format=fmt, errors="coerce", utc=True)
+        parsed = parsed.where(~has_offset, aware.dt.tz_localize(None))
+    return parsed
+
+
+def detect_timestamp_format(values: Any, min_match: float = 0.5) -> Optional[str]:
+    """
+    Detecta o formato de uma amostra de timestamps.
+
+    Números (ou textos só com dígitos) são tratados como epoch; a unidade
+    (ms ou s) vem da magnitude. Os demais são testados contra ISO 8601 e
+    COMMON_FORMATS, cada formato de uma vez sobre a amostra inteira.
+
+    Args:
+        values: Amostra sem nulos
+        min_match: Fração mínima da amostra que o formato precisa converter
+
+    Returns:
+        Formato (strftime, ISO8601, EPOCH_MS ou EPOCH_S) ou None se nenhum servir
+    """
+    import pandas as pd
+
+    sample = pd.Series(values).dropna()
+    if len(sample) == 0:
+        return None
+
+    numbers = pd.to_numeric(sample, errors="coerce")
+    if numbers.notna().mean() >= min_match:
+        # 1e11 ms = 1973, 1e11 s = ano 5138: a magnitude separa as unidades
+        return EPOCH_MS if numbers.abs().median() >= 1e11 else EPOCH_S
+
+    best, best_rate = None, 0.0
+    for fmt in [ISO8601] + COMMON_FORMATS:
+        rate = _to_datetime(sample.astype(str), fmt).notna().mean()
+        if rate > best_rate:
+            best, best_rate = fmt, rate
+        if rate == 1.0:
+            break
+    return best if best_rate >= min_match else None
+
+
+def parse_timestamps(
+    values: Any,
+    source: Optional[str] = None,
+    input_format: Optional[str] = None,
+    sample_size: int = 200,
+    min_match: float = 0.5
+) -> Tuple["pd.Series", "pd.Series"]:
+    """
+    Converte uma coluna inteira de timestamps (texto ou epoch em ms) de uma vez.
+
+    O formato é detectado uma vez a partir de uma amostra e guardado por
+    coluna de origem; as chamadas seguintes com o mesmo `source` convertem
+    direto. Se o formato em cache deixar de servir (a fonte mudou), ele é
+    redetectado a partir dos valores que falharam, que são convertidos de novo.
+
+    Args:
+        values: Lista, array ou Series com os timestamps
+        source: Nome da coluna de origem (chave do cache de formato)
+        input_format: Formato explícito (ignora detecção e cache)
+        sample_size: Tamanho da amostra usada na detecção
+        min_match: Fração mínima de acertos para aceitar um formato
+
+    Returns:
+        Tupla (Series datetime64 na ordem da entrada, com NaT nos inválidos;
+        Series com os valores não convertidos, indexada pela posição deles)
+    """
+    import numpy as np
+    import pandas as pd
+
+    raw = pd.Series(values).reset_index(drop=True)
+    present = raw.notna()
+
+    fmt = input_format or (_FORMAT_CACHE.get(source) if source else None)
+    if fmt is None:
+        fmt = detect_timestamp_format(_sample(raw[present], sample_size), min_match)
+
+    if fmt is None:
+        parsed = pd.Series(pd.NaT, index=raw.index, dtype="datetime64[ns]")
+    else:
+        parsed = _to_datetime(raw, fmt)
+
+    failed = present & parsed.isna()
+    if not input_format and fmt is not None and failed.sum() > (1 - min_match) * present.sum():
+        retry = detect_timestamp_format(_sample(raw[failed], sample_size), min_match)
+        if retry and retry != fmt:
+            parsed = parsed.where(~failed, _to_datetime(raw.where(failed), retry))
+            failed = present & parsed.isna()
+            fmt = retry
+
+    if source and fmt is not None and not input_format:
+        _FORMAT_CACHE[source] = fmt
+
+    positions = np.flatnonzero(failed.to_numpy())
+    return parsed, raw.iloc[positions]
+
+
+def _sample(values: "pd.Series", size: int) -> "pd.Series":
+    """Amostra espaçada ao longo da série (início, meio e fim do lote)."""
+    import numpy as np
+
+    if len(values) <= size:
+        return values
+    return values.iloc[np.linspace(0, len(values) - 1, size).astype(int)]
+
+
+def clear_format_cache(source: Optional[str] = None) -> None:
+    """Esquece o formato detectado de uma coluna (ou de todas)."""
+    if source is None:
+        _FORMAT_CACHE.clear()
+    else:
+        _FORMAT_CACHE.pop(source, None)
+
+
 def generate_partition_path(
     base_path: str,
     timestamp: Optional[datetime] = None,
@@ -0,0 +1,215 @@
+"""
+Captura concorrente de vários feeds de GPS em um único processo (asyncio)
+"""
+from typing import Callable, Dict, List, Optional
+import asyncio
+import os
+import time
+
+from prefect.utilities.logging import get_logger
+
+from pipelines.utils.feeds import FeedConfig, normalize_records, request_feed
+from pipelines.utils.metrics import get_registry
+from pipelines.utils.polling import load_poller, parse_retry_after, save_poller
+from pipelines.utils.positions import update_positions
+
+
+logger = get_logger()
+
+# Marca o fim da janela de captura na fila de um feed
+_END_OF_WINDOW = object()
+
+# Gravação de um lote acumulado: (feed, registros normalizados) -> caminho/URI gerado
+FlushCallback = Callable[[FeedConfig, List[Dict]], Optional[str]]
+
+
+def _new_stats() -> Dict:
+    return {"polls": 0, "errors": 0, "rate_limited": 0, "dropped_snapshots": 0, "records": 0, "files": []}
+
+
+async def _produce(
+    feed: FeedConfig,
+    queue: asyncio.Queue,
+    deadline: float,
+    state_dir: str,
+    stats: Dict
+) -> None:
+    """
+    Faz polling do feed na sua cadência e publica os registros novos na fila.
+
+    A requisição HTTP roda em thread (asyncio.to_thread), então um feed lento
+    só atrasa o próprio poll. Se a fila estiver cheia (o consumidor ainda
+    não processou os snapshots anteriores), o snapshot mais antigo é
+    descartado: o produtor nunca bloqueia e o atraso não se propaga à API.
+    """
+    import requests
+
+    registry = get_registry()
+    state_path = os.path.join(state_dir, f"polling_state_{feed.name}.json")
+    poller = load_poller(
+        state_path,
+        min_interval=float(feed.cadence_seconds),
+        max_interval=float(max(feed.max_interval_seconds, feed.cadence_seconds))
+    )
+    session = requests.Session()
+
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                snapshot = await asyncio.to_thread(request_feed, feed, session)
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status in (429, 503):
+                    retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                    wait = poller.rate_limited(retry_after)
+                    stats["rate_limited"] += 1
+                    registry.inc("pipeline_capture_rate_limited", status=status, feed=feed.name)
+                    logger.warning(f"   ⏳ [{feed.name}] API limitou requisições ({status}), aguardando {wait:.0f}s")
+                else:
+                    wait = poller.interval
+                    stats["errors"] += 1
+                    registry.inc("pipeline_capture_errors", feed=feed.name)
+                    logger.error(f"   ❌ [{feed.name}] Erro ao buscar dados da API: {str(e)}")
+            except (requests.RequestException, ValueError) as e:
+                wait = poller.interval
+                stats["errors"] += 1
+                registry.inc("pipeline_capture_errors", feed=feed.name)
+                logger.error(f"   ❌ [{feed.name}] Erro ao buscar dados da API: {str(e)}")
+            else:
+                stats["polls"] += 1
+                new_records = poller.observe(normalize_records(snapshot, feed))
+                registry.inc("pipeline_capture_polls", feed=feed.name)
+                # Última posição por veículo (servida pelo endpoint local, se ativo)
+                await asyncio.to_thread(update_positions, feed.name, new_records)
+
+                if queue.full():
+                    queue.get_nowait()
+                    queue.task_done()
+                    stats["dropped_snapshots"] += 1
+                    registry.inc("pipeline_capture_dropped_snapshots", feed=feed.name)
+                    logger.warning(f"   ⚠️  [{feed.name}] Consumidor atrasado, snapshot mais antigo descartado")
+                queue.put_nowait(new_records)
+
+                wait = poller.interval
+                logger.info(
+                    f"   📡 [{feed.name}] Poll {stats['polls']}: {len(snapshot)} veículos, "
+                    f"{len(new_records)} novos, próximo em {wait:.0f}s"
+                )
+
+            # A cadência conta a partir do início do poll (o tempo de resposta já foi gasto)
+            wait = max(wait - (time.monotonic() - started), 0.0)
+            if time.monotonic() + wait >= deadline:
+                break
+            await asyncio.sleep(wait)
+    finally:
+        session.close()
+        save_poller(poller, state_path)
+        # Aguarda vaga para o sentinela: o último snapshot da janela não é descartado
+        await queue.put(_END_OF_WINDOW)
+
+
+async def _consume(
+    feed: FeedConfig,
+    queue: asyncio.Queue,
+    flush: FlushCallback,
+    stats: Dict
+) -> None:
+    """
+    Acumula os registros do feed e grava um arquivo a cada `flush_records`.
+
+    A gravação (enriquecimento, CSV e upload) roda em thread; enquanto ela
+    acontece, o produtor do feed continua fazendo polling e a fila absorve
+    até `max_pending` snapshots.
+    """
+    pending: List[Dict] = []
+
+    async def _flush() -> None:
+        batch = pending[:]
+        pending.clear()
+        try:
+            result = await asyncio.to_thread(flush, feed, batch)
+        except Exception as e:
+            # O CSV local (se chegou a ser gravado) fica para reenvio; a captura segue
+            stats["errors"] += 1
+            get_registry().inc("pipeline_capture_errors", feed=feed.name)
+            logger.error(f"   ❌ [{feed.name}] Falha ao gravar lote de {len(batch)} registros: {str(e)}")
+            return
+        stats["records"] += len(batch)
+        if result:
+            stats["files"].append(result)
+
+    while True:
+        item = await queue.get()
+        queue.task_done()
+        if item is _END_OF_WINDOW:
+            break
+        pending.extend(item)
+        if len(pending) >= feed.flush_records:
+            await _flush()
+
+    if pending:
+        await _flush()
+
+
+async def _capture_feed(
+    feed: FeedConfig,
+    deadline: float,
+    flush: FlushCallback,
+    state_dir: str
+) -> Dict:
+    """Produtor e consumidor de um feed, com fila própria (backpressure por feed)."""
+    stats = _new_stats()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(feed.max_pending, 1))
+    await asyncio.gather(
+        _produce(feed, queue, deadline, state_dir, stats),
+        _consume(feed, queue, flush, stats)
+    )
+    return stats
+
+
+async def capture_feeds_async(
+    feeds: List[FeedConfig],
+    window_seconds: float,
+    flush: FlushCallback,
+    state_dir: str = "./data/state"
+) -> Dict[str, Dict]:
+    """
+    Captura os feeds concorrentemente durante a janela.
+
+    Cada feed tem produtor, fila limitada e consumidor próprios; uma falha
+    em um feed é registrada no resultado dele e não interrompe os demais.
+
+    Args:
+        feeds: Feeds a capturar
+        window_seconds: Duração da janela (0 = um poll por feed)
+        flush: Gravação de um lote acumulado (roda em thread)
+        state_dir: Diretório do estado de polling por feed
+
+    Returns:
+        Estatísticas por feed (polls, erros, descartes, registros, arquivos)
+    """
+    deadline = time.monotonic() + float(window_seconds)
+    results = await asyncio.gather(
+        *(_capture_feed(feed, deadline, flush, state_dir) for feed in feeds),
+        return_exceptions=True
+    )
+
+    summary = {}
+    for feed, result in zip(feeds, results):
+        if isinstance(result, BaseException):
+            logger.error(f"   ❌ [{feed.name}] Captura interrompida: {result!r}")
+            summary[feed.name] = {**_new_stats(), "failed": str(result)}
+        else:
+            summary[feed.name] = result
+    return summary
+
+
+def capture_feeds(
+    feeds: List[FeedConfig],
+    window_seconds: float,
+    flush: FlushCallback,
+    state_dir: str = "./data/state"
+) -> Dict[str, Dict]:
+    """Versão síncrona de `capture_feeds_async` (event loop próprio, para uso em tasks)."""
+    return asyncio.run(capture_feeds_async(feeds, window_seconds, flush, state_dir))
@@ -0,0 +1,187 @@
+"""
+Registro dos feeds de GPS da Data.Rio (URL, mapeamento de schema, prefixo e cadência)
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from prefect.utilities.logging import get_logger
+
+from pipelines.constants import Constants
+
+if TYPE_CHECKING:
+    import requests
+
+
+logger = get_logger()
+
+
+# Colunas numéricas que alguns feeds publicam como texto com vírgula decimal ("-22,87")
+NUMERIC_COLUMNS = ("latitude", "longitude", "velocidade")
+
+
+@dataclass(frozen=True)
+class FeedConfig:
+    """
+    Configuração de um feed de GPS.
+
+    `field_mapping` mapeia coluna bronze -> campo da API; vazio quando o
+    feed já publica os nomes do bronze (BRT). Um mesmo campo da API pode
+    alimentar mais de uma coluna (ex: `ordem` vira codigo e placa no SPPO).
+    """
+    name: str
+    url: str
+    gcs_prefix: str
+    cadence_seconds: float
+    max_interval_seconds: float
+    field_mapping: Dict[str, str] = field(default_factory=dict)
+    # Chave da lista de veículos quando a resposta é um objeto (None = lista na raiz)
+    records_key: Optional[str] = "veiculos"
+    # Backpressure: snapshots aguardando processamento antes de descartar o mais antigo
+    max_pending: int = 2
+    # Registros acumulados que disparam a gravação de um arquivo
+    flush_records: int = 50000
+    timeout_seconds: float = 30.0
+
+    @property
+    def file_prefix(self) -> str:
+        """Prefixo dos arquivos locais (último segmento do prefixo no bucket)."""
+        return self.gcs_prefix.rstrip("/").rsplit("/", 1)[-1]
+
+
+FEED_REGISTRY: Dict[str, FeedConfig] = {
+    "brt": FeedConfig(
+        name="brt",
+        url=Constants.BRT_API_URL.value,
+        gcs_prefix="bronze/brt_gps",
+        cadence_seconds=Constants.POLL_MIN_INTERVAL_SECONDS.value,
+        max_interval_seconds=Constants.POLL_MAX_INTERVAL_SECONDS.value,
+    ),
+    # Ônibus convencionais (SPPO): frota ~10x maior que a do BRT, campos em minúsculas
+    "sppo": FeedConfig(
+        name="sppo",
+        url=Constants.SPPO_API_URL.value,
+        gcs_prefix="bronze/onibus_gps",
+        cadence_seconds=Constants.SPPO_POLL_INTERVAL_SECONDS.value,
+        max_interval_seconds=Constants.POLL_MAX_INTERVAL_SECONDS.value,
+        field_mapping={
+            "codigo": "ordem",
+            "placa": "ordem",
+            "linha": "linha",
+            "latitude": "latitude",
+            "longitude": "longitude",
+            "dataHora": "datahora",
+            "velocidade": "velocidade",
+        },
+        records_key=None,
+        max_pending=1,
+        flush_records=200000,
+        timeout_seconds=60.0,
+    ),
+}
+
+
+def get_feed(name: str) -> FeedConfig:
+    """
+    Busca um feed no registro.
+
+    Raises:
+        ValueError: Feed desconhecido
+    """
+    try:
+        return FEED_REGISTRY[name.strip()]
+    except KeyError:
+        raise ValueError(f"Feed desconhecido: {name} (disponíveis: {', '.join(FEED_REGISTRY)})")
+
+
+def parse_feed_names(feeds: Any) -> List[FeedConfig]:
+    """
+    Resolve a lista de feeds de um parâmetro ("brt,sppo" ou lista de nomes).
+
+    Returns:
+        Lista de FeedConfig, na ordem informada e sem repetição
+    """
+    names = feeds.split(",") if isinstance(feeds, str) else list(feeds or [])
+    selected = []
+    for name in names:
+        if name.strip() and get_feed(name) not in selected:
+            selected.append(get_feed(name))
+    return selected
+
+
+def request_feed(
+    feed: FeedConfig,
+    session: Optional["requests.Session"] = None,
+    url: Optional[str] = None
+) -> List[Dict]:
+    """
+    Faz uma requisição ao feed e retorna os registros crus com timestamp_captura.
+
+    Args:
+        feed: Configuração do feed
+        session: Sessão HTTP reaproveitada entre polls (padrão: requisição avulsa)
+        url: URL alternativa (padrão: feed.url)
+
+    Returns:
+        Lista de registros no formato da API (lista vazia se o formato for inesperado)
+
+    Raises:
+        requests.RequestException: Erro na requisição HTTP
+    """
+    import requests
+
+    response = (session or requests).get(url or feed.url, timeout=feed.timeout_seconds)
+    response.raise_for_status()
+
+    data = response.json()
+
+    timestamp_captura = datetime.now().isoformat()
+
+    if feed.records_key and isinstance(data, dict) and feed.records_key in data:
+        records = data[feed.records_key]
+    elif isinstance(data, list):
+        records = data
+    else:
+        logger.warning(f"Formato inesperado da API ({feed.name}). Tipo: {type(data)}")
+        return []
+
+    for record in records:
+        record['timestamp_captura'] = timestamp_captura
+    return records
+
+
+def normalize_records(records: List[Dict], feed: FeedConfig) -> List[Dict]:
+    """
+    Converte registros de um feed para os nomes de coluna do bronze.
+
+    Identidade para feeds sem mapeamento (BRT). Nos demais, renomeia os
+    campos, converte dataHora para milissegundos inteiros e normaliza a
+    vírgula decimal das colunas numéricas.
+
+    Returns:
+        Registros com as colunas bronze (codigo, dataHora em ms, ...)
+    """
+    if not feed.field_mapping:
+        return records
+
+    normalized = []
+    for record in records:
+        row = {column: record.get(source) for column, source in feed.field_mapping.items()}
+        row["timestamp_captura"] = record.get("timestamp_captura")
+
+        for column in NUMERIC_COLUMNS:
+            value = row.get(column)
+            if isinstance(value, str):
+                try:
+                    row[column] = float(value.replace(",", "."))
+                except ValueError:
+                    row[column] = None
+
+        try:
+            row["dataHora"] = int(row["dataHora"])
+        except (TypeError, ValueError):
+            row["dataHora"] = None
+
+        normalized.append(row)
+    return normalized
+
@@ -1,25 +1,213 @@
 """
 Utilitrios para interao com Google Cloud Platform
+
+Os clientes google.cloud são importados dentro de cada função: carregá-los
+custa centenas de milissegundos e o registro do flow não precisa deles.
 """
-from google.cloud import storage, bigquery
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+import base64
+import hashlib
+import json
 import os
+import re
+import threading
+
+if TYPE_CHECKING:
+    from google.cloud import bigquery, storage
+
+
+# Índice local de uploads: MD5 do conteúdo -> objeto no bucket (PIPELINE_UPLOAD_INDEX)
+DEFAULT_UPLOAD_INDEX = "./data/state/upload_index.json"
+UPLOAD_INDEX_MAX_ENTRIES = 5000
+
+# Partes do upload resumível em stream (múltiplo de 256 KB)
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+
+_INDEX_LOCK = threading.Lock()
 
 
-def get_gcs_client() -> storage.Client:
+def get_gcs_client() -> "storage.Client":
     """
     Retorna um cliente do Google Cloud Storage
     """
+    from google.cloud import storage
+    
     return storage.Client()
 
 
-def get_bq_client() -> bigquery.Client:
+def get_bq_client() -> "bigquery.Client":
     """
     Retorna um cliente do BigQuery
     """
+    from google.cloud import bigquery
+    
     return bigquery.Client()
 
 
+def file_md5(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    MD5 do arquivo em base64, no mesmo formato de Blob.md5_hash.
+    """
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode()
+
+
+def _index_path() -> str:
+    return os.getenv("PIPELINE_UPLOAD_INDEX", DEFAULT_UPLOAD_INDEX)
+
+
+def _read_upload_index() -> Dict[str, Dict]:
+    try:
+        with open(_index_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _record_upload(md5: str, bucket_name: str, blob_name: str, generation: Optional[int]) -> None:
+    """Registra um objeto enviado no índice local (escrita atômica, entradas mais recentes)."""
+    with _INDEX_LOCK:
+        index = _read_upload_index()
+        index.pop(md5, None)
+        index[md5] = {"bucket": bucket_name, "name": blob_name, "generation": generation}
+        if len(index) > UPLOAD_INDEX_MAX_ENTRIES:
+            index = dict(list(index.items())[-UPLOAD_INDEX_MAX_ENTRIES:])
+
+        path = _index_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+
+
+def upload_if_changed(
+    bucket_name: str,
+    source_file_path: str,
+    destination_blob_name: str,
+    credentials_path: Optional[str] = None
+) -> Tuple[str, bool]:
+    """
+    Faz upload idempotente de um arquivo, pulando conteúdo já presente no bucket.
+
+    1. Calcula o MD5 local e procura o conteúdo no índice de uploads
+       (PIPELINE_UPLOAD_INDEX); se o objeto indexado ainda existe com o
+       mesmo MD5, devolve a URI dele sem reenviar (retries e reexecuções
+       não criam cópias com outro timestamp no nome).
+    2. Se o destino já existe com o mesmo MD5, também pula.
+    3. Caso contrário envia com precondição de geração: 0 para objeto novo
+       ou a geração lida para substituir uma versão diferente. Um escritor
+       concorrente faz a precondição falhar em vez de ser sobrescrito.
+
+    Args:
+        bucket_name: Nome do bucket
+        source_file_path: Caminho do arquivo local
+        destination_blob_name: Nome do arquivo no GCS
+        credentials_path: Caminho para o arquivo de credenciais (opcional)
+
+    Returns:
+        Tupla (URI do objeto com esse conteúdo, True se houve upload)
+
+    Raises:
+        google.api_core.exceptions.PreconditionFailed: Outro escritor gravou
+            conteúdo diferente no destino durante o upload
+    """
+    from google.api_core.exceptions import PreconditionFailed
+
+    if credentials_path:
+        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
+
+    md5 = file_md5(source_file_path)
+    bucket = get_gcs_client().bucket(bucket_name)
+
+    indexed = _read_upload_index().get(md5)
+    # Só reaproveita objetos do mesmo prefixo (cada prefixo alimenta uma tabela)
+    same_prefix = indexed and os.path.dirname(indexed["name"]) == os.path.dirname(destination_blob_name)
+    if same_prefix and indexed["bucket"] == bucket_name:
+        existing = bucket.get_blob(indexed["name"])
+        if existing is not None and existing.md5_hash == md5:
+            return f"gs://{bucket_name}/{existing.name}", False
+
+    current = bucket.get_blob(destination_blob_name)
+    if current is not None and current.md5_hash == md5:
+        _record_upload(md5, bucket_name, current.name, current.generation)
+        return f"gs://{bucket_name}/{destination_blob_name}", False
+
+    blob = bucket.blob(destination_blob_name)
+    try:
+        blob.upload_from_filename(
+            source_file_path,
+            if_generation_match=current.generation if current is not None else 0,
+            checksum="md5"
+        )
+    except PreconditionFailed:
+        # Outro escritor chegou antes: só é aceitável se gravou o mesmo conteúdo
+        winner = bucket.get_blob(destination_blob_name)
+        if winner is None or winner.md5_hash != md5:
+            raise
+        blob = winner
+    else:
+        _record_upload(md5, bucket_name, destination_blob_name, blob.generation)
+        return f"gs://{bucket_name}/{destination_blob_name}", True
+
+    _record_upload(md5, bucket_name, destination_blob_name, blob.generation)
+    return f"gs://{bucket_name}/{destination_blob_name}", False
+
+
+def stream_to_gcs(
+    bucket_name: str,
+    destination_blob_name: str,
+    chunks: Iterable[bytes],
+    content_type: str = "text/csv",
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    credentials_path: Optional[str] = None
+) -> Tuple[str, int]:
+    """
+    Envia um stream de bytes para o GCS em upload resumível, sem arquivo local.
+
+    O BlobWriter guarda no máximo `chunk_size` bytes antes de enviar cada
+    parte; se um bloco falhar, o upload resumível é cancelado e nenhum
+    objeto parcial fica visível. Como em `upload_if_changed`, a escrita
+    exige que o objeto não exista (geração 0) e o MD5 do conteúdo entra
+    no índice de uploads.
+
+    Args:
+        bucket_name: Nome do bucket
+        destination_blob_name: Nome do objeto
+        chunks: Blocos de bytes, na ordem
+        content_type: Content-Type do objeto
+        chunk_size: Tamanho das partes do upload (múltiplo de 256 KB)
+        credentials_path: Caminho para o arquivo de credenciais (opcional)
+
+    Returns:
+        Tupla (URI do objeto, bytes enviados)
+    """
+    if credentials_path:
+        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
+
+    blob = get_gcs_client().bucket(bucket_name).blob(destination_blob_name)
+    digest = hashlib.md5()
+    size = 0
+
+    with blob.open(
+        "wb",
+        chunk_size=chunk_size,
+        ignore_flush=True,
+        if_generation_match=0,
+        content_type=content_type
+    ) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+
+    _record_upload(base64.b64encode(digest.digest()).decode(), bucket_name, destination_blob_name, None)
+    return f"gs://{bucket_name}/{destination_blob_name}", size
+
+
 def upload_to_gcs(
     bucket_name: str,
     source_file_path: str,
@@ -27,7 +215,7 @@ def upload_to_gcs(
     credentials_path: Optional[str] = None
 ) -> str:
     """
-    Faz upload de arquivo para o Google Cloud Storage
+    Faz upload de arquivo para o Google Cloud Storage (idempotente, ver `upload_if_changed`)
     
     Args:
         bucket_name: Nome do bucket
@@ -36,15 +224,115 @@ def upload_to_gcs(
         credentials_path: Caminho para o arquivo de credenciais (opcional)
         
     Returns:
-        URI do arquivo no GCS
+        URI do objeto no GCS com o conteúdo do arquivo
     """
-    if credentials_path:
-        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
+    gcs_uri, _ = upload_if_changed(bucket_name, source_file_path, destination_blob_name, credentials_path)
+    return gcs_uri
+
+
+def build_load_job_id(source_uri: str, table_ref: str, prefix: str = "bronze_load") -> str:
+    """
+    Gera job_id determinístico a partir do arquivo de origem e da tabela destino.
+    
+    O BigQuery rejeita (409 Conflict) um segundo job com o mesmo id, o que
+    torna a carga idempotente por nome de arquivo.
+    
+    Args:
+        source_uri: URI do arquivo no GCS
+        table_ref: Tabela destino (project.dataset.table)
+        prefix: Prefixo do job_id
         
-    client = get_gcs_client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
+    Returns:
+        job_id válido ([a-zA-Z0-9_-], até 1024 caracteres)
+    """
+    raw = f"{prefix}_{table_ref}_{source_uri.rsplit('/', 1)[-1]}"
+    return re.sub(r"[^a-zA-Z0-9_-]", "_", raw)[:1000]
+
+
+def load_gcs_csv_to_table(
+    source_uri: str,
+    table_ref: str,
+    schema: List,
+    client: Optional["bigquery.Client"] = None,
+    partition_field: Optional[str] = None,
+    job_id_prefix: str = "bronze_load",
+    max_attempts: int = 3
+) -> Dict:
+    """
+    Carrega um CSV do GCS em tabela nativa particionada via load job.
     
-    blob.upload_from_filename(source_file_path)
+    Load jobs não cobram bytes escaneados. A tabela é criada na primeira
+    carga (CREATE_IF_NEEDED) com particionamento diário por tempo de
+    ingestão ou pela coluna `partition_field`. O job_id é derivado do nome
+    do arquivo: se um job com o mesmo id já concluiu com sucesso, a carga é
+    considerada feita e nada é duplicado; se falhou, uma nova tentativa é
+    feita com sufixo `_r<n>`.
+    
+    Args:
+        source_uri: URI do CSV no GCS (gs://bucket/path/file.csv)
+        table_ref: Tabela destino (project.dataset.table)
+        schema: Lista de bigquery.SchemaField
+        client: Cliente BigQuery (permite injetar um substituto local)
+        partition_field: Coluna DATE/TIMESTAMP de particionamento (None = ingestão)
+        job_id_prefix: Prefixo do job_id determinístico
+        max_attempts: Máximo de job_ids tentados para o mesmo arquivo
+        
+    Returns:
+        Dicionário com job_id, status ('loaded' ou 'already_loaded') e output_rows
+    """
+    from google.api_core.exceptions import Conflict
+    from google.cloud import bigquery
+    
+    if client is None:
+        client = get_bq_client()
+    
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.CSV,
+        skip_leading_rows=1,
+        allow_jagged_rows=True,
+        allow_quoted_newlines=True,
+        schema=schema,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED,
+        time_partitioning=bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field=partition_field
+        ),
+    )
+    
+    base_job_id = build_load_job_id(source_uri, table_ref, job_id_prefix)
+    
+    for attempt in range(max_attempts):
+        job_id = base_job_id if attempt == 0 else f"{base_job_id}_r{attempt}"
+        
+        try:
+            job = client.load_table_from_uri(
+                source_uri,
+                table_ref,
+                job_id=job_id,
+                job_config=job_config
+            )
+            job.result()
+            return {
+                "job_id": job_id,
+                "status": "loaded",
+                "output_rows": job.output_rows
+            }
+        
+        except Conflict:
+            # Job com este id já existe: aguardar e verificar o desfecho
+            job = client.get_job(job_id)
+            try:
+                job.result()
+            except Exception:
+                pass
+            
+            if job.error_result is None:
+                return {
+                    "job_id": job_id,
+                    "status": "already_loaded",
+                    "output_rows": job.output_rows
+                }
+            # Job anterior falhou: tentar com o próximo sufixo
     
-    return f"gs://{bucket_name}/{destination_blob_name}"
+    raise RuntimeError(f"Carga de {source_uri} falhou após {max_attempts} tentativas de job_id")
@@ -0,0 +1,201 @@
+"""
+Fila local e durável de manifestos de arquivos bronze entre a captura e o transform
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+import json
+import os
+import shutil
+import time
+import uuid
+
+from prefect.utilities.logging import get_logger
+
+from pipelines.utils.metrics import get_registry
+
+
+logger = get_logger()
+
+# Subdiretórios da fila: manifestos aguardando, lotes em processamento e escrita temporária
+PENDING_DIR = "pending"
+INFLIGHT_DIR = "inflight"
+TMP_DIR = "tmp"
+
+# Feeds cujos arquivos o flow de transform consome (a silver só lê a bronze do BRT);
+# os demais não são enfileirados, ou a fila cresceria sem consumidor
+TRANSFORM_FEEDS = ("brt",)
+
+
+def transform_queue_dir(output_dir: str = "./data") -> str:
+    """Diretório da fila do transform: <output_dir>/queue/transform."""
+    return os.path.join(output_dir, "queue", "transform")
+
+
+class TransformQueue:
+    """
+    Fila de manifestos em disco: um JSON por arquivo bronze gravado.
+
+    A captura só enfileira (escrita atômica, sem lock) e segue. O transform
+    reivindica todos os pendentes de uma vez, movendo-os para
+    inflight/<lote>/ (rename atômico), e os remove depois do gold validado.
+    Um lote que ficou em inflight/ porque o transform morreu volta para a
+    fila no próximo transform (`requeue_inflight`). O nome de cada
+    manifesto começa pelo instante do enfileiramento em nanossegundos, então
+    a ordem e o atraso da fila saem da listagem do diretório.
+    """
+
+    def __init__(self, queue_dir: str):
+        self.queue_dir = queue_dir
+        self.pending_dir = os.path.join(queue_dir, PENDING_DIR)
+        self.inflight_dir = os.path.join(queue_dir, INFLIGHT_DIR)
+        self.tmp_dir = os.path.join(queue_dir, TMP_DIR)
+        for directory in (self.pending_dir, self.inflight_dir, self.tmp_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def enqueue(self, manifest: Dict) -> str:
+        """
+        Enfileira o manifesto de um arquivo gravado (uri, feed, records...).
+
+        Returns:
+            Caminho do manifesto na fila
+        """
+        enqueued_ns = time.time_ns()
+        filename = f"{enqueued_ns:020d}_{uuid.uuid4().hex[:8]}.json"
+        manifest = {**manifest, "enqueued_at": enqueued_ns / 1e9}
+
+        tmp_path = os.path.join(self.tmp_dir, filename)
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        path = os.path.join(self.pending_dir, filename)
+        os.replace(tmp_path, path)
+        return path
+
+    def _pending_files(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.pending_dir) if name.endswith(".json"))
+
+    def _inflight_files(self) -> List[str]:
+        return [
+            os.path.join(batch, name)
+            for batch in sorted(os.listdir(self.inflight_dir))
+            if os.path.isdir(os.path.join(self.inflight_dir, batch))
+            for name in sorted(os.listdir(os.path.join(self.inflight_dir, batch)))
+            if name.endswith(".json")
+        ]
+
+    def stats(self, now: Optional[float] = None) -> Dict:
+        """
+        Profundidade e atraso da fila.
+
+        Returns:
+            Dict com depth (pendentes), inflight (em transform) e
+            lag_seconds (idade do pendente mais antigo, 0 com a fila vazia)
+        """
+        now = time.time() if now is None else now
+        pending = self._pending_files()
+        oldest = int(pending[0].split("_", 1)[0]) / 1e9 if pending else None
+        return {
+            "depth": len(pending),
+            "inflight": len(self._inflight_files()),
+            "oldest_enqueued_at": oldest,
+            "lag_seconds": max(now - oldest, 0.0) if oldest is not None else 0.0,
+        }
+
+    def queued_uris(self) -> Set[str]:
+        """URIs dos manifestos pendentes ou em transform (ainda não consumidos)."""
+        uris = set()
+        paths = [os.path.join(self.pending_dir, n) for n in self._pending_files()]
+        paths += [os.path.join(self.inflight_dir, n) for n in self._inflight_files()]
+        for path in paths:
+            manifest = _read_manifest(path)
+            if manifest and manifest.get("uri"):
+                uris.add(manifest["uri"])
+        return uris
+
+    def claim(self) -> Tuple[Optional[str], List[Dict]]:
+        """
+        Reivindica todos os manifestos pendentes em um lote (coalescidos em um transform).
+
+        Returns:
+            Tupla (id do lote ou None se a fila estava vazia, manifestos)
+        """
+        pending = self._pending_files()
+        if not pending:
+            return None, []
+
+        batch_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        batch_dir = os.path.join(self.inflight_dir, batch_id)
+        os.makedirs(batch_dir)
+
+        manifests = []
+        for name in pending:
+            target = os.path.join(batch_dir, name)
+            try:
+                os.replace(os.path.join(self.pending_dir, name), target)
+            except FileNotFoundError:
+                continue
+            manifest = _read_manifest(target)
+            if manifest is not None:
+                manifests.append(manifest)
+        return batch_id, manifests
+
+    def ack(self, batch_id: str) -> List[Dict]:
+        """
+        Remove um lote consumido (transform concluído).
+
+        Returns:
+            Manifestos do lote
+        """
+        batch_dir = os.path.join(self.inflight_dir, batch_id)
+        if not os.path.isdir(batch_dir):
+            return []
+        manifests = [
+            manifest for manifest in (
+                _read_manifest(os.path.join(batch_dir, name)) for name in sorted(os.listdir(batch_dir))
+            )
+            if manifest is not None
+        ]
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        return manifests
+
+    def requeue_inflight(self) -> int:
+        """
+        Devolve à fila os lotes de transforms que não concluíram.
+
+        Só deve ser chamado com o lock do transform (nenhum lote em uso).
+
+        Returns:
+            Quantidade de manifestos devolvidos
+        """
+        requeued = 0
+        for relative in self._inflight_files():
+            try:
+                os.replace(
+                    os.path.join(self.inflight_dir, relative),
+                    os.path.join(self.pending_dir, os.path.basename(relative))
+                )
+                requeued += 1
+            except FileNotFoundError:
+                continue
+        for batch in os.listdir(self.inflight_dir):
+            shutil.rmtree(os.path.join(self.inflight_dir, batch), ignore_errors=True)
+        return requeued
+
+
+def _read_manifest(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logger.warning(f"⚠️  Manifesto ilegível na fila: {path}")
+        return None
+
+
+def report_queue(queue: TransformQueue, now: Optional[float] = None) -> Dict:
+    """Publica profundidade e atraso da fila como gauges e os devolve."""
+    stats = queue.stats(now)
+    registry = get_registry()
+    registry.set_gauge("pipeline_transform_queue_depth", stats["depth"])
+    registry.set_gauge("pipeline_transform_queue_lag_seconds", stats["lag_seconds"])
+    return stats
@@ -0,0 +1,101 @@
+"""
+Sketch HyperLogLog vetorizado para contagens distintas mescláveis na ingestão
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# Mesma precisão dos sketches HLL_COUNT.INIT gravados no gold (2^14 registradores, ~0,8% de erro)
+DEFAULT_PRECISION = 14
+
+
+def _leading_zeros(values: np.ndarray) -> np.ndarray:
+    """Zeros à esquerda de inteiros uint64 (64 para zero), por busca binária vetorizada."""
+    values = values.astype(np.uint64)
+    count = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        top = values >> np.uint64(64 - shift)
+        empty = top == 0
+        count[empty] += shift
+        values = np.where(empty, values << np.uint64(shift), values)
+    count[values >> np.uint64(63) == 0] += 1
+    return count
+
+
+class HyperLogLog:
+    """
+    Sketch HyperLogLog (Flajolet et al.) com correção de linear counting.
+
+    Os valores são hasheados em 64 bits com `pd.util.hash_array` (estável
+    entre processos); os p bits mais altos escolhem o registrador e o
+    restante define o posto (zeros à esquerda + 1). A mescla de dois
+    sketches é o máximo elemento a elemento, então sketches de horas podem
+    ser combinados em dia, semana ou linha sem revisitar os registros.
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[np.ndarray] = None):
+        """
+        Args:
+            precision: Bits de índice (4 a 18)
+            registers: Registradores existentes (para desserialização)
+        """
+        if not 4 <= precision <= 18:
+            raise ValueError(f"Precisão HLL inválida: {precision}")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    def add(self, values: Iterable) -> "HyperLogLog":
+        """
+        Adiciona valores (nulos e vazios são ignorados).
+
+        Args:
+            values: Array/Series de valores
+
+        Returns:
+            O próprio sketch
+        """
+        series = pd.Series(values, dtype=object).dropna().astype(str)
+        series = series[series.str.strip() != ""]
+        if series.empty:
+            return self
+
+        hashes = pd.util.hash_array(series.to_numpy())
+        p = np.uint64(self.precision)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.intp)
+        remainder = hashes << p
+        rank = np.minimum(_leading_zeros(remainder) + 1, 64 - self.precision + 1).astype(np.uint8)
+
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Incorpora outro sketch de mesma precisão (máximo por registrador)."""
+        if other.precision != self.precision:
+            raise ValueError("Sketches HLL com precisões diferentes")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> int:
+        """Cardinalidade estimada."""
+        m = float(self.m)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * np.log(m / zeros)))
+        return int(round(raw))
+
+    def to_bytes(self) -> bytes:
+        """Serializa (1 byte de precisão + registradores)."""
+        return bytes([self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        """Desserializa um sketch gravado por `to_bytes`."""
+        precision = data[0]
+        registers = np.frombuffer(data[1:], dtype=np.uint8).copy()
+        return cls(precision, registers)
@@ -0,0 +1,452 @@
+"""
+Agregados horários incrementais com estatísticas mescláveis (contagens, somas, Welford)
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipelines.utils.hll import HyperLogLog
+
+
+# Chave dos agregados (mesma granularidade de agg_metricas_horarias)
+KEY_COLUMNS = ["data_gps", "hora_gps"]
+
+# Contagens aditivas
+COUNT_COLUMNS = [
+    "total_registros",
+    "veiculos_parados",
+    "veiculos_lento",
+    "veiculos_moderado",
+    "veiculos_rapido",
+    "veiculos_ligados",
+    "veiculos_desligados",
+]
+
+# Estado da velocidade: n, soma, média e M2 (soma dos quadrados dos desvios)
+SPEED_COLUMNS = [
+    "velocidade_n",
+    "velocidade_soma",
+    "velocidade_media",
+    "velocidade_m2",
+    "velocidade_minima",
+    "velocidade_maxima",
+]
+
+# Contagens distintas estimadas por sketch HLL (não aditivas: mescla por máximo)
+DISTINCT_COLUMNS = ["veiculos_ativos_aprox", "linhas_ativas_aprox"]
+
+# Coluna de origem de cada contagem distinta
+DISTINCT_SOURCES = {"veiculos_ativos_aprox": "codigo", "linhas_ativas_aprox": "linha"}
+
+AGGREGATE_COLUMNS = KEY_COLUMNS + COUNT_COLUMNS + SPEED_COLUMNS + DISTINCT_COLUMNS
+
+# Horas mantidas com sketch no estado local (fixes atrasados além disso não chegam)
+SKETCH_RETENTION_HOURS = 48
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame(columns=AGGREGATE_COLUMNS)
+
+
+def compute_hourly_aggregates(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrega um lote de fixes por (data, hora) do dataHora.
+
+    As faixas de velocidade e o status de ignição seguem as mesmas regras de
+    agg_metricas_horarias (contagens por registro). Média e M2 são calculados
+    por grupo em uma passada vetorizada, prontos para `merge_aggregates`.
+
+    Args:
+        df: Lote com dataHora (ms), velocidade e ignicao
+
+    Returns:
+        DataFrame com AGGREGATE_COLUMNS, uma linha por (data_gps, hora_gps)
+    """
+    if df is None or len(df) == 0 or "dataHora" not in df.columns:
+        return _empty()
+
+    timestamps = pd.to_datetime(pd.to_numeric(df["dataHora"], errors="coerce"), unit="ms")
+    speed = pd.to_numeric(df["velocidade"], errors="coerce") if "velocidade" in df.columns else pd.Series(np.nan, index=df.index)
+    rounded = speed.round(2)
+    ignition = df["ignicao"].astype(str).str.strip().str.upper() if "ignicao" in df.columns else pd.Series("", index=df.index)
+
+    frame = pd.DataFrame({
+        "data_gps": timestamps.dt.date,
+        "hora_gps": timestamps.dt.hour,
+        "total_registros": 1,
+        "veiculos_parados": (rounded == 0).astype(int),
+        "veiculos_lento": rounded.between(0.1, 20).astype(int),
+        "veiculos_moderado": rounded.between(20.1, 50).astype(int),
+        "veiculos_rapido": (rounded > 50).astype(int),
+        "veiculos_ligados": (ignition == "L").astype(int),
+        "veiculos_desligados": (ignition == "D").astype(int),
+        "velocidade": rounded,
+        **{col: df[source] if source in df.columns else None for col, source in DISTINCT_SOURCES.items()},
+    }).dropna(subset=["data_gps"])
+
+    if frame.empty:
+        return _empty()
+
+    grouped = frame.groupby(KEY_COLUMNS, sort=True)
+    result = grouped[COUNT_COLUMNS].sum()
+    result["velocidade_n"] = grouped["velocidade"].count()
+    result["velocidade_soma"] = grouped["velocidade"].sum()
+    result["velocidade_media"] = grouped["velocidade"].mean()
+    result["velocidade_m2"] = grouped["velocidade"].var(ddof=0).fillna(0.0) * result["velocidade_n"]
+    result["velocidade_minima"] = grouped["velocidade"].min()
+    result["velocidade_maxima"] = grouped["velocidade"].max()
+    for col in DISTINCT_COLUMNS:
+        result[col] = grouped[col].nunique()
+
+    return result.reset_index()[AGGREGATE_COLUMNS]
+
+
+def merge_aggregates(left: pd.DataFrame, right: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mescla dois conjuntos de agregados (associativo e comutativo).
+
+    Contagens e somas são somadas; média e M2 usam a combinação paralela de
+    Chan et al. (M2 = M2a + M2b + δ²·na·nb/n); mínimo e máximo por extremo.
+    Contagens distintas não são aditivas: aqui fica o máximo (limite
+    inferior), e o HourlyAggregator as substitui pela estimativa do sketch.
+
+    Args:
+        left: Agregados acumulados
+        right: Agregados de um novo lote
+
+    Returns:
+        DataFrame com AGGREGATE_COLUMNS
+    """
+    if left is None or left.empty:
+        return right.copy() if right is not None else _empty()
+    if right is None or right.empty:
+        return left.copy()
+
+    a = left.set_index(KEY_COLUMNS)
+    b = right.set_index(KEY_COLUMNS)
+    index = a.index.union(b.index)
+    a = a.reindex(index)
+    b = b.reindex(index)
+
+    merged = pd.DataFrame(index=index)
+    for col in COUNT_COLUMNS + ["velocidade_n", "velocidade_soma"]:
+        merged[col] = a[col].fillna(0) + b[col].fillna(0)
+
+    na = a["velocidade_n"].fillna(0).astype(float)
+    nb = b["velocidade_n"].fillna(0).astype(float)
+    n = na + nb
+    ma = a["velocidade_media"].fillna(0.0).astype(float)
+    mb = b["velocidade_media"].fillna(0.0).astype(float)
+    delta = mb - ma
+    safe_n = n.where(n > 0, 1.0)
+
+    merged["velocidade_media"] = (ma + delta * nb / safe_n).where(n > 0)
+    merged["velocidade_m2"] = (
+        a["velocidade_m2"].fillna(0.0) + b["velocidade_m2"].fillna(0.0) + delta ** 2 * na * nb / safe_n
+    )
+    merged["velocidade_minima"] = np.fmin(a["velocidade_minima"].astype(float), b["velocidade_minima"].astype(float))
+    merged["velocidade_maxima"] = np.fmax(a["velocidade_maxima"].astype(float), b["velocidade_maxima"].astype(float))
+    for col in DISTINCT_COLUMNS:
+        merged[col] = np.fmax(a[col].astype(float), b[col].astype(float)).fillna(0)
+
+    for col in COUNT_COLUMNS + ["velocidade_n"] + DISTINCT_COLUMNS:
+        merged[col] = merged[col].astype(int)
+
+    return merged.reset_index()[AGGREGATE_COLUMNS]
+
+
+def finalize_aggregates(aggregates: pd.DataFrame) -> pd.DataFrame:
+    """
+    Deriva as métricas de leitura (média e desvio padrão amostral).
+
+    Args:
+        aggregates: Estado mesclável
+
+    Returns:
+        DataFrame com velocidade_media_kmh e velocidade_desvio_padrao
+        (equivalente a STDDEV do BigQuery)
+    """
+    result = aggregates.copy()
+    n = result["velocidade_n"].astype(float)
+    result["velocidade_media_kmh"] = result["velocidade_media"].round(2)
+    result["velocidade_desvio_padrao"] = np.sqrt(result["velocidade_m2"] / (n - 1).where(n > 1)).round(2)
+    return result
+
+
+class HourlyAggregator:
+    """
+    Agregados por (data, hora) mantidos em memória durante a captura.
+
+    `update` incorpora cada lote aprovado tanto no total acumulado quanto no
+    delta desde o último flush. `flush` grava o delta em um arquivo pequeno
+    (um registro por hora tocada) para o gold mesclar e zera o delta; o
+    total acumulado é persistido em `state_path` para sobreviver entre runs.
+
+    Veículos e linhas distintos por hora vêm de sketches HyperLogLog
+    mantidos por hora (persistidos ao lado do estado, em .npz): o delta leva
+    a estimativa acumulada da hora, que o gold grava por máximo.
+    """
+
+    def __init__(self, state_path: Optional[str] = None):
+        """
+        Args:
+            state_path: CSV com o total acumulado (None = só em memória)
+        """
+        self.state_path = state_path
+        self.totals = load_aggregates(state_path) if state_path else _empty()
+        self.delta = _empty()
+        self.sketches: Dict[Tuple[str, int, str], HyperLogLog] = (
+            load_sketches(self._sketch_path()) if state_path else {}
+        )
+
+    def _sketch_path(self) -> str:
+        return f"{os.path.splitext(self.state_path)[0]}_hll.npz"
+
+    def _update_sketches(self, df: pd.DataFrame, batch: pd.DataFrame) -> None:
+        """Adiciona o lote aos sketches das horas tocadas e atualiza as estimativas."""
+        timestamps = pd.to_datetime(pd.to_numeric(df["dataHora"], errors="coerce"), unit="ms")
+        keys = timestamps.dt.strftime("%Y-%m-%d") + "_" + timestamps.dt.hour.astype("Int64").astype(str)
+
+        for col, source in DISTINCT_SOURCES.items():
+            if source not in df.columns:
+                continue
+            for key, values in df[source].groupby(keys.to_numpy()):
+                date, hour = key.rsplit("_", 1)
+                sketch = self.sketches.setdefault((date, int(hour), col), HyperLogLog())
+                sketch.add(values.to_numpy())
+
+        for frame in (self.delta, self.totals):
+            for col in DISTINCT_COLUMNS:
+                frame[col] = [
+                    self.sketches[(str(d), int(h), col)].estimate() if (str(d), int(h), col) in self.sketches else v
+                    for d, h, v in zip(frame["data_gps"], frame["hora_gps"], frame[col])
+                ]
+
+    def update(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Incorpora um lote.
+
+        Args:
+            df: Lote de fixes (dataHora em ms)
+
+        Returns:
+            Agregados do lote
+        """
+        batch = compute_hourly_aggregates(df)
+        self.delta = merge_aggregates(self.delta, batch)
+        self.totals = merge_aggregates(self.totals, batch)
+        if not batch.empty:
+            self._update_sketches(df, batch)
+        return batch
+
+    def flush(self, output_dir: str, prefix: str = "agg_horario_delta") -> Optional[str]:
+        """
+        Grava o delta pendente e o total acumulado.
+
+        Args:
+            output_dir: Diretório dos arquivos de delta
+            prefix: Prefixo do nome do arquivo
+
+        Returns:
+            Caminho do arquivo de delta (None se não havia nada pendente)
+        """
+        if self.delta.empty:
+            return None
+
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        path = os.path.join(output_dir, f"{prefix}_{timestamp}.csv")
+        self.delta.to_csv(path, index=False)
+
+        if self.state_path:
+            save_aggregates(self.totals, self.state_path)
+            save_sketches(self.sketches, self._sketch_path())
+
+        self.delta = _empty()
+        return path
+
+
+def load_aggregates(path: str) -> pd.DataFrame:
+    """
+    Lê um arquivo de agregados (delta ou estado acumulado).
+
+    Args:
+        path: CSV com AGGREGATE_COLUMNS
+
+    Returns:
+        DataFrame (vazio se o arquivo não existir)
+    """
+    if not path or not os.path.exists(path):
+        return _empty()
+    df = pd.read_csv(path)
+    df["data_gps"] = pd.to_datetime(df["data_gps"]).dt.date
+    for col in DISTINCT_COLUMNS:
+        if col not in df.columns:
+            df[col] = 0
+    return df[AGGREGATE_COLUMNS]
+
+
+def save_aggregates(df: pd.DataFrame, path: str) -> None:
+    """Grava o estado acumulado (escrita atômica)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def load_sketches(path: str) -> Dict[Tuple[str, int, str], HyperLogLog]:
+    """
+    Lê os sketches HLL por hora gravados por `save_sketches`.
+
+    Args:
+        path: Arquivo .npz
+
+    Returns:
+        {(data, hora, coluna): HyperLogLog} (vazio se o arquivo não existir)
+    """
+    if not os.path.exists(path):
+        return {}
+    sketches = {}
+    with np.load(path) as data:
+        for name in data.files:
+            date, hour, col = name.split("|")
+            sketches[(date, int(hour), col)] = HyperLogLog.from_bytes(data[name].tobytes())
+    return sketches
+
+
+def save_sketches(sketches: Dict[Tuple[str, int, str], HyperLogLog], path: str) -> None:
+    """
+    Grava os sketches das últimas SKETCH_RETENTION_HOURS horas (escrita atômica).
+
+    Args:
+        sketches: {(data, hora, coluna): HyperLogLog}
+        path: Arquivo .npz
+    """
+    if not sketches:
+        return
+    hours = {key: datetime.fromisoformat(key[0]) + timedelta(hours=key[1]) for key in sketches}
+    cutoff = max(hours.values()) - timedelta(hours=SKETCH_RETENTION_HOURS)
+
+    arrays = {
+        f"{date}|{hour}|{col}": np.frombuffer(sketch.to_bytes(), dtype=np.uint8)
+        for (date, hour, col), sketch in sketches.items()
+        if hours[(date, hour, col)] >= cutoff
+    }
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def aggregates_merge_sql(table: str, delta: pd.DataFrame, delta_id: str, applied_table: str) -> str:
+    """
+    Gera o script BigQuery que mescla um delta na tabela gold incremental.
+
+    Cria a tabela se necessário. O delta entra como literal (poucas linhas,
+    uma por hora) e a combinação de média/M2 é a mesma de `merge_aggregates`;
+    as contagens distintas do delta já são a estimativa acumulada da hora e
+    entram por máximo. Mínimo, máximo e o termo de correção do M2 ignoram o
+    lado NULL (hora sem velocidade válida em um dos lados), já que LEAST,
+    GREATEST e POW do BigQuery propagam NULL.
+    A tabela `applied_table` registra os deltas já aplicados, tornando o
+    script idempotente em retries.
+
+    Args:
+        table: Tabela destino (`projeto.dataset.tabela`)
+        delta: Agregados do delta
+        delta_id: Identificador único do delta (nome do arquivo)
+        applied_table: Tabela de controle dos deltas aplicados
+
+    Returns:
+        Script SQL (transação única)
+    """
+    def literal(value) -> str:
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return "NULL"
+        return repr(float(value)) if isinstance(value, (float, np.floating)) else str(int(value))
+
+    rows: List[str] = []
+    for record in delta.to_dict("records"):
+        fields = [f"DATE '{record['data_gps']}' AS data_gps", f"{int(record['hora_gps'])} AS hora_gps"]
+        for col in COUNT_COLUMNS + ["velocidade_n"] + DISTINCT_COLUMNS:
+            fields.append(f"{int(record[col])} AS {col}")
+        for col in ["velocidade_soma", "velocidade_media", "velocidade_m2", "velocidade_minima", "velocidade_maxima"]:
+            fields.append(f"CAST({literal(record[col])} AS FLOAT64) AS {col}")
+        rows.append(f"STRUCT({', '.join(fields)})")
+
+    counts_update = ",\n            ".join(f"{c} = T.{c} + D.{c}" for c in COUNT_COLUMNS)
+    insert_columns = ", ".join(AGGREGATE_COLUMNS + ["velocidade_desvio_padrao", "atualizado_em"])
+    insert_values = ", ".join(
+        [f"D.{c}" for c in AGGREGATE_COLUMNS]
+        + ["SQRT(SAFE_DIVIDE(D.velocidade_m2, NULLIF(D.velocidade_n - 1, 0)))", "CURRENT_TIMESTAMP()"]
+    )
+
+    table_columns = ",\n            ".join(
+        ["data_gps DATE", "hora_gps INT64"]
+        + [f"{c} INT64" for c in COUNT_COLUMNS + ["velocidade_n"] + DISTINCT_COLUMNS]
+        + [f"{c} FLOAT64" for c in SPEED_COLUMNS[1:] + ["velocidade_desvio_padrao"]]
+        + ["atualizado_em TIMESTAMP"]
+    )
+
+    distinct_alter = ",\n            ".join(f"ADD COLUMN IF NOT EXISTS {c} INT64" for c in DISTINCT_COLUMNS)
+    distinct_update = ",\n            ".join(f"{c} = GREATEST(IFNULL(T.{c}, 0), D.{c})" for c in DISTINCT_COLUMNS)
+
+    return f"""
+        CREATE TABLE IF NOT EXISTS `{table}` (
+            {table_columns}
+        )
+        PARTITION BY data_gps
+        CLUSTER BY hora_gps;
+
+        ALTER TABLE `{table}`
+            {distinct_alter};
+
+        CREATE TABLE IF NOT EXISTS `{applied_table}` (delta_id STRING, aplicado_em TIMESTAMP);
+
+        BEGIN TRANSACTION;
+
+        MERGE `{table}` T
+        USING (
+            SELECT * FROM UNNEST([
+                {(',' + chr(10) + '                ').join(rows)}
+            ])
+            WHERE NOT EXISTS (SELECT 1 FROM `{applied_table}` WHERE delta_id = '{delta_id}')
+        ) D
+        ON T.data_gps = D.data_gps AND T.hora_gps = D.hora_gps
+        WHEN MATCHED THEN UPDATE SET
+            {counts_update},
+            velocidade_n = T.velocidade_n + D.velocidade_n,
+            velocidade_soma = T.velocidade_soma + D.velocidade_soma,
+            velocidade_media = SAFE_DIVIDE(T.velocidade_soma + D.velocidade_soma, T.velocidade_n + D.velocidade_n),
+            velocidade_m2 = T.velocidade_m2 + D.velocidade_m2
+                + IFNULL(POW(D.velocidade_media - T.velocidade_media, 2)
+                * SAFE_DIVIDE(T.velocidade_n * D.velocidade_n, T.velocidade_n + D.velocidade_n), 0),
+            velocidade_minima = LEAST(
+                COALESCE(T.velocidade_minima, D.velocidade_minima), COALESCE(D.velocidade_minima, T.velocidade_minima)
+            ),
+            velocidade_maxima = GREATEST(
+                COALESCE(T.velocidade_maxima, D.velocidade_maxima), COALESCE(D.velocidade_maxima, T.velocidade_maxima)
+            ),
+            velocidade_desvio_padrao = SQRT(SAFE_DIVIDE(
+                T.velocidade_m2 + D.velocidade_m2
+                    + IFNULL(POW(D.velocidade_media - T.velocidade_media, 2)
+                    * SAFE_DIVIDE(T.velocidade_n * D.velocidade_n, T.velocidade_n + D.velocidade_n), 0),
+                NULLIF(T.velocidade_n + D.velocidade_n - 1, 0)
+            )),
+            {distinct_update},
+            atualizado_em = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN
+            INSERT ({insert_columns})
+            VALUES ({insert_values});
+
+        INSERT INTO `{applied_table}` (delta_id, aplicado_em)
+        SELECT '{delta_id}', CURRENT_TIMESTAMP()
+        FROM UNNEST([1])
+        WHERE NOT EXISTS (SELECT 1 FROM `{applied_table}` WHERE delta_id = '{delta_id}');
+
+        COMMIT TRANSACTION;
+    """
@@ -0,0 +1,157 @@
+"""
+Benchmark do tempo de import do pacote (registro do flow / início do agent)
+
+Uso:
+    python -m pipelines.utils.import_benchmark [--runs 5] [--budget-ms 150]
+
+Sai com código 1 se um módulo pesado for carregado no import de
+`pipelines.flows` ou se o tempo próprio do pacote ultrapassar o orçamento.
+"""
+from typing import Dict, List, Tuple
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Módulo importado pelo agent / registro do flow
+TARGET_MODULE = "pipelines.flows"
+
+# Dependências que só devem ser carregadas quando uma task precisa delas
+HEAVY_MODULES = (
+    "pandas",
+    "numpy",
+    "pyarrow",
+    "google.cloud.bigquery",
+    "google.cloud.storage",
+)
+
+# Frameworks cujo custo de import não é atribuído ao pacote
+FRAMEWORK_PREFIXES = ("prefect",)
+
+# Orçamento padrão do tempo próprio de import (ms)
+DEFAULT_BUDGET_MS = 150.0
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    Interpreta a saída de `python -X importtime`.
+
+    Args:
+        stderr: Saída de erro do processo
+
+    Returns:
+        Lista de (módulo, profundidade, tempo cumulativo em µs)
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        entries.append((name.strip(), depth, int(cumulative)))
+    return entries
+
+
+def measure_once(module: str = TARGET_MODULE) -> Dict:
+    """
+    Importa o módulo em um interpretador novo e mede o custo.
+
+    Returns:
+        Dict com total_ms, framework_ms, own_ms e heavy_modules carregados
+    """
+    probe = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {module}:\n{result.stderr[-2000:]}")
+
+    entries = parse_importtime(result.stderr)
+    total = next((cum for name, _, cum in entries if name == module), 0)
+
+    # Soma apenas o nó mais externo de cada subárvore de framework
+    framework = 0
+    framework_depth = None
+    for name, depth, cumulative in reversed(entries):
+        # importtime lista filhos antes do pai; percorrendo ao contrário o pai vem primeiro
+        if framework_depth is not None and depth > framework_depth:
+            continue
+        framework_depth = None
+        if name.startswith(FRAMEWORK_PREFIXES):
+            framework += cumulative
+            framework_depth = depth
+
+    heavy = [m for m in result.stdout.strip().split(",") if m]
+    return {
+        "total_ms": total / 1000,
+        "framework_ms": framework / 1000,
+        "own_ms": max(total - framework, 0) / 1000,
+        "heavy_modules": heavy,
+    }
+
+
+def run_benchmark(runs: int = 5, budget_ms: float = DEFAULT_BUDGET_MS) -> Dict:
+    """
+    Mede o import várias vezes e compara a mediana com o orçamento.
+
+    Args:
+        runs: Número de interpretadores novos medidos
+        budget_ms: Orçamento do tempo próprio do pacote (ms)
+
+    Returns:
+        Dict com medianas, módulos pesados e lista de falhas
+    """
+    samples = [measure_once() for _ in range(runs)]
+    own_ms = statistics.median(s["own_ms"] for s in samples)
+    heavy = sorted({m for s in samples for m in s["heavy_modules"]})
+
+    failures = []
+    if heavy:
+        failures.append(f"módulos pesados carregados no import: {', '.join(heavy)}")
+    if own_ms > budget_ms:
+        failures.append(f"tempo próprio de import {own_ms:.0f} ms > orçamento {budget_ms:.0f} ms")
+
+    return {
+        "total_ms": statistics.median(s["total_ms"] for s in samples),
+        "framework_ms": statistics.median(s["framework_ms"] for s in samples),
+        "own_ms": own_ms,
+        "budget_ms": budget_ms,
+        "heavy_modules": heavy,
+        "failures": failures,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.getenv("PIPELINE_IMPORT_BUDGET_MS", DEFAULT_BUDGET_MS))
+    )
+    args = parser.parse_args()
+
+    report = run_benchmark(args.runs, args.budget_ms)
+    print(
+        f"import {TARGET_MODULE}: total {report['total_ms']:.0f} ms | "
+        f"framework {report['framework_ms']:.0f} ms | "
+        f"pacote {report['own_ms']:.0f} ms (orçamento {report['budget_ms']:.0f} ms)"
+    )
+    for failure in report["failures"]:
+        print(f"REGRESSÃO: {failure}")
+
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,441 @@
+"""
+Instrumentação de tasks: tempo, volume e retries exportados em formato OpenMetrics
+"""
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+
+import prefect
+from prefect.utilities.logging import get_logger
+
+from pipelines.utils.logging_utils import create_execution_summary
+
+
+logger = get_logger()
+
+
+# Diretório padrão dos arquivos de métricas (textfile OpenMetrics + estado)
+DEFAULT_METRICS_DIR = "./data/metrics"
+
+# Tasks instrumentadas entre dois flushes dentro de um flow run (o fim do run sempre faz flush)
+DEFAULT_FLUSH_EVERY = 20
+
+# Buckets (segundos) do histograma de duração das tasks
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Descrição de cada métrica exportada
+METRIC_HELP = {
+    "pipeline_task_duration_seconds": "Tempo de parede de cada execução de task",
+    "pipeline_task_runs": "Execuções de task por status",
+    "pipeline_task_retries": "Execuções de task que foram retries",
+    "pipeline_task_records_in": "Registros recebidos pela task",
+    "pipeline_task_records_out": "Registros produzidos pela task",
+    "pipeline_task_bytes_written": "Bytes gravados em disco pela task",
+    "pipeline_task_bytes_uploaded": "Bytes enviados ao GCS pela task",
+    "pipeline_task_checkpoint_hits": "Execuções de task atendidas por checkpoint",
+    "pipeline_capture_polls": "Requisições à API no polling adaptativo",
+    "pipeline_capture_rate_limited": "Respostas de rate limiting da API (429/503)",
+    "pipeline_capture_interval_seconds": "Intervalo escolhido entre polls da API",
+    "pipeline_capture_errors": "Polls de feed que falharam (erro HTTP ou resposta inválida)",
+    "pipeline_capture_dropped_snapshots": "Snapshots descartados por backpressure (consumidor do feed atrasado)",
+    "pipeline_upload_skipped": "Uploads pulados por conteúdo (MD5) já presente no GCS",
+    "pipeline_compaction_files": "Arquivos bronze substituídos por arquivos compactados",
+    "pipeline_bq_jobs": "Jobs BigQuery emitidos pela task",
+    "pipeline_bq_bytes_processed": "Bytes processados por jobs BigQuery",
+    "pipeline_bq_bytes_billed": "Bytes faturados por jobs BigQuery",
+    "pipeline_bq_slot_ms": "Slot-milissegundos consumidos por jobs BigQuery",
+    "pipeline_bq_cache_hits": "Jobs BigQuery atendidos pelo cache",
+    "pipeline_transform_queue_enqueued": "Manifestos de arquivos enfileirados para o transform",
+    "pipeline_transform_queue_consumed": "Manifestos consumidos por transforms concluídos",
+    "pipeline_transform_queue_depth": "Manifestos aguardando o transform",
+    "pipeline_transform_queue_lag_seconds": "Idade do manifesto mais antigo aguardando o transform",
+    "pipeline_transform_lag_seconds": "Tempo entre o flush de um arquivo e o fim do transform que o consumiu",
+}
+
+# Task em execução (para atribuir bytes gravados/enviados)
+_current_task: ContextVar[Optional[str]] = ContextVar("pipeline_current_task", default=None)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """
+    Registro em processo de contadores, gauges e histogramas rotulados.
+
+    O estado é persistido em JSON a cada flush, de forma que contadores e
+    histogramas continuam monotônicos entre execuções do flow (cada flow run
+    é um processo novo), e renderizado em um textfile OpenMetrics pronto para
+    o textfile collector do node_exporter ou para scrape direto. O flush é
+    feito no fim de cada flow run (`flush_metrics_on_finish`) e, em runs
+    longos, a cada `flush_every` tasks instrumentadas (`task_finished`).
+
+    Vários processos podem gravar no mesmo diretório (captura, transform e
+    backfill em paralelo, workers do backfill): cada um acumula só o que
+    registrou desde o último flush, e o flush soma esse delta ao estado em
+    disco sob um flock, em vez de sobrescrevê-lo com a visão do processo.
+    """
+
+    def __init__(self, metrics_dir: Optional[str] = None, flush_every: Optional[int] = None):
+        """
+        Args:
+            metrics_dir: Diretório dos arquivos (padrão: $PIPELINE_METRICS_DIR ou ./data/metrics)
+            flush_every: Tasks entre flushes (padrão: $PIPELINE_METRICS_FLUSH_EVERY ou DEFAULT_FLUSH_EVERY)
+        """
+        self.metrics_dir = metrics_dir or os.getenv("PIPELINE_METRICS_DIR", DEFAULT_METRICS_DIR)
+        if flush_every is None:
+            flush_every = int(os.getenv("PIPELINE_METRICS_FLUSH_EVERY", DEFAULT_FLUSH_EVERY))
+        self.flush_every = max(int(flush_every), 1)
+        self.textfile_path = os.path.join(self.metrics_dir, "pipeline.prom")
+        self.state_path = os.path.join(self.metrics_dir, "pipeline_metrics.json")
+        self.lock_path = os.path.join(self.metrics_dir, "pipeline_metrics.lock")
+
+        self._lock = threading.RLock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Dict[str, Any]]] = {}
+        # Registrado por este processo desde o último flush
+        self._pending_counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._pending_gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._pending_histograms: Dict[str, Dict[LabelKey, Dict[str, Any]]] = {}
+        self._tasks_since_flush = 0
+        self._load()
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> LabelKey:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        """Incrementa um contador."""
+        key = self._key(labels)
+        with self._lock:
+            for counters in (self._counters, self._pending_counters):
+                series = counters.setdefault(name, {})
+                series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        """Define o valor atual de um gauge (ex: profundidade de fila)."""
+        key = self._key(labels)
+        with self._lock:
+            for gauges in (self._gauges, self._pending_gauges):
+                gauges.setdefault(name, {})[key] = float(value)
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = DURATION_BUCKETS, **labels) -> None:
+        """Registra uma observação em um histograma."""
+        key = self._key(labels)
+        with self._lock:
+            for histograms in (self._histograms, self._pending_histograms):
+                series = histograms.setdefault(name, {})
+                hist = series.setdefault(key, _empty_histogram(buckets))
+                _add_observation(hist, value)
+
+    def get_counter(self, name: str, **labels) -> float:
+        """Valor atual de um contador (0 se inexistente)."""
+        return self._counters.get(name, {}).get(self._key(labels), 0.0)
+
+    def render(self) -> str:
+        """
+        Renderiza todas as métricas no formato de exposição OpenMetrics.
+
+        Returns:
+            Texto OpenMetrics terminado em '# EOF'
+        """
+        def fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+            items = list(key) + ([extra] if extra else [])
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}_total{fmt_labels(key)} {value:g}")
+
+            for name in sorted(self._gauges):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                for key, value in sorted(self._gauges[name].items()):
+                    lines.append(f"{name}{fmt_labels(key)} {value:g}")
+
+            for name in sorted(self._histograms):
+                lines.append(f"# TYPE {name} histogram")
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                for key, hist in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(hist["buckets"], hist["counts"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt_labels(key, ('le', '+Inf'))} {hist['count']}")
+                    lines.append(f"{name}_count{fmt_labels(key)} {hist['count']}")
+                    lines.append(f"{name}_sum{fmt_labels(key)} {hist['sum']:g}")
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def task_finished(self) -> bool:
+        """
+        Conta uma task instrumentada concluída e faz flush a cada `flush_every`.
+
+        Returns:
+            True se houve flush
+        """
+        with self._lock:
+            self._tasks_since_flush += 1
+            if self._tasks_since_flush < self.flush_every:
+                return False
+        self.flush()
+        return True
+
+    def flush(self) -> None:
+        """
+        Soma o delta deste processo ao estado em disco e regrava o estado
+        JSON e o textfile OpenMetrics (escrita atômica, sob flock).
+
+        Um estado em disco ilegível é renomeado para inspeção (ver
+        `_read_state`) e o registro recomeça a partir do delta pendente.
+        """
+        os.makedirs(self.metrics_dir, exist_ok=True)
+
+        with self._lock:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                counters, gauges, histograms = self._read_state(quarantine=True)
+
+                for name, series in self._pending_counters.items():
+                    merged = counters.setdefault(name, {})
+                    for key, value in series.items():
+                        merged[key] = merged.get(key, 0.0) + value
+                for name, series in self._pending_gauges.items():
+                    gauges.setdefault(name, {}).update(series)
+                for name, series in self._pending_histograms.items():
+                    merged = histograms.setdefault(name, {})
+                    for key, hist in series.items():
+                        merged[key] = _merge_histograms(merged.get(key), hist)
+
+                state = {
+                    "counters": _encode(counters),
+                    "gauges": _encode(gauges),
+                    "histograms": _encode(histograms),
+                }
+                self._counters, self._gauges, self._histograms = counters, gauges, histograms
+
+                for path, content in ((self.state_path, json.dumps(state)), (self.textfile_path, self.render())):
+                    tmp_path = f"{path}.tmp"
+                    with open(tmp_path, "w") as f:
+                        f.write(content)
+                    os.replace(tmp_path, path)
+
+                self._pending_counters, self._pending_gauges, self._pending_histograms = {}, {}, {}
+                self._tasks_since_flush = 0
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _read_state(self, quarantine: bool = False) -> Tuple[Dict, Dict, Dict]:
+        """
+        Lê o estado persistido.
+
+        Args:
+            quarantine: Renomeia um estado corrompido para
+                `<estado>.corrupt-<timestamp>` (só sob o flock do flush)
+
+        Returns:
+            (contadores, gauges, histogramas); vazios se o arquivo não existir
+            ou estiver corrompido (com aviso no log)
+        """
+        if not os.path.exists(self.state_path):
+            return {}, {}, {}
+        with open(self.state_path) as f:
+            content = f.read()
+        try:
+            state = json.loads(content)
+            return (
+                _decode(state.get("counters", {})),
+                _decode(state.get("gauges", {})),
+                _decode(state.get("histograms", {}))
+            )
+        except (ValueError, TypeError, AttributeError) as e:
+            if not quarantine:
+                logger.warning(f"⚠️  Estado de métricas ilegível em {self.state_path}: {e}")
+                return {}, {}, {}
+            corrupt_path = f"{self.state_path}.corrupt-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+            os.replace(self.state_path, corrupt_path)
+            logger.warning(
+                f"⚠️  Estado de métricas ilegível ({e}), guardado em {corrupt_path}; "
+                f"os contadores recomeçam do zero"
+            )
+            return {}, {}, {}
+
+    def _load(self) -> None:
+        """Carrega o estado persistido, se existir (só leitura: o flush trata um estado corrompido)."""
+        try:
+            self._counters, self._gauges, self._histograms = self._read_state()
+        except OSError as e:
+            logger.warning(f"⚠️  Estado de métricas não pôde ser lido: {e}")
+
+
+def _empty_histogram(buckets: Tuple[float, ...]) -> Dict[str, Any]:
+    return {"buckets": list(buckets), "counts": [0] * len(buckets), "count": 0, "sum": 0.0}
+
+
+def _add_observation(hist: Dict[str, Any], value: float) -> None:
+    idx = bisect.bisect_left(hist["buckets"], value)
+    if idx < len(hist["counts"]):
+        hist["counts"][idx] += 1
+    hist["count"] += 1
+    hist["sum"] += value
+
+
+def _merge_histograms(base: Optional[Dict[str, Any]], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Soma um histograma a outro (buckets diferentes: vale o delta)."""
+    if base is None or base["buckets"] != delta["buckets"]:
+        return {**delta, "counts": list(delta["counts"])}
+    return {
+        "buckets": base["buckets"],
+        "counts": [a + b for a, b in zip(base["counts"], delta["counts"])],
+        "count": base["count"] + delta["count"],
+        "sum": base["sum"] + delta["sum"],
+    }
+
+
+def _encode(metrics: Dict[str, Dict[LabelKey, Any]]) -> Dict[str, list]:
+    return {n: [[list(map(list, k)), v] for k, v in s.items()] for n, s in metrics.items()}
+
+
+def _decode(metrics: Dict[str, list]) -> Dict[str, Dict[LabelKey, Any]]:
+    return {n: {tuple(map(tuple, k)): v for k, v in s} for n, s in metrics.items()}
+
+
+_registry: Optional[MetricsRegistry] = None
+
+
+def get_registry() -> MetricsRegistry:
+    """Retorna o registro de métricas do processo (criado sob demanda)."""
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
+
+
+def flush_metrics_on_finish(flow, old_state, new_state):
+    """
+    State handler de flow: grava as métricas do run uma vez, quando ele termina.
+
+    Args:
+        flow: Flow em execução
+        old_state: Estado anterior
+        new_state: Novo estado
+
+    Returns:
+        O novo estado, inalterado
+    """
+    if new_state.is_finished() and _registry is not None:
+        try:
+            _registry.flush()
+        except OSError as e:
+            logger.warning(f"⚠️  Falha ao gravar métricas do flow run: {e}")
+    return new_state
+
+
+def _count_records(value: Any) -> Optional[int]:
+    """Número de registros de uma lista/DataFrame (ou do 1º item de uma tupla)."""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, list) or hasattr(value, "columns"):
+        return len(value)
+    return None
+
+
+def current_task_name() -> Optional[str]:
+    """Nome da task instrumentada em execução (None fora de uma task)."""
+    return _current_task.get()
+
+
+def record_bytes_written(num_bytes: int) -> None:
+    """Atribui bytes gravados em disco à task em execução."""
+    task_name = _current_task.get()
+    if task_name:
+        get_registry().inc("pipeline_task_bytes_written", num_bytes, task=task_name)
+
+
+def record_bytes_uploaded(num_bytes: int) -> None:
+    """Atribui bytes enviados ao GCS à task em execução."""
+    task_name = _current_task.get()
+    if task_name:
+        get_registry().inc("pipeline_task_bytes_uploaded", num_bytes, task=task_name)
+
+
+def instrumented(fn: Callable) -> Callable:
+    """
+    Decorator que mede cada execução de uma task.
+
+    Registra tempo de parede (histograma), execuções por status, retries
+    (via `task_run_count` do contexto Prefect), registros de entrada (1º
+    argumento lista/DataFrame) e de saída (retorno lista/DataFrame). Bytes
+    gravados e enviados são atribuídos pelas próprias tasks via
+    `record_bytes_written` / `record_bytes_uploaded`. Deve ficar abaixo de
+    `@task` para que o Prefect enxergue a assinatura original.
+
+    O registro só vai a disco a cada `flush_every` tasks; o restante é gravado
+    pelo `flush_metrics_on_finish` do flow.
+    """
+    task_name = fn.__name__
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        registry = get_registry()
+        token = _current_task.set(task_name)
+
+        first_arg = args[0] if args else next(iter(kwargs.values()), None)
+        records_in = _count_records(first_arg)
+
+        run_count = prefect.context.get("task_run_count", 1) or 1
+        if run_count > 1:
+            registry.inc("pipeline_task_retries", task=task_name)
+
+        start_time = datetime.now()
+        start = time.perf_counter()
+        status = "failed"
+        records_out = None
+        try:
+            result = fn(*args, **kwargs)
+            status = "success"
+            records_out = _count_records(result)
+            return result
+        finally:
+            duration = time.perf_counter() - start
+            _current_task.reset(token)
+
+            registry.observe("pipeline_task_duration_seconds", duration, task=task_name)
+            registry.inc("pipeline_task_runs", task=task_name, status=status)
+            if records_in is not None:
+                registry.inc("pipeline_task_records_in", records_in, task=task_name)
+            if records_out is not None:
+                registry.inc("pipeline_task_records_out", records_out, task=task_name)
+
+            summary = create_execution_summary(
+                start_time=start_time,
+                end_time=datetime.now(),
+                records_processed=records_out if records_out is not None else (records_in or 0)
+            )
+            logger.debug(
+                f"⏱️  {task_name}: {summary['execution']['duration_formatted']} "
+                f"({summary['data']['records_per_second']:.1f} registros/s, status={status})"
+            )
+
+            try:
+                registry.task_finished()
+            except OSError:
+                pass
+
+    return wrapper
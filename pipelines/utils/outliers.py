@@ -0,0 +1,185 @@
+"""
+Filtro de saltos de GPS por veículo: fixes fisicamente impossíveis em relação ao último fix aceito
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from pipelines.utils.track_metrics import haversine_km
+
+
+# Velocidade implícita acima da qual o deslocamento entre dois fixes é impossível (km/h)
+TELEPORT_MAX_SPEED_KMH = 180.0
+
+# Deslocamentos menores que isso nunca são salto (ruído do GPS com intervalo de 1-2 s)
+TELEPORT_MIN_JUMP_KM = 0.5
+
+# Mudança de rumo que caracteriza ida e volta (salto isolado que retorna ao trajeto)
+TELEPORT_MAX_TURN_DEG = 120.0
+
+# Fixes seguidos fora do trajeto ainda tratados como salto (excursão que volta ao trajeto)
+TELEPORT_MAX_EXCURSION = 3
+
+# Passadas de remoção (um salto removido pode expor outro no mesmo veículo)
+TELEPORT_MAX_PASSES = TELEPORT_MAX_EXCURSION + 1
+
+
+def bearing_deg(
+    lat1: np.ndarray,
+    lon1: np.ndarray,
+    lat2: np.ndarray,
+    lon2: np.ndarray
+) -> np.ndarray:
+    """Rumo inicial (0-360°, a partir do norte) de cada par de pontos, vetorizado."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(x, y)) % 360.0
+
+
+def _impossible(
+    ts_a: np.ndarray, lat_a: np.ndarray, lon_a: np.ndarray,
+    ts_b: np.ndarray, lat_b: np.ndarray, lon_b: np.ndarray,
+    max_speed_kmh: float,
+    min_jump_km: float
+) -> np.ndarray:
+    """Deslocamento a -> b maior que o mínimo e impossível no intervalo (ou sem intervalo)."""
+    distance_km = haversine_km(lat_a, lon_a, lat_b, lon_b)
+    interval_s = (ts_b - ts_a) / 1000.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed_kmh = distance_km / interval_s * 3600.0
+    return (distance_km > min_jump_km) & ((interval_s <= 0) | (speed_kmh > max_speed_kmh))
+
+
+def detect_teleports(
+    vehicle_ids: np.ndarray,
+    timestamps_ms: np.ndarray,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    previous: Optional[pd.DataFrame] = None,
+    max_speed_kmh: float = TELEPORT_MAX_SPEED_KMH,
+    min_jump_km: float = TELEPORT_MIN_JUMP_KM,
+    max_turn_deg: float = TELEPORT_MAX_TURN_DEG,
+    max_excursion: int = TELEPORT_MAX_EXCURSION,
+    max_passes: int = TELEPORT_MAX_PASSES
+) -> np.ndarray:
+    """
+    Marca os fixes que saltam para longe do trajeto do veículo.
+
+    O lote é ordenado por (veículo, dataHora) e cada fix é comparado com o
+    anterior aceito (no lote ou, para o primeiro, o último fix do estado) e
+    com o seguinte. Um fix é salto quando chegar nele é impossível
+    (velocidade implícita acima do limite, ou deslocamento sem intervalo de
+    tempo) e:
+
+    - sair dele também é, com volta de rumo (ida e volta) ou com o
+      anterior e o seguinte compatíveis entre si;
+    - um dos `max_excursion` fixes seguintes é compatível com o anterior
+      (excursão de vários fixes que volta ao trajeto); ou
+    - ele é o último do veículo no lote (não há como confirmar o salto).
+
+    Fixes seguintes coerentes entre si confirmam um deslocamento real (o
+    anterior é que estava errado), então não são marcados. A comparação é
+    refeita sobre os aceitos por até `max_passes` passadas, todas vetorizadas.
+
+    Args:
+        vehicle_ids: Código do veículo de cada fix
+        timestamps_ms: dataHora de cada fix em milissegundos Unix
+        latitudes: Latitude de cada fix
+        longitudes: Longitude de cada fix
+        previous: Último fix aceito por veículo (colunas codigo, dataHora, latitude, longitude)
+        max_speed_kmh: Velocidade implícita máxima
+        min_jump_km: Deslocamento mínimo para considerar salto
+        max_turn_deg: Mudança de rumo que caracteriza ida e volta
+        max_excursion: Fixes seguidos fora do trajeto ainda tratados como salto
+        max_passes: Passadas de remoção
+
+    Returns:
+        Máscara booleana (ordem original do lote) dos fixes marcados como salto
+    """
+    ids = np.asarray(vehicle_ids).astype(str)
+    ts = np.asarray(timestamps_ms, dtype=np.float64)
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    n = len(ids)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+
+    order = np.lexsort((ts, ids))
+    ids_s, ts_s, lat_s, lon_s = ids[order], ts[order], lat[order], lon[order]
+
+    # Último fix aceito de cada veículo (estado), alinhado a cada posição do lote ordenado
+    anchor_ts = np.full(n, np.nan)
+    anchor_lat = np.full(n, np.nan)
+    anchor_lon = np.full(n, np.nan)
+    if previous is not None and len(previous) > 0:
+        state = (
+            previous.assign(codigo=previous["codigo"].astype(str))
+            .drop_duplicates("codigo", keep="last")
+            .set_index("codigo")
+        )
+        pos = state.index.get_indexer(ids_s)
+        found = pos >= 0
+        anchor_ts[found] = state["dataHora"].to_numpy(dtype=np.float64)[pos[found]]
+        anchor_lat[found] = state["latitude"].to_numpy(dtype=np.float64)[pos[found]]
+        anchor_lon[found] = state["longitude"].to_numpy(dtype=np.float64)[pos[found]]
+
+    rejected_s = np.zeros(n, dtype=bool)
+    for _ in range(max(int(max_passes), 1)):
+        keep = np.flatnonzero(~rejected_s)
+        k_ids, k_ts, k_lat, k_lon = ids_s[keep], ts_s[keep], lat_s[keep], lon_s[keep]
+        m = len(keep)
+
+        first = np.ones(m, dtype=bool)
+        first[1:] = k_ids[1:] != k_ids[:-1]
+        last = np.ones(m, dtype=bool)
+        last[:-1] = k_ids[:-1] != k_ids[1:]
+
+        # Anterior aceito: deslocamento no grupo, estado no primeiro fix do veículo
+        prev_ts, prev_lat, prev_lon = (np.empty(m) for _ in range(3))
+        prev_ts[1:], prev_lat[1:], prev_lon[1:] = k_ts[:-1], k_lat[:-1], k_lon[:-1]
+        prev_ts[first] = anchor_ts[keep][first]
+        prev_lat[first] = anchor_lat[keep][first]
+        prev_lon[first] = anchor_lon[keep][first]
+
+        next_ts, next_lat, next_lon = (np.full(m, np.nan) for _ in range(3))
+        next_ts[:-1], next_lat[:-1], next_lon[:-1] = k_ts[1:], k_lat[1:], k_lon[1:]
+        next_ts[last] = np.nan
+        next_lat[last] = np.nan
+        next_lon[last] = np.nan
+
+        limits = (max_speed_kmh, min_jump_km)
+        arrives = _impossible(prev_ts, prev_lat, prev_lon, k_ts, k_lat, k_lon, *limits)
+        leaves = _impossible(k_ts, k_lat, k_lon, next_ts, next_lat, next_lon, *limits)
+        skips = _impossible(prev_ts, prev_lat, prev_lon, next_ts, next_lat, next_lon, *limits)
+
+        turn = np.abs(
+            (bearing_deg(k_lat, k_lon, next_lat, next_lon)
+             - bearing_deg(prev_lat, prev_lon, k_lat, k_lon) + 180.0) % 360.0 - 180.0
+        )
+        round_trip = leaves & ((turn >= max_turn_deg) | ~skips)
+
+        # Excursão: o veículo volta ao trajeto alguns fixes depois (o fix atual sai
+        # nesta passada, os seguintes da excursão nas próximas)
+        for step in range(2, max(int(max_excursion), 1) + 1):
+            if step >= m:
+                break
+            ahead = np.zeros(m, dtype=bool)
+            same = k_ids[step:] == k_ids[:-step]
+            ahead[:-step] = same & ~_impossible(
+                prev_ts[:-step], prev_lat[:-step], prev_lon[:-step],
+                k_ts[step:], k_lat[step:], k_lon[step:],
+                *limits
+            )
+            round_trip |= ahead
+
+        teleport = arrives & (last | round_trip)
+        if not teleport.any():
+            break
+        rejected_s[keep[teleport]] = True
+
+    rejected = np.empty(n, dtype=bool)
+    rejected[order] = rejected_s
+    return rejected
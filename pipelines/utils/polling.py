@@ -0,0 +1,192 @@
+"""
+Polling adaptativo da API do BRT guiado pela cadência de atualização do feed
+"""
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional
+import json
+import os
+
+
+# Limites padrão do intervalo entre requisições (segundos)
+DEFAULT_MIN_INTERVAL_S = 15.0
+DEFAULT_MAX_INTERVAL_S = 300.0
+
+# Fração da frota com dataHora novo desejada a cada poll
+DEFAULT_TARGET_ADVANCE = 0.5
+
+# Peso da observação mais recente na média móvel da fração de avanço
+SMOOTHING = 0.5
+
+# Variação máxima do intervalo entre dois polls (fator multiplicativo)
+MAX_STEP_FACTOR = 2.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Interpreta o cabeçalho Retry-After (segundos ou data HTTP).
+
+    Args:
+        value: Valor do cabeçalho
+
+    Returns:
+        Segundos de espera (None se ausente ou inválido)
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class AdaptivePoller:
+    """
+    Ajusta o intervalo de polling à frequência com que o dataHora avança.
+
+    Cada veículo reporta em uma cadência própria; entre dois polls separados
+    por `intervalo`, a fração da frota com dataHora novo é aproximadamente
+    intervalo / período de reporte. O próximo intervalo é escolhido para
+    que essa fração fique perto de `target_advance`: de madrugada, com a
+    frota parada e o feed quase estático, o intervalo cresce até o máximo;
+    no pico, encolhe até o mínimo. Um 429/503 com Retry-After impõe espera
+    mínima e dobra o intervalo, acima dos limites se o servidor exigir.
+
+    Também deduplica a captura: só entram registros cujo dataHora avançou
+    desde o último visto para aquele veículo.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = DEFAULT_MIN_INTERVAL_S,
+        max_interval: float = DEFAULT_MAX_INTERVAL_S,
+        target_advance: float = DEFAULT_TARGET_ADVANCE,
+        initial_interval: Optional[float] = None
+    ):
+        """
+        Args:
+            min_interval: Menor intervalo entre polls (segundos)
+            max_interval: Maior intervalo entre polls (segundos)
+            target_advance: Fração desejada de veículos com dataHora novo por poll
+            initial_interval: Intervalo inicial (padrão: o mínimo)
+        """
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError(f"Limites de polling inválidos: {min_interval}..{max_interval}")
+
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.target_advance = float(target_advance)
+        self.interval = self._clamp(initial_interval or self.min_interval)
+        self.advance_fraction: Optional[float] = None
+        self.last_seen: Dict[str, int] = {}
+
+    def _clamp(self, interval: float) -> float:
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def observe(self, records: List[Dict]) -> List[Dict]:
+        """
+        Registra um snapshot da API e recalcula o intervalo.
+
+        Args:
+            records: Registros do snapshot (com codigo e dataHora em ms)
+
+        Returns:
+            Registros novos (veículo inédito ou dataHora posterior ao último visto)
+        """
+        new_records = []
+        known = 0
+        advanced = 0
+
+        for record in records:
+            vehicle = record.get("codigo")
+            try:
+                timestamp = int(record.get("dataHora"))
+            except (TypeError, ValueError):
+                continue
+            if vehicle is None:
+                continue
+
+            previous = self.last_seen.get(vehicle)
+            if previous is not None:
+                known += 1
+                if timestamp > previous:
+                    advanced += 1
+            if previous is None or timestamp > previous:
+                self.last_seen[vehicle] = timestamp
+                new_records.append(record)
+
+        if known:
+            fraction = advanced / known
+            self.advance_fraction = (
+                fraction if self.advance_fraction is None
+                else SMOOTHING * fraction + (1 - SMOOTHING) * self.advance_fraction
+            )
+            ratio = self.target_advance / max(self.advance_fraction, 1e-3)
+            ratio = min(max(ratio, 1 / MAX_STEP_FACTOR), MAX_STEP_FACTOR)
+            self.interval = self._clamp(self.interval * ratio)
+
+        return new_records
+
+    def rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """
+        Registra uma resposta de rate limiting e devolve a espera necessária.
+
+        Args:
+            retry_after: Segundos pedidos pelo servidor (Retry-After)
+
+        Returns:
+            Segundos a aguardar antes do próximo poll
+        """
+        self.interval = self._clamp(self.interval * MAX_STEP_FACTOR)
+        return max(self.interval, retry_after or 0.0)
+
+    def to_dict(self) -> Dict:
+        return {
+            "interval": self.interval,
+            "advance_fraction": self.advance_fraction,
+            "last_seen": self.last_seen,
+        }
+
+
+def load_poller(path: str, **bounds) -> AdaptivePoller:
+    """
+    Restaura o poller do último run (intervalo, fração e dataHora por veículo).
+
+    Args:
+        path: Arquivo JSON de estado
+        **bounds: Argumentos de AdaptivePoller (limites e alvo)
+
+    Returns:
+        AdaptivePoller (novo se o estado não existir)
+    """
+    poller = AdaptivePoller(**bounds)
+    if not os.path.exists(path):
+        return poller
+
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return poller
+
+    poller.interval = poller._clamp(state.get("interval", poller.interval))
+    poller.advance_fraction = state.get("advance_fraction")
+    poller.last_seen = {k: int(v) for k, v in state.get("last_seen", {}).items()}
+    return poller
+
+
+def save_poller(poller: AdaptivePoller, path: str) -> None:
+    """Grava o estado do poller (escrita atômica)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(poller.to_dict(), f)
+    os.replace(tmp_path, path)
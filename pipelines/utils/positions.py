@@ -0,0 +1,302 @@
+"""
+Última posição conhecida por veículo, em memória, servida por HTTP/JSON local
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlsplit
+import json
+import os
+import threading
+import time
+
+from prefect.utilities.logging import get_logger
+
+
+logger = get_logger()
+
+# Campos do fix publicados por veículo
+POSITION_FIELDS = (
+    "codigo", "placa", "linha", "latitude", "longitude",
+    "dataHora", "velocidade", "sentido", "trajeto",
+)
+
+# Veículos sem fix novo há mais que isso saem do índice (fora de operação)
+DEFAULT_MAX_AGE_SECONDS = 3600
+
+# Porta padrão do endpoint local
+DEFAULT_PORT = 8765
+
+# Interface de escuta (POSITIONS_HOST): só local por padrão; 0.0.0.0 expõe o
+# endpoint fora do container (publicar a porta no docker-compose)
+DEFAULT_HOST = os.getenv("POSITIONS_HOST", "127.0.0.1")
+
+
+class PositionIndex:
+    """
+    Último fix de cada veículo de um feed, com índice secundário por linha.
+
+    Atualizado a cada snapshot pelo processo de captura; as consultas são
+    buscas em dicionário e devolvem o JSON já serializado (o corpo de um
+    veículo é montado na atualização, o de uma linha na primeira consulta
+    após mudar). Cada resposta tem um ETag, para requisições condicionais.
+    """
+
+    def __init__(self, feed: str, max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS):
+        self.feed = feed
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        # codigo -> (dataHora em ms, fix, corpo JSON, ETag, instante da atualização)
+        self._vehicles: Dict[str, Tuple[int, Dict, bytes, str, float]] = {}
+        # linha -> códigos dos veículos cujo último fix é nela
+        self._lines: Dict[str, Set[str]] = {}
+        # linha -> versão (muda a cada alteração de um veículo da linha)
+        self._line_versions: Dict[str, int] = {}
+        # linha -> (versão, corpo JSON, ETag) da última resposta montada
+        self._line_bodies: Dict[str, Tuple[int, bytes, str]] = {}
+        self._version = 0
+        # Distingue os ETags de linha entre reinícios do processo (as versões recomeçam)
+        self._epoch = format(int(time.time()), "x")
+
+    def update(self, records: Iterable[Dict], now: Optional[float] = None) -> int:
+        """
+        Aplica um snapshot: mantém, por veículo, o fix com maior dataHora.
+
+        Args:
+            records: Registros no layout bronze (codigo, linha, dataHora em ms, ...)
+            now: Instante da atualização (padrão: time.time())
+
+        Returns:
+            Quantidade de veículos cuja posição mudou
+        """
+        now = time.time() if now is None else now
+        changed = 0
+
+        with self._lock:
+            for record in records:
+                vehicle = record.get("codigo")
+                try:
+                    timestamp = int(record.get("dataHora"))
+                except (TypeError, ValueError):
+                    continue
+                if vehicle is None:
+                    continue
+                vehicle = str(vehicle)
+
+                current = self._vehicles.get(vehicle)
+                if current is not None and timestamp <= current[0]:
+                    continue
+
+                fix = {field: record.get(field) for field in POSITION_FIELDS}
+                fix["codigo"] = vehicle
+                fix["feed"] = self.feed
+                body = json.dumps(fix, separators=(",", ":"), default=str).encode("utf-8")
+                etag = f'"{self.feed}-{vehicle}-{timestamp}"'
+
+                previous_line = _line_key(current[1]) if current else None
+                self._vehicles[vehicle] = (timestamp, fix, body, etag, now)
+                self._move(vehicle, previous_line, _line_key(fix))
+                changed += 1
+
+            self._evict(now)
+            if changed:
+                self._version += 1
+        return changed
+
+    def _move(self, vehicle: str, previous_line: Optional[str], line: Optional[str]) -> None:
+        """Atualiza o índice por linha (o veículo pode ter trocado de linha)."""
+        if previous_line is not None and previous_line != line:
+            self._lines.get(previous_line, set()).discard(vehicle)
+            self._touch(previous_line)
+        if line is not None:
+            self._lines.setdefault(line, set()).add(vehicle)
+            self._touch(line)
+
+    def _touch(self, line: str) -> None:
+        self._line_versions[line] = self._line_versions.get(line, 0) + 1
+
+    def _evict(self, now: float) -> None:
+        expired = [
+            vehicle for vehicle, entry in self._vehicles.items()
+            if now - entry[4] > self.max_age_seconds
+        ]
+        for vehicle in expired:
+            line = _line_key(self._vehicles.pop(vehicle)[1])
+            if line is not None:
+                self._lines.get(line, set()).discard(vehicle)
+                self._touch(line)
+
+    def vehicle(self, codigo: str) -> Optional[Tuple[bytes, str]]:
+        """Corpo JSON e ETag do último fix do veículo (None se desconhecido)."""
+        entry = self._vehicles.get(codigo)
+        return (entry[2], entry[3]) if entry else None
+
+    def line(self, linha: str) -> Optional[Tuple[bytes, str]]:
+        """Corpo JSON e ETag das posições dos veículos da linha (None se desconhecida)."""
+        # Caminho comum (linha sem mudança desde a última consulta) não disputa o lock
+        cached = self._line_bodies.get(linha)
+        if cached and cached[0] == self._line_versions.get(linha):
+            return cached[1], cached[2]
+
+        with self._lock:
+            version = self._line_versions.get(linha)
+            if version is None:
+                return None
+
+            vehicles = sorted(self._lines.get(linha, ()))
+            fixes = [self._vehicles[v][1] for v in vehicles]
+            body = json.dumps(
+                {"feed": self.feed, "linha": linha, "veiculos": fixes},
+                separators=(",", ":"),
+                default=str
+            ).encode("utf-8")
+            etag = f'"{self.feed}-linha-{linha}-{self._epoch}.{version}"'
+            self._line_bodies[linha] = (version, body, etag)
+            return body, etag
+
+    def stats(self) -> Dict:
+        """Tamanho do índice (para /health)."""
+        return {
+            "feed": self.feed,
+            "vehicles": len(self._vehicles),
+            "lines": sum(1 for vehicles in self._lines.values() if vehicles),
+            "version": self._version,
+        }
+
+
+def _line_key(fix: Dict) -> Optional[str]:
+    """Linha do fix como chave do índice (a API publica número ou texto)."""
+    line = fix.get("linha")
+    return str(line).strip() if line not in (None, "") else None
+
+
+# Índices do processo, por feed (compartilhados entre a captura e o servidor)
+_INDEXES: Dict[str, PositionIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Testa o ETag atual contra um cabeçalho If-None-Match (RFC 9110, comparação fraca).
+
+    O cabeçalho é "*" ou uma lista de ETags separados por vírgula, cada um
+    entre aspas e opcionalmente com o prefixo fraco W/.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def get_position_index(feed: str) -> PositionIndex:
+    """Índice de posições do feed neste processo (criado no primeiro uso)."""
+    with _INDEXES_LOCK:
+        if feed not in _INDEXES:
+            _INDEXES[feed] = PositionIndex(feed)
+        return _INDEXES[feed]
+
+
+class _PositionsHandler(BaseHTTPRequestHandler):
+    """
+    GET /<feed>/veiculos/<codigo>, /<feed>/linhas/<linha> e /health.
+
+    Com If-None-Match contendo o ETag atual (ou "*"), responde 304 sem corpo.
+    """
+
+    def do_GET(self) -> None:
+        parts = [unquote(p) for p in urlsplit(self.path).path.strip("/").split("/") if p]
+
+        if parts == ["health"]:
+            with _INDEXES_LOCK:
+                indexes = list(_INDEXES.values())
+            body = json.dumps({"status": "ok", "feeds": [index.stats() for index in indexes]}).encode("utf-8")
+            return self._send(200, body)
+
+        result = None
+        if len(parts) == 3 and parts[0] in _INDEXES:
+            index = _INDEXES[parts[0]]
+            if parts[1] == "veiculos":
+                result = index.vehicle(parts[2])
+            elif parts[1] == "linhas":
+                result = index.line(parts[2])
+
+        if result is None:
+            return self._send(404, b'{"error":"not found"}')
+
+        body, etag = result
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            return self._send(304, None, etag)
+        return self._send(200, body, etag)
+
+    def _send(self, status: int, body: Optional[bytes], etag: Optional[str] = None) -> None:
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Uma linha de log por consulta custaria mais que a própria consulta
+        pass
+
+
+_SERVER: Optional[ThreadingHTTPServer] = None
+
+
+def start_position_server(
+    host: Optional[str] = None,
+    port: int = DEFAULT_PORT
+) -> Optional[ThreadingHTTPServer]:
+    """
+    Sobe o endpoint de posições em uma thread daemon (uma vez por processo).
+
+    O endpoint é acessório: se a porta estiver ocupada (ex: outro processo
+    de captura já serve posições), o erro é registrado e a captura segue.
+
+    Args:
+        host: Interface de escuta (padrão: POSITIONS_HOST ou só local)
+        port: Porta TCP
+
+    Returns:
+        Servidor em execução (o mesmo em chamadas seguintes), ou None se não subiu
+    """
+    global _SERVER
+    host = host or DEFAULT_HOST
+    with _INDEXES_LOCK:
+        if _SERVER is None:
+            try:
+                _SERVER = ThreadingHTTPServer((host, int(port)), _PositionsHandler)
+            except OSError as e:
+                logger.warning(f"⚠️  Endpoint de posições não iniciado em {host}:{port}: {e}")
+                return None
+            _SERVER.daemon_threads = True
+            threading.Thread(target=_SERVER.serve_forever, name="positions-http", daemon=True).start()
+            logger.info(f"📍 Posições em http://{host}:{_SERVER.server_address[1]}/<feed>/veiculos/<codigo>")
+    return _SERVER
+
+
+def stop_position_server() -> None:
+    """Encerra o endpoint (os índices continuam em memória)."""
+    global _SERVER
+    with _INDEXES_LOCK:
+        if _SERVER is not None:
+            _SERVER.shutdown()
+            _SERVER.server_close()
+            _SERVER = None
+
+
+def update_positions(feed: str, records: List[Dict]) -> int:
+    """Atualiza o índice do feed com um snapshot (atalho usado pela captura)."""
+    return get_position_index(feed).update(records)
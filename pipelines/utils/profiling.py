@@ -0,0 +1,131 @@
+"""
+Hooks opcionais de profiling (CPU e alocações) para tasks do pipeline
+"""
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Optional, Set
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+
+import prefect
+from prefect.utilities.logging import get_logger
+
+
+logger = get_logger()
+
+# Variável de ambiente com as tasks a perfilar (nomes separados por vírgula ou "all")
+PROFILE_ENV_VAR = "PIPELINE_PROFILE_TASKS"
+
+# Parâmetro do flow equivalente (tem precedência sobre a variável de ambiente)
+PROFILE_PARAMETER = "profile_tasks"
+
+# Quantidade de linhas nos resumos de CPU e de alocação
+DEFAULT_TOP_N = 25
+
+
+def _selected_tasks() -> Set[str]:
+    """Tasks selecionadas para profiling (parâmetro do flow ou variável de ambiente)."""
+    selection = (prefect.context.get("parameters") or {}).get(PROFILE_PARAMETER)
+    if selection is None:
+        selection = os.getenv(PROFILE_ENV_VAR, "")
+    if isinstance(selection, (list, tuple, set)):
+        return {str(s).strip() for s in selection if str(s).strip()}
+    return {s.strip() for s in str(selection).split(",") if s.strip()}
+
+
+def _profile_dir() -> str:
+    """Diretório dos artefatos: <output_dir>/profiles do flow run (ou ./data/profiles)."""
+    output_dir = (prefect.context.get("parameters") or {}).get("output_dir") or "./data"
+    return os.getenv("PIPELINE_PROFILE_DIR", os.path.join(output_dir, "profiles"))
+
+
+def write_profile_artifacts(
+    task_name: str,
+    profiler: cProfile.Profile,
+    snapshot: Optional[tracemalloc.Snapshot],
+    peak_bytes: int,
+    top_n: int = DEFAULT_TOP_N
+) -> str:
+    """
+    Grava o profile de CPU (.prof, legível por pstats/snakeviz) e um resumo texto.
+
+    Args:
+        task_name: Nome da task perfilada
+        profiler: Profiler cProfile já parado
+        snapshot: Snapshot do tracemalloc (None se o tracing não foi iniciado aqui)
+        peak_bytes: Pico de memória rastreada durante a task
+        top_n: Linhas em cada resumo
+
+    Returns:
+        Caminho do arquivo .prof gerado
+    """
+    profile_dir = _profile_dir()
+    os.makedirs(profile_dir, exist_ok=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    base_path = os.path.join(profile_dir, f"{task_name}_{timestamp}")
+
+    profiler.dump_stats(f"{base_path}.prof")
+
+    summary = io.StringIO()
+    summary.write(f"Task: {task_name}\n")
+    summary.write(f"Pico de memória rastreada: {peak_bytes / 1024**2:.2f} MB\n\n")
+
+    summary.write(f"=== CPU: top {top_n} por tempo cumulativo ===\n")
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(top_n)
+
+    if snapshot is not None:
+        summary.write(f"\n=== Alocações: top {top_n} por linha ===\n")
+        for stat in snapshot.statistics("lineno")[:top_n]:
+            summary.write(f"{stat}\n")
+
+    with open(f"{base_path}_top.txt", "w") as f:
+        f.write(summary.getvalue())
+
+    return f"{base_path}.prof"
+
+
+def profiled(fn: Callable) -> Callable:
+    """
+    Decorator que perfila a task quando ela está selecionada.
+
+    A seleção é lida a cada execução do parâmetro `profile_tasks` do flow ou
+    da variável PIPELINE_PROFILE_TASKS (nomes de função separados por vírgula,
+    ou "all"). Desligado, o custo é uma leitura de dicionário por execução.
+    Ligado, a task roda sob cProfile e tracemalloc e grava um .prof e um
+    resumo top-N de CPU e alocações em <output_dir>/profiles.
+    """
+    task_name = fn.__name__
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        selected = _selected_tasks()
+        if not selected or (task_name not in selected and "all" not in selected):
+            return fn(*args, **kwargs)
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+
+            try:
+                artifact = write_profile_artifacts(task_name, profiler, snapshot, peak_bytes)
+                logger.info(f"🔬 Profile de {task_name}: {artifact} (pico {peak_bytes / 1024**2:.2f} MB)")
+            except OSError as e:
+                logger.warning(f"⚠️  Não foi possível gravar profile de {task_name}: {e}")
+
+    return wrapper
@@ -0,0 +1,176 @@
+"""
+Regras de qualidade de dados aplicadas em lote (máscaras vetorizadas) antes do upload
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Campos obrigatórios (mesmo filtro de nulos da silver)
+REQUIRED_FIELDS = ["codigo", "placa", "latitude", "longitude", "dataHora"]
+
+# Faixa aceita de velocidade (km/h)
+VELOCITY_MIN_KMH = 0.0
+VELOCITY_MAX_KMH = 150.0
+
+# Limites aproximados do município do Rio de Janeiro (test_valid_rio_coordinates)
+RIO_LAT_MIN, RIO_LAT_MAX = -23.0, -22.7
+RIO_LON_MIN, RIO_LON_MAX = -43.8, -43.1
+
+# Coluna com os motivos de rejeição na quarentena
+REJECTION_COLUMN = "motivo_rejeicao"
+
+# Regra com estado: salto do GPS em relação ao último fix aceito do veículo
+TELEPORT_RULE = "gps_teleport"
+
+# O que fazer com os saltos: "drop" (quarentena), "flag" (mantidos, só contados) ou "off"
+TELEPORT_ACTIONS = ("drop", "flag", "off")
+
+
+def _not_null(column: str) -> Callable[[pd.DataFrame], np.ndarray]:
+    """Regra: coluna presente, não nula e não vazia."""
+    def rule(df: pd.DataFrame) -> np.ndarray:
+        if column not in df.columns:
+            return np.zeros(len(df), dtype=bool)
+        values = df[column]
+        valid = values.notna()
+        if not pd.api.types.is_numeric_dtype(values):
+            valid &= values.astype(str).str.strip() != ""
+        return valid.to_numpy()
+    return rule
+
+
+def _numeric(df: pd.DataFrame, column: str) -> pd.Series:
+    """Coluna convertida para float (NaN se ausente ou inválida)."""
+    if column not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[column], errors="coerce")
+
+
+def _valid_coordinates(df: pd.DataFrame) -> np.ndarray:
+    """Regra: latitude em [-90, 90] e longitude em [-180, 180]."""
+    lat = _numeric(df, "latitude")
+    lon = _numeric(df, "longitude")
+    return (lat.between(-90, 90) & lon.between(-180, 180)).to_numpy()
+
+
+def _valid_velocity(df: pd.DataFrame) -> np.ndarray:
+    """Regra: velocidade em [0, 150] km/h."""
+    return _numeric(df, "velocidade").between(VELOCITY_MIN_KMH, VELOCITY_MAX_KMH).to_numpy()
+
+
+def _within_rio(df: pd.DataFrame) -> np.ndarray:
+    """Regra: coordenada dentro do bounding box do Rio de Janeiro."""
+    lat = _numeric(df, "latitude")
+    lon = _numeric(df, "longitude")
+    return (lat.between(RIO_LAT_MIN, RIO_LAT_MAX) & lon.between(RIO_LON_MIN, RIO_LON_MAX)).to_numpy()
+
+
+# Regras na ordem de avaliação: (nome, função que retorna máscara de válidos)
+QUALITY_RULES: List[Tuple[str, Callable[[pd.DataFrame], np.ndarray]]] = [
+    *[(f"{field}_not_null", _not_null(field)) for field in REQUIRED_FIELDS],
+    ("valid_coordinates", _valid_coordinates),
+    ("valid_velocity", _valid_velocity),
+    ("within_rio_bounds", _within_rio),
+]
+
+
+def evaluate_quality(df: pd.DataFrame) -> Tuple[np.ndarray, Dict[str, int], pd.Series]:
+    """
+    Avalia todas as regras sobre o lote inteiro.
+
+    Args:
+        df: Lote bruto da API
+
+    Returns:
+        Tupla (máscara de linhas aprovadas, contagem de rejeições por regra,
+        série com os motivos de rejeição separados por ';')
+    """
+    n = len(df)
+    passed = np.ones(n, dtype=bool)
+    counts: Dict[str, int] = {}
+    reasons = np.full(n, "", dtype=object)
+
+    for name, rule in QUALITY_RULES:
+        failed = ~rule(df)
+        counts[name] = int(failed.sum())
+        if counts[name]:
+            reasons[failed] = reasons[failed] + name + ";"
+        passed &= ~failed
+
+    return passed, counts, pd.Series(reasons, index=df.index).str.rstrip(";")
+
+
+def detect_batch_teleports(
+    df: pd.DataFrame,
+    candidates: np.ndarray,
+    track_state_path: Optional[str] = None
+) -> np.ndarray:
+    """
+    Saltos de GPS entre os registros candidatos (os que passaram nas regras sem estado).
+
+    Cada veículo é comparado com o último fix aceito no estado de trajeto
+    (`track_state_path`, o mesmo das métricas de trajeto) e entre os fixes
+    do próprio lote.
+
+    Returns:
+        Máscara do tamanho do lote (False fora dos candidatos)
+    """
+    from pipelines.utils.outliers import detect_teleports
+    from pipelines.utils.track_metrics import load_track_state
+
+    teleports = np.zeros(len(df), dtype=bool)
+    if not candidates.any() or "codigo" not in df.columns:
+        return teleports
+
+    subset = df.loc[candidates]
+    teleports[candidates] = detect_teleports(
+        vehicle_ids=subset["codigo"].to_numpy(),
+        timestamps_ms=_numeric(subset, "dataHora").to_numpy(),
+        latitudes=_numeric(subset, "latitude").to_numpy(),
+        longitudes=_numeric(subset, "longitude").to_numpy(),
+        previous=load_track_state(track_state_path) if track_state_path else None
+    )
+    return teleports
+
+
+def split_by_quality(
+    df: pd.DataFrame,
+    track_state_path: Optional[str] = None,
+    teleport_action: str = "drop"
+) -> Tuple[pd.DataFrame, pd.DataFrame, Dict[str, int]]:
+    """
+    Separa o lote em registros aprovados e rejeitados.
+
+    Depois das regras sem estado, os aprovados passam pelo filtro de saltos
+    de GPS por veículo (regra gps_teleport). Com `teleport_action="flag"` os
+    saltos ficam entre os aprovados e só entram na contagem.
+
+    Args:
+        df: Lote bruto da API
+        track_state_path: Estado de trajeto com o último fix aceito de cada veículo
+        teleport_action: "drop", "flag" ou "off"
+
+    Returns:
+        Tupla (aprovados, rejeitados com coluna motivo_rejeicao, contagem por regra)
+
+    Raises:
+        ValueError: teleport_action desconhecida
+    """
+    if teleport_action not in TELEPORT_ACTIONS:
+        raise ValueError(f"teleport_action inválida: {teleport_action} (use {', '.join(TELEPORT_ACTIONS)})")
+
+    passed, counts, reasons = evaluate_quality(df)
+
+    if teleport_action != "off":
+        teleports = detect_batch_teleports(df, passed, track_state_path)
+        counts[TELEPORT_RULE] = int(teleports.sum())
+        if teleport_action == "drop" and counts[TELEPORT_RULE]:
+            reasons = reasons.mask(teleports, TELEPORT_RULE)
+            passed &= ~teleports
+
+    accepted = df.loc[passed].reset_index(drop=True)
+    rejected = df.loc[~passed].assign(**{REJECTION_COLUMN: reasons[~passed]}).reset_index(drop=True)
+
+    return accepted, rejected, counts
@@ -0,0 +1,233 @@
+"""
+Índice espacial de estações BRT e associação de fixes GPS à estação mais próxima
+"""
+from typing import Dict, Optional, Tuple
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipelines.utils.track_metrics import EARTH_RADIUS_KM
+
+
+# Raio padrão de associação fix → estação (metros)
+DEFAULT_MATCH_RADIUS_M = 150.0
+
+# Colunas adicionadas ao lote durante a ingestão
+STATION_COLUMNS = ["estacao_id", "distancia_estacao_m"]
+
+# Colunas esperadas no arquivo de estações
+STATION_FILE_COLUMNS = ["estacao_id", "latitude", "longitude"]
+
+# Fator de empacotamento da chave de célula (ix, iy) em um único int64
+_CELL_KEY_FACTOR = np.int64(1 << 32)
+
+# Cache de índices já construídos: caminho -> (mtime, raio, índice)
+_INDEX_CACHE: Dict[str, Tuple[float, float, "StationGridIndex"]] = {}
+
+
+class StationGridIndex:
+    """
+    Grade uniforme em memória sobre coordenadas projetadas das estações.
+
+    As coordenadas são projetadas em metros (equirretangular local, centrada
+    nas estações) e indexadas em células do tamanho do raio de busca, de modo
+    que o vizinho mais próximo dentro do raio está sempre na célula do fix ou
+    em uma das 8 vizinhas. As estações ficam ordenadas pela chave da célula;
+    cada consulta é resolvida com `searchsorted` sobre o lote inteiro.
+    """
+
+    def __init__(
+        self,
+        station_ids: np.ndarray,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        radius_m: float = DEFAULT_MATCH_RADIUS_M
+    ):
+        """
+        Args:
+            station_ids: Identificador de cada estação
+            latitudes: Latitude de cada estação (graus)
+            longitudes: Longitude de cada estação (graus)
+            radius_m: Raio máximo de associação em metros
+        """
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lon = np.asarray(longitudes, dtype=np.float64)
+        valid = np.isfinite(lat) & np.isfinite(lon)
+
+        self.radius_m = float(radius_m)
+        self.station_ids = np.asarray(station_ids).astype(str)[valid]
+        self.size = len(self.station_ids)
+
+        # Origem da projeção local
+        self._lat0 = float(np.mean(lat[valid])) if self.size else 0.0
+        self._lon0 = float(np.mean(lon[valid])) if self.size else 0.0
+        self._cos_lat0 = np.cos(np.radians(self._lat0))
+
+        x, y = self._project(lat[valid], lon[valid])
+        keys = self._cell_keys(x, y)
+
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._x = x[order]
+        self._y = y[order]
+        self._ids = self.station_ids[order]
+
+        # Maior ocupação de uma célula (limita as iterações da consulta)
+        if self.size:
+            _, counts = np.unique(self._keys, return_counts=True)
+            self._max_per_cell = int(counts.max())
+        else:
+            self._max_per_cell = 0
+
+    def _project(self, lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Projeta graus em metros relativos à origem do índice."""
+        r_m = EARTH_RADIUS_KM * 1000.0
+        x = r_m * np.radians(lon - self._lon0) * self._cos_lat0
+        y = r_m * np.radians(lat - self._lat0)
+        return x, y
+
+    def _cell_coords(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Coordenadas inteiras da célula de cada ponto."""
+        return (
+            np.floor(x / self.radius_m).astype(np.int64),
+            np.floor(y / self.radius_m).astype(np.int64),
+        )
+
+    def _cell_keys(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Chave int64 única por célula."""
+        ix, iy = self._cell_coords(x, y)
+        return ix * _CELL_KEY_FACTOR + iy
+
+    def query(
+        self,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca a estação mais próxima dentro do raio para cada ponto.
+
+        Args:
+            latitudes: Latitudes dos fixes
+            longitudes: Longitudes dos fixes
+
+        Returns:
+            Tupla (estacao_id, distancia_m): `estacao_id` é um array de objetos
+            com None onde não há estação no raio; `distancia_m` é NaN nesses casos
+        """
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lon = np.asarray(longitudes, dtype=np.float64)
+        n = len(lat)
+
+        best_dist = np.full(n, np.inf)
+        best_idx = np.full(n, -1, dtype=np.int64)
+
+        if n == 0 or self.size == 0:
+            return np.full(n, None, dtype=object), np.full(n, np.nan)
+
+        x, y = self._project(lat, lon)
+        finite = np.isfinite(x) & np.isfinite(y)
+        # Sem coordenada: célula qualquer (descartada pela máscara `finite`), evita o cast de NaN
+        ix, iy = self._cell_coords(np.where(finite, x, 0.0), np.where(finite, y, 0.0))
+
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                keys = (ix + dx) * _CELL_KEY_FACTOR + (iy + dy)
+                lo = np.searchsorted(self._keys, keys, side="left")
+                hi = np.searchsorted(self._keys, keys, side="right")
+
+                # Percorre as estações da célula vizinha (no máximo _max_per_cell)
+                for k in range(self._max_per_cell):
+                    candidate = lo + k
+                    has = finite & (candidate < hi)
+                    if not has.any():
+                        break
+
+                    c = np.where(has, candidate, 0)
+                    dist = np.hypot(self._x[c] - x, self._y[c] - y)
+                    better = has & (dist < best_dist)
+                    best_dist[better] = dist[better]
+                    best_idx[better] = c[better]
+
+        matched = (best_idx >= 0) & (best_dist <= self.radius_m)
+
+        estacao_id = np.full(n, None, dtype=object)
+        estacao_id[matched] = self._ids[best_idx[matched]]
+        distancia_m = np.where(matched, best_dist, np.nan)
+
+        return estacao_id, distancia_m
+
+
+def load_station_index(
+    stations_path: str,
+    radius_m: float = DEFAULT_MATCH_RADIUS_M
+) -> Optional[StationGridIndex]:
+    """
+    Carrega o arquivo de estações e constrói (ou reaproveita) o índice.
+
+    O arquivo é um CSV com ao menos as colunas estacao_id, latitude e
+    longitude. O índice fica em cache por caminho e só é reconstruído quando
+    o arquivo é modificado ou o raio muda.
+
+    Args:
+        stations_path: Caminho do CSV de estações
+        radius_m: Raio máximo de associação em metros
+
+    Returns:
+        StationGridIndex ou None se o arquivo não existir
+    """
+    if not stations_path or not os.path.exists(stations_path):
+        return None
+
+    mtime = os.path.getmtime(stations_path)
+    cached = _INDEX_CACHE.get(stations_path)
+    if cached and cached[0] == mtime and cached[1] == radius_m:
+        return cached[2]
+
+    stations = pd.read_csv(stations_path, dtype={"estacao_id": str})
+    missing = set(STATION_FILE_COLUMNS) - set(stations.columns)
+    if missing:
+        raise ValueError(f"Arquivo de estações sem colunas obrigatórias: {sorted(missing)}")
+
+    index = StationGridIndex(
+        station_ids=stations["estacao_id"].to_numpy(),
+        latitudes=stations["latitude"].to_numpy(),
+        longitudes=stations["longitude"].to_numpy(),
+        radius_m=radius_m
+    )
+    _INDEX_CACHE[stations_path] = (mtime, radius_m, index)
+
+    return index
+
+
+def add_station_columns(
+    df: pd.DataFrame,
+    index: Optional[StationGridIndex]
+) -> pd.DataFrame:
+    """
+    Adiciona estacao_id e distancia_estacao_m a um lote de fixes.
+
+    Sem índice (arquivo de estações ausente) as colunas são criadas vazias,
+    mantendo o layout do CSV estável.
+
+    Args:
+        df: DataFrame com colunas latitude e longitude
+        index: Índice de estações (ou None)
+
+    Returns:
+        O mesmo DataFrame com as colunas de STATION_COLUMNS ao final
+    """
+    if index is None or df.empty or not {"latitude", "longitude"}.issubset(df.columns):
+        df["estacao_id"] = None
+        df["distancia_estacao_m"] = np.nan
+        return df
+
+    estacao_id, distancia_m = index.query(
+        pd.to_numeric(df["latitude"], errors="coerce").to_numpy(),
+        pd.to_numeric(df["longitude"], errors="coerce").to_numpy()
+    )
+
+    df["estacao_id"] = estacao_id
+    df["distancia_estacao_m"] = np.round(distancia_m, 1)
+
+    return df
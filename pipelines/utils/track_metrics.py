@@ -0,0 +1,261 @@
+"""
+Métricas de trajeto por veículo (distância, intervalo e velocidade derivados do GPS)
+"""
+from typing import Dict, Optional
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Raio médio da Terra (IUGG) em km
+EARTH_RADIUS_KM = 6371.0088
+
+# Acima deste intervalo entre fixes o segmento é descartado (linha reta não representa o trajeto)
+MAX_SEGMENT_GAP_SECONDS = 15 * 60
+
+# Colunas adicionadas ao lote durante a ingestão (nesta ordem, ao final do CSV)
+TRACK_METRIC_COLUMNS = [
+    "distancia_segmento_km",
+    "intervalo_segmento_s",
+    "velocidade_calculada_kmh",
+    "distancia_acumulada_km",
+]
+
+# Colunas do estado persistido (último fix de cada veículo)
+TRACK_STATE_COLUMNS = ["codigo", "dataHora", "latitude", "longitude", "distancia_acumulada_km"]
+
+
+def haversine_km(
+    lat1: np.ndarray,
+    lon1: np.ndarray,
+    lat2: np.ndarray,
+    lon2: np.ndarray
+) -> np.ndarray:
+    """
+    Distância de grande círculo (haversine) entre pares de pontos, vetorizada.
+
+    Args:
+        lat1: Latitudes de origem (graus)
+        lon1: Longitudes de origem (graus)
+        lat2: Latitudes de destino (graus)
+        lon2: Longitudes de destino (graus)
+
+    Returns:
+        Array com as distâncias em km (NaN onde alguma coordenada é NaN)
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def compute_track_metrics(
+    vehicle_ids: np.ndarray,
+    timestamps_ms: np.ndarray,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    previous: Optional[pd.DataFrame] = None,
+    max_gap_seconds: float = MAX_SEGMENT_GAP_SECONDS
+) -> Dict[str, np.ndarray]:
+    """
+    Calcula distância, intervalo e velocidade entre fixes consecutivos de cada veículo.
+
+    O lote é ordenado por (veículo, dataHora) uma única vez e todas as
+    métricas são obtidas por deslocamento de arrays, sem loops em Python.
+    O primeiro fix de cada veículo no lote é ligado ao último fix conhecido
+    em `previous` (estado da captura anterior), quando existir.
+
+    Args:
+        vehicle_ids: Código do veículo de cada fix
+        timestamps_ms: dataHora de cada fix em milissegundos Unix
+        latitudes: Latitude de cada fix
+        longitudes: Longitude de cada fix
+        previous: Último fix por veículo (colunas de TRACK_STATE_COLUMNS, opcional)
+        max_gap_seconds: Intervalo máximo para considerar dois fixes consecutivos
+
+    Returns:
+        Dicionário {coluna: array} na ordem original do lote, com as colunas
+        de TRACK_METRIC_COLUMNS
+    """
+    ids = np.asarray(vehicle_ids).astype(str)
+    ts = np.asarray(timestamps_ms, dtype=np.float64)
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    n = len(ids)
+
+    if n == 0:
+        return {col: np.empty(0, dtype=np.float64) for col in TRACK_METRIC_COLUMNS}
+
+    # Ordenar por veículo e tempo
+    order = np.lexsort((ts, ids))
+    ids_s, ts_s, lat_s, lon_s = ids[order], ts[order], lat[order], lon[order]
+
+    # Início de cada grupo (veículo) no lote ordenado
+    group_start = np.ones(n, dtype=bool)
+    group_start[1:] = ids_s[1:] != ids_s[:-1]
+
+    # Fix anterior: deslocamento dentro do grupo
+    prev_ts = np.empty(n)
+    prev_lat = np.empty(n)
+    prev_lon = np.empty(n)
+    prev_ts[1:], prev_lat[1:], prev_lon[1:] = ts_s[:-1], lat_s[:-1], lon_s[:-1]
+    prev_ts[group_start] = np.nan
+    prev_lat[group_start] = np.nan
+    prev_lon[group_start] = np.nan
+
+    # Acumulado anterior de cada veículo (vindo do estado)
+    base_acumulado = np.zeros(n)
+
+    # Primeiro fix de cada grupo: buscar último fix conhecido no estado
+    if previous is not None and len(previous) > 0:
+        state = (
+            previous.assign(codigo=previous["codigo"].astype(str))
+            .drop_duplicates("codigo", keep="last")
+            .set_index("codigo")
+        )
+        starts = np.flatnonzero(group_start)
+        pos = state.index.get_indexer(ids_s[starts])
+        found = pos >= 0
+        rows = starts[found]
+        pos = pos[found]
+
+        prev_ts[rows] = state["dataHora"].to_numpy(dtype=np.float64)[pos]
+        prev_lat[rows] = state["latitude"].to_numpy(dtype=np.float64)[pos]
+        prev_lon[rows] = state["longitude"].to_numpy(dtype=np.float64)[pos]
+        base_acumulado[rows] = np.nan_to_num(state["distancia_acumulada_km"].to_numpy(dtype=np.float64)[pos])
+
+    # Métricas do segmento
+    intervalo_s = (ts_s - prev_ts) / 1000.0
+    distancia_km = haversine_km(prev_lat, prev_lon, lat_s, lon_s)
+
+    # Segmentos inválidos: sem anterior, fora de ordem ou com lacuna grande demais
+    invalid = ~(intervalo_s >= 0) | (intervalo_s > max_gap_seconds)
+    intervalo_s[invalid] = np.nan
+    distancia_km[invalid] = np.nan
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        velocidade_kmh = np.where(intervalo_s > 0, distancia_km / intervalo_s * 3600.0, np.nan)
+
+    # Distância acumulada por veículo: soma sequencial dentro do grupo a partir
+    # do acumulado do estado, na mesma ordem de um lote único (o resultado não
+    # depende de onde o lote foi dividido)
+    segmento = np.nan_to_num(distancia_km)
+    segmento[group_start] += base_acumulado[group_start]
+    group_id = np.cumsum(group_start) - 1
+    acumulado_km = pd.Series(segmento).groupby(group_id).cumsum().to_numpy()
+
+    # Restaurar ordem original do lote
+    inverse = np.empty(n, dtype=np.intp)
+    inverse[order] = np.arange(n)
+
+    return {
+        "distancia_segmento_km": distancia_km[inverse],
+        "intervalo_segmento_s": intervalo_s[inverse],
+        "velocidade_calculada_kmh": velocidade_kmh[inverse],
+        "distancia_acumulada_km": acumulado_km[inverse],
+    }
+
+
+def load_track_state(state_path: str) -> Optional[pd.DataFrame]:
+    """
+    Carrega o último fix conhecido de cada veículo.
+
+    Args:
+        state_path: Caminho do arquivo de estado (CSV)
+
+    Returns:
+        DataFrame com colunas de TRACK_STATE_COLUMNS ou None se não existir
+    """
+    if not os.path.exists(state_path):
+        return None
+
+    return pd.read_csv(state_path, dtype={"codigo": str}, float_precision="round_trip")
+
+
+def save_track_state(
+    df: pd.DataFrame,
+    state_path: str,
+    previous: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    """
+    Atualiza o estado com o fix mais recente de cada veículo presente no lote.
+
+    Args:
+        df: Lote já enriquecido (colunas da API + TRACK_METRIC_COLUMNS)
+        state_path: Caminho do arquivo de estado (CSV)
+        previous: Estado anterior (veículos ausentes no lote são preservados)
+
+    Returns:
+        DataFrame com o novo estado
+    """
+    latest = df[TRACK_STATE_COLUMNS].dropna(subset=["dataHora"])
+
+    if previous is not None and len(previous) > 0:
+        latest = pd.concat([previous[TRACK_STATE_COLUMNS], latest], ignore_index=True)
+
+    latest = latest.assign(codigo=latest["codigo"].astype(str))
+    latest = latest.sort_values(["codigo", "dataHora"], kind="stable").drop_duplicates("codigo", keep="last")
+
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    tmp_path = f"{state_path}.tmp"
+    latest.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, state_path)
+
+    return latest
+
+
+def add_track_metrics(
+    df: pd.DataFrame,
+    state_path: Optional[str] = None,
+    max_gap_seconds: float = MAX_SEGMENT_GAP_SECONDS
+) -> pd.DataFrame:
+    """
+    Adiciona as colunas de TRACK_METRIC_COLUMNS a um lote bruto da API.
+
+    Espera `dataHora` ainda em milissegundos Unix (antes da conversão para
+    string feita em `generate_csv`). Se `state_path` for informado, o último
+    fix de cada veículo é lido antes e gravado depois do cálculo, ligando
+    capturas sucessivas.
+
+    Args:
+        df: DataFrame com colunas codigo, dataHora, latitude e longitude
+        state_path: Caminho do estado entre capturas (opcional)
+        max_gap_seconds: Intervalo máximo entre fixes consecutivos
+
+    Returns:
+        O mesmo DataFrame com as colunas de métricas adicionadas ao final
+    """
+    required = {"codigo", "dataHora", "latitude", "longitude"}
+    if df.empty or not required.issubset(df.columns):
+        for col in TRACK_METRIC_COLUMNS:
+            df[col] = np.nan
+        return df
+
+    df["dataHora"] = pd.to_numeric(df["dataHora"], errors="coerce")
+    df["latitude"] = pd.to_numeric(df["latitude"], errors="coerce")
+    df["longitude"] = pd.to_numeric(df["longitude"], errors="coerce")
+
+    previous = load_track_state(state_path) if state_path else None
+
+    metrics = compute_track_metrics(
+        vehicle_ids=df["codigo"].to_numpy(),
+        timestamps_ms=df["dataHora"].to_numpy(),
+        latitudes=df["latitude"].to_numpy(),
+        longitudes=df["longitude"].to_numpy(),
+        previous=previous,
+        max_gap_seconds=max_gap_seconds
+    )
+
+    for col in TRACK_METRIC_COLUMNS:
+        df[col] = np.round(metrics[col], 6)
+
+    if state_path:
+        # Acumulado sem arredondamento no estado, para o próximo lote continuar a mesma soma
+        state = df[TRACK_STATE_COLUMNS].assign(distancia_acumulada_km=metrics["distancia_acumulada_km"])
+        save_track_state(state, state_path, previous)
+
+    return df
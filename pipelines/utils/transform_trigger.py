@@ -0,0 +1,188 @@
+"""
+Disparo do transform (dbt + gold) pela chegada de dados na bronze, não pelo relógio
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+import fcntl
+import json
+import os
+import time
+
+from prefect.utilities.logging import get_logger
+
+
+logger = get_logger()
+
+# Estado do último transform concluído, em <output_dir>/state
+TRANSFORM_STATE_FILENAME = "transform_state.json"
+
+# Lock do transform em <output_dir>/state (flock: liberado pelo SO se o processo morrer)
+TRANSFORM_LOCK_FILENAME = "transform.lock"
+
+# Intervalo mínimo entre dois transforms: as capturas que chegam nele entram no próximo
+DEFAULT_MIN_INTERVAL_SECONDS = 300
+
+# Idade máxima do gold: passado esse tempo o transform roda mesmo sem arquivo novo (0 = desligado)
+DEFAULT_MAX_STALENESS_SECONDS = 3600
+
+
+def transform_state_path(output_dir: str = "./data") -> str:
+    """Caminho do estado do transform: <output_dir>/state/transform_state.json."""
+    return os.path.join(output_dir, "state", TRANSFORM_STATE_FILENAME)
+
+
+def read_transform_state(path: str) -> Dict:
+    """Estado do último transform concluído (vazio se nunca rodou)."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_transform_state(path: str, state: Dict) -> None:
+    """Grava o estado atomicamente (um run interrompido não deixa arquivo pela metade)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+# Locks do transform mantidos por este processo: caminho -> descritor
+_LOCKS: Dict[str, int] = {}
+
+
+def acquire_transform_lock(output_dir: str = "./data") -> bool:
+    """
+    Tenta o lock exclusivo do transform, sem esperar (um transform por vez).
+
+    O schedule dispara a cada minuto e o estado só é gravado no fim do
+    transform: sem o lock, runs sobrepostos rodariam o dbt cada um. O lock
+    fica com o processo até `release_transform_lock` (as tasks do flow run
+    rodam no mesmo processo) e é liberado pelo SO se ele morrer.
+
+    Returns:
+        True se o lock foi obtido (ou já era deste processo)
+    """
+    path = os.path.join(output_dir, "state", TRANSFORM_LOCK_FILENAME)
+    if path in _LOCKS:
+        return True
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+
+    os.ftruncate(fd, 0)
+    os.write(fd, f"{os.getpid()} {datetime.now().isoformat()}\n".encode())
+    _LOCKS[path] = fd
+    return True
+
+
+def release_transform_lock(output_dir: str = "./data") -> bool:
+    """
+    Libera o lock do transform, se este processo o tiver.
+
+    Returns:
+        True se havia lock a liberar
+    """
+    fd = _LOCKS.pop(os.path.join(output_dir, "state", TRANSFORM_LOCK_FILENAME), None)
+    if fd is None:
+        return False
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+    return True
+
+
+def scan_bronze_watermark(
+    bucket_name: str,
+    prefixes: Iterable[str],
+    since: float = 0.0
+) -> Dict:
+    """
+    Marca d'água da bronze: última atualização entre os CSVs dos prefixos.
+
+    Args:
+        bucket_name: Bucket GCS
+        prefixes: Prefixos bronze observados (ex: ["bronze/brt_gps"])
+        since: Marca d'água do último transform (epoch em segundos)
+
+    Returns:
+        Dict com watermark (epoch, nunca menor que `since`), files,
+        pending_files (CSVs posteriores a `since`) e oldest_pending (epoch ou None)
+    """
+    from pipelines.utils.gcp import get_gcs_client
+
+    bucket = get_gcs_client().bucket(bucket_name)
+    watermark = float(since or 0.0)
+    files = 0
+    pending_files = 0
+    oldest_pending: Optional[float] = None
+
+    for prefix in prefixes:
+        for blob in bucket.list_blobs(prefix=prefix.rstrip("/") + "/"):
+            if not blob.name.endswith(".csv") or blob.updated is None:
+                continue
+            files += 1
+            updated = blob.updated.timestamp()
+            watermark = max(watermark, updated)
+            if updated > (since or 0.0):
+                pending_files += 1
+                oldest_pending = updated if oldest_pending is None else min(oldest_pending, updated)
+
+    return {
+        "watermark": watermark,
+        "files": files,
+        "pending_files": pending_files,
+        "oldest_pending": oldest_pending,
+    }
+
+
+def decide_transform(
+    state: Dict,
+    scan: Optional[Dict],
+    now: Optional[float] = None,
+    min_interval_seconds: float = DEFAULT_MIN_INTERVAL_SECONDS,
+    max_staleness_seconds: float = DEFAULT_MAX_STALENESS_SECONDS
+) -> Tuple[bool, str]:
+    """
+    Decide se o transform roda agora.
+
+    Com arquivos novos na bronze, roda assim que o intervalo mínimo desde o
+    último transform tiver passado; todas as capturas acumuladas entram no
+    mesmo dbt + gold. Sem arquivo novo (ou com a marca d'água indisponível,
+    `scan=None`), só roda quando o gold passa da idade máxima.
+
+    Args:
+        state: Estado do último transform (read_transform_state)
+        scan: Resultado de scan_bronze_watermark (None = não foi possível ler)
+        now: Instante atual (padrão: time.time())
+        min_interval_seconds: Intervalo mínimo entre transforms
+        max_staleness_seconds: Idade máxima do gold (0 = desligado)
+
+    Returns:
+        Tupla (rodar, motivo)
+    """
+    now = time.time() if now is None else now
+    last_run = state.get("transformed_at")
+    pending = (scan or {}).get("pending_files", 0)
+
+    if last_run is None:
+        if pending:
+            return True, f"primeiro transform ({pending} arquivo(s) na bronze)"
+        return scan is None, "primeiro transform sem marca d'água" if scan is None else "bronze vazia"
+
+    elapsed = now - float(last_run)
+    if pending:
+        if elapsed >= float(min_interval_seconds):
+            return True, f"{pending} arquivo(s) novo(s) na bronze"
+        return False, f"{pending} arquivo(s) aguardando o intervalo mínimo ({elapsed:.0f}s de {float(min_interval_seconds):.0f}s)"
+
+    if max_staleness_seconds and elapsed >= float(max_staleness_seconds):
+        return True, f"gold com {elapsed:.0f}s, acima da idade máxima de {float(max_staleness_seconds):.0f}s"
+
+    return False, "sem dados novos na bronze"
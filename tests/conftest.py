@@ -0,0 +1,13 @@
+"""
+Fixtures compartilhadas dos testes
+"""
+import pytest
+
+from pipelines.utils import metrics
+
+
+@pytest.fixture(autouse=True)
+def isolated_metrics(tmp_path, monkeypatch):
+    """Métricas de tasks instrumentadas em um diretório temporário, não em ./data/metrics."""
+    monkeypatch.setenv("PIPELINE_METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setattr(metrics, "_registry", None)
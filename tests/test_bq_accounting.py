@@ -0,0 +1,128 @@
+"""
+Testes da contabilidade de custo dos jobs BigQuery (pipelines.utils.bq_accounting)
+"""
+import json
+import os
+import time
+
+import prefect
+import pytest
+
+from pipelines.utils import bq_accounting
+from pipelines.utils.bq_accounting import (
+    BudgetExceededError,
+    estimate_queries,
+    record_dbt_run_results,
+    run_query,
+    run_totals,
+)
+from pipelines.utils.metrics import get_registry
+
+
+MB = 1024 ** 2
+
+
+class FakeQueryJob:
+    def __init__(self, job_id, bytes_processed, dry_run):
+        self.job_id = job_id
+        self.total_bytes_processed = bytes_processed
+        self.total_bytes_billed = 0 if dry_run else bytes_processed
+        self.slot_millis = None if dry_run else 1500
+        self.cache_hit = False
+
+    def result(self):
+        return ["linha"]
+
+
+class FakeBigQuery:
+    """Cliente que devolve um volume fixo por query e guarda os job configs recebidos."""
+
+    def __init__(self, bytes_per_query=10 * MB, fail_on=None):
+        self.bytes_per_query = bytes_per_query
+        self.fail_on = fail_on
+        self.configs = []
+
+    def query(self, sql, job_config):
+        if self.fail_on and self.fail_on in sql:
+            raise RuntimeError("Syntax error")
+        self.configs.append(job_config)
+        return FakeQueryJob(f"job_{len(self.configs)}", self.bytes_per_query, job_config.dry_run)
+
+
+@pytest.fixture(autouse=True)
+def isolated_run(monkeypatch):
+    for var in ("BQ_DRY_RUN", "BQ_MAX_BYTES_PER_RUN", "BQ_BUDGET_ACTION"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setattr(bq_accounting, "_RUN_TOTALS", {})
+
+
+def ledger():
+    with open(os.path.join(get_registry().metrics_dir, bq_accounting.LEDGER_FILENAME)) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_query_is_recorded_in_ledger_metrics_and_totals():
+    with prefect.context(flow_run_id="run-1"):
+        rows = run_query(FakeBigQuery(), "SELECT 1", label="gold:teste")
+        totals = run_totals()
+
+    assert rows == ["linha"]
+    assert totals["jobs"] == 1 and totals["bytes_billed"] == 10 * MB and totals["slot_ms"] == 1500
+    assert ledger()[0]["label"] == "gold:teste" and ledger()[0]["run_id"] == "run-1"
+    assert get_registry().get_counter("pipeline_bq_bytes_billed", task="untracked") == 10 * MB
+
+
+def test_dry_run_only_estimates():
+    client = FakeBigQuery()
+    with prefect.context(flow_run_id="run-2", parameters={"bq_dry_run": "true"}):
+        assert run_query(client, "SELECT 1", label="gold:teste") is None
+        assert run_totals()["jobs"] == 0
+        assert run_totals(include_dry_run=True)["bytes_processed"] == 10 * MB
+
+    assert client.configs[0].dry_run and not client.configs[0].use_query_cache
+    assert get_registry().get_counter("pipeline_bq_jobs", task="untracked") == 0
+
+
+def test_budget_warns_or_aborts(monkeypatch):
+    monkeypatch.setenv("BQ_MAX_BYTES_PER_RUN", str(15 * MB))
+    client = FakeBigQuery()
+    with prefect.context(flow_run_id="run-3"):
+        run_query(client, "SELECT 1", label="a")
+        run_query(client, "SELECT 2", label="b")
+
+        monkeypatch.setenv("BQ_BUDGET_ACTION", "abort")
+        with pytest.raises(BudgetExceededError):
+            run_query(client, "SELECT 3", label="c")
+
+    assert len(client.configs) == 2
+
+
+def test_abort_caps_maximum_bytes_billed(monkeypatch):
+    monkeypatch.setenv("BQ_MAX_BYTES_PER_RUN", str(25 * MB))
+    monkeypatch.setenv("BQ_BUDGET_ACTION", "abort")
+    client = FakeBigQuery()
+    with prefect.context(flow_run_id="run-4"):
+        run_query(client, "SELECT 1", label="a")
+        run_query(client, "SELECT 2", label="b")
+
+    assert [config.maximum_bytes_billed for config in client.configs] == [25 * MB, 15 * MB]
+
+
+def test_estimate_queries_tolerates_failures():
+    estimate = estimate_queries(FakeBigQuery(fail_on="quebrada"), {"ok": "SELECT 1", "erro": "SELECT quebrada"})
+    assert estimate == {"total_bytes": 10 * MB, "queries": {"ok": 10 * MB, "erro": None}}
+
+
+def test_dbt_run_results_are_recorded_unless_stale(tmp_path):
+    path = tmp_path / "run_results.json"
+    path.write_text(json.dumps({"results": [
+        {"unique_id": "model.civitas.fct_brt_viagens",
+         "adapter_response": {"bytes_processed": 100, "bytes_billed": 200, "slot_ms": 3, "job_id": "j1"}},
+        {"unique_id": "test.civitas.not_null", "adapter_response": {}},
+    ]}))
+
+    assert record_dbt_run_results(str(path), not_before=time.time() + 60) == []
+    entries = record_dbt_run_results(str(path), not_before=time.time() - 60)
+
+    assert [e["label"] for e in entries] == ["dbt:model.civitas.fct_brt_viagens"]
+    assert entries[0]["bytes_billed"] == 200
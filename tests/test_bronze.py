@@ -0,0 +1,137 @@
+"""
+Testes da gravação dos CSVs bronze (pipelines.utils.bronze)
+"""
+import gzip
+import os
+
+import pandas as pd
+import pytest
+
+from pipelines.utils import gcp
+from pipelines.utils.bronze import BRONZE_COLUMNS, stream_bronze_csv, write_bronze_csv, write_bronze_csv_chunked
+from tests.test_gcp_upload import BUCKET, FakeStorageClient
+
+
+BASE_MS = 1_704_103_200_000
+
+
+def records(n=30, vehicles=3):
+    """Fixes de vários veículos intercalados, como num snapshot da API."""
+    return [
+        {
+            "codigo": f"V{i % vehicles}",
+            "placa": f"ABC{i % vehicles:04d}",
+            "linha": "10",
+            "latitude": -22.9 + (i // vehicles) * 0.001,
+            "longitude": -43.4 - (i % vehicles) * 0.01,
+            "dataHora": BASE_MS + (i // vehicles) * 20_000,
+            "velocidade": float(i % 60),
+            "ignicao": "L",
+            "timestamp_captura": "2024-01-01T10:10:00",
+        }
+        for i in range(n)
+    ]
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def reference_csv(tmp_path, data):
+    """Bytes de `write_bronze_csv` para o lote, com estado de trajeto próprio."""
+    return read(write_bronze_csv(data, output_dir=str(tmp_path / "reference"), filename="lote.csv"))
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    client = FakeStorageClient()
+    monkeypatch.setattr(gcp, "get_gcs_client", lambda: client)
+    monkeypatch.setenv("PIPELINE_UPLOAD_INDEX", str(tmp_path / "upload_index.json"))
+    return client
+
+
+def test_write_bronze_csv_follows_the_layout(tmp_path):
+    header = reference_csv(tmp_path, records()).decode().splitlines()[0]
+    assert header.split(",") == [name for name, _ in BRONZE_COLUMNS]
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_stream_matches_local_file(tmp_path, storage, compress):
+    expected = reference_csv(tmp_path, records())
+
+    uri = stream_bronze_csv(
+        records(), BUCKET, output_dir=str(tmp_path / "stream"), compress=compress, chunk_rows=7
+    )
+
+    name = uri.replace(f"gs://{BUCKET}/", "")
+    data = storage.bucket(BUCKET).objects[name][0]
+    assert name.endswith(".csv.gz" if compress else ".csv")
+    assert (gzip.decompress(data) if compress else data) == expected
+
+
+def test_failed_stream_falls_back_to_local_file(tmp_path, storage, monkeypatch):
+    def failing_stream(*args, **kwargs):
+        raise ConnectionError("upload interrompido")
+
+    monkeypatch.setattr(gcp, "stream_to_gcs", failing_stream)
+
+    path = stream_bronze_csv(records(), BUCKET, output_dir=str(tmp_path / "stream"), compress=True)
+
+    assert path.endswith(".csv") and os.path.exists(path)
+    assert read(path) == reference_csv(tmp_path, records())
+
+
+def test_streamed_object_is_indexed_for_upload_skipping(tmp_path, storage):
+    uri, size = gcp.stream_to_gcs(BUCKET, "bronze/brt_gps/brt_gps_1.csv", iter([b"codigo\n", b"V1\n"]))
+    local = tmp_path / "retry.csv"
+    local.write_bytes(b"codigo\nV1\n")
+
+    assert size == len(b"codigo\nV1\n")
+    assert gcp.upload_if_changed(BUCKET, str(local), "bronze/brt_gps/brt_gps_9.csv") == (uri, False)
+
+
+def test_empty_batch_streams_nothing(tmp_path, storage):
+    assert stream_bronze_csv([], BUCKET, output_dir=str(tmp_path)) is None
+    assert storage.bucket(BUCKET).objects == {}
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 30, 1000])
+def test_chunked_writer_matches_single_write(tmp_path, chunk_rows):
+    expected = reference_csv(tmp_path, records())
+
+    path = write_bronze_csv_chunked(
+        records(), output_dir=str(tmp_path / "chunked"), filename="lote.csv", chunk_rows=chunk_rows
+    )
+
+    assert read(path) == expected
+    assert not os.path.exists(f"{path}.part")
+
+
+def test_chunked_writer_consumes_batches_lazily(tmp_path):
+    data = records()
+    consumed = []
+
+    def batches():
+        for start in range(0, len(data), 4):
+            consumed.append(start)
+            yield pd.DataFrame(data[start:start + 4]) if start % 8 else data[start:start + 4]
+
+    path = write_bronze_csv_chunked(batches(), output_dir=str(tmp_path / "chunked"), filename="lote.csv", chunk_rows=5)
+
+    assert read(path) == reference_csv(tmp_path, data)
+    assert consumed == list(range(0, len(data), 4))
+
+
+def test_chunked_writer_leaves_no_file_on_failure(tmp_path):
+    def batches():
+        yield records(6)
+        raise RuntimeError("captura interrompida")
+
+    output_dir = tmp_path / "chunked"
+    with pytest.raises(RuntimeError):
+        write_bronze_csv_chunked(batches(), output_dir=str(output_dir), filename="lote.csv", chunk_rows=2)
+
+    assert not any(name.startswith("lote.csv") for name in os.listdir(output_dir))
+    assert write_bronze_csv_chunked([], output_dir=str(output_dir), filename="vazio.csv") is None
+    assert not os.path.exists(output_dir / "vazio.csv.part")
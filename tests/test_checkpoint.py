@@ -0,0 +1,171 @@
+"""
+Testes do checkpoint de tasks (pipelines.utils.checkpoint)
+"""
+import prefect
+import pytest
+
+from pipelines.utils import checkpoint
+from pipelines.utils.checkpoint import checkpointed, complete_batch, current_batch
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv("PIPELINE_CHECKPOINT_DIR", raising=False)
+    monkeypatch.delenv(checkpoint.BATCH_ENV_VAR, raising=False)
+    monkeypatch.delenv(checkpoint.TTL_ENV_VAR, raising=False)
+    return str(tmp_path)
+
+
+def flow_run(output_dir, flow_run_id, flow_name="BRT: Extract and Load"):
+    return prefect.context(
+        flow_run_id=flow_run_id,
+        flow_name=flow_name,
+        parameters={"output_dir": output_dir}
+    )
+
+
+def counting_task():
+    calls = []
+
+    @checkpointed
+    def double(value):
+        calls.append(value)
+        return value * 2
+
+    return double, calls
+
+
+def test_outside_flow_run_always_executes(output_dir):
+    double, calls = counting_task()
+    assert double(2) == 4
+    assert double(2) == 4
+    assert calls == [2, 2]
+
+
+def test_same_run_reuses_result(output_dir):
+    double, calls = counting_task()
+    with flow_run(output_dir, "run-a"):
+        assert double(3) == 6
+        assert double(3) == 6
+        assert double(4) == 8
+    assert calls == [3, 4]
+
+
+def test_retry_of_failed_run_resumes_batch(output_dir):
+    double, calls = counting_task()
+
+    @checkpointed
+    def explode(value):
+        raise RuntimeError("falha")
+
+    with flow_run(output_dir, "run-a"):
+        batch = current_batch()
+        double(5)
+        with pytest.raises(RuntimeError):
+            explode(1)
+
+    # Retry do mesmo flow run: retoma o lote e não reexecuta o que concluiu
+    with flow_run(output_dir, "run-a"):
+        assert current_batch() == batch
+        assert double(5) == 10
+        assert complete_batch() == batch
+    assert calls == [5]
+
+
+def test_new_run_does_not_adopt_failed_batch(output_dir):
+    double, calls = counting_task()
+    with flow_run(output_dir, "run-a"):
+        failed_batch = current_batch()
+        double(5)
+
+    with flow_run(output_dir, "run-b"):
+        assert current_batch() != failed_batch
+        double(5)
+    assert calls == [5, 5]
+
+
+def test_concurrent_flows_keep_separate_batches(output_dir):
+    double, calls = counting_task()
+
+    def capture():
+        return flow_run(output_dir, "run-capture", "BRT: Extract and Load")
+
+    def backfill():
+        return flow_run(output_dir, "run-backfill", "BRT: Backfill")
+
+    with capture():
+        capture_batch = current_batch()
+        double(7)
+    with backfill():
+        backfill_batch = current_batch()
+        double(7)
+    with capture():
+        assert current_batch() == capture_batch
+        double(7)
+        assert complete_batch() == capture_batch
+    with backfill():
+        assert current_batch() == backfill_batch
+        assert complete_batch() == backfill_batch
+
+    assert capture_batch != backfill_batch
+    assert calls == [7, 7]
+
+
+def test_concurrent_runs_of_same_flow_keep_separate_batches(output_dir):
+    with flow_run(output_dir, "run-a"):
+        batch_a = current_batch()
+    with flow_run(output_dir, "run-b"):
+        batch_b = current_batch()
+    with flow_run(output_dir, "run-a"):
+        assert current_batch() == batch_a
+        assert complete_batch() == batch_a
+    with flow_run(output_dir, "run-b"):
+        assert current_batch() == batch_b
+    assert batch_a != batch_b
+
+
+def test_forced_batch_is_shared(output_dir):
+    double, calls = counting_task()
+    with prefect.context(flow_run_id="run-a", parameters={"output_dir": output_dir, "checkpoint_batch": "manual"}):
+        assert current_batch() == "manual"
+        double(1)
+    with prefect.context(flow_run_id="run-b", parameters={"output_dir": output_dir, "checkpoint_batch": "manual"}):
+        double(1)
+    assert calls == [1]
+
+
+def test_zero_ttl_disables_cache(output_dir):
+    double, calls = counting_task()
+    with prefect.context(flow_run_id="run-a", parameters={"output_dir": output_dir, "checkpoint_ttl_hours": 0}):
+        double(1)
+        double(1)
+    assert calls == [1, 1]
+
+
+def test_complete_batch_without_open_batch(output_dir):
+    with flow_run(output_dir, "run-a"):
+        assert complete_batch() is None
+
+
+def test_retry_reuses_fetched_snapshot(output_dir, monkeypatch):
+    from pipelines.brt.extract_load import tasks
+
+    snapshots = iter([[{"codigo": "V1", "dataHora": 1000}], [{"codigo": "V1", "dataHora": 2000}]])
+    monkeypatch.setattr(tasks, "_request_brt_gps", lambda api_url: next(snapshots))
+
+    with flow_run(output_dir, "run-a"):
+        first = tasks.fetch_brt_gps_data.run(api_url="https://api", output_dir=output_dir)
+    # Retry do mesmo run: o snapshot é o mesmo, então as chaves seguintes também
+    with flow_run(output_dir, "run-a"):
+        assert tasks.fetch_brt_gps_data.run(api_url="https://api", output_dir=output_dir) == first
+    with flow_run(output_dir, "run-b"):
+        assert tasks.fetch_brt_gps_data.run(api_url="https://api", output_dir=output_dir) != first
+
+
+def test_side_effects_and_checks_are_not_checkpointed():
+    from pipelines.brt.extract_load.tasks import cleanup_all_data, validate_layer
+    from pipelines.utils.checkpoint import without_checkpoint
+
+    for task in (cleanup_all_data, validate_layer):
+        assert not getattr(task.run, "__checkpointed__", False)
+        assert without_checkpoint(task).run is task.run
@@ -0,0 +1,189 @@
+"""
+Testes da compactação do arquivo bronze (pipelines.utils.compaction)
+"""
+from datetime import datetime
+import gzip
+import io
+import json
+
+import pandas as pd
+import pytest
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+from pipelines.utils.compaction import (
+    compact_partition,
+    frame_checksum,
+    live_files,
+    load_manifests,
+    window_key
+)
+
+
+PREFIX = "archive/brt_gps/dt=2024-01-01/"
+NOW = datetime(2024, 1, 1, 12, 0)
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def generation(self):
+        return self.bucket.objects[self.name][1] if self.name in self.bucket.objects else None
+
+    def exists(self):
+        return self.name in self.bucket.objects
+
+    def reload(self):
+        if not self.exists():
+            raise NotFound(self.name)
+
+    def download_as_bytes(self):
+        self.reload()
+        return self.bucket.objects[self.name][0]
+
+    def _check(self, if_generation_match):
+        if if_generation_match is not None and (self.generation or 0) != if_generation_match:
+            raise PreconditionFailed(self.name)
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        self._check(if_generation_match)
+        self.bucket.put(self.name, data.encode() if isinstance(data, str) else data)
+
+    def upload_from_filename(self, path, if_generation_match=None, checksum=None):
+        with open(path, "rb") as f:
+            data = f.read()
+        self.upload_from_string(self.bucket.on_upload(self.name, data), if_generation_match=if_generation_match)
+
+    def delete(self, if_generation_match=None):
+        self.reload()
+        self._check(if_generation_match)
+        del self.bucket.objects[self.name]
+
+
+class FakeBucket:
+    """Bucket em memória com gerações e precondições como no GCS."""
+
+    def __init__(self):
+        self.objects = {}
+        self._generation = 0
+
+    def put(self, name, data):
+        self._generation += 1
+        self.objects[name] = (data, self._generation)
+
+    def on_upload(self, name, data):
+        return data
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix=""):
+        return [FakeBlob(self, name) for name in sorted(self.objects) if name.startswith(prefix)]
+
+
+def capture_csv(vehicle, rows=3):
+    df = pd.DataFrame({
+        "codigo": [vehicle] * rows,
+        "latitude": [f"-22.9{i}" for i in range(rows)],
+        "longitude": ["-43.2"] * rows,
+    })
+    return df.to_csv(index=False).encode()
+
+
+@pytest.fixture
+def bucket():
+    bucket = FakeBucket()
+    for name, vehicle in (("brt_gps_20240101_100000.csv", "A"), ("brt_gps_20240101_103000.csv", "B")):
+        bucket.put(PREFIX + name, capture_csv(vehicle))
+    # Janela ainda aberta (dentro da carência)
+    bucket.put(PREFIX + "brt_gps_20240101_115000.csv", capture_csv("C"))
+    bucket.put(PREFIX + "brt_gps_20240101_115500.csv", capture_csv("D"))
+    return bucket
+
+
+def compact(bucket, tmp_path):
+    return compact_partition(bucket, PREFIX, work_dir=str(tmp_path), output_format="csv.gz", now=NOW)
+
+
+def test_window_key():
+    assert window_key(PREFIX + "brt_gps_20240101_103000.csv") == "20240101_10"
+    assert window_key(PREFIX + "brt_gps_20240101_103000.csv", "day") == "20240101"
+    assert window_key(PREFIX + "_compaction_20240101_10.json") is None
+
+
+def test_checksum_ignores_row_order_and_null_kind():
+    # Mesmo lote lido de CSV (NaN) e de Parquet (None), em outra ordem
+    from_csv = pd.DataFrame({"codigo": ["A", "B"], "velocidade": ["10", float("nan")]})
+    from_parquet = pd.DataFrame({"codigo": ["B", "A"], "velocidade": [None, "10"]}, dtype=object)
+    assert frame_checksum(from_csv) == frame_checksum(from_parquet)
+    assert frame_checksum(from_csv) != frame_checksum(from_csv.assign(velocidade=["11", None]))
+
+
+def test_closed_window_is_compacted_and_verified(bucket, tmp_path):
+    compacted, resumed = compact(bucket, tmp_path)
+
+    assert resumed == 0
+    assert [m["window"] for m in compacted] == ["20240101_10"]
+    manifest = compacted[0]
+    assert manifest["rows"] == 6
+    assert manifest["deleted"] == 2
+
+    stored = json.loads(bucket.objects[PREFIX + "_compaction_20240101_10.json"][0])
+    assert stored["output"] == manifest["output"]
+    assert stored["checksum"] == manifest["checksum"]
+
+    output = pd.read_csv(io.BytesIO(gzip.decompress(bucket.objects[manifest["output"]][0])), dtype=str)
+    assert sorted(output["codigo"]) == ["A"] * 3 + ["B"] * 3
+
+    visible = sorted(blob.name for blob in live_files(bucket.list_blobs(PREFIX)))
+    assert visible == sorted([
+        manifest["output"],
+        PREFIX + "brt_gps_20240101_115000.csv",
+        PREFIX + "brt_gps_20240101_115500.csv",
+    ])
+
+
+def test_failed_verification_keeps_originals(bucket, tmp_path):
+    # Upload corrompido: uma linha some no caminho
+    bucket.on_upload = lambda name, data: gzip.compress(b"\n".join(gzip.decompress(data).split(b"\n")[:-2]) + b"\n")
+
+    with pytest.raises(ValueError):
+        compact(bucket, tmp_path)
+
+    names = set(bucket.objects)
+    assert PREFIX + "brt_gps_20240101_100000.csv" in names
+    assert not any("compact_" in name or "_compaction_" in name for name in names)
+
+
+def test_interrupted_delete_is_resumed(bucket, tmp_path):
+    compacted, _ = compact(bucket, tmp_path)
+    manifest = compacted[0]
+
+    # Simula remoção interrompida: um original continua no bucket
+    original = PREFIX + "brt_gps_20240101_100000.csv"
+    bucket.objects[original] = (capture_csv("A"), manifest["generations"][original])
+    assert original not in {blob.name for blob in live_files(bucket.list_blobs(PREFIX))}
+
+    compacted, resumed = compact(bucket, tmp_path)
+    assert compacted == []
+    assert resumed == 1
+    assert original not in bucket.objects
+
+
+def test_rewritten_original_is_not_deleted(bucket, tmp_path):
+    compact(bucket, tmp_path)
+    original = PREFIX + "brt_gps_20240101_100000.csv"
+    bucket.put(original, capture_csv("Z"))
+
+    _, resumed = compact(bucket, tmp_path)
+    assert resumed == 0
+    assert original in bucket.objects
+
+
+def test_orphan_compacted_file_is_ignored(bucket):
+    orphan = PREFIX + "compact_20240101_10_deadbeef.csv.gz"
+    bucket.put(orphan, gzip.compress(capture_csv("A")))
+    assert load_manifests(bucket.list_blobs(PREFIX)) == {}
+    assert orphan not in {blob.name for blob in live_files(bucket.list_blobs(PREFIX))}
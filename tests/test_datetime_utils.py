@@ -0,0 +1,73 @@
+"""
+Testes da conversão de timestamps em lote (pipelines.utils.datetime_utils)
+"""
+import pandas as pd
+import pytest
+
+from pipelines.utils.datetime_utils import (
+    EPOCH_MS,
+    EPOCH_S,
+    ISO8601,
+    clear_format_cache,
+    detect_timestamp_format,
+    parse_timestamps
+)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_format_cache()
+    yield
+    clear_format_cache()
+
+
+def test_mixed_offsets_are_converted_to_utc():
+    parsed, invalid = parse_timestamps([
+        "2024-01-01T10:00:00-03:00",
+        "2024-01-01T13:00:00+00:00",
+        "2024-01-01T13:00:00Z",
+        "2024-01-01T14:00:00+0100"
+    ])
+    assert len(invalid) == 0
+    assert parsed.dt.tz is None
+    assert (parsed == pd.Timestamp("2024-01-01 13:00:00")).all()
+
+
+def test_values_without_offset_are_kept():
+    parsed, invalid = parse_timestamps(["2024-01-01T10:00:00-03:00", "2024-01-01T10:00:00"])
+    assert len(invalid) == 0
+    assert list(parsed) == [pd.Timestamp("2024-01-01 13:00:00"), pd.Timestamp("2024-01-01 10:00:00")]
+
+
+def test_epoch_milliseconds():
+    assert detect_timestamp_format([1704103200000, 1704103201000]) == EPOCH_MS
+    parsed, invalid = parse_timestamps([1704103200000, "1704103201000"])
+    assert len(invalid) == 0
+    assert list(parsed) == [pd.Timestamp("2024-01-01 10:00:00"), pd.Timestamp("2024-01-01 10:00:01")]
+
+
+def test_epoch_seconds():
+    assert detect_timestamp_format([1704103200, 1704103201]) == EPOCH_S
+    parsed, _ = parse_timestamps([1704103200, 1704103201])
+    assert list(parsed) == [pd.Timestamp("2024-01-01 10:00:00"), pd.Timestamp("2024-01-01 10:00:01")]
+
+
+def test_invalid_values_become_nat_and_are_reported():
+    parsed, invalid = parse_timestamps(["2024-01-01T10:00:00", "ontem", None, "2024-01-01T10:00:05"])
+    assert parsed.isna().tolist() == [False, True, True, False]
+    # Nulos não contam como inválidos; o índice é a posição na entrada
+    assert invalid.to_dict() == {1: "ontem"}
+
+
+def test_all_invalid_values():
+    parsed, invalid = parse_timestamps(["abc", "def"])
+    assert parsed.isna().all()
+    assert len(invalid) == 2
+
+
+def test_cached_format_is_redetected_when_source_changes():
+    parse_timestamps([1704103200000, 1704103201000], source="dataHora")
+    parsed, invalid = parse_timestamps(["2024-01-01T10:00:00-03:00", "2024-01-01T10:00:01-03:00"], source="dataHora")
+    assert len(invalid) == 0
+    assert parsed.iloc[0] == pd.Timestamp("2024-01-01 13:00:00")
+    assert detect_timestamp_format(["2024-01-01T10:00:00-03:00"]) == ISO8601
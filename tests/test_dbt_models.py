@@ -0,0 +1,201 @@
+"""
+Smoke test dos modelos dbt: renderiza o Jinja de cada modelo e confere a estrutura do SQL
+
+Não substitui o `dbt parse` (que roda abaixo quando o dbt e os pacotes estão
+instalados), mas pega erros de sintaxe como uma vírgula faltando entre CTEs
+sem precisar do dbt nem do BigQuery.
+"""
+from pathlib import Path
+import os
+import re
+import shutil
+import subprocess
+
+import jinja2
+import pytest
+
+
+DBT_DIR = Path(__file__).resolve().parents[1] / "dbt"
+MODELS = sorted((DBT_DIR / "models").glob("*/*.sql"))
+
+MACRO_PATTERN = re.compile(r"{%-?\s*macro\s+(\w+)\s*\(.*?{%-?\s*endmacro\s*-?%}", re.DOTALL)
+
+# Cenários de run: completo, incremental regular, backfill e dimensões sem/com estado
+SCENARIOS = {
+    "full": {"incremental": False, "vars": {}, "has_state": False},
+    "incremental": {"incremental": True, "vars": {}, "has_state": True},
+    "legacy_dims": {"incremental": True, "vars": {}, "has_state": False},
+    "backfill": {"incremental": True, "vars": {"backfill_dates": ["2024-01-01", "2024-01-02"]}, "has_state": True},
+}
+
+
+class _Return(Exception):
+    def __init__(self, value):
+        self.value = value
+
+
+class _Column:
+    def __init__(self, name):
+        self.name = name
+
+
+class _Adapter:
+    def __init__(self, has_state):
+        self.has_state = has_state
+
+    def get_columns_in_relation(self, relation):
+        names = ["codigo_linha", "ultima_captura_processada"] if self.has_state else ["codigo_linha"]
+        return [_Column(name) for name in names]
+
+
+class _QueryResult:
+    class _Values:
+        def values(self):
+            return ["2024-01-01 10:00:00+00"]
+
+    columns = [_Values()]
+
+
+class _DbtUtils:
+    @staticmethod
+    def generate_surrogate_key(columns):
+        return "TO_HEX(MD5(CONCAT(" + ", ".join(f"CAST({c} AS STRING)" for c in columns) + ")))"
+
+
+def _raise_return(value):
+    raise _Return(value)
+
+
+def _wrap_macro(macro):
+    def call(*args, **kwargs):
+        try:
+            return macro(*args, **kwargs)
+        except _Return as result:
+            return result.value
+    return call
+
+
+def dbt_environment(incremental, vars, has_state):
+    """Ambiente Jinja com o contexto mínimo do dbt e as macros do projeto."""
+    env = jinja2.Environment(undefined=jinja2.StrictUndefined, extensions=["jinja2.ext.do"])
+    env.globals.update(
+        config=lambda **kwargs: "",
+        source=lambda source, table: f"`civitas-data-eng.civitas_bronze.{table}`",
+        ref=lambda model: f"`civitas-data-eng.civitas_silver.{model}`",
+        var=lambda name, default=None: vars.get(name, default),
+        is_incremental=lambda: incremental,
+        execute=True,
+        this="`civitas-data-eng.brt_gold.this`",
+        adapter=_Adapter(has_state),
+        run_query=lambda sql: _QueryResult(),
+        dbt_utils=_DbtUtils(),
+        none=None,
+        **{"return": _raise_return},
+    )
+    # Uma macro por template: as chamadas entre macros passam pelos globais
+    for path in sorted((DBT_DIR / "macros").glob("*.sql")):
+        for match in MACRO_PATTERN.finditer(path.read_text(encoding="utf-8")):
+            macro = getattr(env.from_string(match.group(0)).module, match.group(1))
+            env.globals[match.group(1)] = _wrap_macro(macro)
+    return env
+
+
+def strip_sql(sql):
+    """Remove comentários e literais de texto (parênteses e vírgulas neles não contam)."""
+    sql = re.sub(r"--[^\n]*", "", sql)
+    sql = re.sub(r"/\*.*?\*/", "", sql, flags=re.DOTALL)
+    return re.sub(r"'(?:[^'\\]|\\.)*'", "''", sql)
+
+
+def check_structure(sql):
+    """
+    Confere parênteses balanceados e a lista de CTEs do WITH.
+
+    Returns:
+        Lista de problemas encontrados (vazia se o SQL está bem formado)
+    """
+    sql = strip_sql(sql)
+    problems = []
+
+    depth = 0
+    for char in sql:
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if depth < 0:
+            return ["')' sem '(' correspondente"]
+    if depth:
+        problems.append(f"{depth} parêntese(s) sem fechar")
+
+    with_match = re.search(r"\bWITH\b", sql, flags=re.IGNORECASE)
+    if not with_match:
+        return problems
+
+    pos = with_match.end()
+    while True:
+        cte = re.compile(r"\s*,?\s*(\w+)\s+AS\s*\(", re.IGNORECASE).match(sql, pos)
+        if not cte:
+            problems.append(f"CTE inválida perto de: {sql[pos:pos + 60].strip()!r}")
+            break
+        depth, pos = 1, cte.end()
+        while depth and pos < len(sql):
+            depth += {"(": 1, ")": -1}.get(sql[pos], 0)
+            pos += 1
+        following = re.compile(r"\s*(,|\w+)", re.IGNORECASE).match(sql, pos)
+        if following is None:
+            problems.append(f"SQL termina depois da CTE {cte.group(1)}")
+            break
+        if following.group(1) == ",":
+            continue
+        if following.group(1).upper() != "SELECT":
+            problems.append(f"falta ',' depois da CTE {cte.group(1)} (seguida de {following.group(1)!r})")
+        break
+    return problems
+
+
+@pytest.mark.parametrize("scenario", sorted(SCENARIOS))
+@pytest.mark.parametrize("model", MODELS, ids=lambda path: path.stem)
+def test_model_renders_valid_sql(model, scenario):
+    env = dbt_environment(**SCENARIOS[scenario])
+    sql = env.from_string(model.read_text(encoding="utf-8")).render()
+
+    assert "SELECT" in sql.upper()
+    assert check_structure(sql) == []
+
+
+def test_structure_check_catches_missing_comma():
+    sql = "WITH a AS (SELECT 1)\n\nb AS (SELECT 2)\n\nSELECT * FROM b"
+    assert check_structure(sql) == ["falta ',' depois da CTE a (seguida de 'b')"]
+    assert check_structure(sql.replace(")\n\nb", "),\n\nb")) == []
+    assert check_structure("WITH a AS (SELECT 1)\n, b AS (SELECT 2)\nSELECT 1") == []
+
+
+@pytest.mark.skipif(
+    shutil.which("dbt") is None or not (DBT_DIR / "dbt_packages").is_dir(),
+    reason="dbt ou pacotes do projeto (dbt deps) não instalados"
+)
+def test_dbt_parse(tmp_path):
+    result = subprocess.run(
+        ["dbt", "parse", "--project-dir", str(DBT_DIR), "--profiles-dir", str(DBT_DIR),
+         "--target-path", str(tmp_path)],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "DBT_SEND_ANONYMOUS_USAGE_STATS": "false"},
+    )
+    assert result.returncode == 0, result.stdout[-2000:]
+
+
+@pytest.mark.parametrize("model", ["dim_brt_linhas", "dim_brt_veiculos"])
+def test_dimensions_read_only_new_captures_when_state_exists(model):
+    source = (DBT_DIR / "models" / "gold" / f"{model}.sql").read_text(encoding="utf-8")
+
+    def render(scenario):
+        return dbt_environment(**SCENARIOS[scenario]).from_string(source).render()
+
+    incremental = render("incremental")
+    assert "data_hora_captura > TIMESTAMP('2024-01-01 10:00:00+00')" in incremental
+    assert "FROM `civitas-data-eng.brt_gold.this`" in incremental
+
+    # Sem estado (primeiro run ou tabela anterior ao incremental) a dimensão é recalculada inteira
+    for scenario in ("full", "legacy_dims"):
+        sql = render(scenario)
+        assert "data_hora_captura >" not in sql
+        assert "brt_gold.this" not in sql
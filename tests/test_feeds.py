@@ -0,0 +1,73 @@
+"""
+Testes do registro de feeds de GPS (pipelines.utils.feeds)
+"""
+import pytest
+
+from pipelines.utils.feeds import FEED_REGISTRY, get_feed, normalize_records, parse_feed_names, request_feed
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self, payload):
+        self.payload = payload
+        self.urls = []
+
+    def get(self, url, timeout):
+        self.urls.append(url)
+        return FakeResponse(self.payload)
+
+
+def test_brt_records_pass_through_unchanged():
+    records = [{"codigo": "V1", "dataHora": 1704103200000, "latitude": -22.9}]
+    assert normalize_records(records, get_feed("brt")) is records
+
+
+def test_sppo_records_are_mapped_to_bronze_columns():
+    records = [
+        {"ordem": "A12345", "linha": "309", "latitude": "-22,87", "longitude": "-43,25",
+         "datahora": "1704103200000", "velocidade": "0", "timestamp_captura": "2024-01-01T10:00:01"},
+        {"ordem": "B1", "linha": "10", "latitude": "n/d", "longitude": -43.2,
+         "datahora": None, "velocidade": 12.5},
+    ]
+
+    first, second = normalize_records(records, get_feed("sppo"))
+
+    assert first == {
+        "codigo": "A12345", "placa": "A12345", "linha": "309",
+        "latitude": -22.87, "longitude": -43.25, "dataHora": 1704103200000, "velocidade": 0.0,
+        "timestamp_captura": "2024-01-01T10:00:01",
+    }
+    assert second["latitude"] is None and second["longitude"] == -43.2
+    assert second["dataHora"] is None and second["timestamp_captura"] is None
+
+
+def test_parse_feed_names():
+    assert [f.name for f in parse_feed_names("sppo, brt,sppo,")] == ["sppo", "brt"]
+    assert [f.name for f in parse_feed_names(["brt"])] == ["brt"]
+    assert parse_feed_names(None) == []
+    with pytest.raises(ValueError):
+        parse_feed_names("metro")
+
+
+def test_request_feed_handles_both_payload_shapes():
+    brt = request_feed(FEED_REGISTRY["brt"], session=FakeSession({"veiculos": [{"codigo": "V1"}]}))
+    sppo = request_feed(FEED_REGISTRY["sppo"], session=FakeSession([{"ordem": "A1"}]))
+    unexpected = request_feed(FEED_REGISTRY["brt"], session=FakeSession({"erro": "manutenção"}))
+
+    assert brt[0]["codigo"] == "V1" and "timestamp_captura" in brt[0]
+    assert sppo[0]["ordem"] == "A1" and "timestamp_captura" in sppo[0]
+    assert unexpected == []
+
+
+def test_file_prefix():
+    assert get_feed("sppo").file_prefix == "onibus_gps"
@@ -0,0 +1,77 @@
+"""
+Testes da carga idempotente de CSVs no BigQuery (pipelines.utils.gcp)
+"""
+from google.api_core.exceptions import Conflict
+
+from pipelines.utils.bronze import bronze_schema
+from pipelines.utils.gcp import build_load_job_id, load_gcs_csv_to_table
+
+
+TABLE = "civitas-data-eng.civitas_bronze.brt_gps"
+
+
+class FakeJob:
+    def __init__(self, job_id, output_rows, error_result=None):
+        self.job_id = job_id
+        self.output_rows = output_rows
+        self.error_result = error_result
+
+    def result(self):
+        if self.error_result is not None:
+            raise RuntimeError(self.error_result["message"])
+        return self
+
+
+class FakeBigQuery:
+    """Cliente em memória: job_ids únicos (409 Conflict) e linhas por tabela."""
+
+    def __init__(self, rows_per_file=10):
+        self.rows_per_file = rows_per_file
+        self.jobs = {}
+        self.rows = {}
+
+    def load_table_from_uri(self, source_uri, table_ref, job_id, job_config):
+        if job_id in self.jobs:
+            raise Conflict(f"Already Exists: Job {job_id}")
+        job = FakeJob(job_id, self.rows_per_file)
+        self.jobs[job_id] = job
+        self.rows[table_ref] = self.rows.get(table_ref, 0) + self.rows_per_file
+        return job
+
+    def get_job(self, job_id):
+        return self.jobs[job_id]
+
+
+def test_rerun_of_same_file_is_a_noop():
+    client = FakeBigQuery()
+    uri = "gs://bucket/bronze/brt_gps/brt_gps_20240101_100000.csv"
+
+    first = load_gcs_csv_to_table(uri, TABLE, bronze_schema(), client=client)
+    second = load_gcs_csv_to_table(uri, TABLE, bronze_schema(), client=client)
+
+    assert first["status"] == "loaded"
+    assert second == {"job_id": first["job_id"], "status": "already_loaded", "output_rows": 10}
+    assert first["job_id"] == build_load_job_id(uri, TABLE)
+    assert list(client.jobs) == [first["job_id"]]
+    assert client.rows[TABLE] == 10
+
+
+def test_failed_job_is_retried_with_suffix():
+    client = FakeBigQuery()
+    uri = "gs://bucket/bronze/brt_gps/brt_gps_20240101_100000.csv"
+    job_id = build_load_job_id(uri, TABLE)
+    client.jobs[job_id] = FakeJob(job_id, None, error_result={"message": "invalid CSV"})
+
+    result = load_gcs_csv_to_table(uri, TABLE, bronze_schema(), client=client)
+
+    assert result["status"] == "loaded"
+    assert result["job_id"] == f"{job_id}_r1"
+    assert client.rows[TABLE] == 10
+
+
+def test_distinct_files_get_distinct_job_ids():
+    client = FakeBigQuery()
+    for name in ("brt_gps_20240101_100000.csv", "brt_gps_20240101_100100.csv"):
+        load_gcs_csv_to_table(f"gs://bucket/bronze/brt_gps/{name}", TABLE, bronze_schema(), client=client)
+    assert len(client.jobs) == 2
+    assert client.rows[TABLE] == 20
@@ -0,0 +1,152 @@
+"""
+Testes dos uploads idempotentes para o GCS (pipelines.utils.gcp)
+"""
+import base64
+import hashlib
+import io
+
+import pytest
+from google.api_core.exceptions import PreconditionFailed
+
+from pipelines.utils import gcp
+from pipelines.utils.gcp import file_md5, upload_if_changed
+
+
+BUCKET = "civitas-brt-data"
+
+
+def md5_base64(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+
+class FakeWriter(io.BytesIO):
+    def __init__(self, blob, if_generation_match):
+        super().__init__()
+        self.blob = blob
+        self.if_generation_match = if_generation_match
+
+    def close(self):
+        if not self.closed:
+            self.blob._store(self.getvalue(), self.if_generation_match)
+        super().close()
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def generation(self):
+        return self.bucket.objects.get(self.name, (None, None))[1]
+
+    @property
+    def md5_hash(self):
+        return md5_base64(self.bucket.objects[self.name][0]) if self.name in self.bucket.objects else None
+
+    def _store(self, data, if_generation_match):
+        if if_generation_match is not None and (self.generation or 0) != if_generation_match:
+            raise PreconditionFailed(self.name)
+        self.bucket.uploads.append(self.name)
+        self.bucket.put(self.name, data)
+
+    def upload_from_filename(self, path, if_generation_match=None, checksum=None):
+        with open(path, "rb") as f:
+            self._store(f.read(), if_generation_match)
+
+    def open(self, mode, chunk_size=None, ignore_flush=False, if_generation_match=None, content_type=None):
+        return FakeWriter(self, if_generation_match)
+
+
+class FakeBucket:
+    """Bucket em memória com MD5 e gerações como no GCS."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = []
+        self._generation = 0
+
+    def put(self, name, data):
+        self._generation += 1
+        self.objects[name] = (data, self._generation)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return FakeBlob(self, name) if name in self.objects else None
+
+
+class FakeStorageClient:
+    def __init__(self):
+        self.buckets = {}
+
+    def bucket(self, name):
+        return self.buckets.setdefault(name, FakeBucket())
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """Cliente GCS em memória e índice de uploads em diretório temporário."""
+    client = FakeStorageClient()
+    monkeypatch.setattr(gcp, "get_gcs_client", lambda: client)
+    monkeypatch.setenv("PIPELINE_UPLOAD_INDEX", str(tmp_path / "upload_index.json"))
+    return client
+
+
+def write(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_file_md5_matches_gcs_format(tmp_path):
+    assert file_md5(write(tmp_path / "a.csv", b"codigo\nV1\n")) == md5_base64(b"codigo\nV1\n")
+
+
+def test_unchanged_destination_is_skipped(storage, tmp_path):
+    path = write(tmp_path / "brt_gps_1.csv", b"codigo\nV1\n")
+    bucket = storage.bucket(BUCKET)
+    bucket.put("bronze/brt_gps/brt_gps_1.csv", b"codigo\nV1\n")
+
+    uri, uploaded = upload_if_changed(BUCKET, path, "bronze/brt_gps/brt_gps_1.csv")
+
+    assert (uri, uploaded) == (f"gs://{BUCKET}/bronze/brt_gps/brt_gps_1.csv", False)
+    assert bucket.uploads == []
+
+
+def test_retry_with_new_name_reuses_indexed_object(storage, tmp_path):
+    path = write(tmp_path / "lote.csv", b"codigo\nV1\n")
+
+    first = upload_if_changed(BUCKET, path, "bronze/brt_gps/brt_gps_1.csv")
+    retry = upload_if_changed(BUCKET, path, "bronze/brt_gps/brt_gps_2.csv")
+    other_prefix = upload_if_changed(BUCKET, path, "bronze/onibus_gps/onibus_gps_2.csv")
+
+    assert first == (f"gs://{BUCKET}/bronze/brt_gps/brt_gps_1.csv", True)
+    assert retry == (f"gs://{BUCKET}/bronze/brt_gps/brt_gps_1.csv", False)
+    assert other_prefix == (f"gs://{BUCKET}/bronze/onibus_gps/onibus_gps_2.csv", True)
+    assert storage.bucket(BUCKET).uploads == ["bronze/brt_gps/brt_gps_1.csv", "bronze/onibus_gps/onibus_gps_2.csv"]
+
+
+def test_changed_content_replaces_current_generation(storage, tmp_path):
+    bucket = storage.bucket(BUCKET)
+    bucket.put("bronze/brt_gps/brt_gps_1.csv", b"codigo\nV0\n")
+
+    uri, uploaded = upload_if_changed(BUCKET, write(tmp_path / "a.csv", b"codigo\nV1\n"), "bronze/brt_gps/brt_gps_1.csv")
+
+    assert uploaded
+    assert bucket.objects["bronze/brt_gps/brt_gps_1.csv"][0] == b"codigo\nV1\n"
+
+
+def test_concurrent_writer_with_other_content_fails(storage, tmp_path, monkeypatch):
+    bucket = storage.bucket(BUCKET)
+    original_store = FakeBlob._store
+
+    def racing_store(blob, data, if_generation_match):
+        bucket.put(blob.name, b"outro conteudo")
+        original_store(blob, data, if_generation_match)
+
+    monkeypatch.setattr(FakeBlob, "_store", racing_store)
+
+    with pytest.raises(PreconditionFailed):
+        upload_if_changed(BUCKET, write(tmp_path / "a.csv", b"codigo\nV1\n"), "bronze/brt_gps/brt_gps_1.csv")
+
@@ -0,0 +1,76 @@
+"""
+Testes da codificação de geohash (pipelines.utils.geocell)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipelines.utils.geocell import add_geohash_columns, encode_geohash
+
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def reference_geohash(lat, lon, precision):
+    """Algoritmo clássico por bisseção, um ponto por vez."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    bits, even = [], True
+    while len(bits) < 5 * precision:
+        value, interval = (lon, lon_range) if even else (lat, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        if value >= mid:
+            bits.append(1)
+            interval[0] = mid
+        else:
+            bits.append(0)
+            interval[1] = mid
+        even = not even
+    return "".join(
+        BASE32[int("".join(map(str, bits[i:i + 5])), 2)] for i in range(0, len(bits), 5)
+    )
+
+
+@pytest.mark.parametrize("lat, lon, precision, expected", [
+    (57.64911, 10.40744, 11, "u4pruydqqvj"),
+    (42.6, -5.6, 5, "ezs42"),
+    (-22.9068, -43.1729, 4, "75cm"),
+    (0.0, 0.0, 5, "s0000"),
+    (-90.0, -180.0, 5, "00000"),
+    (90.0, 180.0, 5, "zzzzz"),
+])
+def test_known_geohashes(lat, lon, precision, expected):
+    assert encode_geohash(np.array([lat]), np.array([lon]), precision).tolist() == [expected]
+
+
+def test_matches_reference_implementation():
+    rng = np.random.default_rng(7)
+    lat = rng.uniform(-23.1, -22.7, 200)
+    lon = rng.uniform(-43.8, -43.1, 200)
+
+    encoded = encode_geohash(lat, lon, precision=7)
+
+    assert encoded.tolist() == [reference_geohash(a, b, 7) for a, b in zip(lat, lon)]
+
+
+def test_invalid_coordinates_and_precision():
+    encoded = encode_geohash(np.array([np.nan, 91.0, -22.9]), np.array([-43.2, -43.2, 200.0]), precision=5)
+    assert encoded.tolist() == [None, None, None]
+    with pytest.raises(ValueError):
+        encode_geohash(np.array([0.0]), np.array([0.0]), precision=13)
+
+
+def test_columns_are_prefixes_of_the_finest_resolution():
+    df = pd.DataFrame({"latitude": ["-22.9068", None], "longitude": [-43.1729, -43.2]})
+
+    result = add_geohash_columns(df)
+
+    row = result.iloc[0]
+    assert row["geohash_7"].startswith(row["geohash_6"]) and row["geohash_6"].startswith(row["geohash_5"])
+    assert len(row["geohash_7"]) == 7 and row["geohash_5"].startswith("75cm")
+    assert result[["geohash_5", "geohash_6", "geohash_7"]].iloc[1].isna().all()
+
+
+def test_batch_without_coordinates_gets_empty_columns():
+    result = add_geohash_columns(pd.DataFrame({"codigo": ["A"]}), precisions=(6,))
+    assert result.columns.tolist() == ["codigo", "geohash_6"]
+    assert result["geohash_6"].isna().all()
@@ -0,0 +1,18 @@
+"""
+Testes do SQL das tabelas Gold nativas (pipelines.brt.extract_load.tasks)
+"""
+import pytest
+
+from pipelines.brt.extract_load.tasks import gold_table_statements
+
+
+@pytest.mark.parametrize("table_name, column", [("fct_brt_viagens", "data_viagem"), ("agg_sketches_horarios", "data_gps")])
+def test_partitioned_tables_drop_legacy_layout_before_replace(table_name, column):
+    sql = gold_table_statements("proj")[table_name]
+
+    drop = sql.index(f"DROP TABLE `proj.civitas_gold.{table_name}`")
+    create = sql.index(f"CREATE OR REPLACE TABLE `proj.civitas_gold.{table_name}`")
+
+    assert f"column_name = '{column}'" in sql and "is_partitioning_column = 'YES'" in sql
+    assert drop < create
+    assert f"PARTITION BY {column}" in sql[create:]
@@ -0,0 +1,85 @@
+"""
+Testes da fila de manifestos entre captura e transform (pipelines.utils.handoff_queue)
+"""
+import os
+
+import pytest
+
+from pipelines.utils.handoff_queue import TransformQueue, transform_queue_dir
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return TransformQueue(transform_queue_dir(str(tmp_path)))
+
+
+def enqueue(queue, name):
+    return queue.enqueue({"uri": f"gs://bucket/bronze/brt_gps/{name}.csv", "feed": "brt", "records": 10})
+
+
+def test_claim_takes_all_pending_in_order(queue):
+    for name in ("a", "b", "c"):
+        enqueue(queue, name)
+
+    batch_id, manifests = queue.claim()
+
+    assert batch_id is not None
+    assert [m["uri"].rsplit("/", 1)[-1] for m in manifests] == ["a.csv", "b.csv", "c.csv"]
+    assert all("enqueued_at" in m for m in manifests)
+    assert queue.stats()["depth"] == 0
+    assert queue.stats()["inflight"] == 3
+    assert queue.claim() == (None, [])
+
+
+def test_ack_removes_batch(queue):
+    enqueue(queue, "a")
+    batch_id, _ = queue.claim()
+    enqueue(queue, "b")
+
+    acked = queue.ack(batch_id)
+
+    assert [m["uri"] for m in acked] == ["gs://bucket/bronze/brt_gps/a.csv"]
+    assert queue.stats()["inflight"] == 0
+    assert queue.queued_uris() == {"gs://bucket/bronze/brt_gps/b.csv"}
+    assert queue.ack(batch_id) == []
+
+
+def test_failed_batch_is_requeued(queue):
+    enqueue(queue, "a")
+    enqueue(queue, "b")
+    queue.claim()
+
+    assert queue.requeue_inflight() == 2
+    assert queue.stats()["depth"] == 2
+    assert os.listdir(queue.inflight_dir) == []
+    _, manifests = queue.claim()
+    assert len(manifests) == 2
+
+
+def test_stats_lag_comes_from_oldest_pending(queue):
+    assert queue.stats()["lag_seconds"] == 0.0
+    enqueue(queue, "a")
+    enqueue(queue, "b")
+
+    stats = queue.stats()
+    lag = queue.stats(now=stats["oldest_enqueued_at"] + 30)["lag_seconds"]
+
+    assert stats["depth"] == 2
+    assert lag == pytest.approx(30)
+
+
+def test_queued_uris_include_inflight(queue):
+    enqueue(queue, "a")
+    queue.claim()
+    enqueue(queue, "b")
+    assert queue.queued_uris() == {"gs://bucket/bronze/brt_gps/a.csv", "gs://bucket/bronze/brt_gps/b.csv"}
+
+
+def test_unreadable_manifest_is_skipped(queue):
+    enqueue(queue, "a")
+    with open(os.path.join(queue.pending_dir, "99999999999999999999_broken.json"), "w") as f:
+        f.write("{")
+
+    _, manifests = queue.claim()
+
+    assert [m["uri"] for m in manifests] == ["gs://bucket/bronze/brt_gps/a.csv"]
@@ -0,0 +1,56 @@
+"""
+Testes do sketch HyperLogLog (pipelines.utils.hll)
+"""
+import numpy as np
+import pytest
+
+from pipelines.utils.hll import HyperLogLog, _leading_zeros
+
+
+def vehicles(start, stop):
+    return np.array([f"V{i:06d}" for i in range(start, stop)], dtype=object)
+
+
+def test_leading_zeros():
+    values = np.array([0, 1, 1 << 63, (1 << 40) + 5], dtype=np.uint64)
+    assert _leading_zeros(values).tolist() == [64, 63, 0, 23]
+
+
+@pytest.mark.parametrize("n", [50, 1_000, 20_000, 200_000])
+def test_estimate_within_error_bound(n):
+    sketch = HyperLogLog().add(vehicles(0, n))
+    standard_error = 1.04 / np.sqrt(sketch.m)  # ~0,8% com precisão 14
+    assert abs(sketch.estimate() - n) <= max(3 * standard_error * n, 1)
+
+
+def test_duplicates_and_nulls_do_not_count():
+    sketch = HyperLogLog().add(np.concatenate([vehicles(0, 100)] * 5 + [np.array([None, "", "  "])]))
+    assert sketch.estimate() == 100
+    assert HyperLogLog().add([None, ""]).estimate() == 0
+
+
+def test_merge_equals_union():
+    a = HyperLogLog().add(vehicles(0, 30_000))
+    b = HyperLogLog().add(vehicles(20_000, 50_000))
+    union = HyperLogLog().add(vehicles(0, 50_000))
+
+    merged = HyperLogLog.from_bytes(a.to_bytes()).merge(b)
+
+    assert np.array_equal(merged.registers, union.registers)
+    assert merged.estimate() == union.estimate()
+    # Mesclar é idempotente e comutativo
+    assert np.array_equal(merged.merge(b).registers, HyperLogLog.from_bytes(b.to_bytes()).merge(a).registers)
+
+
+def test_serialization_roundtrip():
+    sketch = HyperLogLog(precision=10).add(vehicles(0, 500))
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+    assert restored.precision == 10
+    assert np.array_equal(restored.registers, sketch.registers)
+
+
+def test_invalid_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=3)
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=10).merge(HyperLogLog(precision=12))
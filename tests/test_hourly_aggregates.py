@@ -0,0 +1,113 @@
+"""
+Testes dos agregados horários mescláveis (pipelines.utils.hourly_aggregates)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipelines.utils.hourly_aggregates import (
+    AGGREGATE_COLUMNS,
+    HourlyAggregator,
+    aggregates_merge_sql,
+    compute_hourly_aggregates,
+    finalize_aggregates,
+    load_aggregates,
+    merge_aggregates,
+)
+
+
+HOUR_MS = 3_600_000
+BASE_MS = 1_704_103_200_000  # 2024-01-01 10:00 UTC
+
+
+def batch(speeds, hour=0, ignition="L", start=0):
+    """Fixes de veículos distintos na mesma hora."""
+    n = len(speeds)
+    return pd.DataFrame({
+        "codigo": [f"V{start + i}" for i in range(n)],
+        "linha": ["10"] * n,
+        "dataHora": [BASE_MS + hour * HOUR_MS + i * 1000 for i in range(n)],
+        "velocidade": speeds,
+        "ignicao": [ignition] * n,
+    })
+
+
+def test_chan_merge_equals_one_pass():
+    rng = np.random.default_rng(42)
+    speeds = rng.uniform(0, 80, 300).round(2)
+    parts = [batch(speeds[:10], start=0), batch(speeds[10:150], start=10), batch(speeds[150:], start=150)]
+
+    merged = compute_hourly_aggregates(parts[0])
+    for part in parts[1:]:
+        merged = merge_aggregates(merged, compute_hourly_aggregates(part))
+    one_pass = compute_hourly_aggregates(pd.concat(parts, ignore_index=True))
+
+    assert merged["total_registros"].tolist() == one_pass["total_registros"].tolist() == [300]
+    assert merged["velocidade_n"].iloc[0] == 300
+    assert merged["velocidade_soma"].iloc[0] == pytest.approx(speeds.sum())
+    assert merged["velocidade_media"].iloc[0] == pytest.approx(speeds.mean())
+    assert merged["velocidade_m2"].iloc[0] == pytest.approx(one_pass["velocidade_m2"].iloc[0])
+    assert merged["velocidade_minima"].iloc[0] == speeds.min()
+    assert merged["velocidade_maxima"].iloc[0] == speeds.max()
+    assert finalize_aggregates(merged)["velocidade_desvio_padrao"].iloc[0] == pytest.approx(
+        round(speeds.std(ddof=1), 2)
+    )
+
+
+def test_merge_is_commutative_and_keeps_distinct_hours():
+    a = compute_hourly_aggregates(batch([10.0, 30.0], hour=0))
+    b = compute_hourly_aggregates(batch([60.0], hour=1))
+
+    ab = merge_aggregates(a, b)
+    ba = merge_aggregates(b, a)
+
+    pd.testing.assert_frame_equal(ab, ba)
+    assert ab["hora_gps"].tolist() == [10, 11]
+    assert ab["veiculos_rapido"].tolist() == [0, 1]
+
+
+def test_hour_without_valid_speed_does_not_poison_merge():
+    empty_speed = compute_hourly_aggregates(batch([np.nan, np.nan]))
+    valid = compute_hourly_aggregates(batch([12.0, 40.0], start=2))
+
+    merged = merge_aggregates(empty_speed, valid)
+
+    assert merged["total_registros"].iloc[0] == 4
+    assert merged["velocidade_n"].iloc[0] == 2
+    assert merged["velocidade_media"].iloc[0] == pytest.approx(26.0)
+    assert merged["velocidade_minima"].iloc[0] == 12.0
+    assert merged["velocidade_maxima"].iloc[0] == 40.0
+
+
+def test_speed_and_ignition_buckets():
+    result = compute_hourly_aggregates(batch([0.0, 15.0, 35.0, 70.0], ignition="d"))
+    row = result.iloc[0]
+    assert (row["veiculos_parados"], row["veiculos_lento"], row["veiculos_moderado"], row["veiculos_rapido"]) == (1, 1, 1, 1)
+    assert row["veiculos_desligados"] == 4 and row["veiculos_ligados"] == 0
+
+
+def test_aggregator_flush_writes_delta_and_persists_totals(tmp_path):
+    state = str(tmp_path / "state" / "agg.csv")
+    aggregator = HourlyAggregator(state)
+    aggregator.update(batch([10.0, 20.0]))
+
+    path = aggregator.flush(str(tmp_path / "deltas"))
+
+    assert list(load_aggregates(path).columns) == AGGREGATE_COLUMNS
+    assert aggregator.flush(str(tmp_path / "deltas")) is None
+
+    restored = HourlyAggregator(state)
+    restored.update(batch([30.0], start=2))
+    assert restored.totals["velocidade_n"].iloc[0] == 3
+    assert restored.totals["veiculos_ativos_aprox"].iloc[0] == 3
+
+
+def test_merge_sql_ignores_null_side_of_min_max():
+    delta = compute_hourly_aggregates(batch([np.nan]))
+    sql = aggregates_merge_sql("p.d.agg", delta, "delta_1", "p.d.applied")
+
+    assert "LEAST(T.velocidade_minima, D.velocidade_minima)" not in sql
+    assert "COALESCE(T.velocidade_minima, D.velocidade_minima)" in sql
+    assert "COALESCE(D.velocidade_maxima, T.velocidade_maxima)" in sql
+    assert "CAST(NULL AS FLOAT64) AS velocidade_minima" in sql
+    assert sql.count("delta_id = 'delta_1'") == 2
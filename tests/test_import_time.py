@@ -0,0 +1,16 @@
+"""
+Regressão do tempo de import de pipelines.flows (pipelines.utils.import_benchmark)
+"""
+import os
+
+from pipelines.utils.import_benchmark import DEFAULT_BUDGET_MS, TARGET_MODULE, run_benchmark
+
+
+def test_import_stays_light_and_within_budget():
+    budget_ms = float(os.getenv("PIPELINE_IMPORT_BUDGET_MS", DEFAULT_BUDGET_MS))
+    report = run_benchmark(runs=3, budget_ms=budget_ms)
+
+    assert report["heavy_modules"] == [], f"import {TARGET_MODULE} carregou {report['heavy_modules']}"
+    assert report["own_ms"] <= budget_ms, (
+        f"import {TARGET_MODULE}: {report['own_ms']:.0f} ms > orçamento {budget_ms:.0f} ms"
+    )
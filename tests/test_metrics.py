@@ -0,0 +1,100 @@
+"""
+Testes do registro de métricas (pipelines.utils.metrics)
+"""
+import glob
+import logging
+import multiprocessing
+import os
+
+from pipelines.utils.metrics import MetricsRegistry
+
+
+def _increment(metrics_dir, times):
+    registry = MetricsRegistry(metrics_dir)
+    for _ in range(times):
+        registry.inc("pipeline_capture_polls", feed="brt")
+        registry.observe("pipeline_task_duration_seconds", 0.2, task="fetch")
+        registry.flush()
+
+
+def test_flush_keeps_counters_of_other_registries(tmp_path):
+    metrics_dir = str(tmp_path)
+    first, second = MetricsRegistry(metrics_dir), MetricsRegistry(metrics_dir)
+    first.inc("pipeline_capture_polls", 2, feed="brt")
+    second.inc("pipeline_capture_polls", 3, feed="brt")
+    second.set_gauge("pipeline_transform_queue_depth", 4)
+    first.flush()
+    second.flush()
+
+    assert second.get_counter("pipeline_capture_polls", feed="brt") == 5
+    assert MetricsRegistry(metrics_dir).get_counter("pipeline_capture_polls", feed="brt") == 5
+    assert "pipeline_transform_queue_depth 4" in open(second.textfile_path).read()
+
+
+def test_repeated_flush_does_not_double_count(tmp_path):
+    registry = MetricsRegistry(str(tmp_path))
+    registry.inc("pipeline_capture_polls")
+    registry.flush()
+    registry.flush()
+    assert MetricsRegistry(str(tmp_path)).get_counter("pipeline_capture_polls") == 1
+
+
+def test_concurrent_processes(tmp_path):
+    metrics_dir, workers, times = str(tmp_path), 4, 25
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_increment, args=(metrics_dir, times)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    registry = MetricsRegistry(metrics_dir)
+    assert registry.get_counter("pipeline_capture_polls", feed="brt") == workers * times
+    assert f'pipeline_task_duration_seconds_count{{task="fetch"}} {workers * times}' in registry.render()
+
+
+def test_instrumented_tasks_flush_every_n_and_at_flow_end(monkeypatch, tmp_path):
+    from prefect import Flow, task
+
+    from pipelines.utils import metrics
+
+    registry = MetricsRegistry(str(tmp_path), flush_every=3)
+    monkeypatch.setattr(metrics, "_registry", registry)
+
+    @metrics.instrumented
+    def step(records):
+        return records
+
+    step([1, 2])
+    step([3])
+    assert not os.path.exists(registry.state_path)
+    step([4])
+    assert MetricsRegistry(str(tmp_path)).get_counter("pipeline_task_runs", task="step", status="success") == 3
+
+    @task
+    @metrics.instrumented
+    def last():
+        return [5]
+
+    with Flow("metrics", state_handlers=[metrics.flush_metrics_on_finish]) as flow:
+        last()
+    assert flow.run().is_successful()
+
+    assert MetricsRegistry(str(tmp_path)).get_counter("pipeline_task_runs", task="last", status="success") == 1
+
+
+def test_corrupt_state_is_kept_for_inspection(tmp_path, caplog):
+    registry = MetricsRegistry(str(tmp_path))
+    with open(registry.state_path, "w") as f:
+        f.write('{"counters": ')
+
+    with caplog.at_level(logging.WARNING):
+        registry = MetricsRegistry(str(tmp_path))
+        registry.inc("pipeline_capture_polls")
+        registry.flush()
+
+    corrupt = glob.glob(f"{registry.state_path}.corrupt-*")
+    assert len(corrupt) == 1
+    assert open(corrupt[0]).read() == '{"counters": '
+    assert "ilegível" in caplog.text
+    assert MetricsRegistry(str(tmp_path)).get_counter("pipeline_capture_polls") == 1
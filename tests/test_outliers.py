@@ -0,0 +1,84 @@
+"""
+Testes do filtro de saltos de GPS (pipelines.utils.outliers)
+"""
+import numpy as np
+import pandas as pd
+
+from pipelines.utils.outliers import bearing_deg, detect_teleports
+
+
+# ~0,1 km por passo de latitude: 20 km/h com fixes a cada 20 s
+STEP_DEG = 0.001
+INTERVAL_MS = 20_000
+
+
+def track(points, vehicle="V1", start_ms=0):
+    """Fixes de um veículo em intervalos fixos a partir de (lat, lon)."""
+    return (
+        [vehicle] * len(points),
+        [start_ms + i * INTERVAL_MS for i in range(len(points))],
+        [lat for lat, _ in points],
+        [lon for _, lon in points],
+    )
+
+
+def straight(n, lat=-22.9, lon=-43.2):
+    return [(lat + i * STEP_DEG, lon) for i in range(n)]
+
+
+def test_bearing():
+    assert bearing_deg(0, 0, 1, 0) == 0
+    assert round(float(bearing_deg(0, 0, 0, 1))) == 90
+
+
+def test_smooth_track_is_kept():
+    assert not detect_teleports(*track(straight(6))).any()
+
+
+def test_isolated_jump_is_flagged():
+    points = straight(6)
+    points[3] = (points[3][0] + 0.2, points[3][1])  # ~22 km fora do trajeto
+    assert detect_teleports(*track(points)).tolist() == [False, False, False, True, False, False]
+
+
+def test_excursion_of_several_fixes_is_flagged():
+    points = straight(8)
+    for i in (3, 4, 5):
+        points[i] = (points[i][0] + 0.2, points[i][1])
+    assert detect_teleports(*track(points)).tolist() == [False] * 3 + [True] * 3 + [False] * 2
+
+
+def test_jump_on_last_fix_is_flagged():
+    points = straight(4) + [(-22.0, -43.2)]
+    assert detect_teleports(*track(points)).tolist() == [False] * 4 + [True]
+
+
+def test_confirmed_relocation_flags_nothing_after_first_fix():
+    # O primeiro fix estava errado: os seguintes são coerentes entre si
+    points = [(-22.0, -43.2)] + straight(5)
+    flagged = detect_teleports(*track(points))
+    assert not flagged[1:].any()
+
+
+def test_state_anchors_first_fix_of_batch():
+    previous = pd.DataFrame({"codigo": ["V1"], "dataHora": [-INTERVAL_MS], "latitude": [-22.9], "longitude": [-43.2]})
+    ids, ts, lat, lon = track([(-22.0, -43.2)])
+    assert detect_teleports(ids, ts, lat, lon, previous=previous).tolist() == [True]
+    assert detect_teleports(ids, ts, lat, lon).tolist() == [False]
+
+
+def test_result_follows_input_order_across_vehicles():
+    a = track(straight(5), "A")
+    points = straight(5)
+    points[2] = (points[2][0] + 0.2, points[2][1])
+    b = track(points, "B")
+    ids, ts, lat, lon = (np.array(x[::-1] + y[::-1]) for x, y in zip(a, b))
+
+    flagged = detect_teleports(ids, ts, lat, lon)
+
+    assert flagged.sum() == 1
+    assert ids[flagged][0] == "B" and ts[flagged][0] == 2 * INTERVAL_MS
+
+
+def test_empty_batch():
+    assert detect_teleports([], [], [], []).shape == (0,)
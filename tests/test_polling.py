@@ -0,0 +1,86 @@
+"""
+Testes do polling adaptativo (pipelines.utils.polling)
+"""
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from pipelines.utils.polling import AdaptivePoller, load_poller, parse_retry_after, save_poller
+
+
+def snapshot(timestamps):
+    return [{"codigo": f"V{i}", "dataHora": ts} for i, ts in enumerate(timestamps)]
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("30") == 30.0
+    assert parse_retry_after("-5") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("amanhã") is None
+
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=60)
+    assert parse_retry_after(format_datetime(retry_at, usegmt=True)) == pytest.approx(60, abs=2)
+
+
+def test_observe_returns_only_new_fixes():
+    poller = AdaptivePoller()
+    assert len(poller.observe(snapshot([1000, 1000]))) == 2
+    new = poller.observe(snapshot([2000, 1000]) + [{"codigo": "V9", "dataHora": None}])
+    assert [r["codigo"] for r in new] == ["V0"]
+    assert poller.last_seen == {"V0": 2000, "V1": 1000}
+
+
+def test_static_feed_backs_off_to_max():
+    poller = AdaptivePoller(min_interval=15, max_interval=300)
+    for _ in range(10):
+        poller.observe(snapshot([1000] * 10))
+    assert poller.interval == 300
+
+
+def test_fast_feed_stays_at_min():
+    poller = AdaptivePoller(min_interval=15, max_interval=300, initial_interval=120)
+    for step in range(10):
+        poller.observe(snapshot([1000 * (step + 1)] * 10))
+    assert poller.interval == 15
+
+
+def test_interval_changes_at_most_by_step_factor():
+    poller = AdaptivePoller(min_interval=1, max_interval=1000, initial_interval=10)
+    poller.observe(snapshot([1000] * 10))
+    poller.observe(snapshot([1000] * 10))
+    assert poller.interval == 20
+
+
+def test_rate_limited_honours_retry_after():
+    poller = AdaptivePoller(min_interval=15, max_interval=300)
+    assert poller.rate_limited() == 30
+    assert poller.rate_limited(retry_after=600) == 600
+    assert poller.interval == 60
+
+
+def test_invalid_bounds():
+    with pytest.raises(ValueError):
+        AdaptivePoller(min_interval=0)
+    with pytest.raises(ValueError):
+        AdaptivePoller(min_interval=60, max_interval=30)
+
+
+def test_state_roundtrip(tmp_path):
+    path = str(tmp_path / "state" / "poller.json")
+    poller = AdaptivePoller(min_interval=15, max_interval=300, initial_interval=90)
+    poller.observe(snapshot([1000, 2000]))
+    save_poller(poller, path)
+
+    restored = load_poller(path, min_interval=15, max_interval=60)
+
+    assert restored.last_seen == poller.last_seen
+    assert restored.interval == 60  # limites novos valem sobre o estado salvo
+
+
+def test_unreadable_state_starts_fresh(tmp_path):
+    path = tmp_path / "poller.json"
+    path.write_text("{")
+    poller = load_poller(str(path))
+    assert poller.last_seen == {}
+    assert poller.interval == poller.min_interval
@@ -0,0 +1,112 @@
+"""
+Testes da última posição por veículo (pipelines.utils.positions)
+"""
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from pipelines.utils import positions
+from pipelines.utils.positions import PositionIndex, etag_matches, start_position_server, stop_position_server
+
+
+def fix(codigo, data_hora, linha="10", latitude=-22.9):
+    return {"codigo": codigo, "linha": linha, "dataHora": data_hora, "latitude": latitude, "longitude": -43.4}
+
+
+def body(result):
+    return json.loads(result[0])
+
+
+def test_latest_fix_wins_regardless_of_arrival_order():
+    index = PositionIndex("brt")
+
+    assert index.update([fix("V1", 2000, latitude=-22.8), fix("V1", 1000, latitude=-22.7)], now=0) == 1
+    assert index.update([fix("V1", 1500, latitude=-22.6)], now=1) == 0
+    assert body(index.vehicle("V1"))["latitude"] == -22.8
+
+    assert index.update([fix("V1", 3000, latitude=-22.5)], now=2) == 1
+    assert body(index.vehicle("V1"))["dataHora"] == 3000
+
+
+def test_invalid_records_are_ignored():
+    index = PositionIndex("brt")
+    changed = index.update([fix(None, 1000), fix("V1", None), fix("V2", "abc"), fix(7, "1000")], now=0)
+
+    assert changed == 1
+    assert body(index.vehicle("7"))["codigo"] == "7"
+    assert index.vehicle("V1") is None
+
+
+def test_line_index_follows_line_changes():
+    index = PositionIndex("brt")
+    index.update([fix("V1", 1000, linha="10"), fix("V2", 1000, linha=10)], now=0)
+    assert [v["codigo"] for v in body(index.line("10"))["veiculos"]] == ["V1", "V2"]
+
+    index.update([fix("V2", 2000, linha="22")], now=1)
+
+    assert [v["codigo"] for v in body(index.line("10"))["veiculos"]] == ["V1"]
+    assert [v["codigo"] for v in body(index.line("22"))["veiculos"]] == ["V2"]
+    assert index.line("99") is None
+
+
+def test_line_etag_changes_only_with_the_line():
+    index = PositionIndex("brt")
+    index.update([fix("V1", 1000, linha="10"), fix("V2", 1000, linha="22")], now=0)
+    _, etag = index.line("10")
+
+    index.update([fix("V2", 2000, linha="22")], now=1)
+    assert index.line("10")[1] == etag
+
+    index.update([fix("V1", 2000, linha="10")], now=2)
+    assert index.line("10")[1] != etag
+
+
+def test_stale_vehicles_are_evicted():
+    index = PositionIndex("brt", max_age_seconds=60)
+    index.update([fix("V1", 1000), fix("V2", 1000, linha="22")], now=0)
+
+    index.update([fix("V2", 2000, linha="22")], now=61)
+
+    assert index.vehicle("V1") is None
+    assert body(index.line("10"))["veiculos"] == []
+    assert index.stats()["vehicles"] == 1
+
+
+def test_etag_matches():
+    assert etag_matches('"a"', '"a"')
+    assert etag_matches('W/"a", "b"', '"a"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches('"b"', '"a"')
+    assert not etag_matches(None, '"a"')
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(positions, "_INDEXES", {})
+    server = start_position_server(host="127.0.0.1", port=0)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    stop_position_server()
+
+
+def get(url, etag=None):
+    request = urllib.request.Request(url, headers={"If-None-Match": etag} if etag else {})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, response.headers.get("ETag"), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("ETag"), e.read()
+
+
+def test_http_endpoint_with_conditional_requests(server):
+    positions.update_positions("brt", [fix("V1", 1000)])
+
+    status, etag, content = get(f"{server}/brt/veiculos/V1")
+    assert status == 200 and json.loads(content)["codigo"] == "V1"
+    assert get(f"{server}/brt/veiculos/V1", etag)[0] == 304
+
+    assert get(f"{server}/brt/linhas/10")[0] == 200
+    assert get(f"{server}/brt/veiculos/V9")[0] == 404
+    assert get(f"{server}/sppo/veiculos/V1")[0] == 404
+    assert json.loads(get(f"{server}/health")[2])["feeds"][0]["vehicles"] == 1
@@ -0,0 +1,68 @@
+"""
+Testes dos hooks de profiling (pipelines.utils.profiling)
+"""
+import os
+import pstats
+
+import prefect
+import pytest
+
+from pipelines.utils.profiling import PROFILE_ENV_VAR, profiled
+
+
+@profiled
+def busy_task(n):
+    return sum(i * i for i in range(n))
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("PIPELINE_PROFILE_DIR", str(tmp_path))
+    monkeypatch.delenv(PROFILE_ENV_VAR, raising=False)
+    return tmp_path
+
+
+def test_unselected_task_runs_without_artifacts(profile_dir, monkeypatch):
+    monkeypatch.setenv(PROFILE_ENV_VAR, "other_task")
+    assert busy_task(10) == 285
+    assert os.listdir(profile_dir) == []
+
+
+@pytest.mark.parametrize("selection", ["busy_task", "other_task, busy_task", "all"])
+def test_selected_task_writes_profile_and_summary(profile_dir, monkeypatch, selection):
+    monkeypatch.setenv(PROFILE_ENV_VAR, selection)
+
+    assert busy_task(1000) == sum(i * i for i in range(1000))
+
+    files = sorted(os.listdir(profile_dir))
+    assert len(files) == 2
+    prof, summary = files
+    assert prof.startswith("busy_task_") and prof.endswith(".prof")
+    assert summary.endswith("_top.txt")
+    assert pstats.Stats(str(profile_dir / prof)).total_calls > 0
+    text = (profile_dir / summary).read_text()
+    assert "Pico de memória rastreada" in text and "Alocações" in text
+
+
+def test_flow_parameter_takes_precedence(profile_dir, monkeypatch):
+    monkeypatch.setenv(PROFILE_ENV_VAR, "all")
+    with prefect.context(parameters={"profile_tasks": []}):
+        busy_task(10)
+    assert os.listdir(profile_dir) == []
+
+    monkeypatch.delenv(PROFILE_ENV_VAR)
+    with prefect.context(parameters={"profile_tasks": ["busy_task"]}):
+        busy_task(10)
+    assert len(os.listdir(profile_dir)) == 2
+
+
+def test_failing_task_is_still_profiled(profile_dir, monkeypatch):
+    monkeypatch.setenv(PROFILE_ENV_VAR, "failing_task")
+
+    @profiled
+    def failing_task():
+        raise RuntimeError("falhou")
+
+    with pytest.raises(RuntimeError):
+        failing_task()
+    assert len(os.listdir(profile_dir)) == 2
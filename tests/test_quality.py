@@ -0,0 +1,111 @@
+"""
+Testes do quality gate vetorizado (pipelines.utils.quality)
+"""
+import pandas as pd
+import pytest
+
+from pipelines.utils.quality import (
+    REJECTION_COLUMN,
+    RIO_LAT_MAX,
+    RIO_LAT_MIN,
+    RIO_LON_MAX,
+    RIO_LON_MIN,
+    evaluate_quality,
+    split_by_quality,
+)
+
+
+def record(**overrides):
+    base = {
+        "codigo": "V1",
+        "placa": "ABC1234",
+        "latitude": -22.9,
+        "longitude": -43.4,
+        "dataHora": 1_704_103_200_000,
+        "velocidade": 30.0,
+    }
+    return {**base, **overrides}
+
+
+def frame(*records):
+    return pd.DataFrame(list(records))
+
+
+def test_valid_record_passes_every_rule():
+    passed, counts, reasons = evaluate_quality(frame(record()))
+    assert passed.tolist() == [True]
+    assert set(counts.values()) == {0}
+    assert reasons.tolist() == [""]
+
+
+@pytest.mark.parametrize("lat, lon, inside", [
+    (RIO_LAT_MIN, RIO_LON_MIN, True),
+    (RIO_LAT_MAX, RIO_LON_MAX, True),
+    (RIO_LAT_MIN - 1e-6, -43.4, False),
+    (RIO_LAT_MAX + 1e-6, -43.4, False),
+    (-22.9, RIO_LON_MIN - 1e-6, False),
+    (-22.9, RIO_LON_MAX + 1e-6, False),
+])
+def test_rio_bounding_box_edges(lat, lon, inside):
+    passed, counts, _ = evaluate_quality(frame(record(latitude=lat, longitude=lon)))
+    assert passed.tolist() == [inside]
+    assert counts["within_rio_bounds"] == (0 if inside else 1)
+    assert counts["valid_coordinates"] == 0
+
+
+def test_masks_per_rule_and_combined_reasons():
+    df = frame(
+        record(),
+        record(placa=" "),
+        record(velocidade=151),
+        record(velocidade=-1, latitude=None),
+        record(latitude="abc", longitude=-200),
+    )
+
+    passed, counts, reasons = evaluate_quality(df)
+
+    assert passed.tolist() == [True, False, False, False, False]
+    assert counts["placa_not_null"] == 1
+    assert counts["valid_velocity"] == 2
+    assert counts["latitude_not_null"] == 1
+    assert counts["valid_coordinates"] == 2
+    assert reasons[3] == "latitude_not_null;valid_coordinates;valid_velocity;within_rio_bounds"
+    assert reasons[4] == "valid_coordinates;within_rio_bounds"
+
+
+def test_missing_column_fails_its_rule():
+    df = frame(record()).drop(columns=["placa"])
+    passed, counts, _ = evaluate_quality(df)
+    assert passed.tolist() == [False]
+    assert counts["placa_not_null"] == 1
+
+
+def test_split_sends_rejections_to_quarantine():
+    df = frame(record(), record(codigo="V2", velocidade=200), record(codigo="V3"))
+
+    accepted, rejected, counts = split_by_quality(df, teleport_action="off")
+
+    assert accepted["codigo"].tolist() == ["V1", "V3"]
+    assert rejected["codigo"].tolist() == ["V2"]
+    assert rejected[REJECTION_COLUMN].tolist() == ["valid_velocity"]
+    assert "gps_teleport" not in counts
+
+
+def test_teleports_are_dropped_or_flagged(tmp_path):
+    track = [record(dataHora=1_704_103_200_000 + i * 20_000, latitude=-22.9 + i * 0.001) for i in range(5)]
+    track[2] = {**track[2], "latitude": -22.75, "longitude": -43.75}
+    df = frame(*track)
+
+    accepted, rejected, counts = split_by_quality(df)
+    assert counts["gps_teleport"] == 1
+    assert len(accepted) == 4
+    assert rejected[REJECTION_COLUMN].tolist() == ["gps_teleport"]
+
+    accepted, rejected, counts = split_by_quality(df, teleport_action="flag")
+    assert counts["gps_teleport"] == 1
+    assert len(accepted) == 5 and rejected.empty
+
+
+def test_unknown_teleport_action():
+    with pytest.raises(ValueError):
+        split_by_quality(frame(record()), teleport_action="ignore")
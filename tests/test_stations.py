@@ -0,0 +1,88 @@
+"""
+Testes do índice de estações BRT (pipelines.utils.stations)
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from pipelines.utils.bronze import _load_stations
+from pipelines.utils.stations import StationGridIndex, add_station_columns, load_station_index
+from pipelines.utils.track_metrics import EARTH_RADIUS_KM
+
+
+LAT0, LON0 = -22.9, -43.2
+
+
+def offset(meters_east=0.0, meters_north=0.0, lat=LAT0, lon=LON0):
+    """(lat, lon) deslocado em metros a partir de um ponto."""
+    r_m = EARTH_RADIUS_KM * 1000.0
+    return (
+        lat + np.degrees(meters_north / r_m),
+        lon + np.degrees(meters_east / (r_m * np.cos(np.radians(lat)))),
+    )
+
+
+def index(stations, radius_m=150.0):
+    ids = [station_id for station_id, _, _ in stations]
+    return StationGridIndex(ids, [lat for _, lat, _ in stations], [lon for _, _, lon in stations], radius_m)
+
+
+def test_match_in_neighbouring_cell():
+    # A estação fica na origem da projeção (célula 0,0); o fix a 10 m a oeste cai na célula -1,0
+    grid = index([("E1", LAT0, LON0)])
+    lat, lon = offset(meters_east=-10)
+
+    estacao_id, distancia = grid.query(np.array([lat]), np.array([lon]))
+
+    assert estacao_id.tolist() == ["E1"]
+    assert abs(distancia[0] - 10) < 0.5
+
+
+def test_nearest_station_wins_and_radius_is_respected():
+    e2 = offset(meters_east=300)
+    grid = index([("E1", LAT0, LON0), ("E2", *e2)])
+    points = [offset(meters_east=100), offset(meters_east=220), offset(meters_north=-400), (np.nan, np.nan)]
+
+    estacao_id, distancia = grid.query(np.array([p[0] for p in points]), np.array([p[1] for p in points]))
+
+    assert estacao_id.tolist() == ["E1", "E2", None, None]
+    assert np.isnan(distancia[2:]).all()
+
+
+def test_crowded_cell_checks_every_station():
+    stations = [(f"E{i}", *offset(meters_east=10 * i)) for i in range(5)]
+    grid = index(stations)
+    lat, lon = offset(meters_east=41)
+
+    estacao_id, _ = grid.query(np.array([lat]), np.array([lon]))
+
+    assert estacao_id.tolist() == ["E4"]
+
+
+def test_add_station_columns_without_index():
+    df = pd.DataFrame({"latitude": [LAT0], "longitude": [LON0]})
+    result = add_station_columns(df, None)
+    assert result["estacao_id"].isna().all()
+    assert result["distancia_estacao_m"].isna().all()
+
+
+def test_load_station_index_from_file(tmp_path):
+    path = tmp_path / "estacoes.csv"
+    pd.DataFrame({"estacao_id": ["001"], "latitude": [LAT0], "longitude": [LON0]}).to_csv(path, index=False)
+
+    grid = load_station_index(str(path))
+
+    assert grid.size == 1 and grid.station_ids.tolist() == ["001"]
+    assert load_station_index(str(path)) is grid
+    assert load_station_index(str(tmp_path / "ausente.csv")) is None
+
+
+def test_station_matching_is_opt_in(tmp_path, caplog):
+    with caplog.at_level(logging.WARNING):
+        assert _load_stations(None) is None
+    assert caplog.records == []
+
+    with caplog.at_level(logging.WARNING):
+        assert _load_stations(str(tmp_path / "ausente.csv")) is None
+    assert "ausente.csv" in caplog.text
@@ -0,0 +1,104 @@
+"""
+Testes das métricas de trajeto por veículo (pipelines.utils.track_metrics)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipelines.utils.track_metrics import (
+    MAX_SEGMENT_GAP_SECONDS,
+    add_track_metrics,
+    haversine_km,
+    load_track_state,
+)
+
+
+# 0,01° de latitude ≈ 1,112 km
+STEP_DEG = 0.01
+STEP_KM = 1.111951
+
+
+def fixes(vehicle, points):
+    """Lote da API: [(dataHora em segundos, latitude)] na longitude -43.2."""
+    return pd.DataFrame({
+        "codigo": [vehicle] * len(points),
+        "dataHora": [seconds * 1000 for seconds, _ in points],
+        "latitude": [lat for _, lat in points],
+        "longitude": [-43.2] * len(points),
+    })
+
+
+def test_haversine():
+    assert haversine_km(0, 0, 0, 0) == 0
+    assert haversine_km(-22.9, -43.2, -22.9 + STEP_DEG, -43.2) == pytest.approx(STEP_KM, rel=1e-5)
+    assert np.isnan(haversine_km(np.nan, 0, 0, 0))
+
+
+def test_segment_metrics_per_vehicle():
+    batch = pd.concat([
+        fixes("A", [(0, -22.9), (60, -22.9 + STEP_DEG)]),
+        fixes("B", [(0, -23.0)]),
+    ], ignore_index=True)
+
+    result = add_track_metrics(batch)
+
+    assert np.isnan(result["distancia_segmento_km"].iloc[0])
+    assert result["distancia_segmento_km"].iloc[1] == pytest.approx(STEP_KM, rel=1e-5)
+    assert result["intervalo_segmento_s"].iloc[1] == 60
+    assert result["velocidade_calculada_kmh"].iloc[1] == pytest.approx(STEP_KM * 60, rel=1e-5)
+    assert np.isnan(result["distancia_segmento_km"].iloc[2])
+    assert result["distancia_acumulada_km"].tolist() == pytest.approx([0, STEP_KM, 0], rel=1e-5)
+
+
+def test_gap_longer_than_max_breaks_the_segment():
+    gap = MAX_SEGMENT_GAP_SECONDS + 1
+    batch = fixes("A", [(0, -22.9), (gap, -22.9 + STEP_DEG), (gap + 60, -22.9 + 2 * STEP_DEG)])
+
+    result = add_track_metrics(batch)
+
+    assert np.isnan(result["distancia_segmento_km"].iloc[1])
+    assert np.isnan(result["intervalo_segmento_s"].iloc[1])
+    assert np.isnan(result["velocidade_calculada_kmh"].iloc[1])
+    assert result["distancia_segmento_km"].iloc[2] == pytest.approx(STEP_KM, rel=1e-5)
+    assert result["distancia_acumulada_km"].iloc[2] == pytest.approx(STEP_KM, rel=1e-5)
+
+
+def test_out_of_order_batch_keeps_input_order():
+    batch = fixes("A", [(120, -22.9 + 2 * STEP_DEG), (0, -22.9), (60, -22.9 + STEP_DEG)])
+
+    result = add_track_metrics(batch)
+
+    assert result["intervalo_segmento_s"].tolist()[0] == 60
+    assert np.isnan(result["intervalo_segmento_s"].iloc[1])
+    assert result["distancia_acumulada_km"].tolist() == pytest.approx([2 * STEP_KM, 0, STEP_KM], rel=1e-5)
+
+
+def test_state_links_consecutive_batches(tmp_path):
+    state_path = str(tmp_path / "state" / "track_state.csv")
+    add_track_metrics(fixes("A", [(0, -22.9), (60, -22.9 + STEP_DEG)]), state_path=state_path)
+    add_track_metrics(fixes("B", [(0, -23.0)]), state_path=state_path)
+
+    result = add_track_metrics(fixes("A", [(120, -22.9 + 2 * STEP_DEG)]), state_path=state_path)
+
+    assert result["intervalo_segmento_s"].iloc[0] == 60
+    assert result["distancia_segmento_km"].iloc[0] == pytest.approx(STEP_KM, rel=1e-5)
+    assert result["distancia_acumulada_km"].iloc[0] == pytest.approx(2 * STEP_KM, rel=1e-5)
+
+    state = load_track_state(state_path).set_index("codigo")
+    assert sorted(state.index) == ["A", "B"]
+    assert state.loc["A", "dataHora"] == 120_000
+
+
+def test_stale_state_beyond_gap_is_not_linked(tmp_path):
+    state_path = str(tmp_path / "track_state.csv")
+    add_track_metrics(fixes("A", [(0, -22.9)]), state_path=state_path)
+
+    result = add_track_metrics(fixes("A", [(MAX_SEGMENT_GAP_SECONDS + 60, -22.8)]), state_path=state_path)
+
+    assert np.isnan(result["distancia_segmento_km"].iloc[0])
+    assert result["distancia_acumulada_km"].iloc[0] == 0
+
+
+def test_batch_without_coordinates_gets_empty_columns():
+    result = add_track_metrics(pd.DataFrame({"codigo": ["A"], "dataHora": [0]}))
+    assert result["distancia_segmento_km"].isna().all()
@@ -0,0 +1,143 @@
+"""
+Testes do disparo do transform por chegada de dados (pipelines.utils.transform_trigger)
+"""
+from datetime import datetime, timezone
+
+import pytest
+
+from pipelines.brt.transform.tasks import check_transform_trigger, record_transform, unlock_transform
+from pipelines.utils import gcp, transform_trigger
+from pipelines.utils.handoff_queue import TransformQueue, transform_queue_dir
+from pipelines.utils.transform_trigger import (
+    acquire_transform_lock,
+    decide_transform,
+    read_transform_state,
+    release_transform_lock,
+    scan_bronze_watermark,
+    transform_state_path
+)
+
+
+NOW = 1_704_103_200.0
+
+
+class FakeBlob:
+    def __init__(self, name, updated):
+        self.name = name
+        self.updated = datetime.fromtimestamp(updated, tz=timezone.utc) if updated is not None else None
+
+
+class FakeBucket:
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def list_blobs(self, prefix):
+        return [b for b in self.blobs if b.name.startswith(prefix)]
+
+
+class FakeStorageClient:
+    def __init__(self, blobs):
+        self._bucket = FakeBucket(blobs)
+
+    def bucket(self, name):
+        return self._bucket
+
+
+@pytest.fixture(autouse=True)
+def isolated_locks(monkeypatch):
+    monkeypatch.setattr(transform_trigger, "_LOCKS", {})
+    monkeypatch.delenv("BQ_DRY_RUN", raising=False)
+
+
+def scan(pending, oldest=None):
+    return {"watermark": NOW, "files": pending, "pending_files": pending, "oldest_pending": oldest}
+
+
+def test_new_files_wait_for_the_minimum_interval():
+    state = {"transformed_at": NOW - 120}
+
+    run, _ = decide_transform(state, scan(3), now=NOW, min_interval_seconds=300)
+    assert not run
+
+    run, reason = decide_transform(state, scan(3), now=NOW + 180, min_interval_seconds=300)
+    assert run and "3 arquivo(s)" in reason
+
+
+def test_no_new_files_only_runs_when_gold_is_stale():
+    state = {"transformed_at": NOW - 600}
+
+    assert not decide_transform(state, scan(0), now=NOW, max_staleness_seconds=3600)[0]
+    assert decide_transform(state, scan(0), now=NOW + 3000, max_staleness_seconds=3600)[0]
+    assert not decide_transform(state, scan(0), now=NOW + 3000, max_staleness_seconds=0)[0]
+    assert decide_transform(state, None, now=NOW + 3000, max_staleness_seconds=3600)[0]
+
+
+def test_first_transform():
+    assert decide_transform({}, scan(1), now=NOW)[0]
+    assert not decide_transform({}, scan(0), now=NOW)[0]
+    assert decide_transform({}, None, now=NOW)[0]
+
+
+def test_scan_counts_only_csvs_after_the_watermark(monkeypatch):
+    blobs = [
+        FakeBlob("bronze/brt_gps/a.csv", NOW - 100),
+        FakeBlob("bronze/brt_gps/b.csv", NOW + 10),
+        FakeBlob("bronze/brt_gps/c.csv", NOW + 20),
+        FakeBlob("bronze/brt_gps/c.json", NOW + 30),
+        FakeBlob("bronze/brt_gps_old/d.csv", NOW + 40),
+        FakeBlob("bronze/onibus_gps/e.csv", NOW + 50),
+        FakeBlob("bronze/brt_gps/f.csv", None),
+    ]
+    monkeypatch.setattr(gcp, "get_gcs_client", lambda: FakeStorageClient(blobs))
+
+    result = scan_bronze_watermark("bucket", ["bronze/brt_gps/"], since=NOW)
+
+    assert result == {"watermark": NOW + 20, "files": 3, "pending_files": 2, "oldest_pending": NOW + 10}
+    assert scan_bronze_watermark("bucket", ["bronze/brt_gps"], since=NOW + 60)["watermark"] == NOW + 60
+
+
+def test_lock_admits_one_transform_at_a_time(tmp_path, monkeypatch):
+    output_dir = str(tmp_path)
+    assert acquire_transform_lock(output_dir)
+    assert acquire_transform_lock(output_dir)
+
+    # Outro processo: o flock é por descritor aberto
+    monkeypatch.setattr(transform_trigger, "_LOCKS", {})
+    assert not acquire_transform_lock(output_dir)
+
+
+def test_release_without_lock(tmp_path):
+    assert not release_transform_lock(str(tmp_path))
+
+
+def test_queued_files_are_coalesced_into_one_transform(tmp_path):
+    output_dir = str(tmp_path)
+    queue = TransformQueue(transform_queue_dir(output_dir))
+    for name in ("a", "b", "c"):
+        queue.enqueue({"uri": f"gs://bucket/bronze/brt_gps/{name}.csv", "feed": "brt", "records": 10})
+
+    decision = check_transform_trigger.run("bucket", output_dir=output_dir)
+    assert decision["run"] and decision["batch_id"] and decision["pending_files"] == 3
+
+    # Captura que chega durante o dbt fica para o próximo transform
+    queue.enqueue({"uri": "gs://bucket/bronze/brt_gps/d.csv", "feed": "brt", "records": 10})
+    record_transform.run(decision, output_dir=output_dir)
+    unlock_transform.run(output_dir=output_dir)
+
+    state = read_transform_state(transform_state_path(output_dir))
+    assert state["pending_files"] == 3 and state["batch_id"] == decision["batch_id"]
+    assert queue.stats()["depth"] == 1 and queue.stats()["inflight"] == 0
+
+    deferred = check_transform_trigger.run("bucket", output_dir=output_dir, min_interval_seconds=300)
+    assert not deferred["run"] and deferred["batch_id"] is None
+    assert queue.stats()["depth"] == 1
+
+
+def test_busy_transform_defers_the_run(tmp_path, monkeypatch):
+    output_dir = str(tmp_path)
+    assert acquire_transform_lock(output_dir)
+    monkeypatch.setattr(transform_trigger, "_LOCKS", {})
+
+    decision = check_transform_trigger.run("bucket", output_dir=output_dir)
+
+    assert not decision["run"] and decision["reason"] == "transform em andamento"